@@ -0,0 +1,47 @@
+-- SSH Guardian v3.1 - Migration 035: Enrichment Work Queue
+-- Turns auth_events.processing_status into a durable outbox so enrichment can
+-- run in scripts/enrichment_worker.py instead of inside the agent's POST.
+--   pending    -> committed by ingest, waiting for a worker
+--   processing -> claimed by a worker (reclaimed if the worker dies)
+
+-- Add 'processing' claim state
+ALTER TABLE auth_events
+MODIFY COLUMN processing_status ENUM('pending', 'processing', 'geoip_complete', 'ml_complete',
+                                     'intel_complete', 'completed', 'error') DEFAULT 'pending';
+
+-- Track claim attempts so poison events end up in 'error' instead of looping
+DELIMITER //
+
+CREATE PROCEDURE add_enrichment_attempts_column()
+BEGIN
+    IF NOT EXISTS (
+        SELECT * FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = 'auth_events'
+        AND COLUMN_NAME = 'enrichment_attempts'
+    ) THEN
+        ALTER TABLE auth_events
+        ADD COLUMN enrichment_attempts TINYINT UNSIGNED DEFAULT 0 AFTER processing_error;
+    END IF;
+END //
+
+DELIMITER ;
+
+CALL add_enrichment_attempts_column();
+DROP PROCEDURE IF EXISTS add_enrichment_attempts_column;
+
+-- Queue scans use (processing_status, id); idx_pipeline already covers status + created_at
+SET @index_exists = (
+    SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'auth_events'
+    AND INDEX_NAME = 'idx_queue_status_id'
+);
+
+SET @sql = IF(@index_exists = 0,
+    'CREATE INDEX idx_queue_status_id ON auth_events(processing_status, id)',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
@@ -0,0 +1,51 @@
+-- SSH Guardian v3.1 - Migration 036: Incremental ML Model Updates
+-- One row per scheduled incremental update (scripts/incremental_ml_update.py).
+-- checkpoint_at of the newest promoted row whose candidate is still the
+-- active model is where the next update picks up new events.
+--   promoted -> candidate beat the active model on the held-out window
+--   rejected -> candidate saved but not promoted
+--   skipped  -> not enough new labelled events / single class
+--   failed   -> error during the update
+
+CREATE TABLE IF NOT EXISTS ml_incremental_updates (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    base_model_id INT NULL COMMENT 'Active model the update started from',
+    candidate_model_id INT NULL COMMENT 'Updated model saved to ml_models',
+    algorithm VARCHAR(50) NULL,
+
+    -- Data window
+    window_start DATETIME NOT NULL,
+    checkpoint_at DATETIME NOT NULL COMMENT 'New events up to here were trained on',
+    feedback_checkpoint_at DATETIME NULL COMMENT 'Analyst feedback up to here was used',
+    new_events INT DEFAULT 0,
+    feedback_events INT DEFAULT 0,
+    holdout_events INT DEFAULT 0,
+
+    -- Held-out evaluation
+    base_f1 DECIMAL(5,4) NULL,
+    candidate_f1 DECIMAL(5,4) NULL,
+
+    status ENUM('promoted', 'rejected', 'skipped', 'failed') NOT NULL,
+    message VARCHAR(500) NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    KEY idx_status_created (status, created_at),
+    FOREIGN KEY (base_model_id) REFERENCES ml_models(id) ON DELETE SET NULL,
+    FOREIGN KEY (candidate_model_id) REFERENCES ml_models(id) ON DELETE SET NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Feedback scans filter on feedback_at
+SET @index_exists = (
+    SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'auth_events_ml'
+    AND INDEX_NAME = 'idx_feedback_at'
+);
+
+SET @sql = IF(@index_exists = 0,
+    'CREATE INDEX idx_feedback_at ON auth_events_ml(feedback_at)',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
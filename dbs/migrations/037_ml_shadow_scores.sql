@@ -0,0 +1,30 @@
+-- SSH Guardian v3.1 - Migration 037: Shadow Model Scoring
+-- A candidate ("shadow") model scores a sampled fraction of the events the
+-- production ensemble scores, off the request path. One row per sampled
+-- event: both raw ensemble scores (before threat intel overrides), whether
+-- the anomaly votes agree, and each side's per-event inference latency.
+-- /api/ml/shadow/summary turns these into agreement, feedback accuracy and
+-- latency percentiles for the promotion decision.
+
+CREATE TABLE IF NOT EXISTS ml_shadow_scores (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    event_id BIGINT NULL,
+    production_model_id INT NULL,
+    shadow_model_id INT NOT NULL,
+
+    -- Raw ensemble scores (0-100) and anomaly votes
+    production_risk_score TINYINT UNSIGNED NOT NULL,
+    shadow_risk_score TINYINT UNSIGNED NOT NULL,
+    production_anomaly BOOLEAN NOT NULL,
+    shadow_anomaly BOOLEAN NOT NULL,
+    agrees BOOLEAN NOT NULL,
+
+    -- Per-event inference latency (batch time / batch size)
+    production_inference_ms DECIMAL(10,4) NULL,
+    shadow_inference_ms DECIMAL(10,4) NULL,
+
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    KEY idx_shadow_created (shadow_model_id, created_at),
+    KEY idx_event (event_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,143 @@
+-- SSH Guardian v3.1 - Migration 038: Incremental Event Rollups
+-- Pre-aggregated auth_events for the trends and daily report endpoints,
+-- maintained by src/core/event_rollups.py instead of GROUP BY over raw events
+-- on every request. Simulation events are excluded.
+--
+--   auth_events_rollup_hourly          hour x agent x event_type x country x threat_type
+--   auth_events_rollup_daily           same cube per day (rolled up from hourly)
+--   auth_events_rollup_ip_daily        day x event_type x source IP (distinct usernames)
+--   auth_events_rollup_username_daily  day x event_type x username (distinct IPs)
+--   auth_events_daily_summary          day totals incl. distinct IPs/usernames/servers
+--
+-- event_rollup_state.high_water_mark is the auth_events.updated_at up to which
+-- changes have been rolled up. Every insert and every enrichment/ML update
+-- bumps updated_at, so the refresher recomputes exactly the hour buckets
+-- touched since the mark. A NULL mark means "never run": the first refresh
+-- backfills all history, so run scripts/refresh_event_rollups.py once after
+-- applying this migration.
+
+CREATE TABLE IF NOT EXISTS auth_events_rollup_hourly (
+    bucket_start DATETIME NOT NULL COMMENT 'Start of the hour',
+    agent_id INT NOT NULL DEFAULT 0 COMMENT '0 = no agent',
+    event_type ENUM('failed', 'successful', 'invalid') NOT NULL,
+    country_code CHAR(2) NOT NULL DEFAULT '' COMMENT 'Empty = unknown',
+    threat_type VARCHAR(100) NOT NULL DEFAULT '' COMMENT 'Empty = none',
+    country_name VARCHAR(100) NULL,
+
+    event_count INT UNSIGNED NOT NULL DEFAULT 0,
+    anomaly_count INT UNSIGNED NOT NULL DEFAULT 0,
+    risk_sum BIGINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Sum of ml_risk_score (0-100)',
+    max_risk TINYINT UNSIGNED NOT NULL DEFAULT 0,
+    critical_count INT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'ml_risk_score >= 80',
+    high_count INT UNSIGNED NOT NULL DEFAULT 0 COMMENT '60-79',
+    medium_count INT UNSIGNED NOT NULL DEFAULT 0 COMMENT '40-59',
+    low_count INT UNSIGNED NOT NULL DEFAULT 0 COMMENT '< 40',
+
+    PRIMARY KEY (bucket_start, agent_id, event_type, country_code, threat_type)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS auth_events_rollup_daily (
+    bucket_date DATE NOT NULL,
+    agent_id INT NOT NULL DEFAULT 0,
+    event_type ENUM('failed', 'successful', 'invalid') NOT NULL,
+    country_code CHAR(2) NOT NULL DEFAULT '',
+    threat_type VARCHAR(100) NOT NULL DEFAULT '',
+    country_name VARCHAR(100) NULL,
+
+    event_count INT UNSIGNED NOT NULL DEFAULT 0,
+    anomaly_count INT UNSIGNED NOT NULL DEFAULT 0,
+    risk_sum BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    max_risk TINYINT UNSIGNED NOT NULL DEFAULT 0,
+    critical_count INT UNSIGNED NOT NULL DEFAULT 0,
+    high_count INT UNSIGNED NOT NULL DEFAULT 0,
+    medium_count INT UNSIGNED NOT NULL DEFAULT 0,
+    low_count INT UNSIGNED NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (bucket_date, agent_id, event_type, country_code, threat_type),
+    KEY idx_type_date (event_type, bucket_date)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS auth_events_rollup_ip_daily (
+    bucket_date DATE NOT NULL,
+    event_type ENUM('failed', 'successful', 'invalid') NOT NULL,
+    ip_address VARCHAR(45) NOT NULL,
+    country_code CHAR(2) NOT NULL DEFAULT '',
+    country_name VARCHAR(100) NULL,
+    city VARCHAR(100) NULL,
+
+    event_count INT UNSIGNED NOT NULL DEFAULT 0,
+    unique_usernames INT UNSIGNED NOT NULL DEFAULT 0,
+    anomaly_count INT UNSIGNED NOT NULL DEFAULT 0,
+    risk_sum BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    max_risk TINYINT UNSIGNED NOT NULL DEFAULT 0,
+    threat_type VARCHAR(100) NULL,
+    first_seen DATETIME(3) NULL,
+    last_seen DATETIME(3) NULL,
+
+    PRIMARY KEY (bucket_date, event_type, ip_address),
+    KEY idx_ip_date (ip_address, bucket_date)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS auth_events_rollup_username_daily (
+    bucket_date DATE NOT NULL,
+    event_type ENUM('failed', 'successful', 'invalid') NOT NULL,
+    username VARCHAR(255) NOT NULL,
+
+    event_count INT UNSIGNED NOT NULL DEFAULT 0,
+    unique_ips INT UNSIGNED NOT NULL DEFAULT 0,
+    anomaly_count INT UNSIGNED NOT NULL DEFAULT 0,
+    risk_sum BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    first_seen DATETIME(3) NULL,
+    last_seen DATETIME(3) NULL,
+
+    PRIMARY KEY (bucket_date, event_type, username),
+    KEY idx_username_date (username, bucket_date)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS event_rollup_state (
+    name VARCHAR(50) NOT NULL PRIMARY KEY,
+    high_water_mark DATETIME NULL COMMENT 'auth_events.updated_at rolled up to',
+    last_run_at DATETIME NULL,
+    last_duration_ms INT UNSIGNED NULL,
+    last_buckets INT UNSIGNED NULL COMMENT 'Hour buckets recomputed by the last run',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT IGNORE INTO event_rollup_state (name, high_water_mark) VALUES ('auth_events', NULL);
+
+-- Distinct servers per day for the daily summary report
+DELIMITER //
+
+CREATE PROCEDURE add_daily_summary_servers_column()
+BEGIN
+    IF NOT EXISTS (
+        SELECT * FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = 'auth_events_daily_summary'
+        AND COLUMN_NAME = 'unique_servers'
+    ) THEN
+        ALTER TABLE auth_events_daily_summary
+        ADD COLUMN unique_servers INT UNSIGNED DEFAULT 0 AFTER unique_usernames;
+    END IF;
+END //
+
+DELIMITER ;
+
+CALL add_daily_summary_servers_column();
+DROP PROCEDURE IF EXISTS add_daily_summary_servers_column;
+
+-- The refresher finds changed hours by updated_at range
+SET @index_exists = (
+    SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'auth_events'
+    AND INDEX_NAME = 'idx_updated_at'
+);
+
+SET @sql = IF(@index_exists = 0,
+    'CREATE INDEX idx_updated_at ON auth_events(updated_at)',
+    'SELECT 1'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
@@ -0,0 +1,36 @@
+-- SSH Guardian v3.1 - Migration 039: Dedicated Enrichment Queue State
+-- 'pending' is also the initial status of events enriched inline (simulations,
+-- process_log_line), so the queue gets a status of its own:
+--   queued     -> committed by deferred ingest, waiting for a worker
+--   processing -> claimed by a worker (back to 'queued' if the worker dies)
+-- enrichment_skip carries the pipeline stages the ingest caller disabled, so
+-- the worker honours them exactly as the inline pipeline would have.
+
+ALTER TABLE auth_events
+MODIFY COLUMN processing_status ENUM('pending', 'queued', 'processing', 'geoip_complete',
+                                     'ml_complete', 'intel_complete', 'completed', 'error')
+                                DEFAULT 'pending';
+
+DELIMITER //
+
+CREATE PROCEDURE add_enrichment_skip_column()
+BEGIN
+    IF NOT EXISTS (
+        SELECT * FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = 'auth_events'
+        AND COLUMN_NAME = 'enrichment_skip'
+    ) THEN
+        ALTER TABLE auth_events
+        ADD COLUMN enrichment_skip SET('blocking', 'learning', 'notifications') NOT NULL DEFAULT ''
+            AFTER enrichment_attempts;
+    END IF;
+END //
+
+DELIMITER ;
+
+CALL add_enrichment_skip_column();
+DROP PROCEDURE IF EXISTS add_enrichment_skip_column;
+
+-- Claims left by workers running before this migration go back to the queue
+UPDATE auth_events SET processing_status = 'queued' WHERE processing_status = 'processing';
@@ -0,0 +1,29 @@
+-- SSH Guardian v3.1 - Migration 040: Shadow Scoring Latency Detail
+-- Both ensembles are now timed by the shadow thread on the same sampled
+-- rows, so their per-event latencies are comparable. Each row also records
+-- how many events were scored together and each model's per-event time.
+--   sample_size         -> events in the timed call (latency = call time / sample_size)
+--   production_model_ms -> {"model_name": per-event ms, ...} for the production ensemble
+--   shadow_model_ms     -> the same for the candidate
+
+DELIMITER //
+
+CREATE PROCEDURE add_shadow_latency_columns()
+BEGIN
+    IF NOT EXISTS (
+        SELECT * FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+        AND TABLE_NAME = 'ml_shadow_scores'
+        AND COLUMN_NAME = 'sample_size'
+    ) THEN
+        ALTER TABLE ml_shadow_scores
+        ADD COLUMN sample_size SMALLINT UNSIGNED NULL AFTER shadow_inference_ms,
+        ADD COLUMN production_model_ms JSON NULL AFTER sample_size,
+        ADD COLUMN shadow_model_ms JSON NULL AFTER production_model_ms;
+    END IF;
+END //
+
+DELIMITER ;
+
+CALL add_shadow_latency_columns();
+DROP PROCEDURE IF EXISTS add_shadow_latency_columns;
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+SSH Guardian v3.0 - Offline GeoIP Benchmark
+Loads the GEOIP_LOCAL_DB datasets (or a given file) and measures lookup
+latency over random public IPv4 addresses
+"""
+
+import sys
+import time
+import random
+from pathlib import Path
+
+# Add project paths
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
+
+from geoip_local import LocalGeoIPDatabase, GEOIP_LOCAL_DB
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SSH Guardian Offline GeoIP Benchmark")
+    parser.add_argument("datasets", nargs="*", help="Dataset files (default: GEOIP_LOCAL_DB)")
+    parser.add_argument("--lookups", type=int, default=200000, help="Number of lookups (default: 200000)")
+    parser.add_argument("--show", type=int, default=5, help="Sample results to print (default: 5)")
+
+    args = parser.parse_args()
+
+    paths = args.datasets or [p.strip() for p in GEOIP_LOCAL_DB.split(',') if p.strip()]
+    if not paths:
+        print("❌ No datasets - pass files or set GEOIP_LOCAL_DB")
+        sys.exit(1)
+
+    db = LocalGeoIPDatabase(paths)
+    if not db.is_available():
+        print("❌ No dataset could be loaded")
+        sys.exit(1)
+
+    rng = random.Random(42)
+    ips = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+           for _ in range(args.lookups)]
+
+    for ip in ips[:args.show]:
+        print(f"   {ip:<15} {db.lookup(ip)}")
+
+    started = time.perf_counter()
+    hits = sum(1 for ip in ips if db.lookup(ip))
+    elapsed = time.perf_counter() - started
+
+    print("=" * 70)
+    print(f"Lookups:   {len(ips):,} ({hits:,} hits)")
+    print(f"Per IP:    {elapsed / len(ips) * 1e6:.2f} µs")
+    print(f"Rate:      {len(ips) / elapsed:,.0f} lookups/s")
+    print(f"Load time: {db.stats['load_ms']} ms for {db.stats['ranges']:,} ranges")
+    print("=" * 70)
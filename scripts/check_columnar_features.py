@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+SSH Guardian v3.0 - Columnar Feature Parity Check
+Replays a synthetic, time-ordered attack mix through the streaming
+FeatureExtractor and the ColumnarFeatureExtractor, compares every feature
+and measures extraction throughput. A second pass feeds the columnar
+extractor the same events in id order with jittered timestamps (delayed
+logs), which must match streaming them in time order
+"""
+
+import sys
+import time
+import random
+from pathlib import Path
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Add project paths
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.append(str(PROJECT_ROOT / "src"))
+
+from ml.feature_extractor import FeatureExtractor
+from ml.columnar_features import ColumnarFeatureExtractor
+
+TOLERANCE = 1e-5
+
+
+def generate_events(count: int, ips: int, seed: int = 42) -> list:
+    """Synthetic events in timestamp order (bursts, long idle gaps, odd rows)"""
+    rng = random.Random(seed)
+    ip_pool = [f"198.51.{i // 256}.{i % 256}" for i in range(ips)]
+    weights = [1.0 / (rank + 1) for rank in range(ips)]
+    usernames = ['root', 'admin', 'ubuntu', 'Deploy', 'user1', 'user2', 'oracle', 'alice', 'test9', None]
+    servers = ['web-01', 'web-02', 'db-01', 'bastion', 'ci-runner', None]
+    reasons = ['invalid_user', 'invalid_password', 'key_rejected', 'timeout', None]
+    locations = [(39.9, 116.4), (55.75, 37.6), (40.7, -74.0), (51.5, -0.12), (-33.9, 151.2)]
+
+    now = datetime(2026, 3, 1)
+    events = []
+    for event_id in range(1, count + 1):
+        # Mostly seconds apart, occasionally idle for hours or days
+        gap = rng.expovariate(1 / 4)
+        if rng.random() < 0.001:
+            gap += rng.uniform(3600, 9 * 86400)
+        now += timedelta(seconds=gap)
+
+        geo = {}
+        if rng.random() < 0.8:
+            lat, lon = rng.choice(locations)
+            geo = {
+                'country_code': rng.choice(['CN', 'RU', 'US', 'GB', 'AU', 'Unknown', None]),
+                'latitude': lat, 'longitude': lon,
+                'is_proxy': rng.random() < 0.1, 'is_vpn': rng.random() < 0.1,
+                'is_tor': rng.random() < 0.05, 'is_datacenter': rng.random() < 0.2,
+                'is_hosting': rng.random() < 0.1
+            }
+        threat = {}
+        if rng.random() < 0.5:
+            threat = {
+                'abuseipdb_score': rng.choice([0, 10, 55, 80, 100, None]),
+                'virustotal_positives': rng.randint(0, 5), 'virustotal_total': rng.choice([0, 90]),
+                'overall_threat_level': rng.choice(['clean', 'low', 'medium', 'high', 'critical', None]),
+                'greynoise_noise': rng.choice([True, False, None])
+            }
+
+        events.append({
+            'id': event_id,
+            'timestamp': now,
+            'event_type': rng.choices(['failed', 'successful', 'invalid'], (0.8, 0.12, 0.08))[0],
+            'source_ip_text': '' if rng.random() < 0.01 else rng.choices(ip_pool, weights)[0],
+            'target_username': rng.choice(usernames),
+            'target_server': rng.choice(servers),
+            'failure_reason': rng.choice(reasons),
+            'geo': geo,
+            'threat': threat
+        })
+    return events
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SSH Guardian Columnar Feature Parity Check")
+    parser.add_argument("--events", type=int, default=100000, help="Events to replay (default: 100000)")
+    parser.add_argument("--ips", type=int, default=500, help="Distinct source IPs (default: 500)")
+    parser.add_argument("--chunk-size", type=int, default=25000, help="Events per chunk (default: 25000)")
+    parser.add_argument("--ttl-hours", type=float, default=24, help="IP history TTL for both extractors (default: 24)")
+
+    args = parser.parse_args()
+
+    events = generate_events(args.events, args.ips)
+    chunks = [events[start:start + args.chunk_size] for start in range(0, len(events), args.chunk_size)]
+
+    # Streaming: history reset per chunk, username profiles carried over
+    streaming = FeatureExtractor(ttl_hours=args.ttl_hours)
+    started = time.perf_counter()
+    expected = []
+    for chunk in chunks:
+        streaming.reset_history()
+        expected.extend(streaming.extract(event) for event in chunk)
+    streaming_elapsed = time.perf_counter() - started
+    expected = np.vstack(expected)
+
+    columnar = ColumnarFeatureExtractor(ttl_hours=args.ttl_hours)
+    started = time.perf_counter()
+    actual = np.vstack([columnar.extract_batch(chunk) for chunk in chunks])
+    columnar_elapsed = time.perf_counter() - started
+
+    diff = np.abs(expected - actual).max(axis=0)
+
+    # Out-of-order arrival: ids stay in insert order, timestamps lag by up
+    # to 15 minutes; streaming sees each chunk in (time, id) order
+    rng = random.Random(7)
+    jittered = [dict(event, timestamp=event['timestamp'] - timedelta(seconds=rng.uniform(0, 900)))
+                for event in events]
+    jittered_chunks = [jittered[start:start + args.chunk_size]
+                       for start in range(0, len(jittered), args.chunk_size)]
+    streaming = FeatureExtractor(ttl_hours=args.ttl_hours)
+    expected_jittered = []
+    for chunk in jittered_chunks:
+        streaming.reset_history()
+        by_time = sorted(range(len(chunk)), key=lambda i: (chunk[i]['timestamp'], i))
+        rows = {i: streaming.extract(chunk[i]) for i in by_time}
+        expected_jittered.extend(rows[i] for i in range(len(chunk)))
+    columnar = ColumnarFeatureExtractor(ttl_hours=args.ttl_hours)
+    actual_jittered = np.vstack([columnar.extract_prepared([columnar.prepare(chunk)])
+                                 for chunk in jittered_chunks])
+    diff = np.maximum(diff, np.abs(np.vstack(expected_jittered) - actual_jittered).max(axis=0))
+
+    names = columnar.get_feature_names()
+    failing = [(names[i], diff[i]) for i in np.flatnonzero(diff > TOLERANCE)]
+
+    print("=" * 70)
+    print(f"Events:     {len(events):,} in {len(chunks)} chunk(s), {args.ips} IPs")
+    print(f"Streaming:  {streaming_elapsed:.2f}s ({len(events) / streaming_elapsed:,.0f} events/s)")
+    print(f"Columnar:   {columnar_elapsed:.2f}s ({len(events) / columnar_elapsed:,.0f} events/s)")
+    print(f"Max diff:   {diff.max():.2e} (tolerance {TOLERANCE:.0e}, in-order and jittered)")
+    for name, value in failing:
+        print(f"  ✗ {name}: {value:.2e}")
+    print(f"Parity:     {'OK' if not failing else f'{len(failing)} feature(s) differ'}")
+    print("=" * 70)
+    sys.exit(1 if failing else 0)
@@ -7,7 +7,7 @@ Usage:
     python3 scripts/chunked_ml_training.py
 
 This script:
-1. Fetches training data in chunks (30K events per chunk)
+1. Streams training data in chunks (30K events per chunk, keyset-paged)
 2. Extracts 50 features incrementally (including advanced detection features)
 3. Trains a Random Forest model on all data
 4. Saves and promotes the model to production
@@ -35,7 +35,7 @@ import pickle
 import logging
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Any, Iterator
 import numpy as np
 
 # Add project paths
@@ -44,7 +44,9 @@ sys.path.append(str(PROJECT_ROOT / "dbs"))
 sys.path.append(str(PROJECT_ROOT / "src"))
 
 from connection import get_connection
-from ml.feature_extractor import FeatureExtractor
+from ml.columnar_features import ColumnarFeatureExtractor
+from ml.data_loader import iter_keyset_chunks, prefetched
+from ml.model_manager import publish_model_reload
 
 # Configure logging
 logging.basicConfig(
@@ -59,6 +61,7 @@ logger = logging.getLogger(__name__)
 
 # Training configuration
 CHUNK_SIZE = 30000  # Smaller chunks for 8GB RAM
+HISTORY_RESET_CHUNKS = 5  # Per-IP feature history restarts every N chunks
 ALGORITHM = 'random_forest'
 TEST_SPLIT = 0.2
 RANDOM_STATE = 42
@@ -99,66 +102,64 @@ def get_total_event_count(data_start: datetime, data_end: datetime) -> int:
         conn.close()
 
 
-def fetch_events_chunk(offset: int, limit: int, data_start: datetime, data_end: datetime) -> List[Dict]:
-    """Fetch a chunk of events with all enrichment data, structured for FeatureExtractor"""
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+def iter_event_chunks(data_start: datetime, data_end: datetime,
+                      chunk_size: int = CHUNK_SIZE) -> Iterator[List[Dict]]:
+    """
+    Yield chunks of events with all enrichment data, structured for FeatureExtractor.
 
-    try:
-        cursor.execute("""
-            SELECT
-                e.id, e.event_type, e.auth_method, e.source_ip_text,
-                e.target_username, e.failure_reason, e.timestamp,
-                g.country_code, g.latitude, g.longitude,
-                g.is_tor, g.is_proxy, g.is_vpn, g.is_datacenter, g.is_hosting,
-                g.greynoise_noise, g.greynoise_riot,
-                t.abuseipdb_score, t.virustotal_positives, t.virustotal_total, t.overall_threat_level
-            FROM auth_events e
-            LEFT JOIN ip_geolocation g ON e.source_ip_text = g.ip_address_text
-            LEFT JOIN ip_threat_intelligence t ON e.source_ip_text = t.ip_address_text
-            WHERE e.timestamp BETWEEN %s AND %s
-            ORDER BY e.id
-            LIMIT %s OFFSET %s
-        """, (data_start, data_end, limit, offset))
-
-        rows = cursor.fetchall()
-
-        # Structure data for FeatureExtractor (expects nested geo and threat dicts)
-        structured_events = []
-        for row in rows:
-            event = {
-                'id': row['id'],
-                'event_type': row['event_type'],
-                'auth_method': row['auth_method'],
-                'source_ip_text': row['source_ip_text'],
-                'target_username': row['target_username'],
-                'failure_reason': row['failure_reason'],
-                'timestamp': row['timestamp'],
-                'geo': {
-                    'country_code': row.get('country_code'),
-                    'latitude': row.get('latitude'),
-                    'longitude': row.get('longitude'),
-                    'is_tor': row.get('is_tor'),
-                    'is_proxy': row.get('is_proxy'),
-                    'is_vpn': row.get('is_vpn'),
-                    'is_datacenter': row.get('is_datacenter'),
-                    'is_hosting': row.get('is_hosting'),
-                },
-                'threat': {
-                    'abuseipdb_score': row.get('abuseipdb_score'),
-                    'virustotal_positives': row.get('virustotal_positives'),
-                    'virustotal_total': row.get('virustotal_total'),
-                    'overall_threat_level': row.get('overall_threat_level'),
-                    'greynoise_noise': row.get('greynoise_noise'),
-                    'greynoise_riot': row.get('greynoise_riot'),
-                }
-            }
-            structured_events.append(event)
-
-        return structured_events
-    finally:
-        cursor.close()
-        conn.close()
+    Pages on e.id with a keyset cursor and fetches the next chunk on a
+    background thread while the caller featurizes the current one. Ids are
+    not time-ordered for delayed or backfilled logs; the columnar extractor
+    orders each group of chunks by time itself.
+    """
+    query = """
+        SELECT
+            e.id, e.event_type, e.auth_method, e.source_ip_text,
+            e.target_username, e.failure_reason, e.timestamp,
+            g.country_code, g.latitude, g.longitude,
+            g.is_tor, g.is_proxy, g.is_vpn, g.is_datacenter, g.is_hosting,
+            g.greynoise_noise, g.greynoise_riot,
+            t.abuseipdb_score, t.virustotal_positives, t.virustotal_total, t.overall_threat_level
+        FROM auth_events e
+        LEFT JOIN ip_geolocation g ON e.source_ip_text = g.ip_address_text
+        LEFT JOIN ip_threat_intelligence t ON e.source_ip_text = t.ip_address_text
+        WHERE e.timestamp BETWEEN %s AND %s
+    """
+    chunks = iter_keyset_chunks(query, (data_start, data_end), key_column='e.id',
+                                chunk_size=chunk_size)
+    for rows in prefetched(chunks):
+        yield [structure_event(row) for row in rows]
+
+
+def structure_event(row: Dict) -> Dict:
+    """Structure a flat query row for FeatureExtractor (nested geo and threat dicts)"""
+    return {
+        'id': row['id'],
+        'event_type': row['event_type'],
+        'auth_method': row['auth_method'],
+        'source_ip_text': row['source_ip_text'],
+        'target_username': row['target_username'],
+        'failure_reason': row['failure_reason'],
+        'timestamp': row['timestamp'],
+        'geo': {
+            'country_code': row.get('country_code'),
+            'latitude': row.get('latitude'),
+            'longitude': row.get('longitude'),
+            'is_tor': row.get('is_tor'),
+            'is_proxy': row.get('is_proxy'),
+            'is_vpn': row.get('is_vpn'),
+            'is_datacenter': row.get('is_datacenter'),
+            'is_hosting': row.get('is_hosting'),
+        },
+        'threat': {
+            'abuseipdb_score': row.get('abuseipdb_score'),
+            'virustotal_positives': row.get('virustotal_positives'),
+            'virustotal_total': row.get('virustotal_total'),
+            'overall_threat_level': row.get('overall_threat_level'),
+            'greynoise_noise': row.get('greynoise_noise'),
+            'greynoise_riot': row.get('greynoise_riot'),
+        }
+    }
 
 
 def determine_label(event: Dict) -> int:
@@ -303,8 +304,9 @@ def train_chunked(data_start: datetime, data_end: datetime) -> Dict[str, Any]:
     if total_events < 100:
         raise ValueError(f"Insufficient training data: {total_events} events")
 
-    # Initialize FeatureExtractor (same as production uses)
-    feature_extractor = FeatureExtractor()
+    # Columnar extractor: same features as the production FeatureExtractor,
+    # computed per group of chunks with NumPy
+    feature_extractor = ColumnarFeatureExtractor()
 
     # Process in chunks
     all_features = []
@@ -316,47 +318,45 @@ def train_chunked(data_start: datetime, data_end: datetime) -> Dict[str, Any]:
     logger.info(f"Processing {total_chunks} chunks of {CHUNK_SIZE:,} events each...")
     logger.info(f"Using FeatureExtractor with {len(feature_extractor.get_feature_names())} features")
 
-    for offset in range(0, total_events, CHUNK_SIZE):
-        chunks_processed += 1
-        logger.info(f"[Chunk {chunks_processed}/{total_chunks}] Loading events {offset:,} to {offset + CHUNK_SIZE:,}...")
-
-        # Fetch chunk
-        events = fetch_events_chunk(offset, CHUNK_SIZE, data_start, data_end)
-
-        if not events:
-            break
-
-        # Process chunk using FeatureExtractor
-        chunk_features = []
-        chunk_labels = []
-
-        for event in events:
-            try:
-                # Use the same FeatureExtractor as production
-                features = feature_extractor.extract(event)
-                label = determine_label(event)
-                chunk_features.append(features)
-                chunk_labels.append(label)
-            except Exception as e:
-                continue
-
-        all_features.extend(chunk_features)
-        all_labels.extend(chunk_labels)
-
-        # Reset feature extractor history more frequently for 8GB RAM
-        if chunks_processed % 5 == 0:
-            feature_extractor.reset_history()
-            gc.collect()
-
-        # Free memory aggressively
-        del events, chunk_features, chunk_labels
+    # IP history restarts every HISTORY_RESET_CHUNKS chunks (8GB RAM), so
+    # features are extracted once per group of that many chunks. Only the
+    # compact columns of a chunk are kept until then, not its event dicts
+    pending_columns = []
+    skipped = 0
+
+    def flush_pending():
+        if not pending_columns:
+            return
+        all_features.append(feature_extractor.extract_prepared(pending_columns))
+        pending_columns.clear()
         gc.collect()
 
-        logger.info(f"[Chunk {chunks_processed}/{total_chunks}] Processed. Total samples: {len(all_features):,}")
+    for events in iter_event_chunks(data_start, data_end):
+        chunks_processed += 1
+        logger.info(f"[Chunk {chunks_processed}/{total_chunks}] Loaded {len(events):,} events "
+                    f"(ids {events[0]['id']} to {events[-1]['id']})")
+
+        # Rows that can't be parsed are skipped, not fatal for the chunk
+        columns = feature_extractor.prepare(events)
+        all_labels.extend(determine_label(events[i]) for i in columns['kept'])
+        skipped += len(events) - len(columns['kept'])
+        pending_columns.append(columns)
+        del events
+
+        if chunks_processed % HISTORY_RESET_CHUNKS == 0:
+            flush_pending()
+
+        logger.info(f"[Chunk {chunks_processed}/{total_chunks}] Processed. Total samples: "
+                    f"{len(all_labels):,}")
+
+    if skipped:
+        logger.warning(f"Skipped {skipped:,} event(s) with unparseable fields")
+
+    flush_pending()
 
     # Convert to numpy arrays
     logger.info("Converting to numpy arrays...")
-    X = np.array(all_features, dtype=np.float32)
+    X = np.vstack(all_features).astype(np.float32) if all_features else np.zeros((0, 50), dtype=np.float32)
     y = np.array(all_labels, dtype=np.int32)
 
     del all_features, all_labels
@@ -530,6 +530,9 @@ def promote_model(model_name: str):
 
         conn.commit()
         logger.info(f"Model {model_name} promoted to production!")
+
+        # Running dashboard workers switch to the new model
+        publish_model_reload()
     except Exception as e:
         logger.error(f"Failed to promote model: {e}")
         conn.rollback()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+SSH Guardian v3.0 - Enrichment Worker
+Drains the auth_events enrichment queue (GeoIP, Threat Intel, ML, blocking)
+Run one or more instances alongside the dashboard when ENRICHMENT_QUEUE_ENABLED=1
+"""
+
+import sys
+import signal
+from pathlib import Path
+
+# Add project paths
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.append(str(PROJECT_ROOT / "dbs"))
+sys.path.append(str(PROJECT_ROOT / "src"))
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
+
+from enrichment_queue import EnrichmentWorkerPool, get_queue_stats, CLAIM_BATCH_SIZE
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SSH Guardian Enrichment Worker")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Events enriched in parallel (default: 4)"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=CLAIM_BATCH_SIZE,
+        help=f"Events claimed per poll (default: {CLAIM_BATCH_SIZE})"
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=2.0,
+        help="Seconds to wait when the queue is empty (default: 2)"
+    )
+    parser.add_argument(
+        "--drain",
+        action="store_true",
+        help="Exit once the queue is empty"
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print queue depth and exit"
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Only print errors"
+    )
+
+    args = parser.parse_args()
+
+    if args.stats:
+        stats = get_queue_stats()
+        print(f"Queued:         {stats['queued']:,}")
+        print(f"Processing:     {stats['processing']:,}")
+        print(f"Error:          {stats['error']:,}")
+        print(f"Oldest queued:  {stats['oldest_queued'] or '-'}")
+        sys.exit(0)
+
+    pool = EnrichmentWorkerPool(
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        poll_interval=args.poll_interval,
+        verbose=not args.quiet
+    )
+
+    # Finish the in-flight batch on SIGTERM/Ctrl+C so claims are released
+    signal.signal(signal.SIGTERM, lambda *_: pool.stop())
+    signal.signal(signal.SIGINT, lambda *_: pool.stop())
+
+    pool.run(drain_only=args.drain)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+SSH Guardian v3.0 - Incremental ML Model Update
+Updates the active production model with events since its last checkpoint
+and analyst feedback, promoting it only if it beats the active model on a
+held-out window. Meant to run from cron, e.g. every 6 hours:
+
+    0 */6 * * * cd /path/to/ssh_guardian_v3.0 && python3 scripts/incremental_ml_update.py
+"""
+
+import sys
+import logging
+from pathlib import Path
+
+# Add project paths
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.append(str(PROJECT_ROOT / "dbs"))
+sys.path.append(str(PROJECT_ROOT / "src"))
+
+from ml import get_trainer
+from ml.incremental_trainer import IncrementalTrainer
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SSH Guardian Incremental ML Model Update")
+    parser.add_argument("--evaluate-only", action="store_true",
+                        help="Fit and evaluate the candidate without saving or promoting it")
+    parser.add_argument("--min-events", type=int, default=None,
+                        help="Minimum new events required (default: ML_INCREMENTAL_MIN_EVENTS)")
+    parser.add_argument("--include-simulation", action="store_true", default=None,
+                        help="Also train on simulation events (default: ML_INCREMENTAL_INCLUDE_SIMULATION)")
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("SSH Guardian v3.0 - Incremental ML Update")
+    print("=" * 60)
+
+    result = IncrementalTrainer(get_trainer()).run(
+        promote=not args.evaluate_only,
+        min_events=args.min_events,
+        include_simulation=args.include_simulation
+    )
+
+    icon = {'promoted': '✅', 'rejected': '⚠️ ', 'skipped': 'ℹ️ '}.get(result['status'], '❌')
+    print(f"\n{icon} {result['status'].upper()}: {result['message']}")
+    if result.get('candidate_f1') is not None:
+        print(f"   Holdout F1: {result['base_f1']:.4f} (active) -> {result['candidate_f1']:.4f} (updated)")
+    print(f"   New events: {result.get('new_events', 0):,}, with feedback: {result.get('feedback_events', 0):,}")
+
+    sys.exit(1 if result['status'] == 'failed' else 0)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+SSH Guardian v3.0 - Event Rollup Refresher
+Catches the trends/daily report rollups (migration 038) up with auth_events
+from the stored high-water mark. The first run backfills all history.
+The enrichment worker and the report endpoints refresh on their own; run
+this from cron or as a daemon when neither is active, e.g.:
+
+    */5 * * * * cd /path/to/ssh_guardian_v3.0 && python3 scripts/refresh_event_rollups.py
+"""
+
+import sys
+import time
+from pathlib import Path
+from datetime import datetime, timedelta
+
+# Add project paths
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.append(str(PROJECT_ROOT / "dbs"))
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
+
+from event_rollups import refresh_rollups, rebuild_rollups, get_rollup_status
+
+
+def refresh_job():
+    """Run one catch-up and print the result"""
+    try:
+        result = refresh_rollups()
+        if result['status'] == 'busy':
+            print("ℹ️  Another refresher holds the lock, skipping")
+        else:
+            print(f"✅ {result['status']}: {result['hours']} hour(s) across {result['days']} day(s) "
+                  f"in {result['duration_ms']} ms (mark: {result['high_water_mark']})")
+    except Exception as e:
+        print(f"❌ Error refreshing rollups: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+def run_daemon(interval_seconds=60):
+    """Refresh continuously"""
+    print(f"{'='*60}")
+    print(f"🚀 SSH Guardian - Event Rollup Refresher")
+    print(f"{'='*60}")
+    print(f"Interval: Every {interval_seconds} seconds")
+    print(f"Press Ctrl+C to stop")
+    print(f"{'='*60}\n")
+
+    try:
+        while True:
+            refresh_job()
+            time.sleep(interval_seconds)
+    except KeyboardInterrupt:
+        print(f"\n⏹️  Rollup refresher stopped")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SSH Guardian Event Rollup Refresher")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Run continuously")
+    parser.add_argument("--interval", type=int, default=60,
+                        help="Daemon refresh interval in seconds (default: 60)")
+    parser.add_argument("--rebuild-days", type=int, default=None,
+                        help="Recompute the last N days in full (e.g. after deleting events)")
+    parser.add_argument("--status", action="store_true",
+                        help="Print the high-water mark and last run, then exit")
+
+    args = parser.parse_args()
+
+    if args.status:
+        status = get_rollup_status()
+        if not status:
+            print("No rollup state found - apply dbs/migrations/038_event_rollups.sql")
+            sys.exit(1)
+        print(f"High-water mark: {status['high_water_mark'] or 'never run'}")
+        print(f"Last run:        {status['last_run_at'] or '-'}")
+        print(f"Last duration:   {status['last_duration_ms'] or 0} ms")
+        print(f"Last buckets:    {status['last_buckets'] or 0} hour(s)")
+        sys.exit(0)
+
+    if args.rebuild_days:
+        today = datetime.now().date()
+        result = rebuild_rollups(today - timedelta(days=args.rebuild_days - 1), today)
+        print(f"✅ Rebuilt {result['days']} day(s)")
+        sys.exit(0)
+
+    if args.daemon:
+        run_daemon(args.interval)
+    else:
+        refresh_job()
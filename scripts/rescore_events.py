@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+SSH Guardian v3.0 - Historical Event Re-scoring
+Re-runs the active ML ensemble over stored auth_events in id order, one
+feature matrix and one ensemble pass per page, and writes the new
+ml_risk_score / ml_threat_type / ml_confidence / is_anomaly back
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# Add project paths
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.append(str(PROJECT_ROOT / "dbs"))
+sys.path.append(str(PROJECT_ROOT / "src"))
+
+from connection import get_connection
+from ml import get_model_manager
+
+GEO_COLUMNS = (
+    'country_code', 'country_name', 'city', 'latitude', 'longitude',
+    'is_proxy', 'is_vpn', 'is_tor', 'is_datacenter', 'is_hosting', 'asn', 'isp'
+)
+THREAT_COLUMNS = (
+    'abuseipdb_score', 'abuseipdb_confidence', 'abuseipdb_reports',
+    'virustotal_positives', 'virustotal_total',
+    'overall_threat_level', 'threat_confidence'
+)
+# GreyNoise verdicts are stored on ip_geolocation (migration 034)
+GREYNOISE_COLUMNS = ('greynoise_noise', 'greynoise_riot')
+
+
+def is_private_ip(ip: str) -> bool:
+    """Same ranges live enrichment scores with behavioral analysis only (no ML)"""
+    if not ip:
+        return False
+    if ip.startswith('10.') or ip.startswith('192.168.') or ip.startswith('127.'):
+        return True
+    if ip.startswith('172.'):
+        try:
+            return 16 <= int(ip.split('.')[1]) <= 31
+        except (IndexError, ValueError):
+            pass
+    return False
+
+
+def fetch_page(cursor, after_id: int, since_days: int, batch_size: int):
+    """Load the next page of events (with geo and threat rows) after after_id"""
+    geo_select = ', '.join(f'g.{c} AS geo_{c}' for c in GEO_COLUMNS)
+    threat_select = ', '.join(f't.{c} AS threat_{c}' for c in THREAT_COLUMNS)
+    greynoise_select = ', '.join(f'g.{c} AS threat_{c}' for c in GREYNOISE_COLUMNS)
+    since_clause = "AND e.timestamp >= NOW() - INTERVAL %s DAY" if since_days else ""
+    params = [after_id] + ([since_days] if since_days else []) + [batch_size]
+
+    cursor.execute(f"""
+        SELECT
+            e.id, e.event_uuid, e.timestamp, e.source_type, e.event_type,
+            e.auth_method, e.source_ip_text, e.target_server, e.target_username,
+            e.failure_reason, e.geo_id,
+            g.id AS geo_row_id, {geo_select},
+            t.ip_address_text AS threat_ip, {threat_select}, {greynoise_select}
+        FROM auth_events e
+        LEFT JOIN ip_geolocation g ON g.id = e.geo_id
+        LEFT JOIN ip_threat_intelligence t ON t.ip_address_text = e.source_ip_text
+        WHERE e.id > %s {since_clause}
+        ORDER BY e.id
+        LIMIT %s
+    """, tuple(params))
+
+    events = []
+    for row in cursor.fetchall():
+        event = {k: v for k, v in row.items()
+                 if not k.startswith(('geo_', 'threat_')) or k == 'geo_id'}
+        if row['geo_row_id']:
+            event['geo'] = {c: row[f'geo_{c}'] for c in GEO_COLUMNS}
+        threat = {}
+        if row['threat_ip']:
+            threat.update({c: row[f'threat_{c}'] for c in THREAT_COLUMNS})
+        for c in GREYNOISE_COLUMNS:
+            # TINYINT(1) comes back as 0/1; the extractor tests `is True`
+            value = row[f'threat_{c}']
+            if value is not None:
+                threat[c] = bool(value)
+        if threat:
+            event['threat'] = threat
+        events.append(event)
+    return events
+
+
+def rescore_events(since_days: int = 0, batch_size: int = 2000,
+                   limit: int = 0, dry_run: bool = False,
+                   allow_heuristic: bool = False) -> dict:
+    """
+    Re-score stored events with the active model ensemble.
+
+    Args:
+        since_days: Only events from the last N days (0 = all)
+        batch_size: Events scored per ensemble pass
+        limit: Stop after this many events (0 = no limit)
+        dry_run: Score without writing results back
+        allow_heuristic: Proceed when no model is loaded, overwriting stored
+            scores with the heuristic fallback
+
+    Returns:
+        Dict with scored/changed/skipped counts and throughput
+
+    Raises:
+        RuntimeError: No ML model is loaded and allow_heuristic is False
+    """
+    manager = get_model_manager()
+    if not manager.models:
+        if not allow_heuristic:
+            raise RuntimeError("No ML models loaded - refusing to overwrite scores with the "
+                               "heuristic fallback (pass --allow-heuristic to do so)")
+        print("⚠️  No ML models loaded - scores will come from the heuristic fallback")
+
+    conn = get_connection()
+    read_cursor = conn.cursor(dictionary=True)
+    write_cursor = conn.cursor()
+
+    stats = {'scored': 0, 'changed': 0, 'skipped_private': 0, 'elapsed_sec': 0.0}
+    seen = 0
+    started = time.time()
+    after_id = 0
+
+    try:
+        while True:
+            page_size = batch_size if not limit else min(batch_size, limit - seen)
+            if page_size <= 0:
+                break
+
+            events = fetch_page(read_cursor, after_id, since_days, page_size)
+            if not events:
+                break
+            after_id = events[-1]['id']
+            seen += len(events)
+
+            # Live ingest never ML-scores private IPs; leave their rows untouched
+            public = [e for e in events if not is_private_ip(e.get('source_ip_text'))]
+            stats['skipped_private'] += len(events) - len(public)
+            events = public
+            if not events:
+                continue
+
+            predictions = manager.predict_batch(events, log_predictions=False)
+
+            updates = [
+                (p['risk_score'], p['threat_type'], p['confidence'], p['is_anomaly'], e['id'])
+                for e, p in zip(events, predictions)
+                if 'error' not in p
+            ]
+            if updates and not dry_run:
+                write_cursor.executemany("""
+                    UPDATE auth_events
+                    SET ml_risk_score = %s,
+                        ml_threat_type = %s,
+                        ml_confidence = %s,
+                        is_anomaly = %s
+                    WHERE id = %s
+                """, updates)
+                stats['changed'] += write_cursor.rowcount
+                conn.commit()
+
+            stats['scored'] += len(events)
+            rate = stats['scored'] / max(time.time() - started, 1e-6)
+            print(f"  ✓ Scored {stats['scored']:,} events (up to id {after_id}, {rate:,.0f}/s)")
+
+    except Exception:
+        conn.rollback()
+        raise
+
+    finally:
+        read_cursor.close()
+        write_cursor.close()
+        conn.close()
+
+    stats['elapsed_sec'] = round(time.time() - started, 2)
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SSH Guardian Historical Event Re-scoring")
+    parser.add_argument("--since-days", type=int, default=0, help="Only events from the last N days (default: all)")
+    parser.add_argument("--batch-size", type=int, default=2000, help="Events per ensemble pass (default: 2000)")
+    parser.add_argument("--limit", type=int, default=0, help="Stop after N events (default: no limit)")
+    parser.add_argument("--dry-run", action="store_true", help="Score without updating auth_events")
+    parser.add_argument("--allow-heuristic", action="store_true",
+                        help="Re-score even when no ML model is loaded (heuristic fallback scores)")
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("SSH Guardian v3.0 - Re-score Events")
+    print("=" * 60)
+
+    try:
+        result = rescore_events(
+            since_days=args.since_days,
+            batch_size=args.batch_size,
+            limit=args.limit,
+            dry_run=args.dry_run,
+            allow_heuristic=args.allow_heuristic
+        )
+    except RuntimeError as e:
+        print(f"\n❌ {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("\n\n❌ Operation cancelled by user")
+        sys.exit(1)
+
+    print(f"\n✅ Scored {result['scored']:,} events in {result['elapsed_sec']}s"
+          f" ({result['changed']:,} rows updated{', dry run' if args.dry_run else ''},"
+          f" {result['skipped_private']:,} private-IP events skipped)")
@@ -13,6 +13,7 @@ sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from connection import get_connection
 from blocking_engine import BlockingEngine, block_ip_manual, unblock_ip
+from attack_counters import record_auth_events
 
 
 def test_create_brute_force_rule():
@@ -143,6 +144,7 @@ def test_simulate_brute_force():
 
     try:
         # Create 6 failed login attempts
+        counted = []
         for i in range(6):
             cursor.execute("""
                 INSERT INTO auth_events (
@@ -160,8 +162,13 @@ def test_simulate_brute_force():
                     INET6_ATON(%s), %s, 'test-server', 'root', 'password'
                 )
             """, (test_ip, test_ip))
+            counted.append({
+                'ip_address': test_ip, 'username': 'root', 'event_type': 'failed',
+                'timestamp': None, 'event_id': cursor.lastrowid
+            })
 
         conn.commit()
+        record_auth_events(counted)
         print(f"✅ Created 6 failed login events for {test_ip}")
 
         return test_ip
@@ -3,6 +3,10 @@ Test Threat Intelligence Integration
 """
 
 import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
 # Add project paths
@@ -125,6 +129,88 @@ def show_threat_stats():
     print("\n" + "="*70 + "\n")
 
 
+# Canned provider responses for --local-stubs
+STUB_RESPONSES = {
+    'abuseipdb': {'data': {'abuseConfidenceScore': 87, 'totalReports': 42, 'reports': []}},
+    'virustotal': {'data': {'attributes': {'last_analysis_stats': {'malicious': 5, 'harmless': 60, 'undetected': 20}}}},
+    'shodan': {'ports': [22, 80], 'vulns': [], 'tags': ['scanner'], 'org': 'Stub Hosting'},
+    'greynoise': {'noise': True, 'riot': False, 'classification': 'malicious'},
+}
+
+
+def start_local_stubs(delays):
+    """
+    Serve the four provider APIs from a local threaded HTTP server.
+
+    Args:
+        delays (dict): provider -> seconds to sleep before answering
+
+    Returns:
+        ThreadingHTTPServer: running server (call shutdown() when done)
+    """
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            provider = self.path.strip('/').split('/')[0].split('?')[0]
+            if provider not in STUB_RESPONSES:
+                self.send_response(404)
+                self.end_headers()
+                return
+            time.sleep(delays.get(provider, 0))
+            body = json.dumps(STUB_RESPONSES[provider]).encode()
+            try:
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Client gave up at its deadline
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    ThreatIntelligence.ABUSEIPDB_URL = f"{base}/abuseipdb"
+    ThreatIntelligence.VIRUSTOTAL_URL = f"{base}/virustotal/{{ip}}"
+    ThreatIntelligence.SHODAN_URL = f"{base}/shodan/{{ip}}"
+    ThreatIntelligence.GREYNOISE_COMMUNITY_URL = f"{base}/greynoise/{{ip}}"
+    ThreatIntelligence.GREYNOISE_ENTERPRISE_URL = f"{base}/greynoise/{{ip}}"
+    ThreatIntelligence.ABUSEIPDB_API_KEY = 'stub'
+    ThreatIntelligence.VIRUSTOTAL_API_KEY = 'stub'
+    ThreatIntelligence.SHODAN_API_KEY = 'stub'
+
+    print(f"🧪 Local provider stubs on {base} (delays: {delays})")
+    return server
+
+
+def test_concurrent_fanout(ips, deadline):
+    """Time the concurrent provider fan-out (no database needed)"""
+    print("\n" + "="*70)
+    print(f"TEST: Concurrent Fan-out (deadline {deadline:.1f}s)")
+    print("="*70)
+
+    for ip in ips:
+        started = time.perf_counter()
+        results = ThreatIntelligence.fetch_providers(ip, deadline)
+        elapsed = time.perf_counter() - started
+
+        answered = [name for name in STUB_RESPONSES if results.get(name)]
+        print(f"\n   {ip:<15} {elapsed:>6.2f}s  answered: {', '.join(answered) or '-'}")
+        if results['timed_out']:
+            print(f"   {'':<15} timed out:    {', '.join(results['timed_out'])}")
+        if results['rate_limited']:
+            print(f"   {'':<15} rate limited: {', '.join(results['rate_limited'])}")
+
+    print(f"\n📊 Rate limiters:")
+    for name, stats in ThreatIntelligence.get_rate_limit_stats().items():
+        print(f"   {name:<11} available {stats['available']:>6} | acquired {stats['acquired']:>3} | "
+              f"rejected {stats['rejected']:>3}")
+
+
 def main():
     """Run all tests"""
     print("\n" + "="*70)
@@ -142,4 +228,30 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SSH Guardian Threat Intelligence Tests")
+    parser.add_argument("--local-stubs", action="store_true",
+                        help="Serve provider APIs locally instead of calling the real services")
+    parser.add_argument("--stub-delays", type=str, default="abuseipdb=0.3,virustotal=0.5,shodan=0.2,greynoise=12",
+                        help="Per-provider stub latency, e.g. 'shodan=2,greynoise=12'")
+    parser.add_argument("--deadline", type=float, default=ThreatIntelligence.LOOKUP_DEADLINE_SEC,
+                        help="Fan-out deadline in seconds")
+    parser.add_argument("--ips", type=str, default="203.0.113.10,198.51.100.7,192.0.2.44",
+                        help="Comma-separated IPs for the stub run")
+
+    args = parser.parse_args()
+
+    if args.local_stubs:
+        delays = {}
+        for item in args.stub_delays.split(','):
+            if '=' in item:
+                name, seconds = item.split('=', 1)
+                delays[name.strip()] = float(seconds)
+        server = start_local_stubs(delays)
+        try:
+            test_concurrent_fanout([ip.strip() for ip in args.ips.split(',') if ip.strip()], args.deadline)
+        finally:
+            server.shutdown()
+    else:
+        main()
@@ -7,7 +7,8 @@ for academic justification of algorithm selection.
 
 Features:
 - Loads data from ml_training_data and ml_testing_data tables
-- Extracts 50 features using FeatureExtractor
+- Extracts 50 features using FeatureExtractor (cached in the ML feature
+  store and reused while the tables are unchanged)
 - Trains 3 models with identical data splits
 - Computes 8+ metrics including confusion matrices
 - Saves all results to ml_comparison_results table
@@ -20,6 +21,8 @@ import os
 import sys
 import json
 import uuid
+import hashlib
+import inspect
 import time
 import logging
 import pickle
@@ -36,6 +39,9 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import mysql.connector
 from mysql.connector import pooling
 
+from src.ml.feature_store import FeatureStore
+from src.ml.data_loader import iter_streamed_chunks, prefetched
+
 # ML Libraries
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import StandardScaler
@@ -354,6 +360,7 @@ class ModelTrainer:
         self.db_pool = None
         self.scaler = StandardScaler()
         self.feature_extractor = FeatureExtractorSimple()
+        self.feature_store = FeatureStore()
         self.results = {}
         self.run_id = None
 
@@ -370,106 +377,107 @@ class ModelTrainer:
         """Get a connection from the pool."""
         return self.db_pool.get_connection()
 
-    def load_training_data(self) -> Tuple[np.ndarray, np.ndarray]:
-        """Load and extract features from training data."""
-        logger.info("Loading training data...")
-
+    def _table_fingerprint(self, table: str) -> Dict:
+        """Cheap identity of a training table's contents plus the extractor code."""
         conn = self.get_connection()
         cursor = conn.cursor(dictionary=True)
 
         try:
-            cursor.execute("SELECT COUNT(*) as cnt FROM ml_training_data")
-            total = cursor.fetchone()['cnt']
-            logger.info(f"Total training events: {total:,}")
-
-            features_list = []
-            labels_list = []
-            offset = 0
-
-            while offset < total:
-                cursor.execute(f"""
-                    SELECT * FROM ml_training_data
-                    LIMIT {BATCH_SIZE} OFFSET {offset}
-                """)
-
-                batch = cursor.fetchall()
-                for event in batch:
-                    features = self.feature_extractor.extract_features(event)
-                    features_list.append(features)
-                    labels_list.append(event['is_malicious'])
-
-                offset += BATCH_SIZE
-                logger.info(f"  Loaded {min(offset, total):,}/{total:,} ({min(offset, total)/total*100:.1f}%)")
-
-            X = np.array(features_list, dtype=np.float32)
-            y = np.array(labels_list, dtype=np.int32)
-
-            # Add 3% label noise for realistic training results
-            # This simulates real-world labeling uncertainty
-            noise_rate = 0.03
-            n_noisy = int(len(y) * noise_rate)
-            noise_indices = np.random.choice(len(y), n_noisy, replace=False)
-            y[noise_indices] = 1 - y[noise_indices]  # Flip labels
-            logger.info(f"Added {noise_rate*100:.0f}% label noise: {n_noisy:,} labels flipped")
-
-            logger.info(f"Training data shape: {X.shape}")
-            logger.info(f"Label distribution: 0={np.sum(y==0):,}, 1={np.sum(y==1):,}")
-
-            return X, y
-
+            cursor.execute(f"""
+                SELECT COUNT(*) as cnt, MIN(timestamp) as first_ts,
+                       MAX(timestamp) as last_ts, MAX(event_uuid) as max_uuid
+                FROM {table}
+            """)
+            fingerprint = cursor.fetchone()
         finally:
             cursor.close()
             conn.close()
 
-    def load_testing_data(self) -> Tuple[np.ndarray, np.ndarray]:
-        """Load and extract features from testing data."""
-        logger.info("Loading testing data...")
+        extractor = hashlib.sha1(inspect.getsource(FeatureExtractorSimple).encode())
+        extractor.update(json.dumps([FEATURE_NAMES, sorted(HIGH_RISK_COUNTRIES),
+                                     sorted(ADMIN_USERNAMES), sorted(SYSTEM_ACCOUNTS)]).encode())
+        fingerprint['extractor'] = extractor.hexdigest()
+        return fingerprint
 
+    def _extract_table(self, table: str) -> Dict[str, np.ndarray]:
+        """Extract features and labels for every row of a training table."""
         conn = self.get_connection()
         cursor = conn.cursor(dictionary=True)
 
         try:
-            cursor.execute("SELECT COUNT(*) as cnt FROM ml_testing_data")
+            cursor.execute(f"SELECT COUNT(*) as cnt FROM {table}")
             total = cursor.fetchone()['cnt']
-            logger.info(f"Total testing events: {total:,}")
+            logger.info(f"Total events in {table}: {total:,}")
+        finally:
+            cursor.close()
+            conn.close()
 
-            features_list = []
-            labels_list = []
-            offset = 0
+        features_list = []
+        labels_list = []
+        loaded = 0
+
+        # One server-side cursor over the table; the next batch is read on a
+        # background thread while this one is featurized
+        batches = iter_streamed_chunks(f"SELECT * FROM {table}", chunk_size=BATCH_SIZE,
+                                       connect=self.get_connection)
+        for batch in prefetched(batches):
+            for event in batch:
+                features = self.feature_extractor.extract_features(event)
+                features_list.append(features)
+                labels_list.append(event['is_malicious'])
+
+            loaded += len(batch)
+            logger.info(f"  Loaded {loaded:,}/{total:,} ({loaded/max(total, 1)*100:.1f}%)")
+
+        return {
+            'X': np.array(features_list, dtype=np.float32).reshape(-1, len(FEATURE_NAMES)),
+            'y': np.array(labels_list, dtype=np.int32)
+        }
 
-            while offset < total:
-                cursor.execute(f"""
-                    SELECT * FROM ml_testing_data
-                    LIMIT {BATCH_SIZE} OFFSET {offset}
-                """)
+    def _load_table(self, table: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Features/labels for a table, from the feature store when unchanged."""
+        arrays = self.feature_store.cached_arrays(
+            table, self._table_fingerprint(table), lambda: self._extract_table(table))
+        logger.info(f"{table}: {len(arrays['y']):,} events (feature store: {self.feature_store.root})")
+        # The label noise below flips labels in place, so take a writable copy
+        return arrays['X'], np.array(arrays['y'])
 
-                batch = cursor.fetchall()
-                for event in batch:
-                    features = self.feature_extractor.extract_features(event)
-                    features_list.append(features)
-                    labels_list.append(event['is_malicious'])
+    def load_training_data(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Load and extract features from training data."""
+        logger.info("Loading training data...")
 
-                offset += BATCH_SIZE
-                logger.info(f"  Loaded {min(offset, total):,}/{total:,} ({min(offset, total)/total*100:.1f}%)")
+        X, y = self._load_table('ml_training_data')
 
-            X = np.array(features_list, dtype=np.float32)
-            y = np.array(labels_list, dtype=np.int32)
+        # Add 3% label noise for realistic training results
+        # This simulates real-world labeling uncertainty
+        noise_rate = 0.03
+        n_noisy = int(len(y) * noise_rate)
+        noise_indices = np.random.choice(len(y), n_noisy, replace=False)
+        y[noise_indices] = 1 - y[noise_indices]  # Flip labels
+        logger.info(f"Added {noise_rate*100:.0f}% label noise: {n_noisy:,} labels flipped")
 
-            # Add 3% label noise to test data for realistic results
-            noise_rate = 0.03
-            n_noisy = int(len(y) * noise_rate)
-            noise_indices = np.random.choice(len(y), n_noisy, replace=False)
-            y[noise_indices] = 1 - y[noise_indices]  # Flip labels
-            logger.info(f"Added {noise_rate*100:.0f}% label noise to test data: {n_noisy:,} labels flipped")
+        logger.info(f"Training data shape: {X.shape}")
+        logger.info(f"Label distribution: 0={np.sum(y==0):,}, 1={np.sum(y==1):,}")
 
-            logger.info(f"Testing data shape: {X.shape}")
-            logger.info(f"Label distribution: 0={np.sum(y==0):,}, 1={np.sum(y==1):,}")
+        return X, y
 
-            return X, y
+    def load_testing_data(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Load and extract features from testing data."""
+        logger.info("Loading testing data...")
 
-        finally:
-            cursor.close()
-            conn.close()
+        X, y = self._load_table('ml_testing_data')
+
+        # Add 3% label noise to test data for realistic results
+        noise_rate = 0.03
+        n_noisy = int(len(y) * noise_rate)
+        noise_indices = np.random.choice(len(y), n_noisy, replace=False)
+        y[noise_indices] = 1 - y[noise_indices]  # Flip labels
+        logger.info(f"Added {noise_rate*100:.0f}% label noise to test data: {n_noisy:,} labels flipped")
+
+        logger.info(f"Testing data shape: {X.shape}")
+        logger.info(f"Label distribution: 0={np.sum(y==0):,}, 1={np.sum(y==1):,}")
+
+        return X, y
 
     def train_model(self, name: str, X_train: np.ndarray, y_train: np.ndarray,
                     X_test: np.ndarray, y_test: np.ndarray) -> Dict:
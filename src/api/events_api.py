@@ -20,6 +20,7 @@ from connection import get_connection, ip_to_binary
 sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 from geoip import enrich_event
 from threat_intel import check_ip_threat
+from attack_counters import record_auth_events
 
 # Import unified ThreatEvaluator
 from threat_evaluator import evaluate_ip_threat
@@ -181,6 +182,12 @@ def submit_event():
             event_id = cursor.lastrowid
             conn.commit()
 
+            record_auth_events([{
+                'ip_address': source_ip, 'username': username,
+                'event_type': 'successful' if status == 'success' else status,
+                'timestamp': event_timestamp, 'event_id': event_id
+            }])
+
             # Log successful submission
             print(f"✅ Event received: {event_uuid} from agent {request.agent['display_name']}")
             print(f"   IP: {source_ip}, User: {username}, Status: {status}")
@@ -0,0 +1,536 @@
+"""
+SSH Guardian v3.0 - Attack Counters
+Sliding-window attempt counters per IP, username and (IP, username)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+# Backend: 'memory' (per process) or 'redis' (shared by every process).
+# Use redis when several web workers ingest events or when the enrichment
+# worker evaluates events that another process stored.
+ATTACK_COUNTERS_ENABLED = os.getenv('ATTACK_COUNTERS_ENABLED', '1') == '1'
+ATTACK_COUNTERS_BACKEND = os.getenv('ATTACK_COUNTERS_BACKEND', 'memory').lower()
+ATTACK_COUNTERS_BUCKET_SEC = int(os.getenv('ATTACK_COUNTERS_BUCKET_SEC', 10))
+ATTACK_COUNTERS_HORIZON_MIN = int(os.getenv('ATTACK_COUNTERS_HORIZON_MIN', 60))
+ATTACK_COUNTERS_MAX_KEYS = int(os.getenv('ATTACK_COUNTERS_MAX_KEYS', 200000))
+
+# auth_events.event_type values; anything else only counts towards totals
+EVENT_TYPES = ('failed', 'successful', 'invalid')
+_TYPE_INDEX = {event_type: i for i, event_type in enumerate(EVENT_TYPES)}
+_OTHER = len(EVENT_TYPES)
+
+SCOPE_IP = 'ip'
+SCOPE_USER = 'user'
+SCOPE_IP_USER = 'ip_user'
+
+
+def _to_epoch(timestamp) -> float:
+    """Event timestamp (datetime, epoch or None) as epoch seconds"""
+    if timestamp is None:
+        return time.time()
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    return float(timestamp)
+
+
+def _scope_key(scope: str, ip_address: Optional[str], username: Optional[str]) -> Optional[str]:
+    """Counter key for a scope, or None if the event lacks the field"""
+    if scope == SCOPE_IP:
+        return ip_address or None
+    if scope == SCOPE_USER:
+        return username or None
+    if ip_address and username:
+        return f"{ip_address}|{username}"
+    return None
+
+
+class _Window:
+    """Time-bucketed counts for one key (bucket index -> per-type counts)"""
+
+    __slots__ = ('buckets', 'latest_ids', 'users', 'last_ts')
+
+    def __init__(self, track_users: bool):
+        self.buckets: Dict[int, list] = {}
+        self.latest_ids: Dict[int, int] = {}
+        # username -> last seen epoch, per type index (IP scope only)
+        self.users: Optional[Dict[int, Dict[str, float]]] = {} if track_users else None
+        self.last_ts = 0.0
+
+
+class AttackCounters:
+    """
+    In-process sliding-window counters.
+
+    Each key keeps one small count vector per time bucket
+    (ATTACK_COUNTERS_BUCKET_SEC wide) for the last ATTACK_COUNTERS_HORIZON_MIN
+    minutes, so "failures from this IP in N minutes" is a sum over at most
+    horizon/bucket entries instead of a COUNT(*) over auth_events. Window
+    edges are bucket-aligned: a count may include up to one bucket of
+    events just older than the window.
+
+    Queries return None when the counters cannot answer exactly (window
+    longer than the horizon, or reaching back before this process started
+    recording) and callers fall back to SQL. An event older than the
+    horizon is stored but can't be counted (backfills, replayed or
+    delayed logs), so it restarts the recording period: windows reaching
+    back before it was seen use SQL.
+    """
+
+    SWEEP_INTERVAL_SEC = 60
+
+    def __init__(self, bucket_sec: int = ATTACK_COUNTERS_BUCKET_SEC,
+                 horizon_min: int = ATTACK_COUNTERS_HORIZON_MIN,
+                 max_keys: int = ATTACK_COUNTERS_MAX_KEYS):
+        """
+        Initialize empty counters.
+
+        Args:
+            bucket_sec: Bucket width in seconds
+            horizon_min: How far back counts are kept
+            max_keys: Per-scope key cap (least recently updated keys go first)
+        """
+        self.bucket_sec = max(1, int(bucket_sec))
+        self.horizon_sec = max(1, int(horizon_min)) * 60
+        self.max_keys = max_keys
+        self._windows = {scope: OrderedDict() for scope in (SCOPE_IP, SCOPE_USER, SCOPE_IP_USER)}
+        self._lock = threading.Lock()
+        self._since: Optional[float] = None
+        self._next_sweep = time.time() + self.SWEEP_INTERVAL_SEC
+        self.stats = {'recorded': 0, 'too_old': 0, 'hits': 0, 'misses': 0, 'evicted': 0}
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    def record(self, ip_address: str, username: Optional[str], event_type: str,
+               timestamp=None, event_id: Optional[int] = None):
+        """
+        Count one stored auth event.
+
+        Args:
+            ip_address: Source IP
+            username: Target username
+            event_type: 'failed', 'successful' or 'invalid'
+            timestamp: Event timestamp (datetime or epoch; default now)
+            event_id: auth_events.id (kept as the latest id per type)
+        """
+        self.record_many([{
+            'ip_address': ip_address, 'username': username, 'event_type': event_type,
+            'timestamp': timestamp, 'event_id': event_id
+        }])
+
+    def record_many(self, events: Iterable[Dict]):
+        """Count a batch of stored events (dicts with the record() fields)"""
+        now = time.time()
+        with self._lock:
+            if self._since is None:
+                self._since = now
+            for event in events:
+                ts = _to_epoch(event.get('timestamp'))
+                if ts < now - self.horizon_sec:
+                    # Not countable: events around it may be missing too
+                    self.stats['too_old'] += 1
+                    self._since = now
+                    continue
+                self._record_locked(event, ts)
+                self.stats['recorded'] += 1
+            if now >= self._next_sweep:
+                self._sweep_locked(now)
+
+    def _record_locked(self, event: Dict, ts: float):
+        ip_address = event.get('ip_address')
+        username = event.get('username')
+        type_index = _TYPE_INDEX.get(event.get('event_type'), _OTHER)
+        bucket = int(ts // self.bucket_sec)
+        oldest = bucket - self.horizon_sec // self.bucket_sec
+
+        for scope, windows in self._windows.items():
+            key = _scope_key(scope, ip_address, username)
+            if key is None:
+                continue
+
+            window = windows.get(key)
+            if window is None:
+                window = windows[key] = _Window(track_users=(scope == SCOPE_IP))
+                if len(windows) > self.max_keys:
+                    windows.popitem(last=False)
+                    self.stats['evicted'] += 1
+                    # The dropped key may still have events in the window
+                    self._since = time.time()
+            else:
+                windows.move_to_end(key)
+
+            counts = window.buckets.get(bucket)
+            if counts is None:
+                counts = window.buckets[bucket] = [0] * (len(EVENT_TYPES) + 1)
+                for stale in [b for b in window.buckets if b < oldest]:
+                    del window.buckets[stale]
+            counts[type_index] += 1
+
+            if event.get('event_id'):
+                window.latest_ids[type_index] = max(window.latest_ids.get(type_index, 0), event['event_id'])
+            if window.users is not None and username:
+                seen = window.users.setdefault(type_index, {})
+                seen[username] = max(seen.get(username, 0.0), ts)
+            window.last_ts = max(window.last_ts, ts)
+
+    def _sweep_locked(self, now: float):
+        """Drop keys with no events inside the horizon"""
+        cutoff = now - self.horizon_sec
+        for windows in self._windows.values():
+            for key in [k for k, w in windows.items() if w.last_ts < cutoff]:
+                del windows[key]
+                self.stats['evicted'] += 1
+            for window in windows.values():
+                if window.users:
+                    for seen in window.users.values():
+                        for username in [u for u, ts in seen.items() if ts < cutoff]:
+                            del seen[username]
+        self._next_sweep = now + self.SWEEP_INTERVAL_SEC
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def _covers(self, cutoff: float, since: Optional[float], now: float) -> bool:
+        """True if every event newer than `cutoff` was recorded"""
+        return since is not None and since <= cutoff and cutoff >= now - self.horizon_sec
+
+    def _hit(self, value):
+        self.stats['hits' if value is not None else 'misses'] += 1
+        return value
+
+    def count(self, scope: str, key: str, seconds: int,
+              event_type: Optional[str] = None) -> Optional[int]:
+        """
+        Events for a key in the last `seconds`.
+
+        Args:
+            scope: SCOPE_IP, SCOPE_USER or SCOPE_IP_USER
+            key: IP, username or "ip|username"
+            seconds: Window length
+            event_type: Only count this type (None counts all)
+
+        Returns:
+            Count, or None if the window is not covered (use SQL)
+        """
+        now = time.time()
+        cutoff = now - seconds
+        with self._lock:
+            if not self._covers(cutoff, self._since, now):
+                return self._hit(None)
+            window = self._windows[scope].get(key)
+            if window is None:
+                return self._hit(0)
+            first = int(cutoff // self.bucket_sec)
+            if event_type is None:
+                total = sum(sum(c) for b, c in window.buckets.items() if b >= first)
+            else:
+                index = _TYPE_INDEX.get(event_type, _OTHER)
+                total = sum(c[index] for b, c in window.buckets.items() if b >= first)
+            return self._hit(total)
+
+    def count_ip(self, ip_address: str, seconds: int, event_type: Optional[str] = None) -> Optional[int]:
+        """Events from an IP in the last `seconds` (None = use SQL)"""
+        return self.count(SCOPE_IP, ip_address, seconds, event_type)
+
+    def count_user(self, username: str, seconds: int, event_type: Optional[str] = None) -> Optional[int]:
+        """Events against a username in the last `seconds` (None = use SQL)"""
+        return self.count(SCOPE_USER, username, seconds, event_type)
+
+    def count_ip_user(self, ip_address: str, username: str, seconds: int,
+                      event_type: Optional[str] = None) -> Optional[int]:
+        """Events from an IP against one username in the last `seconds` (None = use SQL)"""
+        return self.count(SCOPE_IP_USER, f"{ip_address}|{username}", seconds, event_type)
+
+    def distinct_usernames(self, ip_address: str, seconds: int, event_type: Optional[str] = None,
+                           relative_to_latest: bool = False) -> Optional[int]:
+        """
+        Distinct usernames tried by an IP in a window.
+
+        Args:
+            ip_address: Source IP
+            seconds: Window length
+            event_type: Only consider this type (None considers all)
+            relative_to_latest: End the window at the IP's latest event
+                                instead of now (for delayed/simulated logs)
+
+        Returns:
+            Count, or None if the window is not covered (use SQL)
+        """
+        with self._lock:
+            now = time.time()
+            window = self._windows[SCOPE_IP].get(ip_address)
+            end = window.last_ts if (relative_to_latest and window) else now
+            cutoff = end - seconds
+            if not self._covers(cutoff, self._since, now):
+                return self._hit(None)
+            if window is None:
+                return self._hit(0)
+            if event_type is None:
+                users = set()
+                for seen in window.users.values():
+                    users.update(u for u, ts in seen.items() if ts >= cutoff)
+                return self._hit(len(users))
+            seen = window.users.get(_TYPE_INDEX.get(event_type, _OTHER), {})
+            return self._hit(sum(1 for ts in seen.values() if ts >= cutoff))
+
+    def latest_event_id(self, ip_address: str, event_type: Optional[str] = None) -> Optional[int]:
+        """Highest recorded auth_events.id from an IP (optionally of one type)"""
+        with self._lock:
+            window = self._windows[SCOPE_IP].get(ip_address)
+            if window is None or not window.latest_ids:
+                return None
+            if event_type is None:
+                return max(window.latest_ids.values())
+            return window.latest_ids.get(_TYPE_INDEX.get(event_type, _OTHER))
+
+    def get_stats(self) -> Dict:
+        """Counter statistics"""
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'bucket_sec': self.bucket_sec,
+                'horizon_min': self.horizon_sec // 60,
+                'recording_since': datetime.fromtimestamp(self._since).isoformat() if self._since else None,
+                'keys': {scope: len(windows) for scope, windows in self._windows.items()},
+                **self.stats
+            }
+
+
+class RedisAttackCounters(AttackCounters):
+    """
+    Attack counters stored in Redis and shared by every process.
+
+    Per key a hash holds "<bucket>:<type>" counts, the latest event id per
+    type and the latest timestamp; per IP a sorted set per type maps
+    username -> last seen time for distinct-username queries. Keys expire
+    after the horizon. If Redis is unreachable the in-process counters are
+    used, and after Redis comes back windows reaching into the outage fall
+    back to SQL.
+    """
+
+    PREFIX = 'ssh_guardian:attack_counters'
+    REDIS_RETRY_SEC = 30
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._client = None
+        self._redis_retry_at = 0.0
+        self._redis_failed = False
+        self.stats['fallback'] = 0
+
+    def _get_client(self):
+        """Redis client, or None while Redis is unavailable"""
+        if self._client is not None:
+            return self._client
+        if time.monotonic() < self._redis_retry_at:
+            return None
+
+        try:
+            from cache import get_redis_client
+            client = get_redis_client()
+        except Exception:
+            client = None
+
+        if client is None:
+            self._redis_retry_at = time.monotonic() + self.REDIS_RETRY_SEC
+            return None
+
+        self._client = client
+        if self._redis_failed:
+            # Events recorded in-process during the outage are not in Redis
+            client.set(f"{self.PREFIX}:since", time.time())
+            self._redis_failed = False
+        return client
+
+    def _redis_error(self, error: Exception):
+        print(f"⚠️  Attack counters using in-process fallback: {error}")
+        self._client = None
+        self._redis_failed = True
+        self._redis_retry_at = time.monotonic() + self.REDIS_RETRY_SEC
+
+    def _count_key(self, scope: str, key: str) -> str:
+        return f"{self.PREFIX}:c:{scope}:{key}"
+
+    def _users_key(self, ip_address: str, type_name: str) -> str:
+        return f"{self.PREFIX}:u:{ip_address}:{type_name}"
+
+    def _get_since(self, client) -> Optional[float]:
+        since = client.get(f"{self.PREFIX}:since")
+        return float(since) if since is not None else None
+
+    def record_many(self, events: Iterable[Dict]):
+        client = self._get_client()
+        if client is None:
+            self.stats['fallback'] += 1
+            return super().record_many(events)
+
+        events = list(events)
+        now = time.time()
+        ttl = self.horizon_sec + self.bucket_sec
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.set(f"{self.PREFIX}:since", now, nx=True)
+            for event in events:
+                ts = _to_epoch(event.get('timestamp'))
+                if ts < now - self.horizon_sec:
+                    # Restart the shared recording period (see AttackCounters)
+                    self.stats['too_old'] += 1
+                    pipe.set(f"{self.PREFIX}:since", now)
+                    continue
+                ip_address = event.get('ip_address')
+                username = event.get('username')
+                event_type = event.get('event_type')
+                type_name = event_type if event_type in _TYPE_INDEX else 'other'
+                bucket = int(ts // self.bucket_sec)
+
+                for scope in (SCOPE_IP, SCOPE_USER, SCOPE_IP_USER):
+                    key = _scope_key(scope, ip_address, username)
+                    if key is None:
+                        continue
+                    count_key = self._count_key(scope, key)
+                    pipe.hincrby(count_key, f"{bucket}:{type_name}", 1)
+                    if event.get('event_id'):
+                        pipe.hset(count_key, f"id:{type_name}", event['event_id'])
+                    pipe.hset(count_key, 'last_ts', ts)
+                    pipe.expire(count_key, ttl)
+
+                if ip_address and username:
+                    for users_type in (type_name, 'all'):
+                        users_key = self._users_key(ip_address, users_type)
+                        pipe.zadd(users_key, {username: ts})
+                        pipe.zremrangebyscore(users_key, '-inf', now - self.horizon_sec)
+                        pipe.expire(users_key, ttl)
+                self.stats['recorded'] += 1
+            pipe.execute()
+        except Exception as e:
+            self._redis_error(e)
+            super().record_many(events)
+
+    def count(self, scope: str, key: str, seconds: int,
+              event_type: Optional[str] = None) -> Optional[int]:
+        client = self._get_client()
+        if client is None:
+            return super().count(scope, key, seconds, event_type)
+
+        now = time.time()
+        cutoff = now - seconds
+        try:
+            if not self._covers(cutoff, self._get_since(client), now):
+                return self._hit(None)
+            fields = client.hgetall(self._count_key(scope, key))
+        except Exception as e:
+            self._redis_error(e)
+            return self._hit(None)
+
+        first = int(cutoff // self.bucket_sec)
+        type_name = None if event_type is None else (event_type if event_type in _TYPE_INDEX else 'other')
+        total = 0
+        for field, value in fields.items():
+            field = field.decode() if isinstance(field, bytes) else field
+            bucket, _, field_type = field.partition(':')
+            if not bucket.isdigit() or int(bucket) < first:
+                continue
+            if type_name is None or field_type == type_name:
+                total += int(value)
+        return self._hit(total)
+
+    def distinct_usernames(self, ip_address: str, seconds: int, event_type: Optional[str] = None,
+                           relative_to_latest: bool = False) -> Optional[int]:
+        client = self._get_client()
+        if client is None:
+            return super().distinct_usernames(ip_address, seconds, event_type, relative_to_latest)
+
+        try:
+            now = end = time.time()
+            if relative_to_latest:
+                last_ts = client.hget(self._count_key(SCOPE_IP, ip_address), 'last_ts')
+                if last_ts is not None:
+                    end = float(last_ts)
+            cutoff = end - seconds
+            if not self._covers(cutoff, self._get_since(client), now):
+                return self._hit(None)
+            type_name = 'all' if event_type is None else (event_type if event_type in _TYPE_INDEX else 'other')
+            return self._hit(int(client.zcount(self._users_key(ip_address, type_name), cutoff, '+inf')))
+        except Exception as e:
+            self._redis_error(e)
+            return self._hit(None)
+
+    def latest_event_id(self, ip_address: str, event_type: Optional[str] = None) -> Optional[int]:
+        client = self._get_client()
+        if client is None:
+            return super().latest_event_id(ip_address, event_type)
+
+        try:
+            fields = client.hgetall(self._count_key(SCOPE_IP, ip_address))
+        except Exception as e:
+            self._redis_error(e)
+            return None
+
+        ids = {}
+        for field, value in fields.items():
+            field = field.decode() if isinstance(field, bytes) else field
+            if field.startswith('id:'):
+                ids[field[3:]] = int(value)
+        if not ids:
+            return None
+        if event_type is None:
+            return max(ids.values())
+        return ids.get(event_type if event_type in _TYPE_INDEX else 'other')
+
+    def get_stats(self) -> Dict:
+        stats = super().get_stats()
+        stats['backend'] = 'redis' if self._client is not None else 'memory (redis fallback)'
+        return stats
+
+
+class _DisabledCounters(AttackCounters):
+    """Counters switched off: nothing is recorded and every query uses SQL"""
+
+    def record_many(self, events: Iterable[Dict]):
+        pass
+
+    def get_stats(self) -> Dict:
+        stats = super().get_stats()
+        stats['backend'] = 'disabled'
+        return stats
+
+
+# Singleton instance
+_counters = None
+_counters_lock = threading.Lock()
+
+
+def get_attack_counters() -> AttackCounters:
+    """Get the process-wide attack counters (backend from ATTACK_COUNTERS_BACKEND)"""
+    global _counters
+    if _counters is None:
+        with _counters_lock:
+            if _counters is None:
+                if not ATTACK_COUNTERS_ENABLED:
+                    _counters = _DisabledCounters()
+                elif ATTACK_COUNTERS_BACKEND == 'redis':
+                    _counters = RedisAttackCounters()
+                else:
+                    _counters = AttackCounters()
+    return _counters
+
+
+def record_auth_events(events: Iterable[Dict]):
+    """
+    Count freshly stored auth events. Never raises - counting must not
+    fail ingestion.
+
+    Args:
+        events: Dicts with ip_address, username, event_type, timestamp, event_id
+    """
+    try:
+        get_attack_counters().record_many(events)
+    except Exception as e:
+        print(f"⚠️  Attack counter update failed: {e}")
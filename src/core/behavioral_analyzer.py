@@ -21,6 +21,7 @@ sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from connection import get_connection
 from geoip import haversine_distance  # Shared utility
+from attack_counters import get_attack_counters
 
 
 class BehavioralAnalyzer:
@@ -533,15 +534,20 @@ class BehavioralAnalyzer:
         }
 
         # Check attempts in last 5 minutes
-        cursor.execute("""
-            SELECT COUNT(*) as attempts,
-                   SUM(event_type = 'failed') as failed
-            FROM auth_events
-            WHERE source_ip_text = %s
-            AND timestamp >= DATE_SUB(NOW(), INTERVAL 5 MINUTE)
-        """, (ip_address,))
-
-        recent = cursor.fetchone()
+        counters = get_attack_counters()
+        attempts = counters.count_ip(ip_address, 5 * 60)
+        if attempts is not None:
+            recent = {'attempts': attempts, 'failed': counters.count_ip(ip_address, 5 * 60, 'failed')}
+        else:
+            cursor.execute("""
+                SELECT COUNT(*) as attempts,
+                       SUM(event_type = 'failed') as failed
+                FROM auth_events
+                WHERE source_ip_text = %s
+                AND timestamp >= DATE_SUB(NOW(), INTERVAL 5 MINUTE)
+            """, (ip_address,))
+
+            recent = cursor.fetchone()
 
         if recent['attempts'] >= 10:
             result['detected'] = True
@@ -583,17 +589,26 @@ class BehavioralAnalyzer:
         }
 
         # Check last hour
-        cursor.execute("""
-            SELECT
-                COUNT(DISTINCT target_username) as unique_users,
-                COUNT(*) as total_attempts,
-                SUM(event_type = 'successful') as successes
-            FROM auth_events
-            WHERE source_ip_text = %s
-            AND timestamp >= DATE_SUB(NOW(), INTERVAL 1 HOUR)
-        """, (ip_address,))
-
-        stats = cursor.fetchone()
+        counters = get_attack_counters()
+        unique_users = counters.distinct_usernames(ip_address, 3600)
+        if unique_users is not None:
+            stats = {
+                'unique_users': unique_users,
+                'total_attempts': counters.count_ip(ip_address, 3600),
+                'successes': counters.count_ip(ip_address, 3600, 'successful')
+            }
+        else:
+            cursor.execute("""
+                SELECT
+                    COUNT(DISTINCT target_username) as unique_users,
+                    COUNT(*) as total_attempts,
+                    SUM(event_type = 'successful') as successes
+                FROM auth_events
+                WHERE source_ip_text = %s
+                AND timestamp >= DATE_SUB(NOW(), INTERVAL 1 HOUR)
+            """, (ip_address,))
+
+            stats = cursor.fetchone()
 
         unique_users = stats['unique_users'] or 0
         total = stats['total_attempts'] or 0
@@ -632,16 +647,18 @@ class BehavioralAnalyzer:
         }
 
         # Count recent failures before this success
-        cursor.execute("""
-            SELECT COUNT(*) as failed_attempts
-            FROM auth_events
-            WHERE source_ip_text = %s
-            AND target_username = %s
-            AND event_type = 'failed'
-            AND timestamp >= DATE_SUB(NOW(), INTERVAL 1 HOUR)
-        """, (ip_address, username))
-
-        failures = cursor.fetchone()['failed_attempts'] or 0
+        failures = get_attack_counters().count_ip_user(ip_address, username, 3600, 'failed')
+        if failures is None:
+            cursor.execute("""
+                SELECT COUNT(*) as failed_attempts
+                FROM auth_events
+                WHERE source_ip_text = %s
+                AND target_username = %s
+                AND event_type = 'failed'
+                AND timestamp >= DATE_SUB(NOW(), INTERVAL 1 HOUR)
+            """, (ip_address, username))
+
+            failures = cursor.fetchone()['failed_attempts'] or 0
 
         if failures >= 3:
             result['detected'] = True
@@ -9,11 +9,13 @@ from pathlib import Path
 # Add project paths
 PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
 sys.path.append(str(PROJECT_ROOT / "dbs"))
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
-from connection import get_connection
+from event_context import EventContext, ensure_context
+from attack_counters import get_attack_counters
 
 
-def evaluate_ml_threshold_rule(rule, ip_address, ml_result):
+def evaluate_ml_threshold_rule(rule, ip_address, ml_result, context=None):
     """Evaluate ML threshold rule against ML prediction result.
 
     Rule conditions: min_risk_score, min_confidence, threat_types, requires_approval, min_failed_attempts
@@ -34,26 +36,13 @@ def evaluate_ml_threshold_rule(rule, ip_address, ml_result):
 
         # Check minimum failed attempts requirement
         if min_failed_attempts > 1:
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-            try:
-                cursor.execute("""
-                    SELECT COUNT(*) as fail_count
-                    FROM auth_events
-                    WHERE source_ip_text = %s
-                    AND event_type = 'failed'
-                    AND timestamp >= NOW() - INTERVAL 24 HOUR
-                """, (ip_address,))
-                result = cursor.fetchone()
-                fail_count = result['fail_count'] or 0
+            with ensure_context(context, ip_address) as ctx:
+                fail_count = ctx.count_events(24 * 60, 'failed')
 
-                if fail_count < min_failed_attempts:
-                    return {'triggered': False,
-                            'reason': f"Only {fail_count}/{min_failed_attempts} failed attempts (minimum not met)",
-                            'requires_approval': False, 'risk_score': risk_score, 'confidence': confidence}
-            finally:
-                cursor.close()
-                conn.close()
+            if fail_count < min_failed_attempts:
+                return {'triggered': False,
+                        'reason': f"Only {fail_count}/{min_failed_attempts} failed attempts (minimum not met)",
+                        'requires_approval': False, 'risk_score': risk_score, 'confidence': confidence}
 
         if risk_score < min_risk_score:
             return {'triggered': False, 'reason': f"Risk score {risk_score} below threshold {min_risk_score}",
@@ -80,7 +69,7 @@ def evaluate_ml_threshold_rule(rule, ip_address, ml_result):
                 'risk_score': 0, 'confidence': 0.0}
 
 
-def evaluate_credential_stuffing_rule(rule, ip_address):
+def evaluate_credential_stuffing_rule(rule, ip_address, context=None):
     """Evaluate credential stuffing (same IP, many different usernames).
 
     Rule conditions:
@@ -104,19 +93,13 @@ def evaluate_credential_stuffing_rule(rule, ip_address):
         max_abuse_score = conditions.get('max_abuseipdb_score')
         check_off_hours = conditions.get('off_hours', False)
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
+        ctx = context or EventContext(ip_address)
+        cursor = ctx.cursor()
 
         try:
             # Check max_abuseipdb_score filter (for "clean IP only" rules)
             if max_abuse_score is not None:
-                cursor.execute("""
-                    SELECT abuseipdb_score FROM ip_threat_intelligence
-                    WHERE ip_address_text = %s
-                    ORDER BY last_seen DESC LIMIT 1
-                """, (ip_address,))
-                threat_row = cursor.fetchone()
-                ip_abuse_score = threat_row['abuseipdb_score'] if threat_row and threat_row['abuseipdb_score'] else 0
+                ip_abuse_score = ctx.get_abuseipdb_score()
 
                 if ip_abuse_score > max_abuse_score:
                     return {
@@ -133,36 +116,45 @@ def evaluate_credential_stuffing_rule(rule, ip_address):
                 # Off-hours = before 6 AM or after 10 PM (event timestamp, not current time)
                 off_hours_clause = "AND (HOUR(timestamp) < 6 OR HOUR(timestamp) >= 22)"
 
-            # Build query based on event_type filter
-            # Use the IP's most recent event timestamp as reference (not NOW())
-            # This handles: simulated events with past timestamps AND real delayed logs
-            if event_type_filter:
-                cursor.execute(f"""
-                    SELECT COUNT(DISTINCT target_username) as unique_count
-                    FROM auth_events
-                    WHERE source_ip_text = %s
-                    AND event_type = %s
-                    AND timestamp >= (
-                        SELECT MAX(timestamp) - INTERVAL %s MINUTE
-                        FROM auth_events WHERE source_ip_text = %s
-                    )
-                    {off_hours_clause}
-                """, (ip_address, event_type_filter, time_window, ip_address))
-            else:
-                # Count all events (both failed and successful)
-                cursor.execute(f"""
-                    SELECT COUNT(DISTINCT target_username) as unique_count
-                    FROM auth_events
-                    WHERE source_ip_text = %s
-                    AND timestamp >= (
-                        SELECT MAX(timestamp) - INTERVAL %s MINUTE
-                        FROM auth_events WHERE source_ip_text = %s
-                    )
-                    {off_hours_clause}
-                """, (ip_address, time_window, ip_address))
+            # Sliding-window counters answer the plain case; the off-hours
+            # filter needs per-event hours, so that case always uses SQL
+            unique_count = None
+            if not check_off_hours:
+                unique_count = get_attack_counters().distinct_usernames(
+                    ip_address, time_window * 60, event_type_filter, relative_to_latest=True
+                )
 
-            result = cursor.fetchone()
-            unique_count = result['unique_count'] or 0
+            if unique_count is None:
+                # Build query based on event_type filter
+                # Use the IP's most recent event timestamp as reference (not NOW())
+                # This handles: simulated events with past timestamps AND real delayed logs
+                if event_type_filter:
+                    cursor.execute(f"""
+                        SELECT COUNT(DISTINCT target_username) as unique_count
+                        FROM auth_events
+                        WHERE source_ip_text = %s
+                        AND event_type = %s
+                        AND timestamp >= (
+                            SELECT MAX(timestamp) - INTERVAL %s MINUTE
+                            FROM auth_events WHERE source_ip_text = %s
+                        )
+                        {off_hours_clause}
+                    """, (ip_address, event_type_filter, time_window, ip_address))
+                else:
+                    # Count all events (both failed and successful)
+                    cursor.execute(f"""
+                        SELECT COUNT(DISTINCT target_username) as unique_count
+                        FROM auth_events
+                        WHERE source_ip_text = %s
+                        AND timestamp >= (
+                            SELECT MAX(timestamp) - INTERVAL %s MINUTE
+                            FROM auth_events WHERE source_ip_text = %s
+                        )
+                        {off_hours_clause}
+                    """, (ip_address, time_window, ip_address))
+
+                result = cursor.fetchone()
+                unique_count = result['unique_count'] or 0
 
             if unique_count >= threshold:
                 event_desc = f" ({event_type_filter} only)" if event_type_filter else ""
@@ -185,7 +177,8 @@ def evaluate_credential_stuffing_rule(rule, ip_address):
 
         finally:
             cursor.close()
-            conn.close()
+            if context is None:
+                ctx.close()
 
     except Exception as e:
         print(f"Error evaluating credential stuffing rule: {e}")
@@ -236,7 +229,7 @@ def evaluate_anomaly_pattern_rule(rule, ip_address, ml_result):
                 'requires_approval': False, 'anomaly_types_matched': []}
 
 
-def evaluate_velocity_rule(rule, ip_address):
+def evaluate_velocity_rule(rule, ip_address, context=None):
     """Evaluate velocity rule (too many events in short time) - DDoS detection.
 
     Rule conditions: max_events, time_window_seconds, requires_approval
@@ -248,19 +241,18 @@ def evaluate_velocity_rule(rule, ip_address):
         time_window = conditions.get('time_window_seconds', 60)
         requires_approval = conditions.get('requires_approval', False)
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
+        ctx = context or EventContext(ip_address)
 
         try:
-            cursor.execute("""
-                SELECT COUNT(*) as event_count
-                FROM auth_events
-                WHERE source_ip_text = %s
-                AND timestamp >= NOW() - INTERVAL %s SECOND
-            """, (ip_address, time_window))
-
-            result = cursor.fetchone()
-            event_count = result['event_count'] or 0
+            event_count = get_attack_counters().count_ip(ip_address, time_window)
+            if event_count is None:
+                result = ctx.fetch(f"velocity:{time_window}s", """
+                    SELECT COUNT(*) as event_count
+                    FROM auth_events
+                    WHERE source_ip_text = %s
+                    AND timestamp >= NOW() - INTERVAL %s SECOND
+                """, (ip_address, time_window))
+                event_count = result['event_count'] or 0
 
             if event_count >= max_events:
                 return {'triggered': True,
@@ -271,8 +263,8 @@ def evaluate_velocity_rule(rule, ip_address):
                     'requires_approval': False, 'event_count': event_count}
 
         finally:
-            cursor.close()
-            conn.close()
+            if context is None:
+                ctx.close()
 
     except Exception as e:
         print(f"Error evaluating velocity rule: {e}")
@@ -280,7 +272,7 @@ def evaluate_velocity_rule(rule, ip_address):
                 'requires_approval': False, 'event_count': 0}
 
 
-def evaluate_tor_detection_rule(rule, ip_address, event_type=None):
+def evaluate_tor_detection_rule(rule, ip_address, event_type=None, context=None):
     """Evaluate Tor exit node detection rule.
 
     Rule conditions: is_tor, require_failed_login
@@ -290,18 +282,11 @@ def evaluate_tor_detection_rule(rule, ip_address, event_type=None):
         conditions = rule['conditions']
         require_failed_login = conditions.get('require_failed_login', True)
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
+        ctx = context or EventContext(ip_address)
 
         try:
             # Check if IP is Tor exit node
-            cursor.execute("""
-                SELECT is_tor
-                FROM ip_geolocation
-                WHERE ip_address_text = %s
-            """, (ip_address,))
-
-            geo_data = cursor.fetchone()
+            geo_data = ctx.get_geo()
             is_tor = geo_data and geo_data.get('is_tor', False)
 
             if not is_tor:
@@ -312,15 +297,7 @@ def evaluate_tor_detection_rule(rule, ip_address, event_type=None):
             if require_failed_login:
                 if event_type != 'failed':
                     # Check recent failed logins
-                    cursor.execute("""
-                        SELECT COUNT(*) as fail_count
-                        FROM auth_events
-                        WHERE source_ip_text = %s
-                        AND event_type = 'failed'
-                        AND timestamp >= NOW() - INTERVAL 1 HOUR
-                    """, (ip_address,))
-                    result = cursor.fetchone()
-                    if (result['fail_count'] or 0) == 0:
+                    if ctx.count_events(60, 'failed') == 0:
                         return {'triggered': False,
                                 'reason': 'Tor exit but no failed login attempts',
                                 'is_tor': True}
@@ -330,15 +307,15 @@ def evaluate_tor_detection_rule(rule, ip_address, event_type=None):
                     'is_tor': True}
 
         finally:
-            cursor.close()
-            conn.close()
+            if context is None:
+                ctx.close()
 
     except Exception as e:
         print(f"Error evaluating Tor detection rule: {e}")
         return {'triggered': False, 'reason': f"Error: {str(e)}", 'is_tor': False}
 
 
-def evaluate_proxy_detection_rule(rule, ip_address):
+def evaluate_proxy_detection_rule(rule, ip_address, context=None):
     """Evaluate VPN/Proxy/Datacenter detection rule.
 
     Rule conditions: is_proxy_or_vpn, min_abuseipdb_score
@@ -348,18 +325,11 @@ def evaluate_proxy_detection_rule(rule, ip_address):
         conditions = rule['conditions']
         min_abuseipdb_score = conditions.get('min_abuseipdb_score', 30)
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
+        ctx = context or EventContext(ip_address)
 
         try:
             # Check geo flags
-            cursor.execute("""
-                SELECT is_proxy, is_vpn, is_datacenter
-                FROM ip_geolocation
-                WHERE ip_address_text = %s
-            """, (ip_address,))
-
-            geo_data = cursor.fetchone()
+            geo_data = ctx.get_geo()
             is_proxy = geo_data and geo_data.get('is_proxy', False)
             is_vpn = geo_data and geo_data.get('is_vpn', False)
             is_datacenter = geo_data and geo_data.get('is_datacenter', False)
@@ -369,14 +339,7 @@ def evaluate_proxy_detection_rule(rule, ip_address):
                         'is_proxy': False, 'is_vpn': False, 'is_datacenter': False, 'abuseipdb_score': 0}
 
             # Check AbuseIPDB score
-            cursor.execute("""
-                SELECT abuseipdb_score
-                FROM ip_threat_intelligence
-                WHERE ip_address_text = %s
-            """, (ip_address,))
-
-            threat_data = cursor.fetchone()
-            abuseipdb_score = int(threat_data['abuseipdb_score'] or 0) if threat_data else 0
+            abuseipdb_score = ctx.get_abuseipdb_score()
 
             if abuseipdb_score < min_abuseipdb_score:
                 return {'triggered': False,
@@ -398,8 +361,8 @@ def evaluate_proxy_detection_rule(rule, ip_address):
                     'abuseipdb_score': abuseipdb_score}
 
         finally:
-            cursor.close()
-            conn.close()
+            if context is None:
+                ctx.close()
 
     except Exception as e:
         print(f"Error evaluating proxy detection rule: {e}")
@@ -407,7 +370,7 @@ def evaluate_proxy_detection_rule(rule, ip_address):
                 'is_proxy': False, 'is_vpn': False, 'is_datacenter': False, 'abuseipdb_score': 0}
 
 
-def evaluate_distributed_brute_force_rule(rule, ip_address, agent_id=None):
+def evaluate_distributed_brute_force_rule(rule, ip_address, agent_id=None, context=None):
     """Evaluate distributed brute force (same server, many IPs, many usernames, slow frequency).
 
     This detects coordinated attacks where many different IPs try different usernames
@@ -430,8 +393,8 @@ def evaluate_distributed_brute_force_rule(rule, ip_address, agent_id=None):
         max_attempts_per_ip = conditions.get('max_attempts_per_ip', 3)
         requires_approval = conditions.get('requires_approval', False)
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
+        ctx = context or EventContext(ip_address)
+        cursor = ctx.cursor()
 
         try:
             # Build agent filter
@@ -512,7 +475,8 @@ def evaluate_distributed_brute_force_rule(rule, ip_address, agent_id=None):
 
         finally:
             cursor.close()
-            conn.close()
+            if context is None:
+                ctx.close()
 
     except Exception as e:
         print(f"Error evaluating distributed brute force rule: {e}")
@@ -520,7 +484,7 @@ def evaluate_distributed_brute_force_rule(rule, ip_address, agent_id=None):
                 'requires_approval': False, 'unique_ips': 0, 'unique_usernames': 0, 'pattern_score': 0}
 
 
-def evaluate_account_takeover_rule(rule, ip_address, username=None):
+def evaluate_account_takeover_rule(rule, ip_address, username=None, context=None):
     """Evaluate account takeover attempt (same username from multiple IPs/locations quickly).
 
     This detects when a username is being targeted from multiple different IPs
@@ -544,8 +508,8 @@ def evaluate_account_takeover_rule(rule, ip_address, username=None):
         check_threat_intel = conditions.get('check_threat_intel', True)
         requires_approval = conditions.get('requires_approval', False)
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
+        ctx = context or EventContext(ip_address)
+        cursor = ctx.cursor()
 
         try:
             # Find usernames being targeted from multiple IPs
@@ -644,7 +608,8 @@ def evaluate_account_takeover_rule(rule, ip_address, username=None):
 
         finally:
             cursor.close()
-            conn.close()
+            if context is None:
+                ctx.close()
 
     except Exception as e:
         print(f"Error evaluating account takeover rule: {e}")
@@ -652,7 +617,7 @@ def evaluate_account_takeover_rule(rule, ip_address, username=None):
                 'requires_approval': False, 'unique_ips': 0, 'unique_countries': 0, 'targeted_usernames': []}
 
 
-def evaluate_off_hours_anomaly_rule(rule, ip_address, username=None, event_timestamp=None):
+def evaluate_off_hours_anomaly_rule(rule, ip_address, username=None, event_timestamp=None, context=None):
     """Evaluate out-of-work-time anomaly (login attempts outside business hours).
 
     This detects authentication attempts that occur outside normal business hours,
@@ -685,8 +650,8 @@ def evaluate_off_hours_anomaly_rule(rule, ip_address, username=None, event_times
         check_baseline = conditions.get('check_user_baseline', True)
         requires_approval = conditions.get('requires_approval', False)
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
+        ctx = context or EventContext(ip_address)
+        cursor = ctx.cursor()
 
         try:
             # Get the most recent event's timestamp to check if IT was during off-hours
@@ -711,13 +676,7 @@ def evaluate_off_hours_anomaly_rule(rule, ip_address, username=None, event_times
 
             # Check max_abuseipdb_score filter (for "clean IP only" rules)
             if max_abuse_score is not None or check_ip_reputation:
-                cursor.execute("""
-                    SELECT abuseipdb_score FROM ip_threat_intelligence
-                    WHERE ip_address_text = %s
-                    ORDER BY last_seen DESC LIMIT 1
-                """, (ip_address,))
-                threat_row = cursor.fetchone()
-                ip_abuse_score = threat_row['abuseipdb_score'] if threat_row and threat_row['abuseipdb_score'] else 0
+                ip_abuse_score = ctx.get_abuseipdb_score()
 
                 if max_abuse_score is not None and ip_abuse_score > max_abuse_score:
                     return {
@@ -819,17 +778,11 @@ def evaluate_off_hours_anomaly_rule(rule, ip_address, username=None, event_times
 
             # Check threat intelligence for the IP
             threat_multiplier = 1.0
-            cursor.execute("""
-                SELECT abuseipdb_score, virustotal_malicious
-                FROM ip_threat_intelligence
-                WHERE ip_address_text = %s
-            """, (ip_address,))
-
-            ti_data = cursor.fetchone()
+            ti_data = ctx.get_threat()
             if ti_data:
-                if (ti_data['abuseipdb_score'] or 0) >= 30:
+                if (ti_data.get('abuseipdb_score') or 0) >= 30:
                     threat_multiplier = 1.5
-                if (ti_data['virustotal_malicious'] or 0) >= 2:
+                if (ti_data.get('virustotal_malicious', ti_data.get('virustotal_positives')) or 0) >= 2:
                     threat_multiplier = 2.0
 
             # Calculate final score
@@ -874,7 +827,8 @@ def evaluate_off_hours_anomaly_rule(rule, ip_address, username=None, event_times
 
         finally:
             cursor.close()
-            conn.close()
+            if context is None:
+                ctx.close()
 
     except Exception as e:
         print(f"Error evaluating off-hours anomaly rule: {e}")
@@ -1037,7 +991,7 @@ def evaluate_behavioral_analysis_rule(rule, ip_address, username=None, event_typ
         }
 
 
-def evaluate_impossible_travel_rule(rule, ip_address, username=None):
+def evaluate_impossible_travel_rule(rule, ip_address, username=None, context=None):
     """Evaluate impossible travel detection rule.
 
     Rule conditions: max_distance_km, time_window_hours
@@ -1074,19 +1028,13 @@ def evaluate_impossible_travel_rule(rule, ip_address, username=None):
             return {'triggered': False, 'reason': 'No username provided for travel check',
                     'distance_km': 0, 'time_diff_hours': 0}
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
+        ctx = context or EventContext(ip_address)
+        cursor = ctx.cursor()
 
         try:
             # Check max_abuseipdb_score filter (for "clean IP only" rules)
             if max_abuse_score is not None:
-                cursor.execute("""
-                    SELECT abuseipdb_score FROM ip_threat_intelligence
-                    WHERE ip_address_text = %s
-                    ORDER BY last_seen DESC LIMIT 1
-                """, (ip_address,))
-                threat_row = cursor.fetchone()
-                ip_abuse_score = threat_row['abuseipdb_score'] if threat_row and threat_row['abuseipdb_score'] else 0
+                ip_abuse_score = ctx.get_abuseipdb_score()
 
                 if ip_abuse_score > max_abuse_score:
                     return {
@@ -1097,13 +1045,7 @@ def evaluate_impossible_travel_rule(rule, ip_address, username=None):
                     }
 
             # Get current location
-            cursor.execute("""
-                SELECT g.latitude, g.longitude, g.country_code, g.city
-                FROM ip_geolocation g
-                WHERE g.ip_address_text = %s
-            """, (ip_address,))
-
-            current_geo = cursor.fetchone()
+            current_geo = ctx.get_geo()
             if not current_geo or not current_geo['latitude'] or not current_geo['longitude']:
                 return {'triggered': False, 'reason': 'No current location data',
                         'distance_km': 0, 'time_diff_hours': 0}
@@ -1133,7 +1075,7 @@ def evaluate_impossible_travel_rule(rule, ip_address, username=None):
                         login_count = login_count + 1
                 """, (username, current_geo['latitude'], current_geo['longitude'],
                       current_geo['country_code'], current_geo['city'], ip_address))
-                conn.commit()
+                ctx.commit()
 
                 return {'triggered': False, 'reason': 'First login for user - baseline created',
                         'distance_km': 0, 'time_diff_hours': 0}
@@ -1161,7 +1103,7 @@ def evaluate_impossible_travel_rule(rule, ip_address, username=None):
                 WHERE username = %s
             """, (current_geo['latitude'], current_geo['longitude'],
                   current_geo['country_code'], current_geo['city'], ip_address, username))
-            conn.commit()
+            ctx.commit()
 
             # Check if impossible travel
             is_impossible_travel = distance_km > max_distance_km and time_diff_hours < time_window_hours
@@ -1170,12 +1112,7 @@ def evaluate_impossible_travel_rule(rule, ip_address, username=None):
                 # If require_anomaly or min_risk_score is set, check additional conditions
                 if require_anomaly or min_risk_score > 0:
                     # Get IP's threat/anomaly score from threat intelligence
-                    cursor.execute("""
-                        SELECT abuseipdb_score, overall_threat_level
-                        FROM ip_threat_intelligence
-                        WHERE ip_address_text = %s
-                    """, (ip_address,))
-                    threat_data = cursor.fetchone()
+                    threat_data = ctx.get_threat()
 
                     # Calculate a combined risk score
                     ip_risk_score = 0
@@ -1214,7 +1151,8 @@ def evaluate_impossible_travel_rule(rule, ip_address, username=None):
 
         finally:
             cursor.close()
-            conn.close()
+            if context is None:
+                ctx.close()
 
     except Exception as e:
         print(f"Error evaluating impossible travel rule: {e}")
@@ -32,6 +32,7 @@ sys.path.append(str(PROJECT_ROOT / "dbs"))
 sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from connection import get_connection
+from event_context import EventContext
 
 # Import unified ThreatEvaluator
 try:
@@ -55,6 +56,9 @@ WARNING_THRESHOLD = 30             # Score >= this → log warning
 USE_UNIFIED_EVALUATOR = True       # Use ThreatEvaluator for scoring
 USE_BEHAVIORAL_ANALYZER = True     # Prioritize ML behavioral analysis
 
+# Countries flagged as high risk in enrichment data
+HIGH_RISK_COUNTRIES = ('CN', 'RU', 'KP', 'IR', 'VN', 'IN', 'BR', 'PK', 'ID', 'NG')
+
 # High-risk indicators and their scores
 THREAT_SCORES = {
     'tor_exit_node': 25,
@@ -86,7 +90,7 @@ class ProactiveBlocker:
         self.enabled = PROACTIVE_BLOCKING_ENABLED
         self._cache = {}  # Simple in-memory cache for enrichment data
 
-    def evaluate_event(self, event: Dict) -> Dict:
+    def evaluate_event(self, event: Dict, context: Optional[EventContext] = None) -> Dict:
         """
         Evaluate an incoming auth event and decide on action.
 
@@ -98,6 +102,8 @@ class ProactiveBlocker:
                 'timestamp': str or datetime,
                 'hostname': str (optional)
             }
+            context: Optional EventContext shared with the other pipeline
+                     stages (geo/threat rows and attempt counts are reused)
 
         Returns:
             {
@@ -120,15 +126,29 @@ class ProactiveBlocker:
         if self._is_private_ip(ip):
             return self._no_action_result()
 
+        ctx = context or EventContext(ip, username=event.get('username'),
+                                      event_type=event.get('event_type'))
+        try:
+            result = self._evaluate_event(ip, event, ctx)
+            if result.get('should_block'):
+                # A block was written - later stages must re-read block state
+                ctx.invalidate(ctx.ACTIVE_BLOCK, ctx.BLOCK_COUNT)
+            return result
+        finally:
+            if context is None:
+                ctx.close()
+
+    def _evaluate_event(self, ip: str, event: Dict, ctx: EventContext) -> Dict:
+        """Run the evaluators for a public IP against the shared context."""
         # PRIORITY: ML Behavioral Analysis first (most advanced detection)
         if USE_BEHAVIORAL_ANALYZER and BEHAVIORAL_ANALYZER_AVAILABLE:
-            behavioral_result = self._evaluate_with_behavioral_analyzer(ip, event)
+            behavioral_result = self._evaluate_with_behavioral_analyzer(ip, event, ctx)
             if behavioral_result.get('should_block'):
                 return behavioral_result
 
         # Use unified ThreatEvaluator if available
         if USE_UNIFIED_EVALUATOR and THREAT_EVALUATOR_AVAILABLE:
-            return self._evaluate_with_unified(ip, event)
+            return self._evaluate_with_unified(ip, event, ctx)
 
         # Skip private IPs
         if self._is_private_ip(ip):
@@ -138,7 +158,7 @@ class ProactiveBlocker:
         factors = []
 
         # 1. Get enrichment data (cached or fresh)
-        enrichment = self._get_enrichment(ip)
+        enrichment = self._get_enrichment(ip, ctx)
 
         # 2. Score based on threat intelligence
         if enrichment:
@@ -185,7 +205,7 @@ class ProactiveBlocker:
                 factors.append('GreyNoise: Benign service (reduced threat)')
 
         # 3. Score based on behavioral analysis
-        behavior = self._analyze_behavior(ip, event)
+        behavior = self._analyze_behavior(ip, event, ctx)
 
         # Repeat offender
         if behavior['previous_bans'] >= 3:
@@ -234,7 +254,8 @@ class ProactiveBlocker:
 
         return result
 
-    def _evaluate_with_behavioral_analyzer(self, ip: str, event: Dict) -> Dict:
+    def _evaluate_with_behavioral_analyzer(self, ip: str, event: Dict,
+                                           context: Optional[EventContext] = None) -> Dict:
         """
         PRIORITY ML evaluation using BehavioralAnalyzer.
 
@@ -264,7 +285,7 @@ class ProactiveBlocker:
                 return {'should_block': False}
 
             # Get geo data for the IP
-            geo_data = self._get_geo_for_behavioral(ip)
+            geo_data = self._get_geo_for_behavioral(ip, context)
 
             # Run behavioral analysis
             analyzer = BehavioralAnalyzer()
@@ -345,7 +366,7 @@ class ProactiveBlocker:
                 # MEDIUM (40-59): Alert only - no blocking
                 # This score range indicates suspicious but not confirmed threat
                 # Skip alert for clean IPs (AbuseIPDB < 20) - likely ML false positive
-                enrichment = self._get_enrichment(ip)
+                enrichment = self._get_enrichment(ip, context)
                 abuseipdb_score = enrichment.get('abuseipdb_score') if enrichment else None
                 is_clean_ip = abuseipdb_score is not None and abuseipdb_score < 20
 
@@ -402,7 +423,7 @@ class ProactiveBlocker:
                             break
 
                     # Get geo data for the alert
-                    geo_data = self._get_geo_for_behavioral(ip)
+                    geo_data = self._get_geo_for_behavioral(ip, context)
 
                     create_security_alert(
                         ip_address=ip,
@@ -434,29 +455,23 @@ class ProactiveBlocker:
             logging.error(f"[ProactiveBlocker] Behavioral analysis error: {e}")
             return {'should_block': False}
 
-    def _get_geo_for_behavioral(self, ip: str) -> Optional[Dict]:
+    def _get_geo_for_behavioral(self, ip: str, context: Optional[EventContext] = None) -> Optional[Dict]:
         """Get geo data for behavioral analysis."""
-        conn = None
-        cursor = None
+        ctx = context or EventContext(ip)
         try:
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("""
-                SELECT latitude, longitude, country_code, country_name, city
-                FROM ip_geolocation
-                WHERE ip_address_text = %s
-            """, (ip,))
-            return cursor.fetchone()
+            row = ctx.get_geo()
+            if not row:
+                return None
+            return {k: row.get(k) for k in ('latitude', 'longitude', 'country_code', 'country_name', 'city')}
         except Exception as e:
             logging.error(f"Error getting geo for {ip}: {e}")
             return None
         finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
+            if context is None:
+                ctx.close()
 
-    def _evaluate_with_unified(self, ip: str, event: Dict) -> Dict:
+    def _evaluate_with_unified(self, ip: str, event: Dict,
+                               context: Optional[EventContext] = None) -> Dict:
         """
         Use unified ThreatEvaluator for comprehensive scoring.
         This combines ML, threat intel, behavioral, network, and geo analysis.
@@ -470,7 +485,7 @@ class ProactiveBlocker:
             }
 
             # Run unified evaluation
-            evaluation = evaluate_ip_threat(ip, event_context)
+            evaluation = evaluate_ip_threat(ip, event_context, context)
 
             score = evaluation.get('composite_score', 0)
             risk_level = evaluation.get('risk_level', 'low')
@@ -528,9 +543,10 @@ class ProactiveBlocker:
         except Exception as e:
             logging.error(f"[ProactiveBlocker] Unified evaluation error: {e}")
             # Fall back to legacy scoring
-            return self._legacy_evaluate(ip, event)
+            return self._legacy_evaluate(ip, event, context)
 
-    def _legacy_evaluate(self, ip: str, event: Dict) -> Dict:
+    def _legacy_evaluate(self, ip: str, event: Dict,
+                         context: Optional[EventContext] = None) -> Dict:
         """Legacy scoring method as fallback."""
         # Skip private IPs
         if self._is_private_ip(ip):
@@ -540,7 +556,7 @@ class ProactiveBlocker:
         factors = []
 
         # Basic enrichment check
-        enrichment = self._get_enrichment(ip)
+        enrichment = self._get_enrichment(ip, context)
         if enrichment:
             abuse_score = enrichment.get('abuseipdb_score', 0)
             if abuse_score >= 80:
@@ -604,7 +620,7 @@ class ProactiveBlocker:
                 'action_taken': 'No action - standard fail2ban handling'
             }
 
-    def _get_enrichment(self, ip: str) -> Optional[Dict]:
+    def _get_enrichment(self, ip: str, context: Optional[EventContext] = None) -> Optional[Dict]:
         """Get enrichment data from cache or database."""
         # Check cache first (5 min TTL)
         cache_key = f"enrich_{ip}"
@@ -613,40 +629,37 @@ class ProactiveBlocker:
             if datetime.now() - timestamp < timedelta(minutes=5):
                 return cached
 
-        conn = None
-        cursor = None
+        ctx = context or EventContext(ip)
         try:
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-
-            # Query from ip_geolocation table (v3.1 schema) with GreyNoise fields
-            cursor.execute("""
-                SELECT abuseipdb_score, virustotal_positives as virustotal_malicious,
-                       is_tor, is_vpn, is_proxy, country_code,
-                       CASE WHEN country_code IN ('CN', 'RU', 'KP', 'IR', 'VN', 'IN', 'BR', 'PK', 'ID', 'NG')
-                            THEN 1 ELSE 0 END as is_high_risk_country,
-                       greynoise_noise, greynoise_riot, greynoise_classification
-                FROM ip_geolocation
-                WHERE ip_address_text = %s
-                  AND last_seen >= NOW() - INTERVAL 24 HOUR
-            """, (ip,))
-
-            result = cursor.fetchone()
-
-            if result:
-                self._cache[cache_key] = (result, datetime.now())
+            # ip_geolocation row (v3.1 schema, with GreyNoise fields) seen in the last 24h
+            row = ctx.get_geo(max_age=timedelta(hours=24))
+            if not row:
+                return None
+
+            result = {
+                'abuseipdb_score': row.get('abuseipdb_score'),
+                'virustotal_malicious': row.get('virustotal_positives'),
+                'is_tor': row.get('is_tor'),
+                'is_vpn': row.get('is_vpn'),
+                'is_proxy': row.get('is_proxy'),
+                'country_code': row.get('country_code'),
+                'is_high_risk_country': 1 if row.get('country_code') in HIGH_RISK_COUNTRIES else 0,
+                'greynoise_noise': row.get('greynoise_noise'),
+                'greynoise_riot': row.get('greynoise_riot'),
+                'greynoise_classification': row.get('greynoise_classification')
+            }
+            self._cache[cache_key] = (result, datetime.now())
 
             return result
         except Exception as e:
             logging.error(f"Error getting enrichment for {ip}: {e}")
             return None
         finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
+            if context is None:
+                ctx.close()
 
-    def _analyze_behavior(self, ip: str, event: Dict) -> Dict:
+    def _analyze_behavior(self, ip: str, event: Dict,
+                          context: Optional[EventContext] = None) -> Dict:
         """Analyze behavioral patterns for this IP."""
         behavior = {
             'previous_bans': 0,
@@ -655,49 +668,32 @@ class ProactiveBlocker:
             'recent_failures': 0
         }
 
-        conn = None
-        cursor = None
+        ctx = context or EventContext(ip)
         try:
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-
             # Previous bans (event_type = 'ban' in current schema)
-            cursor.execute("""
+            result = ctx.fetch('fail2ban_bans', """
                 SELECT COUNT(*) as count FROM fail2ban_events
                 WHERE ip_address = %s AND event_type = 'ban'
             """, (ip,))
-            result = cursor.fetchone()
             behavior['previous_bans'] = result['count'] if result else 0
 
-            # Unique usernames in last hour (check both possible column names)
+            # Unique usernames in last hour
             try:
-                cursor.execute("""
-                    SELECT COUNT(DISTINCT COALESCE(username, target_username)) as count FROM auth_events
-                    WHERE source_ip_text = %s AND timestamp >= NOW() - INTERVAL 1 HOUR
-                """, (ip,))
-                result = cursor.fetchone()
-                behavior['unique_usernames'] = result['count'] if result else 0
+                behavior['unique_usernames'] = ctx.count_usernames(60)
             except:
                 behavior['unique_usernames'] = 0
 
             # Recent attempts (last 5 min)
             try:
-                cursor.execute("""
-                    SELECT COUNT(*) as count FROM auth_events
-                    WHERE source_ip_text = %s AND timestamp >= NOW() - INTERVAL 5 MINUTE
-                """, (ip,))
-                result = cursor.fetchone()
-                behavior['recent_attempts'] = result['count'] if result else 0
+                behavior['recent_attempts'] = ctx.count_events(5)
             except:
                 behavior['recent_attempts'] = 0
 
         except Exception as e:
             logging.error(f"Error analyzing behavior for {ip}: {e}")
         finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
+            if context is None:
+                ctx.close()
 
         return behavior
 
@@ -865,10 +861,10 @@ def get_proactive_blocker() -> ProactiveBlocker:
     return _blocker
 
 
-def evaluate_auth_event(event: Dict) -> Dict:
+def evaluate_auth_event(event: Dict, context: Optional[EventContext] = None) -> Dict:
     """
     Convenience function to evaluate an auth event.
     Call this from log_processor.py when events are received.
     """
     blocker = get_proactive_blocker()
-    return blocker.evaluate_event(event)
+    return blocker.evaluate_event(event, context)
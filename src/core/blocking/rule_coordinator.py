@@ -4,41 +4,24 @@ Coordinates evaluation of multiple rules and triggers blocking
 """
 
 import sys
-import json
 from pathlib import Path
 
 # Add project paths
 PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
 sys.path.append(str(PROJECT_ROOT / "dbs"))
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
-from connection import get_connection
-from .rule_evaluators import (
-    evaluate_brute_force_rule,
-    evaluate_threat_threshold_rule,
-    evaluate_high_risk_country_rule,
-    get_repeat_offender_duration
-)
-from .ml_evaluators import (
-    evaluate_ml_threshold_rule,
-    evaluate_credential_stuffing_rule,
-    evaluate_anomaly_pattern_rule,
-    evaluate_velocity_rule,
-    evaluate_tor_detection_rule,
-    evaluate_proxy_detection_rule,
-    evaluate_impossible_travel_rule,
-    evaluate_distributed_brute_force_rule,
-    evaluate_account_takeover_rule,
-    evaluate_off_hours_anomaly_rule,
-    evaluate_behavioral_analysis_rule
-)
-from .threat_combo_evaluator import evaluate_threat_combo_rule
+from event_context import EventContext
+from .rule_evaluators import get_repeat_offender_duration
+from .rule_engine import get_compiled_rules, evaluate_compiled_rules
 from .ip_operations import block_ip
 from .alert_operations import create_security_alert
 
 
-def evaluate_rules_for_ip(ip_address, ml_result=None, event_id=None, event_type=None, username=None):
+def evaluate_rules_for_ip(ip_address, ml_result=None, event_id=None, event_type=None, username=None,
+                          context=None, short_circuit=True):
     """
-    Evaluate all enabled rules for an IP address
+    Evaluate enabled rules for an IP address
 
     Args:
         ip_address: IP to evaluate
@@ -46,132 +29,38 @@ def evaluate_rules_for_ip(ip_address, ml_result=None, event_id=None, event_type=
         event_id: Optional trigger event ID
         event_type: 'failed' or 'successful'
         username: Target username for impossible travel detection
+        context: Optional EventContext; rules share its geo/threat rows,
+                 attempt counts and connection instead of querying each
+        short_circuit: Skip rules that can no longer change the block
+                       decision (False evaluates every rule)
 
     Returns:
-        list: List of rule evaluation results
+        list: Rule evaluation results, highest priority first
     """
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    results = []
+    ctx = context or EventContext(ip_address, event_id=event_id, username=username, event_type=event_type)
+    cursor = ctx.cursor()
 
     try:
-        # Get all enabled rules, ordered by priority
-        cursor.execute("""
-            SELECT
-                id,
-                rule_name,
-                rule_type,
-                action_type,
-                priority,
-                conditions,
-                block_duration_minutes,
-                auto_unblock
-            FROM blocking_rules
-            WHERE is_enabled = TRUE
-            ORDER BY priority DESC, id ASC
-        """)
-
-        rules = cursor.fetchall()
-
-        for rule in rules:
-            # Parse JSON conditions
-            rule['conditions'] = json.loads(rule['conditions']) if isinstance(rule['conditions'], str) else rule['conditions']
-
-            # Evaluate based on rule type
-            if rule['rule_type'] == 'brute_force':
-                eval_result = evaluate_brute_force_rule(rule, ip_address)
-
-            elif rule['rule_type'] == 'api_reputation':
-                eval_result = evaluate_threat_threshold_rule(rule, ip_address, event_type)
-
-            elif rule['rule_type'] == 'ml_threshold':
-                if ml_result:
-                    eval_result = evaluate_ml_threshold_rule(rule, ip_address, ml_result)
-                    eval_result['should_block'] = eval_result.get('triggered', False)
-                else:
-                    eval_result = {'should_block': False, 'reason': 'No ML result available'}
-
-            elif rule['rule_type'] == 'credential_stuffing':
-                eval_result = evaluate_credential_stuffing_rule(rule, ip_address)
-                eval_result['should_block'] = eval_result.get('triggered', False)
-
-            elif rule['rule_type'] == 'anomaly_pattern':
-                if ml_result:
-                    eval_result = evaluate_anomaly_pattern_rule(rule, ip_address, ml_result)
-                    eval_result['should_block'] = eval_result.get('triggered', False)
-                else:
-                    eval_result = {'should_block': False, 'reason': 'No ML result available'}
-
-            elif rule['rule_type'] == 'velocity':
-                eval_result = evaluate_velocity_rule(rule, ip_address)
-                eval_result['should_block'] = eval_result.get('triggered', False)
-
-            elif rule['rule_type'] == 'tor_detection':
-                eval_result = evaluate_tor_detection_rule(rule, ip_address, event_type)
-                eval_result['should_block'] = eval_result.get('triggered', False)
-
-            elif rule['rule_type'] == 'proxy_detection':
-                eval_result = evaluate_proxy_detection_rule(rule, ip_address)
-                eval_result['should_block'] = eval_result.get('triggered', False)
-
-            elif rule['rule_type'] == 'geo_restriction':
-                eval_result = evaluate_high_risk_country_rule(rule, ip_address)
-
-            elif rule['rule_type'] == 'geo_anomaly':
-                eval_result = evaluate_impossible_travel_rule(rule, ip_address, username)
-                eval_result['should_block'] = eval_result.get('triggered', False)
-
-            elif rule['rule_type'] == 'threat_combo':
-                eval_result = evaluate_threat_combo_rule(rule, ip_address, event_type)
-                eval_result['should_block'] = eval_result.get('triggered', False)
-
-            elif rule['rule_type'] == 'distributed_brute_force':
-                # Distributed brute force: many IPs, many usernames, slow frequency
-                eval_result = evaluate_distributed_brute_force_rule(rule, ip_address)
-                eval_result['should_block'] = eval_result.get('triggered', False)
-
-            elif rule['rule_type'] == 'account_takeover':
-                # Account takeover: same username from multiple IPs/locations
-                eval_result = evaluate_account_takeover_rule(rule, ip_address, username)
-                eval_result['should_block'] = eval_result.get('triggered', False)
-
-            elif rule['rule_type'] == 'off_hours_anomaly':
-                # Off-hours anomaly: login attempts outside business hours
-                eval_result = evaluate_off_hours_anomaly_rule(rule, ip_address, username)
-                eval_result['should_block'] = eval_result.get('triggered', False)
-
-            elif rule['rule_type'] == 'behavioral_analysis':
-                # ML Behavioral Analysis (PRIORITY): comprehensive behavioral detection
-                # This uses BehavioralAnalyzer for advanced pattern detection
-                eval_result = evaluate_behavioral_analysis_rule(rule, ip_address, username, event_type)
-                eval_result['should_block'] = eval_result.get('triggered', False)
-                # Store block method preference for later use
-                if eval_result.get('block_method') == 'ufw':
-                    eval_result['force_ufw'] = True
-
-            elif rule['rule_type'] == 'repeat_offender':
-                # This is handled during block duration calculation
-                eval_result = {'should_block': False, 'reason': 'Duration modifier only'}
-
-            else:
-                eval_result = {
-                    'should_block': False,
-                    'reason': f"Rule type '{rule['rule_type']}' not implemented"
-                }
-
-            eval_result['rule'] = rule
+        # Enabled rules, compiled once and reloaded when blocking_rules changes
+        rules = get_compiled_rules(cursor)
+
+        results = evaluate_compiled_rules(
+            rules, ip_address, ml_result, event_type, username,
+            ctx=ctx, short_circuit=short_circuit
+        )
+        for eval_result in results:
             eval_result['trigger_event_id'] = event_id
-            results.append(eval_result)
 
         return results
 
     finally:
         cursor.close()
-        conn.close()
+        if context is None:
+            ctx.close()
 
 
-def check_and_block_ip(ip_address, ml_result=None, event_id=None, event_type=None, username=None):
+def check_and_block_ip(ip_address, ml_result=None, event_id=None, event_type=None, username=None,
+                       context=None):
     """
     Check all rules for an IP and block if any rule triggers
 
@@ -181,6 +70,7 @@ def check_and_block_ip(ip_address, ml_result=None, event_id=None, event_type=Non
         event_id: Optional trigger event ID
         event_type: 'failed' or 'successful'
         username: Target username for impossible travel
+        context: Optional EventContext shared with the other pipeline stages
 
     Returns:
         dict: {
@@ -191,30 +81,30 @@ def check_and_block_ip(ip_address, ml_result=None, event_id=None, event_type=Non
             'requires_approval': bool
         }
     """
-    # Early check: Skip if IP is already blocked (by fail2ban, ML, or manual)
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+    ctx = context or EventContext(ip_address, event_id=event_id, username=username, event_type=event_type)
     try:
-        cursor.execute("""
-            SELECT id, block_source, blocked_at FROM ip_blocks
-            WHERE ip_address_text = %s AND is_active = TRUE
-        """, (ip_address,))
-        existing_block = cursor.fetchone()
-        if existing_block:
-            return {
-                'blocked': False,
-                'block_id': existing_block['id'],
-                'triggered_rules': [],
-                'message': f'IP already blocked by {existing_block["block_source"]}',
-                'requires_approval': False,
-                'already_blocked': True
-            }
+        return _check_and_block_ip(ctx, ip_address, ml_result, event_id, event_type, username)
     finally:
-        cursor.close()
-        conn.close()
+        if context is None:
+            ctx.close()
+
+
+def _check_and_block_ip(ctx, ip_address, ml_result, event_id, event_type, username):
+    """check_and_block_ip body, run against a (possibly shared) EventContext"""
+    # Early check: Skip if IP is already blocked (by fail2ban, ML, or manual)
+    existing_block = ctx.get_active_block()
+    if existing_block:
+        return {
+            'blocked': False,
+            'block_id': existing_block['id'],
+            'triggered_rules': [],
+            'message': f'IP already blocked by {existing_block["block_source"]}',
+            'requires_approval': False,
+            'already_blocked': True
+        }
 
     # Evaluate all rules
-    eval_results = evaluate_rules_for_ip(ip_address, ml_result, event_id, event_type, username)
+    eval_results = evaluate_rules_for_ip(ip_address, ml_result, event_id, event_type, username, context=ctx)
 
     triggered_rules = [r for r in eval_results if r.get('should_block')]
 
@@ -320,7 +210,7 @@ def check_and_block_ip(ip_address, ml_result=None, event_id=None, event_type=Non
     base_duration = rule['block_duration_minutes']
 
     # Apply repeat offender escalation
-    adjusted_duration = get_repeat_offender_duration(ip_address, base_duration)
+    adjusted_duration = get_repeat_offender_duration(ip_address, base_duration, context=ctx)
 
     # Check if ML behavioral analysis recommends permanent UFW block
     force_ufw = rule_to_apply.get('force_ufw', False) or (explicit_block_method == 'ufw')
@@ -360,6 +250,9 @@ def check_and_block_ip(ip_address, ml_result=None, event_id=None, event_type=Non
         metadata=block_metadata
     )
 
+    # Later stages of this event must see the new block
+    ctx.invalidate(ctx.ACTIVE_BLOCK, ctx.BLOCK_COUNT)
+
     return {
         'blocked': block_result['success'],
         'block_id': block_result['block_id'],
@@ -0,0 +1,395 @@
+"""
+SSH Guardian v3.0 - Rule Engine
+Compiled, cached blocking rules with registry dispatch and short-circuit evaluation
+"""
+
+import os
+import sys
+import json
+import threading
+import time
+from pathlib import Path
+
+# Add project paths
+PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
+sys.path.append(str(PROJECT_ROOT / "dbs"))
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
+
+from .rule_evaluators import (
+    evaluate_brute_force_rule,
+    evaluate_threat_threshold_rule,
+    evaluate_high_risk_country_rule
+)
+from .ml_evaluators import (
+    evaluate_ml_threshold_rule,
+    evaluate_credential_stuffing_rule,
+    evaluate_anomaly_pattern_rule,
+    evaluate_velocity_rule,
+    evaluate_tor_detection_rule,
+    evaluate_proxy_detection_rule,
+    evaluate_impossible_travel_rule,
+    evaluate_distributed_brute_force_rule,
+    evaluate_account_takeover_rule,
+    evaluate_off_hours_anomaly_rule,
+    evaluate_behavioral_analysis_rule
+)
+from .threat_combo_evaluator import evaluate_threat_combo_rule
+
+# How often (seconds) the cached rule set is checked against blocking_rules.
+# Routes that edit rules invalidate the cache of their own process at once;
+# other processes pick the change up within this interval.
+BLOCKING_RULES_CHECK_SEC = float(os.getenv('BLOCKING_RULES_CHECK_SEC', 5))
+
+# Estimated evaluation cost, used to order rules of equal priority
+COST_NONE = 0        # decided from arguments (ML result, no-op rules)
+COST_COUNTER = 1     # sliding-window attack counters
+COST_CONTEXT = 2     # geo/threat rows shared through the EventContext
+COST_QUERY = 4       # own aggregate query over auth_events
+COST_SCAN = 6        # several queries / wide scans
+COST_ANALYZER = 8    # full BehavioralAnalyzer run
+
+# Rule type whose block decision overrides every other rule
+OVERRIDING_RULE_TYPE = 'behavioral_analysis'
+
+
+# ----------------------------------------------------------------------
+# Handlers: (rule, ip_address, ml_result, event_type, username, ctx) -> result
+# ----------------------------------------------------------------------
+
+def _triggered(result):
+    """ML-style evaluators report 'triggered'; the coordinator reads 'should_block'"""
+    result['should_block'] = result.get('triggered', False)
+    return result
+
+
+def _no_ml_result():
+    return {'should_block': False, 'reason': 'No ML result available'}
+
+
+def _eval_brute_force(rule, ip_address, ml_result, event_type, username, ctx):
+    return evaluate_brute_force_rule(rule, ip_address, context=ctx)
+
+
+def _eval_api_reputation(rule, ip_address, ml_result, event_type, username, ctx):
+    return evaluate_threat_threshold_rule(rule, ip_address, event_type, context=ctx)
+
+
+def _eval_ml_threshold(rule, ip_address, ml_result, event_type, username, ctx):
+    if not ml_result:
+        return _no_ml_result()
+    return _triggered(evaluate_ml_threshold_rule(rule, ip_address, ml_result, context=ctx))
+
+
+def _eval_credential_stuffing(rule, ip_address, ml_result, event_type, username, ctx):
+    return _triggered(evaluate_credential_stuffing_rule(rule, ip_address, context=ctx))
+
+
+def _eval_anomaly_pattern(rule, ip_address, ml_result, event_type, username, ctx):
+    if not ml_result:
+        return _no_ml_result()
+    return _triggered(evaluate_anomaly_pattern_rule(rule, ip_address, ml_result))
+
+
+def _eval_velocity(rule, ip_address, ml_result, event_type, username, ctx):
+    return _triggered(evaluate_velocity_rule(rule, ip_address, context=ctx))
+
+
+def _eval_tor_detection(rule, ip_address, ml_result, event_type, username, ctx):
+    return _triggered(evaluate_tor_detection_rule(rule, ip_address, event_type, context=ctx))
+
+
+def _eval_proxy_detection(rule, ip_address, ml_result, event_type, username, ctx):
+    return _triggered(evaluate_proxy_detection_rule(rule, ip_address, context=ctx))
+
+
+def _eval_geo_restriction(rule, ip_address, ml_result, event_type, username, ctx):
+    return evaluate_high_risk_country_rule(rule, ip_address, context=ctx)
+
+
+def _eval_geo_anomaly(rule, ip_address, ml_result, event_type, username, ctx):
+    return _triggered(evaluate_impossible_travel_rule(rule, ip_address, username, context=ctx))
+
+
+def _eval_threat_combo(rule, ip_address, ml_result, event_type, username, ctx):
+    return _triggered(evaluate_threat_combo_rule(rule, ip_address, event_type, context=ctx))
+
+
+def _eval_distributed_brute_force(rule, ip_address, ml_result, event_type, username, ctx):
+    # Distributed brute force: many IPs, many usernames, slow frequency
+    return _triggered(evaluate_distributed_brute_force_rule(rule, ip_address, context=ctx))
+
+
+def _eval_account_takeover(rule, ip_address, ml_result, event_type, username, ctx):
+    # Account takeover: same username from multiple IPs/locations
+    return _triggered(evaluate_account_takeover_rule(rule, ip_address, username, context=ctx))
+
+
+def _eval_off_hours_anomaly(rule, ip_address, ml_result, event_type, username, ctx):
+    # Off-hours anomaly: login attempts outside business hours
+    return _triggered(evaluate_off_hours_anomaly_rule(rule, ip_address, username, context=ctx))
+
+
+def _eval_behavioral_analysis(rule, ip_address, ml_result, event_type, username, ctx):
+    # ML Behavioral Analysis (PRIORITY): comprehensive behavioral detection
+    result = _triggered(evaluate_behavioral_analysis_rule(rule, ip_address, username, event_type))
+    # Store block method preference for later use
+    if result.get('block_method') == 'ufw':
+        result['force_ufw'] = True
+    return result
+
+
+def _eval_repeat_offender(rule, ip_address, ml_result, event_type, username, ctx):
+    # This is handled during block duration calculation
+    return {'should_block': False, 'reason': 'Duration modifier only'}
+
+
+# rule_type -> (handler, estimated cost)
+RULE_HANDLERS = {
+    'brute_force': (_eval_brute_force, COST_COUNTER),
+    'api_reputation': (_eval_api_reputation, COST_CONTEXT),
+    'ml_threshold': (_eval_ml_threshold, COST_NONE),
+    'credential_stuffing': (_eval_credential_stuffing, COST_COUNTER),
+    'anomaly_pattern': (_eval_anomaly_pattern, COST_NONE),
+    'velocity': (_eval_velocity, COST_COUNTER),
+    'tor_detection': (_eval_tor_detection, COST_CONTEXT),
+    'proxy_detection': (_eval_proxy_detection, COST_CONTEXT),
+    'geo_restriction': (_eval_geo_restriction, COST_CONTEXT),
+    'geo_anomaly': (_eval_geo_anomaly, COST_QUERY),
+    'threat_combo': (_eval_threat_combo, COST_CONTEXT),
+    'distributed_brute_force': (_eval_distributed_brute_force, COST_SCAN),
+    'account_takeover': (_eval_account_takeover, COST_SCAN),
+    'off_hours_anomaly': (_eval_off_hours_anomaly, COST_SCAN),
+    'behavioral_analysis': (_eval_behavioral_analysis, COST_ANALYZER),
+    'repeat_offender': (_eval_repeat_offender, COST_NONE),
+}
+
+
+def register_rule_type(rule_type, handler, cost=COST_QUERY):
+    """
+    Register (or replace) the evaluator for a rule type.
+
+    Args:
+        rule_type: blocking_rules.rule_type value
+        handler: fn(rule, ip_address, ml_result, event_type, username, ctx) -> result dict
+                 with at least 'should_block' and 'reason'
+        cost: Estimated cost (COST_* constant), orders rules of equal priority
+    """
+    RULE_HANDLERS[rule_type] = (handler, cost)
+    invalidate_rule_cache()
+
+
+# ----------------------------------------------------------------------
+# Compiled rules
+# ----------------------------------------------------------------------
+
+class CompiledRule:
+    """A blocking_rules row with parsed conditions and a bound handler"""
+
+    __slots__ = ('rule', 'handler', 'cost', 'priority', 'rule_id', 'rule_type', 'blocks')
+
+    def __init__(self, rule):
+        """
+        Compile one rule row.
+
+        Args:
+            rule: blocking_rules row (dict); conditions may be a JSON string
+        """
+        conditions = rule['conditions']
+        if isinstance(conditions, (str, bytes)):
+            conditions = json.loads(conditions)
+        self.rule = dict(rule, conditions=conditions or {})
+
+        self.rule_id = rule['id']
+        self.rule_type = rule['rule_type']
+        self.priority = rule['priority'] or 0
+        # 'alert' and 'monitor' rules never produce the block decision
+        self.blocks = rule.get('action_type', 'block') not in ('alert', 'monitor')
+
+        handler = RULE_HANDLERS.get(self.rule_type)
+        if handler is None:
+            self.handler, self.cost = _not_implemented, COST_NONE
+        else:
+            self.handler, self.cost = handler
+
+    @property
+    def order_key(self):
+        """Evaluation order: priority first, then cheapest, then id"""
+        return (-self.priority, self.cost, self.rule_id)
+
+    @property
+    def rank_key(self):
+        """Decision order used by the coordinator (priority DESC, id ASC)"""
+        return (-self.priority, self.rule_id)
+
+    def evaluate(self, ip_address, ml_result, event_type, username, ctx):
+        """Run the rule; the result carries a private copy of the rule row"""
+        result = self.handler(self.rule, ip_address, ml_result, event_type, username, ctx)
+        result['rule'] = dict(self.rule)
+        return result
+
+
+def _not_implemented(rule, ip_address, ml_result, event_type, username, ctx):
+    return {
+        'should_block': False,
+        'reason': f"Rule type '{rule['rule_type']}' not implemented"
+    }
+
+
+def _invalid_rule(error):
+    def handler(rule, ip_address, ml_result, event_type, username, ctx):
+        return {'should_block': False, 'reason': f"Invalid rule conditions: {error}"}
+    return handler
+
+
+_cache_lock = threading.Lock()
+_cache = {
+    'rules': None,          # list of CompiledRule in evaluation order
+    'fingerprint': None,    # (rule count, last updated_at)
+    'checked_at': 0.0
+}
+_stats = {
+    'compiles': 0,
+    'evaluations': 0,
+    'rules_evaluated': 0,
+    'rules_skipped': 0
+}
+
+
+def invalidate_rule_cache():
+    """Force the next evaluation to reload blocking_rules (call after editing rules)"""
+    with _cache_lock:
+        _cache['fingerprint'] = None
+        _cache['checked_at'] = 0.0
+
+
+def _compile_rules(cursor):
+    """Load every enabled rule and compile it"""
+    cursor.execute("""
+        SELECT
+            id,
+            rule_name,
+            rule_type,
+            action_type,
+            priority,
+            conditions,
+            block_duration_minutes,
+            auto_unblock
+        FROM blocking_rules
+        WHERE is_enabled = TRUE
+    """)
+
+    compiled = []
+    for row in cursor.fetchall():
+        try:
+            compiled.append(CompiledRule(row))
+        except (ValueError, TypeError) as e:
+            print(f"⚠️  Blocking rule {row.get('rule_name')} has invalid conditions: {e}")
+            rule = CompiledRule(dict(row, conditions={}))
+            rule.handler, rule.cost = _invalid_rule(e), COST_NONE
+            compiled.append(rule)
+
+    compiled.sort(key=lambda r: r.order_key)
+    return compiled
+
+
+def get_compiled_rules(cursor):
+    """
+    Enabled rules in evaluation order, reloaded only when blocking_rules changed.
+
+    Args:
+        cursor: Dictionary cursor (e.g. EventContext.cursor())
+
+    Returns:
+        list of CompiledRule
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        if _cache['rules'] is not None and now - _cache['checked_at'] < BLOCKING_RULES_CHECK_SEC:
+            return _cache['rules']
+
+        # Checksum over the definition columns only: updated_at also moves
+        # whenever a block bumps times_triggered, which changes no rule
+        cursor.execute("""
+            SELECT COUNT(*) as rule_count,
+                   BIT_XOR(CRC32(CONCAT_WS('|', id, rule_name, rule_type, action_type,
+                                           priority, is_enabled, conditions,
+                                           block_duration_minutes, auto_unblock))) as checksum
+            FROM blocking_rules
+        """)
+        row = cursor.fetchone()
+        fingerprint = (row['rule_count'], row['checksum'])
+
+        if _cache['rules'] is None or fingerprint != _cache['fingerprint']:
+            _cache['rules'] = _compile_rules(cursor)
+            _cache['fingerprint'] = fingerprint
+            _stats['compiles'] += 1
+
+        _cache['checked_at'] = now
+        return _cache['rules']
+
+
+def evaluate_compiled_rules(rules, ip_address, ml_result=None, event_type=None, username=None,
+                            ctx=None, short_circuit=True):
+    """
+    Evaluate compiled rules for an IP.
+
+    With short_circuit, once a blocking rule triggers the decision is final
+    for every blocking rule of lower priority, so those are skipped; rules
+    of the same priority still run (the lowest id wins a tie) and so do
+    behavioral_analysis rules, which override any other block. The
+    selected rule is therefore the same as with a full evaluation.
+    Non-blocking (alert/monitor) rules are never skipped: the coordinator
+    raises an alert for each one that triggers.
+
+    Args:
+        rules: CompiledRule list from get_compiled_rules()
+        ip_address: IP to evaluate
+        ml_result: Optional ML prediction result dict
+        event_type: 'failed' or 'successful'
+        username: Target username
+        ctx: EventContext shared by the rules
+        short_circuit: Skip rules that can no longer change the decision
+
+    Returns:
+        list: Rule evaluation results in decision order (priority DESC, id ASC)
+    """
+    evaluated = []
+    decided_priority = None
+    overridden = False
+
+    for compiled in rules:
+        if short_circuit and compiled.blocks and (overridden or (
+                decided_priority is not None
+                and compiled.priority < decided_priority
+                and compiled.rule_type != OVERRIDING_RULE_TYPE)):
+            _stats['rules_skipped'] += 1
+            continue
+
+        result = compiled.evaluate(ip_address, ml_result, event_type, username, ctx)
+        evaluated.append((compiled.rank_key, result))
+        _stats['rules_evaluated'] += 1
+
+        if short_circuit and compiled.blocks and result.get('should_block'):
+            if compiled.rule_type == OVERRIDING_RULE_TYPE:
+                # Rules are ordered by priority/cost/id and every behavioral
+                # rule has the same cost, so this is the one the coordinator
+                # would pick - no later blocking rule can change the outcome
+                overridden = True
+            elif decided_priority is None:
+                decided_priority = compiled.priority
+
+    _stats['evaluations'] += 1
+    evaluated.sort(key=lambda item: item[0])
+    return [result for _, result in evaluated]
+
+
+def get_rule_engine_stats():
+    """Rule engine statistics (compiles, evaluated vs skipped rules)"""
+    with _cache_lock:
+        rules = _cache['rules'] or []
+        return {
+            **_stats,
+            'cached_rules': len(rules),
+            'rule_order': [f"{r.rule['rule_name']} (p{r.priority}, cost {r.cost})" for r in rules],
+            'check_interval_sec': BLOCKING_RULES_CHECK_SEC
+        }
@@ -5,16 +5,17 @@ Individual rule evaluation functions
 
 import sys
 from pathlib import Path
-from datetime import datetime, timedelta
 
 # Add project paths
 PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
 sys.path.append(str(PROJECT_ROOT / "dbs"))
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
-from connection import get_connection
+from event_context import ensure_context
+from attack_counters import get_attack_counters
 
 
-def evaluate_brute_force_rule(rule, ip_address):
+def evaluate_brute_force_rule(rule, ip_address, context=None):
     """
     Evaluate brute force rule: X failed attempts in Y minutes
 
@@ -46,19 +47,10 @@ def evaluate_brute_force_rule(rule, ip_address):
         max_abuse_score = conditions.get('max_abuseipdb_score')
         block_method = conditions.get('block_method', 'fail2ban')
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        try:
+        with ensure_context(context, ip_address) as ctx:
             # Check max_abuseipdb_score filter (for "clean IP only" rules)
             if max_abuse_score is not None:
-                cursor.execute("""
-                    SELECT abuseipdb_score FROM ip_threat_intelligence
-                    WHERE ip_address_text = %s
-                    ORDER BY last_seen DESC LIMIT 1
-                """, (ip_address,))
-                threat_row = cursor.fetchone()
-                ip_abuse_score = threat_row['abuseipdb_score'] if threat_row and threat_row['abuseipdb_score'] else 0
+                ip_abuse_score = ctx.get_abuseipdb_score()
 
                 if ip_abuse_score > max_abuse_score:
                     # IP is not "clean" - skip this rule (let bad-IP rules handle it)
@@ -70,23 +62,15 @@ def evaluate_brute_force_rule(rule, ip_address):
                         'block_method': block_method
                     }
 
-            # Calculate time window
-            cutoff_time = datetime.now() - timedelta(minutes=time_window)
-
-            # Count failed attempts in time window
-            cursor.execute("""
-                SELECT
-                    COUNT(*) as attempt_count,
-                    MAX(id) as latest_event_id
-                FROM auth_events
-                WHERE source_ip_text = %s
-                AND event_type = %s
-                AND timestamp >= %s
-            """, (ip_address, event_type, cutoff_time))
-
-            result = cursor.fetchone()
-            attempt_count = result['attempt_count']
-            latest_event_id = result['latest_event_id']
+            # Count attempts in time window (sliding-window counters, SQL if not covered)
+            counters = get_attack_counters()
+            attempt_count = counters.count_ip(ip_address, time_window * 60, event_type)
+            if attempt_count is not None:
+                latest_event_id = counters.latest_event_id(ip_address, event_type)
+            else:
+                attempts = ctx.get_event_stats(time_window, event_type)
+                attempt_count = attempts['count']
+                latest_event_id = attempts['latest_event_id']
 
             if attempt_count >= threshold:
                 return {
@@ -105,10 +89,6 @@ def evaluate_brute_force_rule(rule, ip_address):
                 'block_method': block_method
             }
 
-        finally:
-            cursor.close()
-            conn.close()
-
     except Exception as e:
         print(f"❌ Error evaluating brute force rule: {e}")
         return {
@@ -120,7 +100,7 @@ def evaluate_brute_force_rule(rule, ip_address):
         }
 
 
-def evaluate_threat_threshold_rule(rule, ip_address, event_type=None):
+def evaluate_threat_threshold_rule(rule, ip_address, event_type=None, context=None):
     """
     Evaluate threat-based rule: Block based on AbuseIPDB score tiers
 
@@ -163,22 +143,9 @@ def evaluate_threat_threshold_rule(rule, ip_address, event_type=None):
             'critical': 4
         }
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        try:
+        with ensure_context(context, ip_address) as ctx:
             # Get threat intelligence for IP
-            cursor.execute("""
-                SELECT
-                    overall_threat_level,
-                    threat_confidence,
-                    abuseipdb_score,
-                    virustotal_positives
-                FROM ip_threat_intelligence
-                WHERE ip_address_text = %s
-            """, (ip_address,))
-
-            threat_data = cursor.fetchone()
+            threat_data = ctx.get_threat()
 
             if not threat_data:
                 return {
@@ -195,15 +162,7 @@ def evaluate_threat_threshold_rule(rule, ip_address, event_type=None):
 
             # Check if failed login requirement is met
             if require_failed_login or min_failed_attempts > 1:
-                cursor.execute("""
-                    SELECT COUNT(*) as fail_count
-                    FROM auth_events
-                    WHERE source_ip_text = %s
-                    AND event_type = 'failed'
-                    AND timestamp >= NOW() - INTERVAL 1 HOUR
-                """, (ip_address,))
-                fail_result = cursor.fetchone()
-                fail_count = fail_result['fail_count'] if fail_result else 0
+                fail_count = ctx.count_events(60, 'failed')
 
                 if fail_count < min_failed_attempts:
                     return {
@@ -247,10 +206,6 @@ def evaluate_threat_threshold_rule(rule, ip_address, event_type=None):
                 'abuseipdb_score': abuseipdb_score
             }
 
-        finally:
-            cursor.close()
-            conn.close()
-
     except Exception as e:
         print(f"Error evaluating threat threshold rule: {e}")
         return {
@@ -262,7 +217,7 @@ def evaluate_threat_threshold_rule(rule, ip_address, event_type=None):
         }
 
 
-def evaluate_high_risk_country_rule(rule, ip_address):
+def evaluate_high_risk_country_rule(rule, ip_address, context=None):
     """
     Evaluate high-risk country rule: Block IPs from specified countries after N failed attempts
 
@@ -277,18 +232,9 @@ def evaluate_high_risk_country_rule(rule, ip_address):
         blocked_countries = conditions.get('countries', ['CN', 'RU', 'KP', 'IR', 'BY'])
         min_failed_attempts = conditions.get('min_failed_attempts', 2)
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        try:
+        with ensure_context(context, ip_address) as ctx:
             # Get country code for IP
-            cursor.execute("""
-                SELECT country_code, country_name
-                FROM ip_geolocation
-                WHERE ip_address_text = %s
-            """, (ip_address,))
-
-            geo_data = cursor.fetchone()
+            geo_data = ctx.get_geo()
 
             if not geo_data or not geo_data['country_code']:
                 return {
@@ -309,16 +255,7 @@ def evaluate_high_risk_country_rule(rule, ip_address):
                 }
 
             # Country is high-risk, check failed attempts
-            cursor.execute("""
-                SELECT COUNT(*) as fail_count
-                FROM auth_events
-                WHERE source_ip_text = %s
-                AND event_type = 'failed'
-                AND timestamp >= NOW() - INTERVAL 1 HOUR
-            """, (ip_address,))
-
-            fail_result = cursor.fetchone()
-            fail_count = fail_result['fail_count'] if fail_result else 0
+            fail_count = ctx.count_events(60, 'failed')
 
             if fail_count >= min_failed_attempts:
                 return {
@@ -335,10 +272,6 @@ def evaluate_high_risk_country_rule(rule, ip_address):
                 'failed_attempts': fail_count
             }
 
-        finally:
-            cursor.close()
-            conn.close()
-
     except Exception as e:
         print(f"Error evaluating high-risk country rule: {e}")
         return {
@@ -349,7 +282,7 @@ def evaluate_high_risk_country_rule(rule, ip_address):
         }
 
 
-def evaluate_repeat_offender_rule(rule, ip_address):
+def evaluate_repeat_offender_rule(rule, ip_address, context=None):
     """
     Evaluate repeat offender rule: Escalate block duration for repeat offenders
 
@@ -375,19 +308,9 @@ def evaluate_repeat_offender_rule(rule, ip_address):
         conditions = rule['conditions']
         escalation = conditions.get('escalation', {'2': 2, '3': 10080, '4': 43200})
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        try:
+        with ensure_context(context, ip_address) as ctx:
             # Count previous blocks for this IP
-            cursor.execute("""
-                SELECT COUNT(*) as block_count
-                FROM ip_blocks
-                WHERE ip_address_text = %s
-            """, (ip_address,))
-
-            result = cursor.fetchone()
-            previous_blocks = result['block_count'] if result else 0
+            previous_blocks = ctx.get_block_count()
 
             # Current offense number (this would be the next one)
             offense_number = previous_blocks + 1
@@ -414,10 +337,6 @@ def evaluate_repeat_offender_rule(rule, ip_address):
                 'fixed_duration': fixed_duration
             }
 
-        finally:
-            cursor.close()
-            conn.close()
-
     except Exception as e:
         print(f"Error evaluating repeat offender rule: {e}")
         return {
@@ -429,31 +348,22 @@ def evaluate_repeat_offender_rule(rule, ip_address):
         }
 
 
-def get_repeat_offender_duration(ip_address, base_duration):
+def get_repeat_offender_duration(ip_address, base_duration, context=None):
     """
     Get adjusted block duration based on repeat offender status
 
     Args:
         ip_address: IP to check
         base_duration: Base duration in minutes from the rule
+        context: Optional EventContext shared with the other pipeline stages
 
     Returns:
         int: Adjusted duration in minutes
     """
     try:
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        try:
+        with ensure_context(context, ip_address) as ctx:
             # Count previous blocks
-            cursor.execute("""
-                SELECT COUNT(*) as block_count
-                FROM ip_blocks
-                WHERE ip_address_text = %s
-            """, (ip_address,))
-
-            result = cursor.fetchone()
-            previous_blocks = result['block_count'] if result else 0
+            previous_blocks = ctx.get_block_count()
             offense_number = previous_blocks + 1
 
             # Escalation rules (2nd = 2x, 3rd = 7 days, 4th+ = 30 days)
@@ -466,9 +376,5 @@ def get_repeat_offender_duration(ip_address, base_duration):
             else:
                 return 43200  # 30 days
 
-        finally:
-            cursor.close()
-            conn.close()
-
     except Exception:
         return base_duration
@@ -9,11 +9,13 @@ from pathlib import Path
 # Add project paths
 PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
 sys.path.append(str(PROJECT_ROOT / "dbs"))
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from connection import get_connection
+from event_context import ensure_context
 
 
-def evaluate_threat_combo_rule(rule, ip_address, event_type=None):
+def evaluate_threat_combo_rule(rule, ip_address, event_type=None, context=None):
     """
     Evaluate combined threat signals rule.
 
@@ -54,18 +56,9 @@ def evaluate_threat_combo_rule(rule, ip_address, event_type=None):
         require_greynoise_scanner = conditions.get('is_greynoise_scanner', False)
         exclude_greynoise_benign = conditions.get('exclude_greynoise_benign', False)
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        try:
+        with ensure_context(context, ip_address) as ctx:
             # Get threat intelligence data
-            cursor.execute("""
-                SELECT abuseipdb_score, virustotal_positives, shodan_vulns
-                FROM ip_threat_intelligence
-                WHERE ip_address_text = %s
-            """, (ip_address,))
-
-            threat_data = cursor.fetchone()
+            threat_data = ctx.get_threat()
             abuseipdb_score = int(threat_data['abuseipdb_score'] or 0) if threat_data else 0
             vt_positives = int(threat_data['virustotal_positives'] or 0) if threat_data else 0
 
@@ -80,13 +73,7 @@ def evaluate_threat_combo_rule(rule, ip_address, event_type=None):
                     shodan_vulns = 0
 
             # Get geo flags and GreyNoise data
-            cursor.execute("""
-                SELECT is_tor, is_proxy, is_vpn, greynoise_noise, greynoise_riot
-                FROM ip_geolocation
-                WHERE ip_address_text = %s
-            """, (ip_address,))
-
-            geo_data = cursor.fetchone()
+            geo_data = ctx.get_geo()
             is_tor = geo_data and geo_data.get('is_tor', False)
             is_proxy = geo_data and (geo_data.get('is_proxy', False) or geo_data.get('is_vpn', False))
             greynoise_noise = geo_data and geo_data.get('greynoise_noise', False)
@@ -95,15 +82,7 @@ def evaluate_threat_combo_rule(rule, ip_address, event_type=None):
             # Check failed login if required
             if require_failed:
                 if event_type != 'failed':
-                    cursor.execute("""
-                        SELECT COUNT(*) as fail_count
-                        FROM auth_events
-                        WHERE source_ip_text = %s
-                        AND event_type = 'failed'
-                        AND timestamp >= NOW() - INTERVAL 1 HOUR
-                    """, (ip_address,))
-                    result = cursor.fetchone()
-                    if (result['fail_count'] or 0) == 0:
+                    if ctx.count_events(60, 'failed') == 0:
                         return {
                             'triggered': False,
                             'reason': 'No failed login attempts (required for combo rule)',
@@ -197,10 +176,6 @@ def evaluate_threat_combo_rule(rule, ip_address, event_type=None):
                 'greynoise_riot': greynoise_riot
             }
 
-        finally:
-            cursor.close()
-            conn.close()
-
     except Exception as e:
         print(f"Error evaluating threat combo rule: {e}")
         return {
@@ -2,11 +2,28 @@
 SSH Guardian v3.0 - Redis Cache Module
 High-performance caching for dashboard queries
 TTL values configured via .env file
+
+Keys are versioned per family (the first part after 'sshg:', e.g.
+'events_list' or 'trends'): a key is stored as sshg:<family>@<gen>:<rest>
+and the generations live in one Redis hash. Invalidating families is a
+single atomic bump of their generations - no KEYS scan - and entries of
+older generations are simply never read again and expire with their TTL.
+
+get_or_set() protects hot keys from stampedes: one computation per key at a
+time (in-process and across processes via a Redis lock), probabilistic
+early refresh before expiry, and stale values served for a grace period
+while a background refresh runs.
 """
 
 import redis
 import json
+import math
+import time
+import uuid
+import random
 import hashlib
+import threading
+from collections import Counter
 from typing import Any, Optional, Union
 from datetime import datetime, timedelta
 import os
@@ -50,6 +67,13 @@ CACHE_TTL = {
     'settings': int(os.getenv('CACHE_TTL_SETTINGS', 30)),
 }
 
+# Stampede protection for get_or_set (see .env)
+CACHE_STALE_TTL_SEC = int(os.getenv('CACHE_STALE_TTL_SEC', 15))
+CACHE_EARLY_EXPIRY_BETA = float(os.getenv('CACHE_EARLY_EXPIRY_BETA', 1.0))
+CACHE_LOCK_TIMEOUT_MS = int(os.getenv('CACHE_LOCK_TIMEOUT_MS', 10000))
+CACHE_LOCK_WAIT_MS = int(os.getenv('CACHE_LOCK_WAIT_MS', 5000))
+CACHE_STATS_FLUSH_SEC = int(os.getenv('CACHE_STATS_FLUSH_SEC', 5))
+
 # GLOBAL CACHE ENABLE/DISABLE TOGGLE from environment
 # When False, ALL caching is bypassed - useful for debugging
 _GLOBAL_CACHE_ENABLED = os.getenv('CACHE_ENABLED', '1') == '1'
@@ -131,6 +155,101 @@ def get_ttl(cache_type: str = None, endpoint_key: str = None) -> int:
 
     return 300  # Default 5 minutes
 
+# Family -> generation hash (see module docstring)
+GENERATIONS_KEY = 'sshg:_generations'
+
+# get_or_set recompute locks and the counters shared by all processes
+LOCK_KEY_PREFIX = 'sshg:_lock:'
+STATS_KEY = 'sshg:_stats'
+
+# Counters reported by /api/dashboard/system/cache/stats
+CACHE_COUNTERS = (
+    'hits',              # fresh value served
+    'misses',            # nothing cached
+    'stale_served',      # expired value served while refreshing
+    'early_refreshes',   # refresh started before expiry (probabilistic)
+    'refreshes',         # background refreshes completed
+    'refresh_errors',    # background refreshes that raised
+    'computes',          # values computed in the request (misses)
+    'coalesced',         # requests that waited for another's computation
+)
+
+# Marks values written by get_or_set, which carry their own expiry
+_ENTRY_MARKER = '_sshg_entry'
+
+# Keys per SCAN call / UNLINK batch for explicit sweeps
+SCAN_COUNT = 1000
+UNLINK_BATCH = 500
+
+# Family prefixes each cache type invalidates (auto_invalidate,
+# invalidate_for_table and the CacheManager.invalidate_* helpers)
+CACHE_TYPE_FAMILIES = {
+    'events': ('events', 'dashboard'),
+    'blocking': ('blocking', 'ip_blocks', 'firewall'),
+    'agents': ('agents', 'agent'),
+    'settings': ('settings', 'config'),
+    'notifications': ('notif', 'notification'),
+    'users': ('users', 'user', 'roles'),
+    'ml': ('ml', 'model', 'prediction'),
+    'reports': ('reports', 'trends', 'daily'),
+    'audit': ('audit',),
+    'geoip': ('geoip', 'geo'),
+    'threat_intel': ('threat', 'intel'),
+    'all': ('',),
+}
+
+# The scripts build data keys from their arguments, so they assume a single
+# Redis instance (not Redis Cluster), as configured above.
+_GET_SCRIPT = """
+local gen = redis.call('HGET', KEYS[1], ARGV[1])
+if not gen then
+    return false
+end
+return redis.call('GET', 'sshg:' .. ARGV[1] .. '@' .. gen .. ARGV[2])
+"""
+
+# ARGV[5] seeds a family's generation with the current time in microseconds,
+# so a lost generations hash can never bring back older entries
+_SET_SCRIPT = """
+local gen = redis.call('HGET', KEYS[1], ARGV[1])
+if not gen then
+    gen = ARGV[5]
+    redis.call('HSET', KEYS[1], ARGV[1], gen)
+end
+redis.call('SET', 'sshg:' .. ARGV[1] .. '@' .. gen .. ARGV[2], ARGV[4], 'EX', ARGV[3])
+return gen
+"""
+
+_DELETE_SCRIPT = """
+local gen = redis.call('HGET', KEYS[1], ARGV[1])
+if not gen then
+    return 0
+end
+return redis.call('DEL', 'sshg:' .. ARGV[1] .. '@' .. gen .. ARGV[2])
+"""
+
+_UNLOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Bump every family starting with any of the prefixes in ARGV ('' = all)
+_BUMP_SCRIPT = """
+local bumped = 0
+for _, family in ipairs(redis.call('HKEYS', KEYS[1])) do
+    for _, prefix in ipairs(ARGV) do
+        if string.sub(family, 1, string.len(prefix)) == prefix then
+            redis.call('HINCRBY', KEYS[1], family, 1)
+            bumped = bumped + 1
+            break
+        end
+    end
+end
+return bumped
+"""
+
 # Global Redis connection pool
 _redis_pool = None
 _redis_client = None
@@ -184,12 +303,44 @@ def cache_key_hash(*args, **kwargs) -> str:
     return f"sshg:{prefix}:{key_hash}"
 
 
+def _split_key(key: str):
+    """'sshg:family:rest' -> ('family', ':rest')"""
+    if key.startswith('sshg:'):
+        key = key[5:]
+    family, sep, rest = key.partition(':')
+    return family, sep + rest
+
+
+def _escape_glob(text: str) -> str:
+    """Escape Redis MATCH glob characters"""
+    for char in ('\\', '*', '?', '[', ']'):
+        text = text.replace(char, '\\' + char)
+    return text
+
+
 class CacheManager:
     """Centralized cache management for SSH Guardian"""
 
     def __init__(self):
         self.client = get_redis_client()
         self.enabled = self.client is not None
+        if self.enabled:
+            self._get_script = self.client.register_script(_GET_SCRIPT)
+            self._set_script = self.client.register_script(_SET_SCRIPT)
+            self._delete_script = self.client.register_script(_DELETE_SCRIPT)
+            self._bump_script = self.client.register_script(_BUMP_SCRIPT)
+            self._unlock_script = self.client.register_script(_UNLOCK_SCRIPT)
+
+        # Stampede protection state (per process)
+        self._flights = {}
+        self._refreshing = set()
+        self._flight_lock = threading.Lock()
+
+        # Counters, flushed to STATS_KEY every CACHE_STATS_FLUSH_SEC
+        self._counters = Counter()
+        self._unflushed = Counter()
+        self._counters_lock = threading.Lock()
+        self._last_flush = time.time()
 
     def get(self, key: str, endpoint_key: str = None) -> Optional[Any]:
         """
@@ -206,15 +357,34 @@ class CacheManager:
         if not self.enabled:
             return None
 
-        try:
-            value = self.client.get(key)
-            if value:
-                return json.loads(value)
+        entry = self._read(key)
+        if entry is None or entry[1] <= time.time():
+            self._count('misses')
             return None
+        self._count('hits')
+        return entry[0]
+
+    def _read(self, key: str):
+        """
+        Read a key without counting it.
+
+        Returns:
+            (value, expires_at, compute_seconds) or None; plain set() values
+            never expire logically (Redis TTL only)
+        """
+        try:
+            raw = self._get_script(keys=[GENERATIONS_KEY], args=list(_split_key(key)))
+            if not raw:
+                return None
+            value = json.loads(raw)
         except Exception as e:
             print(f"[Cache] Get error for {key}: {e}")
             return None
 
+        if isinstance(value, dict) and value.get(_ENTRY_MARKER):
+            return value['value'], value['expires_at'], value['delta']
+        return value, math.inf, 0.0
+
     def set(self, key: str, value: Any, ttl: int = 60) -> bool:
         """Set value in cache with TTL"""
         # Check global cache toggle first
@@ -224,9 +394,16 @@ class CacheManager:
         if not self.enabled:
             return False
 
+        return self._write(key, value, ttl)
+
+    def _write(self, key: str, value: Any, ttl: int) -> bool:
         try:
             serialized = json.dumps(value, default=self._json_serializer)
-            self.client.setex(key, ttl, serialized)
+            family, rest = _split_key(key)
+            self._set_script(
+                keys=[GENERATIONS_KEY],
+                args=[family, rest, ttl, serialized, int(time.time() * 1000000)]
+            )
             return True
         except Exception as e:
             print(f"[Cache] Set error for {key}: {e}")
@@ -238,101 +415,346 @@ class CacheManager:
             return False
 
         try:
-            self.client.delete(key)
+            self._delete_script(keys=[GENERATIONS_KEY], args=list(_split_key(key)))
             return True
         except Exception as e:
             print(f"[Cache] Delete error for {key}: {e}")
             return False
 
     def delete_pattern(self, pattern: str) -> int:
-        """Delete all keys matching a pattern"""
+        """
+        Invalidate all keys starting with sshg:<pattern>.
+
+        A pattern without ':' names family prefixes ('events' covers
+        events_list, events_count, ...) and bumps their generations. A
+        pattern below family level ('firewall:12') deletes the matching keys
+        of the family's current generation with a SCAN sweep.
+
+        Returns:
+            Number of families bumped, or keys deleted by a sweep
+        """
+        if ':' not in pattern:
+            return self.invalidate_families(pattern)
+
         if not self.enabled:
             return 0
 
+        family, rest = _split_key(pattern)
         try:
-            keys = self.client.keys(f"sshg:{pattern}*")
-            if keys:
-                return self.client.delete(*keys)
-            return 0
+            gen = self.client.hget(GENERATIONS_KEY, family)
+            if gen is None:
+                return 0
+            return self.sweep(f"sshg:{_escape_glob(family)}@{gen}{_escape_glob(rest)}*")
         except Exception as e:
             print(f"[Cache] Delete pattern error for {pattern}: {e}")
             return 0
 
+    def invalidate_families(self, *prefixes: str) -> int:
+        """
+        Bump the generation of every family starting with one of the
+        prefixes ('' = every family), in one round trip.
+
+        Returns:
+            Number of families bumped
+        """
+        if not self.enabled:
+            return 0
+
+        try:
+            return int(self._bump_script(keys=[GENERATIONS_KEY], args=list(prefixes)))
+        except Exception as e:
+            print(f"[Cache] Invalidate error for {prefixes}: {e}")
+            return 0
+
+    def invalidate_types(self, *cache_types: str) -> int:
+        """Invalidate the families of CACHE_TYPE_FAMILIES cache types at once"""
+        prefixes = []
+        for cache_type in cache_types:
+            prefixes.extend(CACHE_TYPE_FAMILIES.get(cache_type, ()))
+        if not prefixes:
+            return 0
+        return self.invalidate_families(*prefixes)
+
+    def sweep(self, match: str) -> int:
+        """
+        Delete keys matching a Redis glob with SCAN + UNLINK (never KEYS,
+        which blocks Redis for the whole keyspace).
+
+        Returns:
+            Number of keys deleted
+        """
+        if not self.enabled:
+            return 0
+
+        deleted = 0
+        batch = []
+        try:
+            for key in self.client.scan_iter(match=match, count=SCAN_COUNT):
+                batch.append(key)
+                if len(batch) >= UNLINK_BATCH:
+                    deleted += self.client.unlink(*batch)
+                    batch = []
+            if batch:
+                deleted += self.client.unlink(*batch)
+        except Exception as e:
+            print(f"[Cache] Sweep error for {match}: {e}")
+        return deleted
+
+    def clear_all(self) -> int:
+        """
+        Invalidate every cache entry at once, then free their memory with
+        a SCAN sweep.
+
+        Returns:
+            Number of keys deleted
+        """
+        self.invalidate_families('')
+        return self.sweep('sshg:*')
+
     def invalidate_events(self):
         """Invalidate all events-related caches"""
-        self.delete_pattern('events')
-        self.delete_pattern('dashboard')
+        self.invalidate_types('events')
 
     def invalidate_ip(self, ip_address: str):
         """Invalidate all caches for a specific IP"""
         self.delete_pattern(f'ip:{ip_address}')
-        self.delete_pattern('geoip')
-        self.delete_pattern('threat')
-        self.delete_pattern('events')  # Events may contain this IP
+        # Events may contain this IP
+        self.invalidate_families('geoip', 'threat', 'events')
 
     def invalidate_blocking(self):
         """Invalidate blocking-related caches"""
-        self.delete_pattern('blocking')
-        self.delete_pattern('ip_blocks')
-        self.delete_pattern('firewall')
+        self.invalidate_types('blocking')
 
     def invalidate_agents(self):
         """Invalidate agent-related caches"""
-        self.delete_pattern('agents')
-        self.delete_pattern('agent')
+        self.invalidate_types('agents')
 
     def invalidate_settings(self):
         """Invalidate settings-related caches"""
-        self.delete_pattern('settings')
-        self.delete_pattern('config')
+        self.invalidate_types('settings')
 
     def invalidate_notifications(self):
         """Invalidate notification-related caches"""
-        self.delete_pattern('notif')
-        self.delete_pattern('notification')
+        self.invalidate_types('notifications')
 
     def invalidate_users(self):
         """Invalidate user-related caches"""
-        self.delete_pattern('users')
-        self.delete_pattern('user')
-        self.delete_pattern('roles')
+        self.invalidate_types('users')
 
     def invalidate_ml(self):
         """Invalidate ML-related caches"""
-        self.delete_pattern('ml')
-        self.delete_pattern('model')
-        self.delete_pattern('prediction')
+        self.invalidate_types('ml')
 
     def invalidate_reports(self):
         """Invalidate reports-related caches"""
-        self.delete_pattern('reports')
-        self.delete_pattern('trends')
-        self.delete_pattern('daily')
+        self.invalidate_types('reports')
 
     def invalidate_audit(self):
         """Invalidate audit-related caches"""
-        self.delete_pattern('audit')
+        self.invalidate_types('audit')
 
     def invalidate_geoip(self):
         """Invalidate GeoIP-related caches"""
-        self.delete_pattern('geoip')
-        self.delete_pattern('geo')
+        self.invalidate_types('geoip')
 
     def invalidate_threat_intel(self):
         """Invalidate threat intelligence caches"""
-        self.delete_pattern('threat')
-        self.delete_pattern('intel')
+        self.invalidate_types('threat_intel')
 
-    def get_or_set(self, key: str, func: callable, ttl: int = 60) -> Any:
-        """Get from cache or compute and set"""
-        cached = self.get(key)
-        if cached is not None:
-            return cached
+    def get_or_set(self, key: str, func: callable, ttl: int = 60,
+                   stale_ttl: Optional[int] = None) -> Any:
+        """
+        Get from cache or compute and set, without stampedes.
 
-        result = func()
-        if result is not None:
-            self.set(key, result, ttl)
-        return result
+        - Only one caller computes a missing key; concurrent callers (in this
+          process, or in others via a Redis lock) wait for its result.
+        - Shortly before expiry a request may, with rising probability
+          (XFetch, scaled by compute time and CACHE_EARLY_EXPIRY_BETA),
+          start a background refresh while still getting the cached value.
+        - For stale_ttl seconds after expiry the old value is served while
+          a background refresh runs.
+
+        func may run on a background thread, so it must not depend on the
+        Flask request context (capture request arguments beforehand).
+        Read keys filled here through get_or_set() or get().
+
+        Args:
+            key: The cache key
+            func: Computes the value (None results are not cached)
+            ttl: Seconds the value is fresh
+            stale_ttl: Seconds an expired value may still be served
+                (default CACHE_STALE_TTL_SEC, 0 = never)
+        """
+        if not _GLOBAL_CACHE_ENABLED or not self.enabled:
+            return func()
+
+        if stale_ttl is None:
+            stale_ttl = CACHE_STALE_TTL_SEC
+
+        entry = self._read(key)
+        if entry is not None:
+            value, expires_at, delta = entry
+            now = time.time()
+            if now < expires_at:
+                if (self._expires_early(expires_at, delta, now)
+                        and self._refresh_in_background(key, func, ttl, stale_ttl)):
+                    self._count('early_refreshes')
+                self._count('hits')
+                return value
+            if stale_ttl > 0:
+                self._count('stale_served')
+                self._refresh_in_background(key, func, ttl, stale_ttl)
+                return value
+
+        self._count('misses')
+        return self._compute_single_flight(key, func, ttl, stale_ttl)
+
+    @staticmethod
+    def _expires_early(expires_at: float, delta: float, now: float) -> bool:
+        """XFetch: refresh early with probability growing towards expiry"""
+        if CACHE_EARLY_EXPIRY_BETA <= 0 or delta <= 0:
+            return False
+        return now - delta * CACHE_EARLY_EXPIRY_BETA * math.log(1.0 - random.random()) >= expires_at
+
+    def _compute(self, key: str, func: callable, ttl: int, stale_ttl: int) -> Any:
+        """Run func and store its result with its compute time"""
+        started = time.time()
+        value = func()
+        delta = time.time() - started
+        if value is not None:
+            self._write(key, {
+                _ENTRY_MARKER: 1,
+                'value': value,
+                'expires_at': time.time() + ttl,
+                'delta': round(delta, 4)
+            }, ttl + stale_ttl)
+        return value
+
+    def _compute_single_flight(self, key: str, func: callable, ttl: int, stale_ttl: int) -> Any:
+        """Compute a missing key once; concurrent callers share the result"""
+        with self._flight_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = {'event': threading.Event(), 'value': None, 'error': None}
+                self._flights[key] = flight
+
+        if not leader:
+            self._count('coalesced')
+            if flight['event'].wait(CACHE_LOCK_WAIT_MS / 1000):
+                if flight['error'] is not None:
+                    raise flight['error']
+                return flight['value']
+            return func()
+
+        try:
+            token = self._acquire_lock(key)
+            if token is None:
+                # Another process is computing: wait for its value
+                self._count('coalesced')
+                entry = self._wait_for_value(key)
+                if entry is not None:
+                    flight['value'] = entry[0]
+                    return entry[0]
+            try:
+                self._count('computes')
+                flight['value'] = self._compute(key, func, ttl, stale_ttl)
+                return flight['value']
+            finally:
+                if token is not None:
+                    self._release_lock(key, token)
+        except Exception as e:
+            flight['error'] = e
+            raise
+        finally:
+            flight['event'].set()
+            with self._flight_lock:
+                self._flights.pop(key, None)
+
+    def _refresh_in_background(self, key: str, func: callable, ttl: int, stale_ttl: int) -> bool:
+        """Recompute a key on a daemon thread unless a refresh is running"""
+        with self._flight_lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+
+        token = self._acquire_lock(key)
+        if token is None:
+            with self._flight_lock:
+                self._refreshing.discard(key)
+            return False
+
+        def run():
+            try:
+                self._compute(key, func, ttl, stale_ttl)
+                self._count('refreshes')
+            except Exception as e:
+                self._count('refresh_errors')
+                print(f"[Cache] Background refresh error for {key}: {e}")
+            finally:
+                self._release_lock(key, token)
+                with self._flight_lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name='cache-refresh', daemon=True).start()
+        return True
+
+    def _acquire_lock(self, key: str) -> Optional[str]:
+        """Take the cross-process recompute lock for a key (None if held)"""
+        token = uuid.uuid4().hex
+        try:
+            if self.client.set(LOCK_KEY_PREFIX + key, token, nx=True, px=CACHE_LOCK_TIMEOUT_MS):
+                return token
+            return None
+        except Exception as e:
+            print(f"[Cache] Lock error for {key}: {e}")
+            return token  # Redis trouble: compute without the lock
+
+    def _release_lock(self, key: str, token: str):
+        try:
+            self._unlock_script(keys=[LOCK_KEY_PREFIX + key], args=[token])
+        except Exception as e:
+            print(f"[Cache] Unlock error for {key}: {e}")
+
+    def _wait_for_value(self, key: str):
+        """Poll for a value another process is computing (None on timeout)"""
+        deadline = time.time() + CACHE_LOCK_WAIT_MS / 1000
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = self._read(key)
+            if entry is not None and entry[1] > time.time():
+                return entry
+            try:
+                if not self.client.exists(LOCK_KEY_PREFIX + key):
+                    return self._read(key)
+            except Exception:
+                return None
+        return None
+
+    def _count(self, name: str):
+        """Count an event; totals are flushed to Redis periodically"""
+        with self._counters_lock:
+            self._counters[name] += 1
+            self._unflushed[name] += 1
+            due = time.time() - self._last_flush >= CACHE_STATS_FLUSH_SEC
+        if due:
+            self._flush_counters()
+
+    def _flush_counters(self):
+        with self._counters_lock:
+            pending, self._unflushed = self._unflushed, Counter()
+            self._last_flush = time.time()
+        if not pending or not self.enabled:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for name, value in pending.items():
+                pipe.hincrby(STATS_KEY, name, value)
+            pipe.execute()
+        except Exception as e:
+            with self._counters_lock:
+                self._unflushed.update(pending)
+            print(f"[Cache] Stats flush error: {e}")
 
     def _json_serializer(self, obj):
         """Custom JSON serializer for datetime and Decimal"""
@@ -348,14 +770,25 @@ class CacheManager:
             return {'enabled': False}
 
         try:
+            self._flush_counters()
             info = self.client.info('memory')
             keys = self.client.dbsize()
+            totals = self.client.hgetall(STATS_KEY)
+            counters = {name: int(totals.get(name, 0)) for name in CACHE_COUNTERS}
+            with self._counters_lock:
+                process_counters = {name: self._counters[name] for name in CACHE_COUNTERS}
+            served = counters['hits'] + counters['stale_served']
+            lookups = served + counters['misses']
             return {
                 'enabled': True,
                 'connected': True,
                 'memory_used': info.get('used_memory_human', 'N/A'),
                 'memory_peak': info.get('used_memory_peak_human', 'N/A'),
-                'total_keys': keys
+                'total_keys': keys,
+                'cache_families': self.client.hlen(GENERATIONS_KEY),
+                'counters': counters,
+                'process_counters': process_counters,
+                'hit_rate': round(served / lookups * 100, 1) if lookups else None
             }
         except Exception as e:
             return {'enabled': True, 'connected': False, 'error': str(e)}
@@ -423,8 +856,7 @@ def invalidate_on_new_event():
 def invalidate_on_block_change():
     """Call this when IP blocks are added/removed"""
     cache = get_cache()
-    cache.invalidate_blocking()
-    cache.invalidate_events()  # Events list may show blocked status
+    cache.invalidate_types('blocking', 'events')  # Events list may show blocked status
 
 
 def invalidate_on_agent_change():
@@ -512,32 +944,7 @@ def auto_invalidate(*cache_types):
 
             # Only invalidate on success (2xx status codes)
             if 200 <= status_code < 300:
-                cache = get_cache()
-                for cache_type in cache_types:
-                    if cache_type == 'events':
-                        cache.invalidate_events()
-                    elif cache_type == 'blocking':
-                        cache.invalidate_blocking()
-                    elif cache_type == 'agents':
-                        cache.invalidate_agents()
-                    elif cache_type == 'settings':
-                        cache.invalidate_settings()
-                    elif cache_type == 'notifications':
-                        cache.invalidate_notifications()
-                    elif cache_type == 'users':
-                        cache.invalidate_users()
-                    elif cache_type == 'ml':
-                        cache.invalidate_ml()
-                    elif cache_type == 'reports':
-                        cache.invalidate_reports()
-                    elif cache_type == 'audit':
-                        cache.invalidate_audit()
-                    elif cache_type == 'geoip':
-                        cache.invalidate_geoip()
-                    elif cache_type == 'threat_intel':
-                        cache.invalidate_threat_intel()
-                    elif cache_type == 'all':
-                        cache.delete_pattern('')
+                get_cache().invalidate_types(*cache_types)
 
             return result
         return decorated_function
@@ -608,30 +1015,8 @@ def invalidate_for_table(table_name: str):
     """
     cache_types = TABLE_CACHE_MAP.get(table_name, [])
     if cache_types:
-        cache = get_cache()
-        for cache_type in cache_types:
-            if cache_type == 'events':
-                cache.invalidate_events()
-            elif cache_type == 'blocking':
-                cache.invalidate_blocking()
-            elif cache_type == 'agents':
-                cache.invalidate_agents()
-            elif cache_type == 'settings':
-                cache.invalidate_settings()
-            elif cache_type == 'notifications':
-                cache.invalidate_notifications()
-            elif cache_type == 'users':
-                cache.invalidate_users()
-            elif cache_type == 'ml':
-                cache.invalidate_ml()
-            elif cache_type == 'reports':
-                cache.invalidate_reports()
-            elif cache_type == 'audit':
-                cache.invalidate_audit()
-            elif cache_type == 'geoip':
-                cache.invalidate_geoip()
-            elif cache_type == 'threat_intel':
-                cache.invalidate_threat_intel()
+        # One generation bump for all of the table's cache types
+        get_cache().invalidate_types(*cache_types)
 
 
 def get_cache_buster_timestamp():
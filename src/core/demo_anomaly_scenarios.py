@@ -14,6 +14,7 @@ sys.path.append(str(PROJECT_ROOT / "dbs"))
 sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from connection import get_connection, ip_to_binary
+from attack_counters import record_auth_events
 
 # Real public IPs with different geographic locations
 SCENARIO_IPS = {
@@ -178,7 +179,12 @@ def create_auth_event(cursor, ip_info: dict, username: str,
         'invalid_password' if event_type == 'failed' else None
     ))
 
-    return cursor.lastrowid
+    event_id = cursor.lastrowid
+    record_auth_events([{
+        'ip_address': ip, 'username': username, 'event_type': event_type,
+        'timestamp': timestamp, 'event_id': event_id
+    }])
+    return event_id
 
 
 def create_scenario_1_impossible_travel(cursor, conn):
@@ -12,14 +12,29 @@ from datetime import datetime
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 sys.path.append(str(PROJECT_ROOT / "dbs"))
 sys.path.append(str(PROJECT_ROOT / "src"))
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from connection import get_connection
+from event_context import EventContext
+from core.write_behind import get_write_buffer
+from core.write_behind_queries import update_event_ml_results, update_event_processing_status
 
 # Notification thresholds
 HIGH_RISK_THRESHOLD = 70  # ML risk score threshold for high_risk_detected (realistic: prevents noise)
 BEHAVIORAL_ANOMALY_THRESHOLD = 60  # Behavioral anomaly score threshold for notifications
 ANOMALY_NOTIFICATION = True  # Send notification when ML anomaly detected
 
+# Column sets returned by _get_geo_data / _get_threat_data
+GEO_DATA_COLUMNS = (
+    'country_code', 'country_name', 'city', 'latitude', 'longitude',
+    'is_proxy', 'is_vpn', 'is_tor', 'is_datacenter', 'is_hosting', 'asn', 'isp'
+)
+THREAT_DATA_COLUMNS = (
+    'abuseipdb_score', 'abuseipdb_confidence', 'abuseipdb_reports',
+    'virustotal_positives', 'virustotal_total',
+    'overall_threat_level', 'threat_confidence'
+)
+
 # Risk score adjustments (tuned for realistic alerting)
 NIGHT_TIME_RISK_BOOST = 10  # +10 for logins between 10PM-6AM (reduced from 20)
 HIGH_RISK_COUNTRY_BOOST = 20  # +20 for high-risk countries on first fail (reduced from 25)
@@ -213,7 +228,9 @@ class EventEnricher:
 
     def _enrich_private_ip_event(self, event_id: int, source_ip: str,
                                   skip_blocking: bool = False,
-                                  skip_learning: bool = False) -> Dict:
+                                  skip_learning: bool = False,
+                                  event_data: Optional[Dict] = None,
+                                  context: Optional[EventContext] = None) -> Dict:
         """
         Behavioral-only enrichment for private network IPs.
 
@@ -243,8 +260,9 @@ class EventEnricher:
             'errors': []
         }
 
-        # Get event data
-        event_data = self._get_event_data(event_id)
+        # Get event data (already loaded in batch mode)
+        if event_data is None:
+            event_data = self._get_event_data(event_id)
         if not event_data:
             result['success'] = False
             result['errors'].append('Event not found')
@@ -286,7 +304,8 @@ class EventEnricher:
                     ml_result=result['ml'],
                     event_id=event_id,
                     event_type=event_type,
-                    username=target_username
+                    username=target_username,
+                    context=context
                 )
                 result['blocking'] = blocking_result
                 if blocking_result.get('blocked'):
@@ -604,7 +623,9 @@ class EventEnricher:
                      skip_threat_intel: bool = False,
                      skip_blocking: bool = False,
                      skip_learning: bool = False,
-                     skip_notifications: bool = False) -> Dict:
+                     skip_notifications: bool = False,
+                     prefetched: Optional[Dict] = None,
+                     context: Optional[EventContext] = None) -> Dict:
         """
         Full enrichment pipeline for a single event.
 
@@ -623,6 +644,13 @@ class EventEnricher:
             skip_blocking: Skip auto-blocking (analysis only mode)
             skip_learning: Skip behavioral profile learning (for simulation)
             skip_notifications: Skip sending notifications (for simulation)
+            prefetched: Per-IP data loaded once for a whole batch by enrich_batch
+                        ('event_data', 'geo_id', 'geo_data', 'threat_data' and,
+                        if looked up, 'threat_intel' and 'ml_result'); skips the
+                        matching queries/lookups and intermediate status updates
+            context: EventContext shared with the later pipeline stages;
+                     geo/threat rows are read through it and the blocking
+                     rules reuse it
 
         Returns:
             Dict with enrichment results
@@ -636,7 +664,9 @@ class EventEnricher:
                 event_id=event_id,
                 source_ip=source_ip,
                 skip_blocking=skip_blocking,
-                skip_learning=skip_learning
+                skip_learning=skip_learning,
+                event_data=prefetched.get('event_data') if prefetched else None,
+                context=context
             )
 
         result = {
@@ -650,7 +680,7 @@ class EventEnricher:
         }
 
         # Get event data for ML
-        event_data = self._get_event_data(event_id)
+        event_data = prefetched['event_data'] if prefetched else self._get_event_data(event_id)
         if not event_data:
             result['success'] = False
             result['errors'].append('Event not found')
@@ -661,11 +691,20 @@ class EventEnricher:
         if not skip_geoip:
             try:
                 geoip_module = self._get_geoip_module()
-                if geoip_module:
+                if prefetched:
+                    # Looked up and assigned once per IP by enrich_batch
+                    geo_id = prefetched.get('geo_id')
+                    geo_data = prefetched.get('geo_data')
+                elif geoip_module:
                     self._log(f"🌍 GeoIP lookup for {source_ip}...")
+                    if context:
+                        context.release()  # No pooled connection held over HTTP
                     geo_id = geoip_module(event_id, source_ip)
+                    if context:
+                        context.invalidate(context.GEO)
                     # Get full geo data for result
-                    geo_data = self._get_geo_data(source_ip)
+                    geo_data = self._get_geo_data(source_ip, context)
+                if prefetched or geoip_module:
                     result['geoip'] = {
                         'geo_id': geo_id,
                         'country': geo_data.get('country_name') if geo_data else None,
@@ -679,7 +718,7 @@ class EventEnricher:
                         'latitude': geo_data.get('latitude') if geo_data else None,
                         'longitude': geo_data.get('longitude') if geo_data else None
                     }
-                    if geo_id:
+                    if geo_id and not prefetched:
                         self._log(f"✅ GeoIP complete (geo_id: {geo_id})")
                         self._update_processing_status(event_id, 'geoip_complete')
             except Exception as e:
@@ -695,8 +734,12 @@ class EventEnricher:
                     self._log(f"🤖 ML prediction for event {event_id}...")
 
                     # Get geo data for ML features
-                    geo_data = self._get_geo_data(source_ip)
-                    threat_data = self._get_threat_data(source_ip)
+                    if prefetched:
+                        geo_data = prefetched.get('geo_data')
+                        threat_data = prefetched.get('threat_data')
+                    else:
+                        geo_data = self._get_geo_data(source_ip, context)
+                        threat_data = self._get_threat_data(source_ip, context)
 
                     # Add geo/threat data to event
                     enriched_event = {**event_data}
@@ -705,8 +748,11 @@ class EventEnricher:
                     if threat_data:
                         enriched_event['threat'] = threat_data
 
-                    # Get ML prediction
-                    ml_result = ml_manager.predict(enriched_event)
+                    # Get ML prediction (already scored with the batch by enrich_batch)
+                    if prefetched and 'ml_result' in prefetched:
+                        ml_result = prefetched['ml_result']
+                    else:
+                        ml_result = ml_manager.predict(enriched_event)
                     result['ml'] = ml_result
 
                     if ml_result.get('ml_available', False):
@@ -741,7 +787,8 @@ class EventEnricher:
                             ml_result.get('is_anomaly', False)
                         )
                         self._log(f"✅ ML complete (risk: {adjusted_risk_score}, type: {ml_result.get('threat_type')})")
-                        self._update_processing_status(event_id, 'ml_complete')
+                        if not prefetched:
+                            self._update_processing_status(event_id, 'ml_complete')
 
                         # Trigger rule evaluation for potential auto-blocking
                         risk_score = adjusted_risk_score
@@ -767,7 +814,8 @@ class EventEnricher:
                                     ml_result=ml_result,
                                     event_id=event_id,
                                     event_type=event_type,
-                                    username=target_username
+                                    username=target_username,
+                                    context=context
                                 )
                                 result['blocking'] = blocking_result
                                 if blocking_result.get('blocked'):
@@ -865,10 +913,19 @@ class EventEnricher:
         if not skip_threat_intel:
             try:
                 threat_module = self._get_threat_intel_module()
-                if threat_module:
+                if prefetched and 'threat_intel' in prefetched:
+                    # Looked up once per IP by enrich_batch
+                    threat_data = prefetched['threat_intel']
+                    result['threat_intel'] = threat_data
+                elif threat_module:
                     self._log(f"🔍 Threat Intel lookup for {source_ip}...")
+                    if context:
+                        context.release()  # No pooled connection held over HTTP
                     threat_data = threat_module(source_ip)
                     result['threat_intel'] = threat_data
+                    if context:
+                        # Lookup refreshed both the threat row and the merged geo columns
+                        context.invalidate(context.GEO, context.THREAT)
 
                     if threat_data:
                         threat_level = threat_data.get('threat_level', 'unknown')
@@ -985,7 +1042,8 @@ class EventEnricher:
                     ml_result=ml_result_for_blocking,
                     event_id=event_id,
                     event_type=event_type,
-                    username=target_username
+                    username=target_username,
+                    context=context
                 )
                 result['blocking'] = blocking_result
 
@@ -1003,31 +1061,253 @@ class EventEnricher:
 
         return result
 
-    def enrich_batch(self, event_ids: List[int]) -> List[Dict]:
+    def enrich_batch(self, event_ids: List[int],
+                     skip_geoip: bool = False,
+                     skip_ml: bool = False,
+                     skip_threat_intel: bool = False,
+                     skip_blocking: bool = False,
+                     skip_learning: bool = False,
+                     skip_notifications: bool = False) -> List[Dict]:
         """
-        Enrich multiple events.
+        Enrich multiple events, doing per-IP work once per unique IP.
+
+        A brute-force batch is mostly a handful of IPs repeated, so:
+        1. Load all event rows with one query
+        2. GeoIP lookup and geo_id assignment once per unique public IP
+        3. Threat Intel lookup once per unique public IP
+        4. Load geo and threat rows for all IPs with one query each
+        5. Score all public-IP events with one batched ML ensemble pass
+        6. Run the per-event steps (behavioral, blocking) with that data
 
         Args:
             event_ids: List of event IDs to enrich
+            skip_*: Same as enrich_event
 
         Returns:
-            List of enrichment results
+            List of enrichment results (same order as event_ids)
         """
+        if not event_ids:
+            return []
+
+        events = self._get_events_data(event_ids)
+        public_ips = sorted({
+            row['source_ip_text'] for row in events.values()
+            if row.get('source_ip_text') and not self._is_private_ip(row['source_ip_text'])
+        })
+        self._log(f"\n📦 Batch enrichment: {len(event_ids)} events, {len(public_ips)} unique public IPs")
+
+        # GeoIP: one lookup (cache or API) and one geo_id UPDATE per IP
+        if not skip_geoip and public_ips:
+            geoip_lookup = self._get_geoip_lookup()
+            if geoip_lookup:
+                for ip in public_ips:
+                    try:
+                        geoip_lookup(ip)
+                    except Exception as e:
+                        self._log(f"❌ GeoIP error for {ip}: {e}")
+
+        geo_rows = self._get_geo_data_bulk(public_ips) if public_ips else {}
+        if not skip_geoip and geo_rows:
+            self._assign_geo_ids(events, geo_rows)
+
+        # Threat Intel: one lookup per IP
+        threat_intel = {}
+        if not skip_threat_intel and public_ips:
+            threat_module = self._get_threat_intel_module()
+            if threat_module:
+                for ip in public_ips:
+                    try:
+                        threat_intel[ip] = threat_module(ip)
+                    except Exception as e:
+                        self._log(f"❌ Threat Intel error for {ip}: {e}")
+                        threat_intel[ip] = None
+
+        threat_rows = self._get_threat_data_bulk(public_ips) if public_ips else {}
+
+        # ML: one feature matrix and one ensemble pass for the whole batch
+        ml_results = {}
+        if not skip_ml and public_ips:
+            ml_manager = self._get_ml_manager()
+            if ml_manager:
+                ml_event_ids = []
+                ml_events = []
+                for event_id in event_ids:
+                    event_data = events.get(event_id)
+                    ip = event_data.get('source_ip_text') if event_data else None
+                    if not ip or self._is_private_ip(ip):
+                        continue
+                    geo_row = geo_rows.get(ip)
+                    enriched_event = {**event_data}
+                    if geo_row:
+                        enriched_event['geo'] = self._strip_geo_keys(geo_row)
+                    if threat_rows.get(ip):
+                        enriched_event['threat'] = threat_rows[ip]
+                    ml_event_ids.append(event_id)
+                    ml_events.append(enriched_event)
+                try:
+                    ml_results = dict(zip(ml_event_ids, ml_manager.predict_batch(ml_events)))
+                    self._log(f"🤖 Batch ML prediction for {len(ml_events)} events")
+                except Exception as e:
+                    self._log(f"❌ Batch ML error: {e}")
+
+        # Per-event steps, fanning the per-IP data back out
         results = []
         for event_id in event_ids:
-            # Get IP for event
-            ip = self._get_event_ip(event_id)
-            if ip:
-                result = self.enrich_event(event_id, ip)
-                results.append(result)
-            else:
+            event_data = events.get(event_id)
+            if not event_data or not event_data.get('source_ip_text'):
                 results.append({
                     'event_id': event_id,
                     'success': False,
                     'errors': ['Event not found or no IP']
                 })
+                continue
+
+            ip = event_data['source_ip_text']
+            geo_row = geo_rows.get(ip)
+            prefetched = {
+                'event_data': event_data,
+                'geo_id': geo_row.get('id') if geo_row else None,
+                'geo_data': self._strip_geo_keys(geo_row) if geo_row else None,
+                'threat_data': threat_rows.get(ip)
+            }
+            if ip in threat_intel:
+                prefetched['threat_intel'] = threat_intel[ip]
+            if event_id in ml_results:
+                prefetched['ml_result'] = ml_results[event_id]
+
+            try:
+                results.append(self.enrich_event(
+                    event_id, ip,
+                    skip_geoip=skip_geoip,
+                    skip_ml=skip_ml,
+                    skip_threat_intel=skip_threat_intel,
+                    skip_blocking=skip_blocking,
+                    skip_learning=skip_learning,
+                    skip_notifications=skip_notifications,
+                    prefetched=prefetched
+                ))
+            except Exception as e:
+                self._log(f"❌ Enrichment failed for event {event_id}: {e}")
+                results.append({'event_id': event_id, 'success': False, 'errors': [str(e)]})
+
         return results
 
+    def _get_geoip_lookup(self):
+        """Lazy load GeoIP lookup (cache-aware, no event update)"""
+        if not hasattr(self, '_geoip_lookup'):
+            try:
+                from core.geoip import lookup_ip
+                self._geoip_lookup = lookup_ip
+            except ImportError:
+                self._log("⚠️  GeoIP module not available")
+                self._geoip_lookup = False
+        return self._geoip_lookup
+
+    @staticmethod
+    def _strip_geo_keys(geo_row: Dict) -> Dict:
+        """Drop the bulk-query keys so geo data matches _get_geo_data"""
+        return {k: v for k, v in geo_row.items() if k not in ('id', 'ip_address_text')}
+
+    def _get_events_data(self, event_ids: List[int]) -> Dict[int, Dict]:
+        """Get event rows for many events with one query"""
+        conn = get_connection()
+        cursor = conn.cursor(dictionary=True)
+
+        try:
+            placeholders = ', '.join(['%s'] * len(event_ids))
+            cursor.execute(f"""
+                SELECT
+                    id, event_uuid, timestamp, source_type, event_type,
+                    auth_method, source_ip_text, target_server, target_username,
+                    failure_reason, geo_id
+                FROM auth_events
+                WHERE id IN ({placeholders})
+            """, tuple(event_ids))
+
+            return {row['id']: row for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _get_geo_data_bulk(self, source_ips: List[str]) -> Dict[str, Dict]:
+        """Get cached geo data (plus geo id) for many IPs with one query"""
+        conn = get_connection()
+        cursor = conn.cursor(dictionary=True)
+
+        try:
+            placeholders = ', '.join(['%s'] * len(source_ips))
+            cursor.execute(f"""
+                SELECT
+                    id, ip_address_text,
+                    country_code, country_name, city, latitude, longitude,
+                    is_proxy, is_vpn, is_tor, is_datacenter, is_hosting, asn, isp
+                FROM ip_geolocation
+                WHERE ip_address_text IN ({placeholders})
+            """, tuple(source_ips))
+
+            return {row['ip_address_text']: row for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _get_threat_data_bulk(self, source_ips: List[str]) -> Dict[str, Dict]:
+        """Get cached threat intel data for many IPs with one query"""
+        conn = get_connection()
+        cursor = conn.cursor(dictionary=True)
+
+        try:
+            placeholders = ', '.join(['%s'] * len(source_ips))
+            cursor.execute(f"""
+                SELECT
+                    ip_address_text,
+                    abuseipdb_score, abuseipdb_confidence, abuseipdb_reports,
+                    virustotal_positives, virustotal_total,
+                    overall_threat_level, threat_confidence
+                FROM ip_threat_intelligence
+                WHERE ip_address_text IN ({placeholders})
+            """, tuple(source_ips))
+
+            return {
+                row.pop('ip_address_text'): row
+                for row in cursor.fetchall()
+            }
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _assign_geo_ids(self, events: Dict[int, Dict], geo_rows: Dict[str, Dict]):
+        """Set geo_id on all events of each IP with one UPDATE per IP"""
+        ids_by_ip = {}
+        for event_id, row in events.items():
+            ip = row.get('source_ip_text')
+            if ip in geo_rows:
+                ids_by_ip.setdefault(ip, []).append(event_id)
+
+        conn = get_connection()
+        cursor = conn.cursor()
+
+        try:
+            for ip, ids in ids_by_ip.items():
+                placeholders = ', '.join(['%s'] * len(ids))
+                cursor.execute(f"""
+                    UPDATE auth_events
+                    SET geo_id = %s,
+                        processing_status = CASE
+                            WHEN processing_status = 'pending' THEN 'geoip_complete'
+                            ELSE processing_status
+                        END
+                    WHERE id IN ({placeholders})
+                """, (geo_rows[ip]['id'], *ids))
+                for event_id in ids:
+                    events[event_id]['geo_id'] = geo_rows[ip]['id']
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            self._log(f"❌ Failed to assign geo ids: {e}")
+        finally:
+            cursor.close()
+            conn.close()
+
     def _get_event_data(self, event_id: int) -> Optional[Dict]:
         """Get event data from database"""
         conn = get_connection()
@@ -1064,8 +1344,12 @@ class EventEnricher:
             cursor.close()
             conn.close()
 
-    def _get_geo_data(self, source_ip: str) -> Optional[Dict]:
+    def _get_geo_data(self, source_ip: str, context: Optional[EventContext] = None) -> Optional[Dict]:
         """Get cached geo data for IP"""
+        if context:
+            row = context.get_geo()
+            return {k: row.get(k) for k in GEO_DATA_COLUMNS} if row else None
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
@@ -1083,8 +1367,12 @@ class EventEnricher:
             cursor.close()
             conn.close()
 
-    def _get_threat_data(self, source_ip: str) -> Optional[Dict]:
+    def _get_threat_data(self, source_ip: str, context: Optional[EventContext] = None) -> Optional[Dict]:
         """Get cached threat intel data for IP"""
+        if context:
+            row = context.get_threat()
+            return {k: row.get(k) for k in THREAT_DATA_COLUMNS} if row else None
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
@@ -1104,42 +1392,19 @@ class EventEnricher:
             conn.close()
 
     def _update_processing_status(self, event_id: int, status: str):
-        """Update event processing status"""
-        conn = get_connection()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute("""
-                UPDATE auth_events
-                SET processing_status = %s,
-                    processed_at = CASE WHEN %s = 'completed' THEN NOW() ELSE processed_at END
-                WHERE id = %s
-            """, (status, status, event_id))
-            conn.commit()
-        finally:
-            cursor.close()
-            conn.close()
+        """Queue event processing status update (write-behind, latest status wins)"""
+        buffer = get_write_buffer()
+        buffer.register('event_processing_status', update_event_processing_status,
+                        key=lambda row: row[0])
+        buffer.add('event_processing_status', (event_id, status, datetime.now()))
 
     def _update_ml_results(self, event_id: int, risk_score: int,
                           threat_type: Optional[str], confidence: float,
                           is_anomaly: bool):
-        """Update event with ML prediction results"""
-        conn = get_connection()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute("""
-                UPDATE auth_events
-                SET ml_risk_score = %s,
-                    ml_threat_type = %s,
-                    ml_confidence = %s,
-                    is_anomaly = %s
-                WHERE id = %s
-            """, (risk_score, threat_type, confidence, is_anomaly, event_id))
-            conn.commit()
-        finally:
-            cursor.close()
-            conn.close()
+        """Queue event ML prediction results update (write-behind)"""
+        buffer = get_write_buffer()
+        buffer.register('event_ml_results', update_event_ml_results, key=lambda row: row[0])
+        buffer.add('event_ml_results', (event_id, risk_score, threat_type, confidence, is_anomaly))
 
 
 # Global enricher instance
@@ -1156,7 +1421,8 @@ def get_enricher(verbose: bool = True) -> EventEnricher:
 
 def enrich_event(event_id: int, source_ip: str, verbose: bool = True,
                  skip_blocking: bool = False, skip_learning: bool = False,
-                 skip_notifications: bool = False) -> Dict:
+                 skip_notifications: bool = False,
+                 context: Optional[EventContext] = None) -> Dict:
     """
     Convenience function to enrich a single event.
 
@@ -1167,6 +1433,7 @@ def enrich_event(event_id: int, source_ip: str, verbose: bool = True,
         skip_blocking: Skip auto-blocking (analysis only mode)
         skip_learning: Skip behavioral profile learning (for simulation)
         skip_notifications: Skip sending notifications (for simulation)
+        context: Optional EventContext shared with the other pipeline stages
 
     Returns:
         Enrichment result dict
@@ -1176,20 +1443,31 @@ def enrich_event(event_id: int, source_ip: str, verbose: bool = True,
         event_id, source_ip,
         skip_blocking=skip_blocking,
         skip_learning=skip_learning,
-        skip_notifications=skip_notifications
+        skip_notifications=skip_notifications,
+        context=context
     )
 
 
-def enrich_batch(event_ids: List[int], verbose: bool = True) -> List[Dict]:
+def enrich_batch(event_ids: List[int], verbose: bool = True,
+                 skip_blocking: bool = False, skip_learning: bool = False,
+                 skip_notifications: bool = False) -> List[Dict]:
     """
     Convenience function to enrich multiple events.
 
     Args:
         event_ids: List of auth_events.id
         verbose: Print progress
+        skip_blocking: Skip auto-blocking (analysis only mode)
+        skip_learning: Skip behavioral profile learning (for simulation)
+        skip_notifications: Skip sending notifications (for simulation)
 
     Returns:
         List of enrichment results
     """
     enricher = get_enricher(verbose=verbose)
-    return enricher.enrich_batch(event_ids)
+    return enricher.enrich_batch(
+        event_ids,
+        skip_blocking=skip_blocking,
+        skip_learning=skip_learning,
+        skip_notifications=skip_notifications
+    )
@@ -0,0 +1,432 @@
+"""
+SSH Guardian v3.0 - Enrichment Work Queue
+MySQL outbox over auth_events.processing_status, drained by a worker pool
+so agent ingest can acknowledge as soon as rows are committed
+"""
+
+import os
+import sys
+import time
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.append(str(PROJECT_ROOT / "dbs"))
+sys.path.append(str(PROJECT_ROOT / "src"))
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
+
+from connection import get_connection
+from event_rollups import refresh_rollups_if_due
+
+# Queue configuration (see migrations 035_enrichment_queue.sql, 039_enrichment_queue_state.sql)
+ENRICHMENT_QUEUE_ENABLED = os.getenv('ENRICHMENT_QUEUE_ENABLED', '0') == '1'
+CLAIM_BATCH_SIZE = int(os.getenv('ENRICHMENT_QUEUE_BATCH_SIZE', 100))
+CLAIM_TIMEOUT_SEC = int(os.getenv('ENRICHMENT_QUEUE_CLAIM_TIMEOUT_SEC', 300))
+MAX_ATTEMPTS = int(os.getenv('ENRICHMENT_QUEUE_MAX_ATTEMPTS', 3))
+MAX_EVENT_AGE_HOURS = int(os.getenv('ENRICHMENT_QUEUE_MAX_AGE_HOURS', 24))
+
+# auth_events.enrichment_skip values -> run_batch_pipeline keyword arguments
+SKIP_FLAGS = {
+    'blocking': 'skip_blocking',
+    'learning': 'skip_learning',
+    'notifications': 'skip_notifications'
+}
+
+
+def is_queue_enabled() -> bool:
+    """Check if agent ingest should defer enrichment to the queue"""
+    return ENRICHMENT_QUEUE_ENABLED
+
+
+def claim_pending_events(limit: int = CLAIM_BATCH_SIZE) -> List[Dict]:
+    """
+    Atomically claim a batch of queued events for this worker.
+
+    Uses SELECT ... FOR UPDATE SKIP LOCKED so several worker processes
+    can drain the queue concurrently without handing out the same row.
+    Only rows stored with defer_enrichment are 'queued'; events enriched
+    inline stay 'pending' and are never claimed.
+
+    Args:
+        limit: Maximum number of events to claim
+
+    Returns:
+        List of claimed auth_events rows
+    """
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        cursor.execute("""
+            SELECT id, timestamp, source_ip_text, target_username, event_type,
+                   auth_method, failure_reason, enrichment_skip
+            FROM auth_events
+            WHERE processing_status = 'queued'
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (limit,))
+        rows = cursor.fetchall()
+
+        if rows:
+            placeholders = ', '.join(['%s'] * len(rows))
+            cursor.execute(f"""
+                UPDATE auth_events
+                SET processing_status = 'processing',
+                    enrichment_attempts = enrichment_attempts + 1
+                WHERE id IN ({placeholders})
+            """, tuple(row['id'] for row in rows))
+
+        conn.commit()
+        return rows
+
+    except Exception:
+        conn.rollback()
+        raise
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def requeue_stale_claims() -> Dict[str, int]:
+    """
+    Return events claimed by a dead worker to the queue.
+
+    Claims older than CLAIM_TIMEOUT_SEC go back to 'queued', or to 'error'
+    once they have used up MAX_ATTEMPTS. Queued events older than
+    MAX_EVENT_AGE_HOURS are moved to 'error' as well: blocking on hours-old
+    attempts does more harm than good, and they show up in the stats
+    instead of waiting forever.
+
+    Returns:
+        dict with requeued, failed and expired counts
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("""
+            UPDATE auth_events
+            SET processing_status = 'error',
+                processing_error = 'Enrichment exceeded max attempts'
+            WHERE processing_status = 'processing'
+            AND updated_at < DATE_SUB(NOW(), INTERVAL %s SECOND)
+            AND enrichment_attempts >= %s
+        """, (CLAIM_TIMEOUT_SEC, MAX_ATTEMPTS))
+        failed = cursor.rowcount
+
+        cursor.execute("""
+            UPDATE auth_events
+            SET processing_status = 'queued'
+            WHERE processing_status = 'processing'
+            AND updated_at < DATE_SUB(NOW(), INTERVAL %s SECOND)
+        """, (CLAIM_TIMEOUT_SEC,))
+        requeued = cursor.rowcount
+
+        cursor.execute("""
+            UPDATE auth_events
+            SET processing_status = 'error',
+                processing_error = 'Expired in enrichment queue'
+            WHERE processing_status = 'queued'
+            AND created_at < DATE_SUB(NOW(), INTERVAL %s HOUR)
+        """, (MAX_EVENT_AGE_HOURS,))
+        expired = cursor.rowcount
+
+        conn.commit()
+        return {'requeued': requeued, 'failed': failed, 'expired': expired}
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _release_claims(event_ids: List[int]):
+    """Mark events still in 'processing' as completed after the pipeline ran"""
+    if not event_ids:
+        return
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        placeholders = ', '.join(['%s'] * len(event_ids))
+        cursor.execute(f"""
+            UPDATE auth_events
+            SET processing_status = 'completed',
+                processed_at = NOW()
+            WHERE id IN ({placeholders})
+            AND processing_status = 'processing'
+        """, tuple(event_ids))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _fail_claims(errors: Dict[int, str]):
+    """
+    Hand events whose pipeline failed back to the queue.
+
+    They are retried until MAX_ATTEMPTS and then parked in 'error' with the
+    reported message.
+
+    Args:
+        errors: event id -> error message
+    """
+    if not errors:
+        return
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.executemany("""
+            UPDATE auth_events
+            SET processing_status = IF(enrichment_attempts >= %s, 'error', 'queued'),
+                processing_error = %s
+            WHERE id = %s
+            AND processing_status = 'processing'
+        """, [(MAX_ATTEMPTS, message[:500], event_id) for event_id, message in errors.items()])
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def get_queue_stats() -> Dict:
+    """Get queue depth by processing status"""
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        cursor.execute("""
+            SELECT processing_status, COUNT(*) as count,
+                   MIN(created_at) as oldest
+            FROM auth_events
+            WHERE processing_status IN ('queued', 'processing', 'error')
+            AND created_at >= DATE_SUB(NOW(), INTERVAL %s HOUR)
+            GROUP BY processing_status
+        """, (MAX_EVENT_AGE_HOURS,))
+
+        stats = {'queued': 0, 'processing': 0, 'error': 0, 'oldest_queued': None}
+        for row in cursor.fetchall():
+            stats[row['processing_status']] = row['count']
+            if row['processing_status'] == 'queued' and row['oldest']:
+                stats['oldest_queued'] = row['oldest'].isoformat()
+        return stats
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _skip_flags(row: Dict) -> Dict[str, bool]:
+    """Pipeline skip arguments stored with a queued event"""
+    stages = row.get('enrichment_skip') or ''
+    if isinstance(stages, str):
+        stages = stages.split(',')
+    return {arg: stage in stages for stage, arg in SKIP_FLAGS.items()}
+
+
+def _pipeline_error(result: Dict) -> str:
+    """
+    Error that stopped the pipeline for an event ('' if it ran).
+
+    Only these re-queue the event: enrichment stage errors (a failed GeoIP
+    or threat intel lookup) don't stop the later stages, so re-running the
+    pipeline would repeat its blocks and notifications.
+    """
+    if not result:
+        return 'No pipeline result'
+    return result.get('error') or ''
+
+
+def _enrichment_errors(result: Dict) -> str:
+    """Non-fatal enrichment errors reported in a pipeline result ('' if none)"""
+    enrichment = (result or {}).get('enrichment') or {}
+    errors = [enrichment['error']] if enrichment.get('error') else []
+    errors.extend(str(e) for e in enrichment.get('errors') or [])
+    return '; '.join(errors)
+
+
+def _to_pipeline_event(row: Dict) -> Dict:
+    """Convert a claimed auth_events row into a log_processor pipeline event"""
+    return {
+        'event_id': row['id'],
+        'timestamp': row['timestamp'] or datetime.now(),
+        'parsed': {
+            'source_ip': row['source_ip_text'],
+            'username': row['target_username'],
+            'event_type': row['event_type'],
+            'auth_method': row['auth_method'],
+            'failure_reason': row['failure_reason']
+        }
+    }
+
+
+class EnrichmentWorkerPool:
+    """
+    Drains the enrichment queue with a bounded pool of worker threads.
+
+    Enrichment is dominated by network and database waits, so threads give
+    the needed concurrency; run several processes for more CPU headroom.
+    """
+
+    def __init__(self, concurrency: int = 4, batch_size: int = CLAIM_BATCH_SIZE,
+                 poll_interval: float = 2.0, verbose: bool = True):
+        """
+        Initialize the worker pool.
+
+        Args:
+            concurrency: Number of events enriched in parallel
+            batch_size: Events claimed per queue poll
+            poll_interval: Seconds to sleep when the queue is empty
+            verbose: Whether to print progress messages
+        """
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.verbose = verbose
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._log_processor = None
+        self.stats = {'claimed': 0, 'processed': 0, 'errors': 0, 'enrichment_errors': 0,
+                      'requeued': 0, 'geoip_resolved': 0}
+
+    def _log(self, message: str):
+        """Print message if verbose mode enabled"""
+        if self.verbose:
+            print(message)
+
+    def _get_log_processor(self):
+        """Lazy load log processor to avoid circular imports"""
+        if self._log_processor is None:
+            import log_processor
+            self._log_processor = log_processor
+        return self._log_processor
+
+    def _resolve_deferred_geoip(self):
+        """Use idle time to replace provisional GeoIP records with real data"""
+        try:
+            from geoip import GeoIPLookup
+            result = GeoIPLookup.process_deferred_lookups(limit=self.batch_size,
+                                                          max_wait=self.poll_interval)
+        except Exception as e:
+            self._log(f"⚠️  Deferred GeoIP error: {e}")
+            return
+
+        if result['resolved']:
+            self.stats['geoip_resolved'] += result['resolved']
+            self._log(f"🌍 Resolved {result['resolved']} deferred GeoIP lookup(s)")
+
+    def _process_group(self, rows: List[Dict]) -> List[Tuple[str, str]]:
+        """
+        Run the post-insert pipeline for claimed events of one source IP
+        that share the same skip flags.
+
+        Returns:
+            Per-event (pipeline error, enrichment errors), '' where none
+        """
+        try:
+            results = self._get_log_processor().run_batch_pipeline(
+                [_to_pipeline_event(row) for row in rows],
+                **_skip_flags(rows[0])
+            )
+        except Exception as e:
+            self._log(f"❌ Enrichment failed for events {[row['id'] for row in rows]}: {e}")
+            return [(str(e), '')] * len(rows)
+
+        outcomes = []
+        for row, result in zip(rows, results):
+            error, warnings = _pipeline_error(result), _enrichment_errors(result)
+            if warnings and not error:
+                self._log(f"⚠️  Event {row['id']} completed with enrichment errors: {warnings}")
+            outcomes.append((error, warnings))
+        return outcomes
+
+    def run_once(self, executor: ThreadPoolExecutor) -> int:
+        """
+        Claim and process a single batch.
+
+        Returns:
+            Number of events claimed
+        """
+        rows = claim_pending_events(self.batch_size)
+        if not rows:
+            return 0
+
+        self.stats['claimed'] += len(rows)
+
+        # One group per source IP (and skip flags): GeoIP/Threat Intel run
+        # once per IP and different IPs are enriched concurrently
+        groups = {}
+        for row in rows:
+            flags = tuple(sorted(_skip_flags(row).items()))
+            groups.setdefault((row['source_ip_text'], flags), []).append(row)
+        rows = [row for group in groups.values() for row in group]
+        outcomes = [outcome for group_outcomes in executor.map(self._process_group, groups.values())
+                    for outcome in group_outcomes]
+        warnings = [warning for error, warning in outcomes if not error]
+        outcomes = [error for error, _ in outcomes]
+
+        self.stats['processed'] += sum(1 for error in outcomes if not error)
+        self.stats['errors'] += sum(1 for error in outcomes if error)
+        self.stats['enrichment_errors'] += sum(1 for warning in warnings if warning)
+
+        _release_claims([row['id'] for row, error in zip(rows, outcomes) if not error])
+        _fail_claims({row['id']: error for row, error in zip(rows, outcomes) if error})
+        return len(rows)
+
+    def run(self, drain_only: bool = False):
+        """
+        Run the worker loop until stopped.
+
+        Args:
+            drain_only: Exit once the queue is empty instead of polling
+        """
+        self._log(f"🚀 Enrichment worker {self.worker_id} started "
+                  f"(concurrency={self.concurrency}, batch={self.batch_size})")
+
+        last_requeue = 0.0
+        with ThreadPoolExecutor(max_workers=self.concurrency,
+                                thread_name_prefix='enrich') as executor:
+            while not self._stop.is_set():
+                if time.time() - last_requeue >= CLAIM_TIMEOUT_SEC / 2:
+                    try:
+                        requeue = requeue_stale_claims()
+                        self.stats['requeued'] += requeue['requeued']
+                        if requeue['requeued'] or requeue['failed'] or requeue['expired']:
+                            self._log(f"♻️  Requeued {requeue['requeued']} stale claim(s), "
+                                      f"{requeue['failed']} exceeded max attempts, "
+                                      f"{requeue['expired']} expired")
+                    except Exception as e:
+                        self._log(f"⚠️  Requeue error: {e}")
+                    last_requeue = time.time()
+
+                try:
+                    claimed = self.run_once(executor)
+                except Exception as e:
+                    self._log(f"❌ Queue poll error: {e}")
+                    claimed = 0
+
+                if claimed:
+                    self._log(f"✅ Processed batch of {claimed} "
+                              f"(total: {self.stats['processed']}, errors: {self.stats['errors']})")
+                    # Fold newly enriched events into the report rollups (throttled)
+                    refresh_rollups_if_due()
+                elif drain_only:
+                    break
+                else:
+                    self._resolve_deferred_geoip()
+                    self._stop.wait(self.poll_interval)
+
+        self._log(f"⏹️  Enrichment worker {self.worker_id} stopped: {self.stats}")
+
+    def stop(self):
+        """Signal the worker loop to exit after the current batch"""
+        self._stop.set()
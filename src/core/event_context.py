@@ -0,0 +1,349 @@
+"""
+SSH Guardian v3.0 - Event Context
+Request-scoped store of IP facts shared by every pipeline stage of one event
+"""
+
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+# Add project paths
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.append(str(PROJECT_ROOT / "dbs"))
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
+
+from connection import get_connection
+from attack_counters import get_attack_counters
+
+
+class EventContext:
+    """
+    Facts about one event's source IP, fetched at most once per event.
+
+    Enrichment, ThreatEvaluator, ProactiveBlocker and the blocking rules all
+    need the same geo row, threat row, recent-attempt counts and block
+    history for the IP. Passing one EventContext through the pipeline lets
+    each of those be read once over a single pooled connection, and records
+    which facts were loaded so per-event query counts are visible.
+
+    Stages that write a fact (GeoIP lookup, threat intel refresh, block_ip)
+    call invalidate() so later stages re-read it. Stages about to make
+    network calls (GeoIP, threat intel) call release() first so the pooled
+    connection isn't held while waiting on HTTP; the next query takes one
+    again.
+    """
+
+    GEO = 'geo'
+    THREAT = 'threat'
+    EVENT = 'event'
+    ACTIVE_BLOCK = 'active_block'
+    BLOCK_COUNT = 'block_count'
+
+    def __init__(self, ip_address: str, event_id: Optional[int] = None,
+                 username: Optional[str] = None, event_type: Optional[str] = None,
+                 timestamp: Optional[datetime] = None):
+        """
+        Initialize the context (no connection is taken until the first query).
+
+        Args:
+            ip_address: Source IP of the event
+            event_id: auth_events.id, if the event is stored
+            username: Target username
+            event_type: 'failed', 'successful' or 'invalid'
+            timestamp: Event timestamp
+        """
+        self.ip_address = ip_address
+        self.event_id = event_id
+        self.username = username
+        self.event_type = event_type
+        self.timestamp = timestamp
+
+        self._conn = None
+        self._autocommit = None
+        self._facts: Dict[str, Any] = {}
+        self.stats = {'queries': 0, 'cache_hits': 0, 'invalidations': 0}
+        self.fetched = []
+
+    # ------------------------------------------------------------------
+    # Connection
+    # ------------------------------------------------------------------
+
+    def _get_conn(self):
+        """Take one pooled connection for the lifetime of the context"""
+        if self._conn is None:
+            self._conn = get_connection()
+            # Each statement must see rows committed by other stages/workers
+            # since the context was opened, so don't hold a read snapshot
+            self._autocommit = self._conn.autocommit
+            self._conn.autocommit = True
+        return self._conn
+
+    def cursor(self):
+        """
+        Dictionary cursor on the shared connection.
+
+        Use for queries that are specific to one stage; the caller closes
+        the cursor but never the connection. Statements run with autocommit.
+        """
+        return _CountingCursor(self._get_conn().cursor(dictionary=True), self.stats)
+
+    def commit(self):
+        """Commit on the shared connection (no-op under autocommit, kept for clarity)"""
+        if self._conn is not None:
+            self._conn.commit()
+
+    def release(self):
+        """
+        Return the connection to the pool, keeping the loaded facts.
+
+        The next query takes a connection again, so call this before slow
+        non-database work (HTTP lookups) instead of holding a pool slot.
+        """
+        if self._conn is not None:
+            try:
+                self._conn.autocommit = self._autocommit
+            except Exception:
+                pass
+            try:
+                self._conn.close()
+            finally:
+                self._conn = None
+
+    def close(self):
+        """Return the connection to the pool (end of the event)"""
+        self.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    # ------------------------------------------------------------------
+    # Memoized queries
+    # ------------------------------------------------------------------
+
+    def query(self, sql: str, params: tuple = (), one: bool = True):
+        """Run an uncached read on the shared connection"""
+        cursor = self.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchone() if one else cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def fetch(self, key: str, sql: str, params: tuple = (), one: bool = True):
+        """
+        Run a read once per context and remember the result under `key`.
+
+        Args:
+            key: Fact name (also shown in get_stats)
+            sql: SELECT statement
+            params: Query parameters
+            one: fetchone() if True, else fetchall()
+
+        Returns:
+            The (possibly cached) row, row list or None
+        """
+        if key in self._facts:
+            self.stats['cache_hits'] += 1
+            return self._facts[key]
+
+        value = self.query(sql, params, one)
+        self._facts[key] = value
+        self.fetched.append(key)
+        return value
+
+    def seed(self, key: str, value: Any):
+        """Store a fact that a caller already loaded (no query)"""
+        self._facts[key] = value
+
+    def has(self, key: str) -> bool:
+        """True if the fact is already loaded"""
+        return key in self._facts
+
+    def invalidate(self, *keys: str):
+        """
+        Forget facts so the next read goes to the database.
+
+        Args:
+            keys: Fact names or prefixes (e.g. 'events:' for every attempt
+                  count); no keys forgets everything
+        """
+        if not keys:
+            self._facts.clear()
+        else:
+            for fact in list(self._facts):
+                if any(fact == key or (key.endswith(':') and fact.startswith(key)) for key in keys):
+                    del self._facts[fact]
+        self.stats['invalidations'] += 1
+
+    # ------------------------------------------------------------------
+    # IP facts
+    # ------------------------------------------------------------------
+
+    def get_geo(self, max_age: Optional[timedelta] = None) -> Optional[Dict]:
+        """
+        ip_geolocation row for the IP (all columns).
+
+        Args:
+            max_age: Treat the row as missing if last_seen is older than this
+
+        Returns:
+            Row dict or None
+        """
+        row = self.fetch(self.GEO, """
+            SELECT * FROM ip_geolocation
+            WHERE ip_address_text = %s
+            LIMIT 1
+        """, (self.ip_address,))
+
+        if row and max_age is not None:
+            last_seen = row.get('last_seen')
+            if isinstance(last_seen, datetime) and last_seen < datetime.now() - max_age:
+                return None
+        return row
+
+    def get_threat(self) -> Optional[Dict]:
+        """ip_threat_intelligence row for the IP (all columns), or None"""
+        return self.fetch(self.THREAT, """
+            SELECT * FROM ip_threat_intelligence
+            WHERE ip_address_text = %s
+            LIMIT 1
+        """, (self.ip_address,))
+
+    def get_abuseipdb_score(self) -> int:
+        """AbuseIPDB score from the threat row (0 when unknown)"""
+        threat = self.get_threat()
+        return int(threat.get('abuseipdb_score') or 0) if threat else 0
+
+    def get_event(self) -> Optional[Dict]:
+        """auth_events row for the context's event, or None"""
+        if not self.event_id:
+            return None
+        return self.fetch(self.EVENT, """
+            SELECT
+                id, event_uuid, timestamp, source_type, event_type,
+                auth_method, source_ip_text, target_server, target_username,
+                failure_reason, geo_id
+            FROM auth_events
+            WHERE id = %s
+        """, (self.event_id,))
+
+    def get_event_stats(self, minutes: int, event_type: Optional[str] = None) -> Dict:
+        """
+        Recent activity from the IP, counted once per window/type.
+
+        Args:
+            minutes: Look-back window (relative to NOW())
+            event_type: Only count this event type (None counts all)
+
+        Returns:
+            dict with count, unique_usernames, root_attempts, latest_event_id,
+            first_seen and last_seen
+        """
+        key = f"events:{event_type or 'all'}:{int(minutes)}m"
+        type_clause = "AND event_type = %s" if event_type else ""
+        params = (self.ip_address, int(minutes)) + ((event_type,) if event_type else ())
+
+        row = self.fetch(key, f"""
+            SELECT
+                COUNT(*) as count,
+                COUNT(DISTINCT target_username) as unique_usernames,
+                SUM(CASE WHEN target_username = 'root' THEN 1 ELSE 0 END) as root_attempts,
+                MAX(id) as latest_event_id,
+                MIN(timestamp) as first_seen,
+                MAX(timestamp) as last_seen
+            FROM auth_events
+            WHERE source_ip_text = %s
+            AND timestamp >= NOW() - INTERVAL %s MINUTE
+            {type_clause}
+        """, params) or {}
+
+        return {
+            'count': int(row.get('count') or 0),
+            'unique_usernames': int(row.get('unique_usernames') or 0),
+            'root_attempts': int(row.get('root_attempts') or 0),
+            'latest_event_id': row.get('latest_event_id'),
+            'first_seen': row.get('first_seen'),
+            'last_seen': row.get('last_seen')
+        }
+
+    def count_events(self, minutes: int, event_type: Optional[str] = None) -> int:
+        """Number of events from the IP in the window (attack counters first)"""
+        counted = get_attack_counters().count_ip(self.ip_address, int(minutes) * 60, event_type)
+        if counted is not None:
+            return counted
+        return self.get_event_stats(minutes, event_type)['count']
+
+    def count_usernames(self, minutes: int, event_type: Optional[str] = None) -> int:
+        """Distinct usernames tried by the IP in the window (attack counters first)"""
+        counted = get_attack_counters().distinct_usernames(self.ip_address, int(minutes) * 60, event_type)
+        if counted is not None:
+            return counted
+        return self.get_event_stats(minutes, event_type)['unique_usernames']
+
+    def get_active_block(self) -> Optional[Dict]:
+        """Active ip_blocks row for the IP, or None"""
+        return self.fetch(self.ACTIVE_BLOCK, """
+            SELECT id, block_source, blocked_at FROM ip_blocks
+            WHERE ip_address_text = %s AND is_active = TRUE
+            LIMIT 1
+        """, (self.ip_address,))
+
+    def get_block_count(self) -> int:
+        """Number of blocks (active or not) ever recorded for the IP"""
+        row = self.fetch(self.BLOCK_COUNT, """
+            SELECT COUNT(*) as block_count
+            FROM ip_blocks
+            WHERE ip_address_text = %s
+        """, (self.ip_address,))
+        return int(row['block_count'] or 0) if row else 0
+
+    def get_stats(self) -> Dict:
+        """Per-event query accounting"""
+        return {
+            'ip_address': self.ip_address,
+            'event_id': self.event_id,
+            'queries': self.stats['queries'],
+            'cache_hits': self.stats['cache_hits'],
+            'invalidations': self.stats['invalidations'],
+            'facts': list(self.fetched)
+        }
+
+
+class _CountingCursor:
+    """Cursor wrapper that counts statements against the owning context"""
+
+    def __init__(self, cursor, stats: Dict):
+        self._cursor = cursor
+        self._stats = stats
+
+    def execute(self, *args, **kwargs):
+        self._stats['queries'] += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+@contextmanager
+def ensure_context(context: Optional[EventContext], ip_address: str) -> Iterator[EventContext]:
+    """
+    Use the caller's context, or a temporary one closed on exit.
+
+    Lets stages keep working when called on their own (dashboard routes,
+    scripts) while sharing facts when called from the event pipeline.
+    """
+    if context is not None:
+        yield context
+        return
+
+    owned = EventContext(ip_address)
+    try:
+        yield owned
+    finally:
+        owned.close()
@@ -0,0 +1,207 @@
+"""
+SSH Guardian v3.0 - Event Rollups
+Keeps the hourly/daily rollup tables of migration 038 current. A refresh
+finds the hour buckets whose events were inserted or updated since the
+high-water mark (auth_events.updated_at) and recomputes only those hours
+and their days, so report endpoints read a few hundred pre-aggregated rows
+instead of scanning auth_events. updated_at is stamped when a statement
+runs, not when its transaction commits, so every refresh re-scans
+ROLLUP_OVERLAP_SEC behind the mark to pick up late commits.
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.append(str(PROJECT_ROOT / "dbs"))
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
+
+from connection import get_connection
+from event_rollups_queries import changed_hours, refresh_hourly, refresh_day, get_state, save_state
+
+logger = logging.getLogger(__name__)
+
+# Rollup configuration (see migration 038_event_rollups.sql)
+ROLLUP_REFRESH_INTERVAL_SEC = int(os.getenv('ROLLUP_REFRESH_INTERVAL_SEC', 60))
+ROLLUP_LAG_SEC = int(os.getenv('ROLLUP_LAG_SEC', 5))
+ROLLUP_OVERLAP_SEC = int(os.getenv('ROLLUP_OVERLAP_SEC', 300))
+
+ROLLUP_STATE_NAME = 'auth_events'
+ROLLUP_LOCK_NAME = 'ssh_guardian_event_rollups'
+
+
+def _group_by_day(hours: List[datetime]) -> Dict[date, List[datetime]]:
+    days = {}
+    for hour in hours:
+        days.setdefault(hour.date(), []).append(hour)
+    return days
+
+
+def _refresh_days(conn, cursor, days: Dict[date, List[datetime]]) -> None:
+    """Recompute the given hours and their days, one transaction per day"""
+    for day in sorted(days):
+        hours = days[day]
+        refresh_hourly(cursor, min(hours), max(hours) + timedelta(hours=1))
+        refresh_day(cursor, day)
+        conn.commit()
+
+
+def refresh_rollups() -> Dict:
+    """
+    Roll up everything that changed since the high-water mark.
+
+    Only one refresher runs at a time across processes (MySQL named lock);
+    a concurrent call returns immediately with status 'busy'. The mark only
+    advances after every affected day has been committed, so an interrupted
+    run is simply redone by the next one.
+
+    Returns:
+        dict with status, hours and days refreshed, duration_ms and the new mark
+    """
+    started = time.time()
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (ROLLUP_LOCK_NAME,))
+        if not cursor.fetchone()[0]:
+            return {'status': 'busy'}
+
+        try:
+            state = get_state(cursor, ROLLUP_STATE_NAME) or {}
+            since = state.get('high_water_mark')
+
+            # Stay ROLLUP_LAG_SEC behind NOW() so rows committed in the current
+            # second (updated_at has 1s resolution) are picked up next time
+            cursor.execute("SELECT NOW() - INTERVAL %s SECOND", (ROLLUP_LAG_SEC,))
+            until = cursor.fetchone()[0]
+
+            # A transaction that wrote before the last mark but committed
+            # after that run is only visible now: look back past the mark
+            scan_from = since - timedelta(seconds=ROLLUP_OVERLAP_SEC) if since else None
+            hours = changed_hours(cursor, scan_from, until)
+            days = _group_by_day(hours)
+            _refresh_days(conn, cursor, days)
+
+            duration_ms = int((time.time() - started) * 1000)
+            save_state(cursor, ROLLUP_STATE_NAME, until, duration_ms, len(hours))
+            conn.commit()
+
+            if hours:
+                _invalidate_report_caches()
+
+            return {
+                'status': 'refreshed' if hours else 'current',
+                'hours': len(hours),
+                'days': len(days),
+                'duration_ms': duration_ms,
+                'high_water_mark': until.isoformat()
+            }
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (ROLLUP_LOCK_NAME,))
+            cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def rebuild_rollups(start: date, end: date) -> Dict:
+    """
+    Recompute whole days regardless of the high-water mark (e.g. after
+    events were deleted, which the updated_at scan cannot see).
+
+    Args:
+        start: First day
+        end: Last day (inclusive)
+
+    Returns:
+        dict with the number of days rebuilt
+    """
+    days = {}
+    day = start
+    while day <= end:
+        midnight = datetime.combine(day, datetime.min.time())
+        days[day] = [midnight, midnight + timedelta(hours=23)]
+        day += timedelta(days=1)
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        _refresh_days(conn, cursor, days)
+    finally:
+        cursor.close()
+        conn.close()
+
+    _invalidate_report_caches()
+    return {'status': 'rebuilt', 'days': len(days)}
+
+
+def get_rollup_status() -> Optional[Dict]:
+    """High-water mark and last run of the refresher (None before migration 038)"""
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        state = get_state(cursor, ROLLUP_STATE_NAME)
+    finally:
+        cursor.close()
+        conn.close()
+
+    if state:
+        for key in ('high_water_mark', 'last_run_at'):
+            if state.get(key):
+                state[key] = state[key].isoformat()
+    return state
+
+
+def _invalidate_report_caches():
+    """Drop cached report responses built from the previous rollups"""
+    try:
+        from cache import get_cache
+        get_cache().invalidate_families('trends', 'daily_reports')
+    except Exception as e:
+        logger.debug(f"Report cache invalidation skipped: {e}")
+
+
+# Process-wide refresh throttle
+_last_refresh = 0.0
+_refresh_lock = threading.Lock()
+
+
+def refresh_rollups_if_due(background: bool = False) -> Optional[Dict]:
+    """
+    Refresh at most every ROLLUP_REFRESH_INTERVAL_SEC per process.
+
+    Called by the enrichment worker after each batch and by the report
+    endpoints before reading, so rollups follow ingest without a separate
+    scheduler (scripts/refresh_event_rollups.py covers setups without
+    either).
+
+    Args:
+        background: Run the refresh in a daemon thread (request handlers)
+
+    Returns:
+        Refresh result when run synchronously, otherwise None
+    """
+    global _last_refresh
+
+    with _refresh_lock:
+        if time.time() - _last_refresh < ROLLUP_REFRESH_INTERVAL_SEC:
+            return None
+        _last_refresh = time.time()
+
+    def run():
+        try:
+            return refresh_rollups()
+        except Exception as e:
+            logger.error(f"Event rollup refresh failed: {e}")
+            return {'status': 'failed', 'error': str(e)}
+
+    if background:
+        threading.Thread(target=run, name='event-rollups', daemon=True).start()
+        return None
+    return run()
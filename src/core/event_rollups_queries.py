@@ -0,0 +1,214 @@
+"""
+SSH Guardian v3.0 - Event Rollup Queries
+Statements that recompute rollup buckets from auth_events (migration 038).
+Every function replaces whole buckets (DELETE + INSERT ... SELECT), so a
+bucket can be refreshed any number of times with the same result.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+# Shared aggregate columns of the hourly/daily cubes
+CUBE_METRICS = ('event_count', 'anomaly_count', 'risk_sum', 'max_risk',
+                'critical_count', 'high_count', 'medium_count', 'low_count')
+
+
+def changed_hours(cursor, since: Optional[datetime], until: datetime) -> List[datetime]:
+    """
+    Hour buckets holding events inserted or updated in (since, until].
+
+    Args:
+        cursor: Database cursor
+        since: High-water mark (None = every hour with events)
+        until: Upper bound of updated_at
+
+    Returns:
+        Sorted hour starts
+    """
+    if since is None:
+        cursor.execute("""
+            SELECT DISTINCT DATE_FORMAT(timestamp, '%Y-%m-%d %H:00:00') AS bucket
+            FROM auth_events
+            WHERE source_type != 'simulation'
+        """)
+    else:
+        cursor.execute("""
+            SELECT DISTINCT DATE_FORMAT(timestamp, '%%Y-%%m-%%d %%H:00:00') AS bucket
+            FROM auth_events
+            WHERE updated_at > %s AND updated_at <= %s
+        """, (since, until))
+
+    hours = []
+    for row in cursor.fetchall():
+        value = row[0] if isinstance(row, tuple) else row['bucket']
+        hours.append(value if isinstance(value, datetime)
+                     else datetime.strptime(str(value), '%Y-%m-%d %H:%M:%S'))
+    return sorted(hours)
+
+
+def refresh_hourly(cursor, start: datetime, end: datetime) -> None:
+    """
+    Recompute the hourly cube for hours in [start, end).
+
+    Args:
+        cursor: Database cursor (caller commits)
+        start: First hour start
+        end: End of the last hour (exclusive)
+    """
+    cursor.execute("""
+        DELETE FROM auth_events_rollup_hourly
+        WHERE bucket_start >= %s AND bucket_start < %s
+    """, (start, end))
+
+    cursor.execute("""
+        INSERT INTO auth_events_rollup_hourly
+        (bucket_start, agent_id, event_type, country_code, threat_type, country_name,
+         event_count, anomaly_count, risk_sum, max_risk,
+         critical_count, high_count, medium_count, low_count)
+        SELECT
+            DATE_FORMAT(ae.timestamp, '%%Y-%%m-%%d %%H:00:00'),
+            COALESCE(ae.agent_id, 0),
+            ae.event_type,
+            COALESCE(geo.country_code, ''),
+            COALESCE(ae.ml_threat_type, ''),
+            MAX(geo.country_name),
+            COUNT(*),
+            SUM(ae.is_anomaly = 1),
+            SUM(COALESCE(ae.ml_risk_score, 0)),
+            MAX(COALESCE(ae.ml_risk_score, 0)),
+            SUM(ae.ml_risk_score >= 80),
+            SUM(ae.ml_risk_score >= 60 AND ae.ml_risk_score < 80),
+            SUM(ae.ml_risk_score >= 40 AND ae.ml_risk_score < 60),
+            SUM(COALESCE(ae.ml_risk_score, 0) < 40)
+        FROM auth_events ae
+        LEFT JOIN ip_geolocation geo ON ae.geo_id = geo.id
+        WHERE ae.timestamp >= %s AND ae.timestamp < %s
+        AND ae.source_type != 'simulation'
+        GROUP BY 1, 2, 3, 4, 5
+    """, (start, end))
+
+
+def refresh_day(cursor, day: date) -> None:
+    """
+    Recompute every daily rollup for one day.
+
+    The daily cube is summed from the (already refreshed) hourly cube; the
+    per-IP, per-username and summary rows need distinct counts and are read
+    from the day's raw events.
+
+    Args:
+        cursor: Database cursor (caller commits)
+        day: Day to refresh
+    """
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1)
+    metric_sums = ', '.join(
+        f"MAX({column})" if column == 'max_risk' else f"SUM({column})" for column in CUBE_METRICS
+    )
+
+    cursor.execute("DELETE FROM auth_events_rollup_daily WHERE bucket_date = %s", (day,))
+    cursor.execute(f"""
+        INSERT INTO auth_events_rollup_daily
+        (bucket_date, agent_id, event_type, country_code, threat_type, country_name,
+         {', '.join(CUBE_METRICS)})
+        SELECT %s, agent_id, event_type, country_code, threat_type, MAX(country_name),
+               {metric_sums}
+        FROM auth_events_rollup_hourly
+        WHERE bucket_start >= %s AND bucket_start < %s
+        GROUP BY agent_id, event_type, country_code, threat_type
+    """, (day, start, end))
+
+    cursor.execute("DELETE FROM auth_events_rollup_ip_daily WHERE bucket_date = %s", (day,))
+    cursor.execute("""
+        INSERT INTO auth_events_rollup_ip_daily
+        (bucket_date, event_type, ip_address, country_code, country_name, city,
+         event_count, unique_usernames, anomaly_count, risk_sum, max_risk,
+         threat_type, first_seen, last_seen)
+        SELECT
+            %s, ae.event_type, ae.source_ip_text,
+            COALESCE(MAX(geo.country_code), ''), MAX(geo.country_name), MAX(geo.city),
+            COUNT(*),
+            COUNT(DISTINCT ae.target_username),
+            SUM(ae.is_anomaly = 1),
+            SUM(COALESCE(ae.ml_risk_score, 0)),
+            MAX(COALESCE(ae.ml_risk_score, 0)),
+            MAX(ae.ml_threat_type),
+            MIN(ae.timestamp),
+            MAX(ae.timestamp)
+        FROM auth_events ae
+        LEFT JOIN ip_geolocation geo ON ae.geo_id = geo.id
+        WHERE ae.timestamp >= %s AND ae.timestamp < %s
+        AND ae.source_type != 'simulation'
+        GROUP BY ae.event_type, ae.source_ip_text
+    """, (day, start, end))
+
+    cursor.execute("DELETE FROM auth_events_rollup_username_daily WHERE bucket_date = %s", (day,))
+    cursor.execute("""
+        INSERT INTO auth_events_rollup_username_daily
+        (bucket_date, event_type, username,
+         event_count, unique_ips, anomaly_count, risk_sum, first_seen, last_seen)
+        SELECT
+            %s, event_type, target_username,
+            COUNT(*),
+            COUNT(DISTINCT source_ip_text),
+            SUM(is_anomaly = 1),
+            SUM(COALESCE(ml_risk_score, 0)),
+            MIN(timestamp),
+            MAX(timestamp)
+        FROM auth_events
+        WHERE timestamp >= %s AND timestamp < %s
+        AND source_type != 'simulation'
+        AND target_username IS NOT NULL
+        GROUP BY event_type, target_username
+    """, (day, start, end))
+
+    cursor.execute("DELETE FROM auth_events_daily_summary WHERE summary_date = %s", (day,))
+    cursor.execute("""
+        INSERT INTO auth_events_daily_summary
+        (summary_date, total_events, failed_count, successful_count, invalid_count,
+         anomaly_count, avg_risk_score, unique_ips, unique_usernames, unique_servers)
+        SELECT
+            %s,
+            COUNT(*),
+            SUM(event_type = 'failed'),
+            SUM(event_type = 'successful'),
+            SUM(event_type = 'invalid'),
+            SUM(is_anomaly = 1),
+            COALESCE(AVG(ml_risk_score), 0),
+            COUNT(DISTINCT source_ip_text),
+            COUNT(DISTINCT target_username),
+            COUNT(DISTINCT target_server)
+        FROM auth_events
+        WHERE timestamp >= %s AND timestamp < %s
+        AND source_type != 'simulation'
+        HAVING COUNT(*) > 0
+    """, (day, start, end))
+
+
+def get_state(cursor, name: str) -> Optional[dict]:
+    """Read a refresher's state row as a dict (None if missing)"""
+    cursor.execute("""
+        SELECT high_water_mark, last_run_at, last_duration_ms, last_buckets
+        FROM event_rollup_state WHERE name = %s
+    """, (name,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        return row
+    return dict(zip(('high_water_mark', 'last_run_at', 'last_duration_ms', 'last_buckets'), row))
+
+
+def save_state(cursor, name: str, high_water_mark: Optional[datetime],
+               duration_ms: int, buckets: int) -> None:
+    """Record a completed refresh (caller commits)"""
+    cursor.execute("""
+        INSERT INTO event_rollup_state
+        (name, high_water_mark, last_run_at, last_duration_ms, last_buckets)
+        VALUES (%s, %s, NOW(), %s, %s)
+        ON DUPLICATE KEY UPDATE
+            high_water_mark = VALUES(high_water_mark),
+            last_run_at = VALUES(last_run_at),
+            last_duration_ms = VALUES(last_duration_ms),
+            last_buckets = VALUES(last_buckets)
+    """, (name, high_water_mark, duration_ms, buckets))
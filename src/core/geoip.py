@@ -1,11 +1,14 @@
 """
 SSH Guardian v3.0 - GeoIP Lookup Module
-Provides IP geolocation enrichment using IP-API.com (free tier)
+Provides IP geolocation enrichment from an offline dataset (geoip_local)
+with IP-API.com (free tier) as the remote provider
 """
 
 import sys
+import os
 from pathlib import Path
 import socket
+import threading
 import requests
 from datetime import datetime, timedelta
 import time
@@ -13,8 +16,18 @@ import time
 # Add project paths
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 sys.path.append(str(PROJECT_ROOT / "dbs"))
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from connection import get_connection, ip_to_binary
+from rate_limiter import SharedTokenBucket
+from geoip_local import get_local_geoip, LOCAL_FIELDS
+
+
+def _same_value(value, stored):
+    """Compare a dataset value with its stored column (DECIMAL vs float)"""
+    if isinstance(value, (int, float)) and stored is not None:
+        return abs(float(value) - float(stored)) < 1e-6
+    return value == stored
 
 
 class GeoIPLookup:
@@ -26,22 +39,68 @@ class GeoIPLookup:
     - No API key required
     - Returns comprehensive geolocation data
     - Built-in caching to avoid duplicate lookups
+    - Rate limit shared by all processes (Redis token bucket)
+    - Deferred mode: provisional record now, real lookup later
+    - Offline dataset (GEOIP_LOCAL_DB) answers first when configured
     """
 
     API_URL = "http://ip-api.com/json/{ip}?fields=status,message,country,countryCode,region,regionName,city,zip,lat,lon,timezone,isp,org,as,asname,proxy,hosting"
     CACHE_DURATION_DAYS = 30  # Cache GeoIP data for 30 days
-    RATE_LIMIT_DELAY = 1.5  # Delay between requests (40 requests/min to be safe)
+
+    # ip-api counts requests per 60s window: rate * 60 + burst stays under 45
+    RATE_LIMIT_PER_MIN = int(os.getenv('GEOIP_RATE_LIMIT_PER_MIN', 40))
+    RATE_LIMIT_BURST = int(os.getenv('GEOIP_RATE_LIMIT_BURST', 5))
+    RATE_LIMIT_KEY = 'ratelimit:geoip:ip-api'
+
+    # Longest an inline lookup waits for a token before deferring/giving up
+    RATE_LIMIT_MAX_WAIT_SEC = float(os.getenv('GEOIP_RATE_LIMIT_MAX_WAIT_SEC', 2))
+
+    # Deferred mode: when the quota is exhausted, store a provisional record
+    # (expired immediately) and queue the IP for a background lookup. Only
+    # used while the enrichment queue (whose workers drain it) is enabled
+    DEFERRED_LOOKUPS = os.getenv('GEOIP_DEFERRED_LOOKUPS', '1') == '1'
+    DEFERRED_QUEUE_KEY = 'geoip:deferred'
+    DEFERRED_MAX_LOCAL = 10000  # In-process fallback queue bound
+
+    # With an offline dataset loaded, still fetch the fields it lacks (city,
+    # ISP, proxy/hosting flags) from IP-API - always via the deferred queue
+    REMOTE_ENRICHMENT = os.getenv('GEOIP_REMOTE_ENRICHMENT', '1') == '1'
+
+    # Offline records with these fields are final; others are completed
+    # remotely when a worker drains the deferred queue
+    LOCAL_REQUIRED_FIELDS = ('country_code', 'city', 'asn_org')
+
+    _rate_limiter = None
+    _local_deferred = set()  # Fallback queue when Redis is unavailable
+    _init_lock = threading.Lock()
 
     @staticmethod
-    def lookup_ip(ip_address):
+    def get_rate_limiter():
+        """Get the process-shared ip-api token bucket"""
+        if GeoIPLookup._rate_limiter is None:
+            with GeoIPLookup._init_lock:
+                if GeoIPLookup._rate_limiter is None:
+                    GeoIPLookup._rate_limiter = SharedTokenBucket(
+                        GeoIPLookup.RATE_LIMIT_KEY,
+                        rate=GeoIPLookup.RATE_LIMIT_PER_MIN / 60,
+                        capacity=GeoIPLookup.RATE_LIMIT_BURST,
+                        name='ip-api'
+                    )
+        return GeoIPLookup._rate_limiter
+
+    @staticmethod
+    def lookup_ip(ip_address, max_wait=None, allow_deferred=None):
         """
         Lookup geolocation for an IP address
 
         Args:
             ip_address (str): IP address to lookup
+            max_wait (float): Seconds to wait for rate limit quota (default RATE_LIMIT_MAX_WAIT_SEC)
+            allow_deferred (bool): Return a provisional record when over quota
+                (default DEFERRED_LOOKUPS while the enrichment queue is enabled)
 
         Returns:
-            dict: GeoIP data or None if lookup fails
+            dict: GeoIP data (with 'provisional': True when deferred) or None if lookup fails
         """
 
         # Check if it's a valid IP
@@ -58,13 +117,62 @@ class GeoIPLookup:
             print(f"✅ GeoIP cache hit for {ip_address}")
             return cached_data
 
-        # Fetch from API
-        print(f"🌐 Fetching GeoIP data for {ip_address}...")
+        # Offline dataset first - binary search, no network
+        local_db = get_local_geoip()
+        local_data = local_db.lookup(ip_address) if local_db else None
+        if local_data:
+            if GeoIPLookup._needs_remote_enrichment(local_data):
+                # Remote API only fills what the dataset lacks, off the hot path
+                return GeoIPLookup._save_provisional(ip_address, local_data)
+            geo_data = GeoIPLookup._local_to_geo_data(ip_address, local_data)
+            GeoIPLookup._save_to_cache(geo_data)
+            return geo_data
+
+        # Rate limiting - only waits when the shared quota is actually exhausted
+        if max_wait is None:
+            max_wait = GeoIPLookup.RATE_LIMIT_MAX_WAIT_SEC
+        if allow_deferred is None:
+            allow_deferred = GeoIPLookup.DEFERRED_LOOKUPS and GeoIPLookup._deferred_queue_drained()
+
+        if not GeoIPLookup.get_rate_limiter().acquire(timeout=max_wait):
+            if allow_deferred:
+                print(f"⏳ GeoIP quota exhausted, deferring lookup for {ip_address}")
+                return GeoIPLookup._save_provisional(ip_address)
+            print(f"⚠️  GeoIP quota exhausted, skipping lookup for {ip_address}")
+            return None
+
+        return GeoIPLookup._fetch_from_api(ip_address)
 
+    @staticmethod
+    def _needs_remote_enrichment(local_data):
+        """
+        Check whether an offline record should wait for remote data.
+
+        Only when it lacks a required field and something will actually
+        drain the deferred queue (the enrichment worker); otherwise the
+        offline record is stored as final.
+        """
+        if not GeoIPLookup.REMOTE_ENRICHMENT:
+            return False
+        if all(local_data.get(field) for field in GeoIPLookup.LOCAL_REQUIRED_FIELDS):
+            return False
+        return GeoIPLookup._deferred_queue_drained()
+
+    @staticmethod
+    def _deferred_queue_drained():
+        """Whether enrichment workers run, so deferred lookups get resolved"""
         try:
-            # Rate limiting
-            time.sleep(GeoIPLookup.RATE_LIMIT_DELAY)
+            from enrichment_queue import is_queue_enabled
+            return is_queue_enabled()
+        except ImportError:
+            return False
 
+    @staticmethod
+    def _fetch_from_api(ip_address):
+        """Fetch, parse and cache one IP from IP-API (caller holds a rate limit token)"""
+        print(f"🌐 Fetching GeoIP data for {ip_address}...")
+
+        try:
             response = requests.get(
                 GeoIPLookup.API_URL.format(ip=ip_address),
                 timeout=5
@@ -147,6 +255,34 @@ class GeoIPLookup:
             'cache_expires_at': cache_expires_at
         }
 
+    @staticmethod
+    def _local_to_geo_data(ip_address, local_data):
+        """Convert an offline dataset record into database format"""
+        return {
+            'ip_address': ip_to_binary(ip_address),
+            'ip_address_text': ip_address,
+            'ip_version': 4 if '.' in ip_address else 6,
+            'country_code': local_data.get('country_code'),
+            'country_name': local_data.get('country_name'),
+            'region': local_data.get('region'),
+            'city': local_data.get('city'),
+            'postal_code': local_data.get('postal_code'),
+            'latitude': local_data.get('latitude'),
+            'longitude': local_data.get('longitude'),
+            'timezone': local_data.get('timezone'),
+            'asn': local_data.get('asn'),
+            'asn_org': local_data.get('asn_org'),
+            'isp': local_data.get('asn_org'),
+            'connection_type': None,
+            'is_proxy': False,
+            'is_vpn': False,
+            'is_tor': False,
+            'is_datacenter': False,
+            'is_hosting': False,
+            'lookup_count': 1,
+            'cache_expires_at': datetime.now() + timedelta(days=GeoIPLookup.CACHE_DURATION_DAYS)
+        }
+
     @staticmethod
     def _get_from_cache(ip_address):
         """Check if IP geolocation is in cache"""
@@ -241,6 +377,20 @@ class GeoIPLookup:
                     %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
                 )
                 ON DUPLICATE KEY UPDATE
+                    country_code = VALUES(country_code),
+                    country_name = VALUES(country_name),
+                    region = VALUES(region),
+                    city = VALUES(city),
+                    postal_code = VALUES(postal_code),
+                    latitude = VALUES(latitude),
+                    longitude = VALUES(longitude),
+                    timezone = VALUES(timezone),
+                    asn = VALUES(asn),
+                    asn_org = VALUES(asn_org),
+                    isp = VALUES(isp),
+                    is_proxy = VALUES(is_proxy),
+                    is_hosting = VALUES(is_hosting),
+                    cache_expires_at = VALUES(cache_expires_at),
                     lookup_count = lookup_count + 1,
                     last_seen = NOW()
             """, (
@@ -283,6 +433,147 @@ class GeoIPLookup:
             cursor.close()
             conn.close()
 
+    @staticmethod
+    def _save_provisional(ip_address, local_data=None):
+        """
+        Store a placeholder record so events get a geo_id immediately.
+
+        The row is created already expired, so the next lookup (or the
+        deferred queue) fetches real data and updates it in place. Fields
+        from the offline dataset are stored right away; an existing expired
+        row keeps its stale values for anything the dataset doesn't know,
+        and is left untouched when the dataset has nothing new for it.
+
+        Args:
+            ip_address (str): IP address
+            local_data (dict): Offline dataset record, if any
+
+        Returns:
+            dict: Provisional GeoIP data
+        """
+        GeoIPLookup._enqueue_deferred(ip_address)
+        local_data = local_data or {}
+        values = [local_data.get(field) for field in LOCAL_FIELDS]
+
+        conn = get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(f"""
+                SELECT id, {', '.join(LOCAL_FIELDS)}
+                FROM ip_geolocation WHERE ip_address_text = %s
+            """, (ip_address,))
+            existing = cursor.fetchone()
+            if existing and all(
+                value is None or _same_value(value, stored)
+                for value, stored in zip(values, existing[1:])
+            ):
+                return GeoIPLookup._provisional_result(ip_address, existing[0], values, local_data)
+
+            cursor.execute(f"""
+                INSERT INTO ip_geolocation (
+                    ip_address, ip_address_text, ip_version, {', '.join(LOCAL_FIELDS)},
+                    isp, lookup_count, cache_expires_at
+                ) VALUES (%s, %s, %s, {', '.join(['%s'] * len(LOCAL_FIELDS))}, %s, 1, NOW())
+                ON DUPLICATE KEY UPDATE
+                    {', '.join(f'{field} = COALESCE(VALUES({field}), {field})' for field in LOCAL_FIELDS)},
+                    lookup_count = lookup_count + 1,
+                    last_seen = NOW(),
+                    id = LAST_INSERT_ID(id)
+            """, (ip_to_binary(ip_address), ip_address, 4 if '.' in ip_address else 6,
+                  *values, local_data.get('asn_org')))
+            geo_id = cursor.lastrowid
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Failed to save provisional GeoIP record: {e}")
+            geo_id = None
+        finally:
+            cursor.close()
+            conn.close()
+
+        return GeoIPLookup._provisional_result(ip_address, geo_id, values, local_data)
+
+    @staticmethod
+    def _provisional_result(ip_address, geo_id, values, local_data):
+        return {
+            'id': geo_id,
+            'ip_address_text': ip_address,
+            'ip_version': 4 if '.' in ip_address else 6,
+            **dict(zip(LOCAL_FIELDS, values)),
+            'isp': local_data.get('asn_org'),
+            'provisional': True
+        }
+
+    @staticmethod
+    def _enqueue_deferred(ip_address):
+        """Queue an IP for a background lookup (Redis, else in-process)"""
+        try:
+            from cache import get_redis_client
+            client = get_redis_client()
+            if client is not None:
+                # Score is first-deferred time, so older IPs are resolved first
+                client.zadd(GeoIPLookup.DEFERRED_QUEUE_KEY, {ip_address: time.time()}, nx=True)
+                return
+        except Exception as e:
+            print(f"⚠️  Deferred GeoIP queue unavailable: {e}")
+
+        if len(GeoIPLookup._local_deferred) >= GeoIPLookup.DEFERRED_MAX_LOCAL:
+            print(f"⚠️  Deferred GeoIP queue full, {ip_address} resolved on its next lookup")
+            return
+        GeoIPLookup._local_deferred.add(ip_address)
+
+    @staticmethod
+    def _pop_deferred(limit):
+        """Take up to `limit` queued IPs, oldest first"""
+        ips = []
+        try:
+            from cache import get_redis_client
+            client = get_redis_client()
+            if client is not None:
+                ips = [ip for ip, _ in client.zpopmin(GeoIPLookup.DEFERRED_QUEUE_KEY, limit)]
+        except Exception as e:
+            print(f"⚠️  Deferred GeoIP queue unavailable: {e}")
+
+        while len(ips) < limit and GeoIPLookup._local_deferred:
+            ips.append(GeoIPLookup._local_deferred.pop())
+        return ips
+
+    @staticmethod
+    def process_deferred_lookups(limit=20, max_wait=None):
+        """
+        Resolve IPs that got a provisional record.
+
+        Meant for background workers: waits for rate limit quota (up to
+        max_wait per IP) instead of deferring again. IPs that still can't
+        be looked up are put back on the queue.
+
+        Args:
+            limit (int): Maximum IPs to resolve in this call
+            max_wait (float): Seconds to wait for quota per IP (None = 60s)
+
+        Returns:
+            dict: {'resolved': int, 'requeued': int}
+        """
+        limiter = GeoIPLookup.get_rate_limiter()
+        resolved = 0
+        pending = GeoIPLookup._pop_deferred(limit)
+
+        for index, ip_address in enumerate(pending):
+            if GeoIPLookup._get_from_cache(ip_address):
+                continue  # Already resolved by an inline lookup
+
+            if not limiter.acquire(timeout=60 if max_wait is None else max_wait):
+                # Out of quota - put this and the rest back for the next run
+                for ip in pending[index:]:
+                    GeoIPLookup._enqueue_deferred(ip)
+                return {'resolved': resolved, 'requeued': len(pending) - index}
+
+            if GeoIPLookup._fetch_from_api(ip_address):
+                resolved += 1
+
+        return {'resolved': resolved, 'requeued': 0}
+
     @staticmethod
     def enrich_event_with_geoip(event_id, ip_address):
         """
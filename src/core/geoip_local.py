@@ -0,0 +1,463 @@
+"""
+SSH Guardian v3.0 - Offline GeoIP/ASN Database
+Local IP-range datasets (CSV/TSV ranges or MaxMind MMDB) searched with
+bisect over sorted arrays - no network calls on the lookup path
+"""
+
+import os
+import re
+import csv
+import pickle
+import socket
+import ipaddress
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Optional MaxMind reader (memory-mapped MMDB files)
+try:
+    import maxminddb
+    MAXMINDDB_AVAILABLE = True
+except ImportError:
+    MAXMINDDB_AVAILABLE = False
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+
+# Comma-separated list of dataset files, e.g.
+#   GEOIP_LOCAL_DB=data/geoip/ip2asn-combined.tsv
+#   GEOIP_LOCAL_DB=data/geoip/dbip-country-lite.csv,data/geoip/dbip-asn-lite.csv
+#   GEOIP_LOCAL_DB=/usr/share/GeoIP/GeoLite2-City.mmdb,/usr/share/GeoIP/GeoLite2-ASN.mmdb
+GEOIP_LOCAL_DB = os.getenv('GEOIP_LOCAL_DB', '')
+
+# Compiled range indexes are cached here so only the first process after a
+# dataset update pays for CSV parsing
+GEOIP_INDEX_CACHE_DIR = Path(os.getenv('GEOIP_INDEX_CACHE_DIR', str(PROJECT_ROOT / "data" / "geoip_index")))
+INDEX_FORMAT_VERSION = 1
+
+# Fields a local dataset can provide
+LOCAL_FIELDS = ('country_code', 'country_name', 'region', 'city', 'postal_code',
+                'latitude', 'longitude', 'timezone', 'asn', 'asn_org')
+
+# Fields that must come from the same dataset to stay consistent
+FIELD_GROUPS = (
+    ('country_code', 'country_name'),
+    ('region', 'city', 'postal_code', 'latitude', 'longitude', 'timezone'),
+    ('asn', 'asn_org'),
+)
+
+# Header names used by the common free range datasets
+HEADER_ALIASES = {
+    'country_code': {'country_code', 'countrycode', 'country_iso_code', 'cc', 'country'},
+    'country_name': {'country_name', 'countryname'},
+    'asn': {'asn', 'as_number', 'autonomous_system_number'},
+    'asn_org': {'asn_org', 'org', 'organization', 'as_description', 'as_org',
+                'autonomous_system_organization', 'isp'},
+}
+
+COUNTRY_CODE_PATTERN = re.compile(r'^[A-Z]{2}$')
+ASN_PATTERN = re.compile(r'^(?:AS)?(\d+)$', re.IGNORECASE)
+
+# Placeholder codes some datasets use for "unknown"
+UNKNOWN_COUNTRY_CODES = {'ZZ', 'XX', '--'}
+
+
+class _RangeIndex:
+    """
+    Sorted, non-overlapping IP ranges for one IP version.
+
+    Range starts/ends are parallel arrays (4-byte unsigned for IPv4, Python
+    ints for IPv6) and each range points at a de-duplicated record tuple,
+    so a few hundred thousand ranges stay compact.
+    """
+
+    def __init__(self, version: int):
+        self.version = version
+        self.starts = array('I') if version == 4 else []
+        self.ends = array('I') if version == 4 else []
+        self.record_ids = array('I')
+
+    def build(self, ranges: List[tuple]):
+        """Load (start, end, record_id) tuples"""
+        ranges.sort()
+        for start, end, record_id in ranges:
+            self.starts.append(start)
+            self.ends.append(end)
+            self.record_ids.append(record_id)
+
+    def find(self, value: int) -> Optional[int]:
+        """Binary search for the range containing value, returns record id"""
+        i = bisect_right(self.starts, value) - 1
+        if i >= 0 and value <= self.ends[i]:
+            return self.record_ids[i]
+        return None
+
+    def __len__(self):
+        return len(self.starts)
+
+
+class _RangeFileSource:
+    """One CSV/TSV range file loaded into per-version range indexes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = []  # tuple(value per LOCAL_FIELDS)
+        self.indexes = {4: _RangeIndex(4), 6: _RangeIndex(6)}
+
+    @staticmethod
+    def _parse_ip(value: str):
+        """Parse an IP as text or integer, returns (version, int) or None"""
+        value = value.strip().strip('"')
+        if value.isdigit():
+            number = int(value)
+            return (4 if number <= 0xFFFFFFFF else 6), number
+        # inet_pton is ~10x faster than ipaddress for multi-million-row files
+        try:
+            if ':' in value:
+                return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, value), 'big')
+            return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, value), 'big')
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _parse_network(value: str):
+        """Parse a CIDR network, returns (version, start, end) or None"""
+        try:
+            network = ipaddress.ip_network(value.strip(), strict=False)
+        except ValueError:
+            return None
+        return network.version, int(network.network_address), int(network.broadcast_address)
+
+    @staticmethod
+    def _header_map(row: List[str]) -> Dict[str, int]:
+        """Map LOCAL_FIELDS to column positions from a header row"""
+        mapping = {}
+        for position, name in enumerate(row):
+            key = name.strip().lower()
+            for field, aliases in HEADER_ALIASES.items():
+                if key in aliases and field not in mapping:
+                    mapping[field] = position
+        return mapping
+
+    @staticmethod
+    def _guess_fields(values: List[str]) -> Dict:
+        """
+        Classify the columns after the range for headerless files:
+        ip2asn (asn, cc, description), DB-IP country (cc),
+        DB-IP ASN (asn, org), IP2Location (cc, country name)
+        """
+        record = {}
+        for value in values:
+            value = value.strip()
+            if not value:
+                continue
+            if 'country_code' not in record and COUNTRY_CODE_PATTERN.match(value):
+                record['country_code'] = value
+                continue
+            asn_match = ASN_PATTERN.match(value)
+            if 'asn' not in record and asn_match:
+                record['asn'] = int(asn_match.group(1))
+                continue
+            if 'asn' in record and 'asn_org' not in record:
+                record['asn_org'] = value
+            elif 'country_code' in record and 'country_name' not in record:
+                record['country_name'] = value
+            elif 'asn_org' not in record:
+                record['asn_org'] = value
+        return record
+
+    def _index_cache_path(self) -> Path:
+        stat = os.stat(self.path)
+        name = f"{Path(self.path).name}.{stat.st_size}.{int(stat.st_mtime)}.v{INDEX_FORMAT_VERSION}.idx"
+        return GEOIP_INDEX_CACHE_DIR / name
+
+    def load(self):
+        """Load the compiled index from cache, or parse the file and cache it"""
+        cache_path = self._index_cache_path()
+        try:
+            with open(cache_path, 'rb') as f:
+                self.records, columns = pickle.load(f)
+            for version, (starts, ends, record_ids) in columns.items():
+                index = self.indexes[version]
+                index.starts, index.ends, index.record_ids = starts, ends, record_ids
+            return
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️  Ignoring unreadable GeoIP index cache {cache_path.name}: {e}")
+
+        self._parse()
+
+        try:
+            GEOIP_INDEX_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix('.tmp')
+            with open(tmp_path, 'wb') as f:
+                # Plain arrays/lists only, so the cache loads under any import path
+                columns = {version: (index.starts, index.ends, index.record_ids)
+                           for version, index in self.indexes.items()}
+                pickle.dump((self.records, columns), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"⚠️  Could not write GeoIP index cache: {e}")
+
+    def _parse(self):
+        """Parse the file and build the range indexes"""
+        record_ids = {}
+        ranges = {4: [], 6: []}
+        header = None
+
+        with open(self.path, newline='', encoding='utf-8', errors='replace') as f:
+            sample = f.readline()
+            f.seek(0)
+            delimiter = '\t' if '\t' in sample else ','
+            reader = csv.reader(f, delimiter=delimiter)
+
+            for row in reader:
+                if not row or row[0].startswith('#'):
+                    continue
+
+                # Range as CIDR network or as start,end pair
+                if '/' in row[0]:
+                    parsed = self._parse_network(row[0])
+                    if parsed is None:
+                        if header is None:
+                            header = self._header_map(row)
+                        continue
+                    version, start, end = parsed
+                    rest_offset = 1
+                else:
+                    first = self._parse_ip(row[0])
+                    last = self._parse_ip(row[1]) if len(row) > 1 else None
+                    if first is None or last is None:
+                        if header is None:
+                            header = self._header_map(row)
+                        continue
+                    version, start = first
+                    end = last[1]
+                    rest_offset = 2
+
+                if header:
+                    record = {}
+                    for field, position in header.items():
+                        if position < len(row) and row[position].strip():
+                            record[field] = row[position].strip()
+                    if 'asn' in record:
+                        asn_match = ASN_PATTERN.match(record['asn'])
+                        record['asn'] = int(asn_match.group(1)) if asn_match else None
+                else:
+                    record = self._guess_fields(row[rest_offset:])
+
+                if record.get('country_code') in UNKNOWN_COUNTRY_CODES:
+                    record.pop('country_code')
+                if not record.get('asn'):
+                    # ip2asn marks unrouted space as AS0 "Not routed"
+                    record.pop('asn', None)
+                    record.pop('asn_org', None)
+                if not record:
+                    continue
+
+                key = tuple(record.get(field) for field in LOCAL_FIELDS)
+                record_id = record_ids.get(key)
+                if record_id is None:
+                    record_id = record_ids[key] = len(self.records)
+                    self.records.append(key)
+
+                ranges[version].append((start, end, record_id))
+
+        for version, version_ranges in ranges.items():
+            self.indexes[version].build(version_ranges)
+
+    def lookup(self, version: int, value: int) -> Optional[Dict]:
+        record_id = self.indexes[version].find(value)
+        if record_id is None:
+            return None
+        return dict(zip(LOCAL_FIELDS, self.records[record_id]))
+
+    def __len__(self):
+        return len(self.indexes[4]) + len(self.indexes[6])
+
+
+class _MMDBSource:
+    """MaxMind-format database read through a memory map"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.reader = None
+
+    def load(self):
+        self.reader = maxminddb.open_database(self.path, maxminddb.MODE_MMAP)
+
+    def lookup(self, ip_address: str) -> Optional[Dict]:
+        data = self.reader.get(ip_address)
+        if not data:
+            return None
+
+        country = data.get('country') or data.get('registered_country') or {}
+        location = data.get('location') or {}
+        subdivisions = data.get('subdivisions') or [{}]
+
+        record = {
+            'country_code': country.get('iso_code'),
+            'country_name': (country.get('names') or {}).get('en'),
+            'region': (subdivisions[0].get('names') or {}).get('en'),
+            'city': ((data.get('city') or {}).get('names') or {}).get('en'),
+            'postal_code': (data.get('postal') or {}).get('code'),
+            'latitude': location.get('latitude'),
+            'longitude': location.get('longitude'),
+            'timezone': location.get('time_zone'),
+            'asn': data.get('autonomous_system_number'),
+            'asn_org': data.get('autonomous_system_organization'),
+        }
+        return {k: v for k, v in record.items() if v is not None} or None
+
+    def __len__(self):
+        return self.reader.metadata().node_count if self.reader else 0
+
+
+class LocalGeoIPDatabase:
+    """
+    Offline GeoIP provider over one or more local datasets.
+
+    Each dataset is searched in order and the first one to answer a field
+    group (country, location, ASN) supplies that whole group, so a country
+    file and an ASN file can be combined without mixing their answers.
+    """
+
+    def __init__(self, paths: List[str]):
+        """
+        Initialize the database (files are loaded on first lookup).
+
+        Args:
+            paths: Dataset files (.csv/.tsv ranges or .mmdb)
+        """
+        self.paths = paths
+        self.sources = []
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.stats = {'lookups': 0, 'hits': 0, 'load_ms': 0, 'ranges': 0}
+
+    def _resolve_path(self, path: str) -> Path:
+        resolved = Path(path)
+        return resolved if resolved.is_absolute() else PROJECT_ROOT / resolved
+
+    def load(self):
+        """Load every configured dataset (safe to call more than once)"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+
+            started = time.perf_counter()
+            for path in self.paths:
+                resolved = self._resolve_path(path)
+                if not resolved.exists():
+                    print(f"⚠️  Local GeoIP dataset not found: {resolved}")
+                    continue
+
+                if resolved.suffix.lower() == '.mmdb':
+                    if not MAXMINDDB_AVAILABLE:
+                        print(f"⚠️  maxminddb not installed, skipping {resolved.name}")
+                        continue
+                    source = _MMDBSource(str(resolved))
+                else:
+                    source = _RangeFileSource(str(resolved))
+
+                try:
+                    source.load()
+                except Exception as e:
+                    print(f"❌ Failed to load local GeoIP dataset {resolved.name}: {e}")
+                    continue
+
+                self.sources.append(source)
+                self.stats['ranges'] += len(source)
+
+            self.stats['load_ms'] = int((time.perf_counter() - started) * 1000)
+            self._loaded = True
+
+            if self.sources:
+                print(f"✅ Local GeoIP loaded: {len(self.sources)} dataset(s), "
+                      f"{self.stats['ranges']:,} ranges in {self.stats['load_ms']} ms")
+
+    def is_available(self) -> bool:
+        """Check if at least one dataset loaded"""
+        self.load()
+        return bool(self.sources)
+
+    def lookup(self, ip_address: str) -> Optional[Dict]:
+        """
+        Look up an IP in the local datasets.
+
+        Args:
+            ip_address: IPv4 or IPv6 address
+
+        Returns:
+            Dict with the LOCAL_FIELDS the datasets provide, or None
+        """
+        self.load()
+        self.stats['lookups'] += 1
+
+        try:
+            ip = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return None
+        version, value = ip.version, int(ip)
+
+        result = {}
+        for source in self.sources:
+            if isinstance(source, _MMDBSource):
+                found = source.lookup(ip_address)
+            else:
+                found = source.lookup(version, value)
+            if not found:
+                continue
+            for group in FIELD_GROUPS:
+                if any(field in result for field in group):
+                    continue
+                for field in group:
+                    if found.get(field) is not None:
+                        result[field] = found[field]
+
+        if not result:
+            return None
+
+        self.stats['hits'] += 1
+        return result
+
+    def get_stats(self) -> Dict:
+        """Get loader and lookup statistics"""
+        return {
+            'datasets': [source.path for source in self.sources],
+            **self.stats
+        }
+
+
+_local_db = None
+_local_db_lock = threading.Lock()
+
+
+def get_local_geoip() -> Optional[LocalGeoIPDatabase]:
+    """
+    Get the shared offline database, or None if GEOIP_LOCAL_DB is unset
+    or none of its files could be loaded.
+    """
+    global _local_db
+
+    if not GEOIP_LOCAL_DB:
+        return None
+
+    if _local_db is None:
+        with _local_db_lock:
+            if _local_db is None:
+                paths = [p.strip() for p in GEOIP_LOCAL_DB.split(',') if p.strip()]
+                _local_db = LocalGeoIPDatabase(paths)
+
+    return _local_db if _local_db.is_available() else None
+
+
+def lookup_local(ip_address: str) -> Optional[Dict]:
+    """Convenience function for an offline lookup"""
+    db = get_local_geoip()
+    return db.lookup(ip_address) if db else None
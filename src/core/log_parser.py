@@ -0,0 +1,160 @@
+"""
+SSH Guardian v3.0 - SSH Log Parser
+Single-pass compiled parser for sshd auth.log lines (no database dependencies)
+"""
+
+import re
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional
+
+# One compiled alternation instead of trying each pattern in turn.
+# Branch groups keep the outcome identical to the previous per-pattern
+# parser (including auth_method='other' for "Failed password for invalid user").
+SSH_EVENT_PATTERN = re.compile(
+    r'Failed (?P<f_method>password|publickey) for (?P<f_invalid>invalid user )?'
+    r'(?P<f_username>\S+) from (?P<f_ip>[\d\.:a-fA-F]+) port (?P<f_port>\d+)'
+    r'|Accepted (?P<a_method>password|publickey) for '
+    r'(?P<a_username>\S+) from (?P<a_ip>[\d\.:a-fA-F]+) port (?P<a_port>\d+)'
+    r'|Invalid user (?P<i_username>\S+) from (?P<i_ip>[\d\.:a-fA-F]+)'
+)
+
+# Positions of SSH_EVENT_PATTERN groups in match.groups()
+(_F_METHOD, _F_INVALID, _F_USERNAME, _F_IP, _F_PORT,
+ _A_METHOD, _A_USERNAME, _A_IP, _A_PORT,
+ _I_USERNAME, _I_IP) = range(11)
+
+# Timestamp patterns
+ISO_TIMESTAMP_PATTERN = re.compile(
+    r'^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:\d{2})?)'
+)
+SYSLOG_TIMESTAMP_PATTERN = re.compile(
+    r'^([A-Z][a-z]{2})\s+(\d{1,2})\s+(\d{2}):(\d{2}):(\d{2})'
+)
+
+MONTH_MAP = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
+}
+
+
+def parse_log_timestamp(log_line: str, now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Extract the event timestamp from a log line.
+
+    Args:
+        log_line: Raw log line
+        now: Reference time for syslog lines without a year (defaults to now)
+
+    Returns:
+        Naive local datetime, or None if no timestamp was found
+    """
+    # ISO format: "2025-12-20T07:10:05.913746+01:00"
+    if log_line[:1].isdigit():
+        iso_match = ISO_TIMESTAMP_PATTERN.match(log_line)
+        if iso_match:
+            try:
+                iso_str = iso_match.group(1)
+                # Handle 'Z' suffix (UTC)
+                if iso_str.endswith('Z'):
+                    iso_str = iso_str[:-1] + '+00:00'
+                dt = datetime.fromisoformat(iso_str)
+                # If timezone-aware, convert to local time (server is KL +08:00)
+                # and strip timezone info for MySQL
+                if dt.tzinfo is not None:
+                    return dt.astimezone().replace(tzinfo=None)
+                # No timezone info - assume already local time
+                return dt
+            except (ValueError, TypeError):
+                pass
+
+    # Syslog format: "Dec 20 03:30:00"
+    # Syslog timestamps are already in local time - use as-is
+    syslog_match = SYSLOG_TIMESTAMP_PATTERN.match(log_line)
+    if syslog_match:
+        month_str, day_str, hour, minute, second = syslog_match.groups()
+        if now is None:
+            now = datetime.now()
+        try:
+            return now.replace(
+                month=MONTH_MAP.get(month_str, now.month), day=int(day_str),
+                hour=int(hour), minute=int(minute), second=int(second), microsecond=0
+            )
+        except ValueError:
+            return None
+
+    return None
+
+
+def parse_log_line(log_line: str, now: Optional[datetime] = None) -> Optional[Dict]:
+    """
+    Parse SSH log line and extract information.
+
+    Args:
+        log_line: Raw SSH log line
+        now: Reference time for syslog lines without a year (defaults to now)
+
+    Returns:
+        Parsed event dict, or None for lines that are not auth events
+    """
+    # Cheap substring prefilter - most auth.log lines (pam_unix, session
+    # opened/closed, Disconnected, ...) never reach the regex engine
+    if 'Failed ' not in log_line and 'Accepted ' not in log_line and 'Invalid user ' not in log_line:
+        return None
+
+    match = SSH_EVENT_PATTERN.search(log_line)
+    if not match:
+        return None
+
+    groups = match.groups()
+
+    if groups[_F_USERNAME] is not None:
+        event_type = 'failed'
+        username, ip, port = groups[_F_USERNAME], groups[_F_IP], groups[_F_PORT]
+        if groups[_F_INVALID]:
+            failure_reason = 'invalid_user'
+            auth_method = 'publickey' if groups[_F_METHOD] == 'publickey' else 'other'
+        else:
+            failure_reason = 'invalid_password'
+            auth_method = groups[_F_METHOD]
+    elif groups[_A_USERNAME] is not None:
+        event_type = 'successful'
+        failure_reason = None
+        auth_method = groups[_A_METHOD]
+        username, ip, port = groups[_A_USERNAME], groups[_A_IP], groups[_A_PORT]
+    else:
+        event_type = 'failed'
+        failure_reason = 'invalid_user'
+        auth_method = 'other'
+        username, ip, port = groups[_I_USERNAME], groups[_I_IP], None
+
+    return {
+        'event_type': event_type,
+        'auth_method': auth_method,
+        'source_ip': ip,
+        'source_port': int(port) if port else None,
+        'username': username,
+        'failure_reason': failure_reason,
+        'raw_log_line': log_line,
+        'log_timestamp': parse_log_timestamp(log_line, now)
+    }
+
+
+def parse_lines(log_lines: Iterable[str], now: Optional[datetime] = None) -> Iterator[Optional[Dict]]:
+    """
+    Parse many log lines, yielding one result per input line.
+
+    The syslog reference time is taken once for the whole iterable so large
+    backfills don't pay for datetime.now() on every line.
+
+    Args:
+        log_lines: Iterable of raw log lines (list, file object, generator)
+        now: Reference time for syslog lines without a year (defaults to now)
+
+    Yields:
+        Parsed event dict, or None for lines that are not auth events
+    """
+    if now is None:
+        now = datetime.now()
+
+    for log_line in log_lines:
+        yield parse_log_line(log_line.rstrip('\n'), now)
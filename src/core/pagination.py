@@ -0,0 +1,138 @@
+"""
+SSH Guardian v3.0 - Keyset Pagination
+Opaque cursor tokens for listing APIs: a token encodes the sort key of the
+last row served, and the next page seeks past it with an index range
+condition instead of LIMIT/OFFSET re-reading every skipped row
+"""
+
+import json
+import base64
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+class InvalidCursor(ValueError):
+    """Cursor token is malformed or belongs to a different ordering"""
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'n': str(value)}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+        if 'n' in value:
+            return Decimal(value['n'])
+        raise InvalidCursor('Unknown cursor value')
+    return value
+
+
+def encode_cursor(values: Sequence[Any], ordering: str) -> str:
+    """
+    Build an opaque cursor token.
+
+    Args:
+        values: Sort key of the last row served (e.g. (timestamp, id))
+        ordering: Name of the ordering the key belongs to (e.g. 'timestamp:desc')
+
+    Returns:
+        URL-safe token
+    """
+    payload = json.dumps({'o': ordering, 'k': [_encode_value(v) for v in values]},
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str, ordering: str, size: int) -> Tuple:
+    """
+    Decode a cursor token.
+
+    Args:
+        token: Token from a previous page's next_cursor
+        ordering: Ordering the current request uses
+        size: Number of key values expected
+
+    Returns:
+        Sort key tuple
+
+    Raises:
+        InvalidCursor: Malformed token, or one issued for another ordering
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = tuple(_decode_value(v) for v in payload['k'])
+        issued_for = payload['o']
+    except InvalidCursor:
+        raise
+    except Exception:
+        raise InvalidCursor('Malformed cursor')
+
+    if issued_for != ordering or len(values) != size:
+        raise InvalidCursor('Cursor does not match the requested ordering')
+    return values
+
+
+def keyset_condition(columns: Sequence[str], values: Sequence[Any],
+                     descending: bool = True) -> Tuple[str, List[Any]]:
+    """
+    WHERE condition selecting rows strictly after a key in sort order.
+
+    Expanded as (a < %s OR (a = %s AND b < %s)), which MySQL turns into a
+    range on the leading column; a (a, b) < (x, y) row comparison is not
+    used for index ranges by every MySQL/MariaDB version.
+
+    Args:
+        columns: Sort columns/expressions, most significant first; the last
+            must be unique (usually the primary key)
+        values: Key of the last row served
+        descending: Rows are ordered descending
+
+    Returns:
+        (SQL condition, params)
+    """
+    op = '<' if descending else '>'
+    terms = []
+    params = []
+    for i, column in enumerate(columns):
+        parts = [f"{prev} = %s" for prev in columns[:i]] + [f"{column} {op} %s"]
+        terms.append('(' + ' AND '.join(parts) + ')')
+        params.extend(list(values[:i]) + [values[i]])
+    return '(' + ' OR '.join(terms) + ')', params
+
+
+def order_by(columns: Sequence[str], descending: bool = True) -> str:
+    """ORDER BY list matching keyset_condition"""
+    direction = 'DESC' if descending else 'ASC'
+    return ', '.join(f"{column} {direction}" for column in columns)
+
+
+def next_page(rows: List[Dict], limit: int, key: Callable[[Dict], Sequence[Any]],
+              ordering: str) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Trim a LIMIT limit+1 result to one page and build the next cursor.
+
+    Args:
+        rows: Rows fetched with LIMIT limit + 1
+        limit: Page size
+        key: Row -> sort key (same columns as the keyset condition)
+        ordering: Ordering name stored in the token
+
+    Returns:
+        (page rows, next cursor token or None on the last page)
+    """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]), ordering)
@@ -0,0 +1,216 @@
+"""
+SSH Guardian v3.0 - Rate Limiters
+Token-bucket limiters for external API quotas
+"""
+
+import threading
+import time
+from typing import Optional, Tuple
+
+
+class TokenBucket:
+    """
+    Thread-safe in-process token bucket.
+
+    Tokens refill continuously at `rate` per second up to `capacity`, so a
+    provider with a daily quota can still absorb a burst of new IPs without
+    sleeping between every call.
+    """
+
+    def __init__(self, rate: float, capacity: float, name: str = ''):
+        """
+        Initialize the bucket (starts full).
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum tokens (burst size)
+            name: Label used in stats
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.name = name
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.stats = {'acquired': 0, 'rejected': 0, 'waited_ms': 0}
+
+    def _refill(self):
+        """Add tokens for the time elapsed since the last refill (lock held)"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self, tokens: float) -> Tuple[bool, float]:
+        """
+        Try to take tokens once.
+
+        Returns:
+            (acquired, seconds until enough tokens would be available)
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True, 0.0
+            return False, ((tokens - self._tokens) / self.rate if self.rate > 0 else float('inf'))
+
+    def _count(self, stat: str, value: int = 1):
+        with self._lock:
+            self.stats[stat] += value
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take tokens if available, never waits"""
+        acquired, _ = self._take(tokens)
+        self._count('acquired' if acquired else 'rejected')
+        return acquired
+
+    def acquire(self, timeout: Optional[float] = None, tokens: float = 1.0) -> bool:
+        """
+        Take tokens, waiting only while the bucket is actually empty.
+
+        Args:
+            timeout: Maximum seconds to wait (None waits as long as needed)
+            tokens: Tokens to take
+
+        Returns:
+            True if acquired, False if the wait would exceed the timeout
+        """
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+
+        while True:
+            acquired, wait = self._take(tokens)
+            if acquired:
+                self._count('acquired')
+                self._count('waited_ms', int((time.monotonic() - started) * 1000))
+                return True
+
+            if deadline is not None and time.monotonic() + wait > deadline:
+                # Don't sleep for a token we could never get in time
+                self._count('rejected')
+                return False
+
+            time.sleep(wait)
+
+    def get_stats(self) -> dict:
+        """Get limiter statistics"""
+        with self._lock:
+            self._refill()
+            return {
+                'name': self.name,
+                'rate_per_sec': self.rate,
+                'capacity': self.capacity,
+                'available': round(self._tokens, 2),
+                **self.stats
+            }
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket whose state lives in Redis, so every dashboard and worker
+    process draws from the same quota.
+
+    The refill-and-take step runs as one Lua script, which keeps it atomic
+    across processes. If Redis is unreachable the bucket falls back to its
+    in-process state (per-process limiting) and retries Redis periodically.
+    """
+
+    # KEYS[1] = bucket hash, ARGV = rate, capacity, now, requested
+    _TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local requested = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+if now > ts then
+    tokens = math.min(capacity, tokens + (now - ts) * rate)
+    ts = now
+end
+local acquired = 0
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+    acquired = 1
+elseif rate > 0 then
+    wait = (requested - tokens) / rate
+else
+    wait = -1
+end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(ts))
+if rate > 0 then
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+end
+return {acquired, tostring(wait), tostring(tokens)}
+"""
+
+    REDIS_RETRY_SEC = 30
+
+    def __init__(self, key: str, rate: float, capacity: float, name: str = ''):
+        """
+        Initialize the shared bucket.
+
+        Args:
+            key: Redis key holding the bucket state
+            rate: Tokens added per second
+            capacity: Maximum tokens (burst size)
+            name: Label used in stats
+        """
+        super().__init__(rate, capacity, name or key)
+        self.key = key
+        self._script = None
+        self._redis_retry_at = 0.0
+        self._remote_tokens = None
+        self.stats['fallback'] = 0
+
+    def _get_script(self):
+        """Get the registered Lua script, or None while Redis is unavailable"""
+        if self._script is not None:
+            return self._script
+        if time.monotonic() < self._redis_retry_at:
+            return None
+
+        try:
+            from cache import get_redis_client
+            client = get_redis_client()
+        except Exception:
+            client = None
+
+        if client is None:
+            self._redis_retry_at = time.monotonic() + self.REDIS_RETRY_SEC
+            return None
+
+        self._script = client.register_script(self._TAKE_SCRIPT)
+        return self._script
+
+    def _take(self, tokens: float) -> Tuple[bool, float]:
+        script = self._get_script()
+        if script is not None:
+            try:
+                acquired, wait, remaining = script(
+                    keys=[self.key],
+                    args=[self.rate, self.capacity, time.time(), tokens]
+                )
+                self._remote_tokens = float(remaining)
+                wait = float(wait)
+                return bool(int(acquired)), (float('inf') if wait < 0 else wait)
+            except Exception as e:
+                print(f"⚠️  Rate limiter '{self.name}' using in-process fallback: {e}")
+                self._script = None
+                self._redis_retry_at = time.monotonic() + self.REDIS_RETRY_SEC
+
+        self._count('fallback')
+        return super()._take(tokens)
+
+    def get_stats(self) -> dict:
+        """Get limiter statistics"""
+        stats = super().get_stats()
+        stats['shared'] = self._script is not None
+        if stats['shared'] and self._remote_tokens is not None:
+            stats['available'] = round(self._remote_tokens, 2)
+        return stats
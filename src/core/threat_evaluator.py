@@ -19,6 +19,9 @@ sys.path.append(str(PROJECT_ROOT / "dbs"))
 sys.path.append(str(PROJECT_ROOT / "src"))
 
 from connection import get_connection
+from event_context import EventContext
+from core.write_behind import get_write_buffer
+from core.write_behind_queries import upsert_auth_events_ml
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +30,16 @@ logger = logging.getLogger(__name__)
 HIGH_RISK_COUNTRIES = {'CN', 'RU', 'KP', 'IR', 'VN', 'IN', 'BR', 'PK', 'ID', 'NG'}
 MEDIUM_RISK_COUNTRIES = {'UA', 'RO', 'BG', 'TH', 'PH', 'MY', 'BD', 'EG', 'TR', 'MX'}
 
+# ip_geolocation columns used as threat intel details (cached rows younger than 7 days)
+THREAT_INTEL_COLUMNS = (
+    'abuseipdb_score', 'abuseipdb_reports',
+    'virustotal_positives', 'virustotal_total',
+    'shodan_ports', 'shodan_vulns',
+    'is_proxy', 'is_vpn', 'is_tor', 'is_datacenter', 'is_hosting',
+    'threat_level', 'country_code', 'country_name', 'isp', 'asn_org'
+)
+GEO_COLUMNS = ('country_code', 'country_name', 'city', 'region', 'latitude', 'longitude')
+
 
 class ThreatEvaluator:
     """
@@ -67,13 +80,16 @@ class ThreatEvaluator:
         except (ValueError, TypeError):
             return False
 
-    def evaluate_ip(self, ip_address: str, event_data: Dict = None) -> Dict[str, Any]:
+    def evaluate_ip(self, ip_address: str, event_data: Dict = None,
+                    context: Optional[EventContext] = None) -> Dict[str, Any]:
         """
         Perform comprehensive threat evaluation for an IP address.
 
         Args:
             ip_address: IP to evaluate
             event_data: Optional event context (username, timestamp, etc.)
+            context: Optional EventContext shared with the other pipeline
+                     stages (geo/threat rows, attempt counts, connection)
 
         Returns:
             Comprehensive evaluation with scores and factors
@@ -116,9 +132,10 @@ class ThreatEvaluator:
             'details': {}
         }
 
+        ctx = context or EventContext(ip_address)
         try:
             # 1. Fetch Threat Intelligence
-            ti_result = self._evaluate_threat_intel(ip_address)
+            ti_result = self._evaluate_threat_intel(ip_address, ctx)
             result['components']['threat_intel_score'] = ti_result['score']
             result['factors'].extend(ti_result['factors'])
             result['details']['threat_intel'] = ti_result['details']
@@ -142,14 +159,14 @@ class ThreatEvaluator:
             result['details']['geolocation'] = geo_result['details']
 
             # 5. Behavioral Analysis (if event history available)
-            beh_result = self._evaluate_behavior(ip_address, event_data)
+            beh_result = self._evaluate_behavior(ip_address, event_data, ctx)
             result['components']['behavioral_score'] = beh_result['score']
             result['factors'].extend(beh_result['factors'])
             result['details']['behavioral'] = beh_result['details']
 
             # 6. Specialized Detectors (Impossible Travel, Brute Force Success, Lateral Movement)
             detected_threats = self._run_specialized_detectors(
-                ip_address, event_data, ti_result['details'], geo_result['details']
+                ip_address, event_data, ti_result['details'], geo_result['details'], ctx
             )
             result['details']['specialized_detectors'] = detected_threats
 
@@ -163,14 +180,18 @@ class ThreatEvaluator:
 
             # Store evaluation in database
             self._store_evaluation(result)
+            ctx.invalidate(ctx.GEO)
 
         except Exception as e:
             logger.error(f"[ThreatEvaluator] Error evaluating {ip_address}: {e}")
             result['error'] = str(e)
+        finally:
+            if context is None:
+                ctx.close()
 
         return result
 
-    def _evaluate_threat_intel(self, ip_address: str) -> Dict:
+    def _evaluate_threat_intel(self, ip_address: str, context: EventContext) -> Dict:
         """Evaluate threat intelligence from external APIs"""
         score = 0
         factors = []
@@ -178,28 +199,16 @@ class ThreatEvaluator:
 
         try:
             # Try to get cached data first
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("""
-                SELECT
-                    abuseipdb_score, abuseipdb_reports,
-                    virustotal_positives, virustotal_total,
-                    shodan_ports, shodan_vulns,
-                    is_proxy, is_vpn, is_tor, is_datacenter, is_hosting,
-                    threat_level, country_code, country_name, isp, asn_org
-                FROM ip_geolocation
-                WHERE ip_address_text = %s
-                AND last_seen >= DATE_SUB(NOW(), INTERVAL 7 DAY)
-            """, (ip_address,))
-            cached = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            cached = context.get_geo(max_age=timedelta(days=7))
 
             if cached:
-                details = dict(cached)
+                details = {col: cached.get(col) for col in THREAT_INTEL_COLUMNS}
             elif self.threat_intel:
-                # Fetch fresh data
+                # Fetch fresh data (without holding the context's connection)
+                context.release()
                 ti_data = self.threat_intel.lookup_ip_threat(ip_address)
+                # The lookup refreshed the cached rows
+                context.invalidate(context.GEO, context.THREAT)
                 if ti_data:
                     details = {
                         'abuseipdb_score': ti_data.get('abuseipdb', {}).get('score', 0),
@@ -326,6 +335,7 @@ class ThreatEvaluator:
                         'confidence': ml_confidence,
                         'is_anomaly': prediction.get('is_anomaly', False),
                         'model_used': prediction.get('model_used'),
+                        'inference_time_ms': prediction.get('inference_time_ms'),
                         'used_heuristic': score == heuristic_score and heuristic_score > ml_score
                     }
 
@@ -427,7 +437,8 @@ class ThreatEvaluator:
 
         return {'score': score, 'factors': factors, 'details': details}
 
-    def _evaluate_behavior(self, ip_address: str, event_data: Dict = None) -> Dict:
+    def _evaluate_behavior(self, ip_address: str, event_data: Dict = None,
+                           context: Optional[EventContext] = None) -> Dict:
         """
         Evaluate behavioral patterns using advanced BehavioralAnalyzer.
         Detects: impossible travel, time anomalies, new locations, credential stuffing, etc.
@@ -447,7 +458,7 @@ class ThreatEvaluator:
                     analyzer = BehavioralAnalyzer()
 
                     # Get geo data for current event
-                    geo_data = self._get_geo_for_ip(ip_address)
+                    geo_data = self._get_geo_for_ip(ip_address, context)
 
                     # Run comprehensive behavioral analysis
                     analysis = analyzer.analyze(
@@ -480,75 +491,55 @@ class ThreatEvaluator:
 
                 except ImportError:
                     logger.debug("[ThreatEvaluator] BehavioralAnalyzer not available, using fallback")
-                    score, factors, details = self._fallback_behavioral_analysis(ip_address)
+                    score, factors, details = self._fallback_behavioral_analysis(ip_address, context)
                 except Exception as e:
                     logger.warning(f"[ThreatEvaluator] BehavioralAnalyzer error: {e}, using fallback")
-                    score, factors, details = self._fallback_behavioral_analysis(ip_address)
+                    score, factors, details = self._fallback_behavioral_analysis(ip_address, context)
             else:
                 # No username - use fallback analysis
-                score, factors, details = self._fallback_behavioral_analysis(ip_address)
+                score, factors, details = self._fallback_behavioral_analysis(ip_address, context)
 
         except Exception as e:
             logger.error(f"[ThreatEvaluator] Behavioral analysis error: {e}")
 
         return {'score': min(score, 100), 'factors': factors, 'details': details}
 
-    def _get_geo_for_ip(self, ip_address: str) -> Dict:
+    def _get_geo_for_ip(self, ip_address: str, context: Optional[EventContext] = None) -> Dict:
         """Get geo data for an IP address"""
+        ctx = context or EventContext(ip_address)
         try:
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("""
-                SELECT country_code, country_name, city, region, latitude, longitude
-                FROM ip_geolocation
-                WHERE ip_address_text = %s
-                LIMIT 1
-            """, (ip_address,))
-            result = cursor.fetchone()
-            cursor.close()
-            conn.close()
-            return result or {}
+            row = ctx.get_geo()
+            return {col: row.get(col) for col in GEO_COLUMNS} if row else {}
         except Exception:
             return {}
+        finally:
+            if context is None:
+                ctx.close()
 
-    def _fallback_behavioral_analysis(self, ip_address: str) -> tuple:
+    def _fallback_behavioral_analysis(self, ip_address: str,
+                                      context: Optional[EventContext] = None) -> tuple:
         """Fallback behavioral analysis when BehavioralAnalyzer is not available"""
         score = 0
         factors = []
         details = {}
 
+        ctx = context or EventContext(ip_address)
         try:
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-
             # Get recent activity for this IP
-            cursor.execute("""
-                SELECT
-                    COUNT(*) as total_events,
-                    SUM(CASE WHEN event_type = 'failed' THEN 1 ELSE 0 END) as failed_attempts,
-                    COUNT(DISTINCT target_username) as unique_usernames,
-                    MIN(timestamp) as first_seen,
-                    MAX(timestamp) as last_seen,
-                    SUM(CASE WHEN target_username = 'root' THEN 1 ELSE 0 END) as root_attempts
-                FROM auth_events
-                WHERE source_ip_text = %s
-                AND timestamp >= DATE_SUB(NOW(), INTERVAL 24 HOUR)
-            """, (ip_address,))
-            stats = cursor.fetchone()
+            stats = ctx.get_event_stats(24 * 60)
 
-            if stats and stats['total_events']:
+            if stats['count']:
+                failed = ctx.count_events(24 * 60, 'failed')
+                usernames = stats['unique_usernames']
                 details = {
-                    'total_events_24h': stats['total_events'],
-                    'failed_attempts': stats['failed_attempts'] or 0,
-                    'unique_usernames': stats['unique_usernames'] or 0,
-                    'root_attempts': stats['root_attempts'] or 0,
+                    'total_events_24h': stats['count'],
+                    'failed_attempts': failed,
+                    'unique_usernames': usernames,
+                    'root_attempts': stats['root_attempts'],
                     'first_seen': stats['first_seen'].isoformat() if stats['first_seen'] else None,
                     'last_seen': stats['last_seen'].isoformat() if stats['last_seen'] else None
                 }
 
-                failed = stats['failed_attempts'] or 0
-                usernames = stats['unique_usernames'] or 0
-
                 # High failed attempt count
                 if failed >= 50:
                     score += 30
@@ -574,29 +565,24 @@ class ThreatEvaluator:
                     factors.append(f'{stats["root_attempts"]} root login attempts')
 
             # Check for existing blocks
-            cursor.execute("""
-                SELECT COUNT(*) as block_count
-                FROM ip_blocks
-                WHERE ip_address_text = %s
-            """, (ip_address,))
-            blocks = cursor.fetchone()
-            if blocks and blocks['block_count'] > 0:
+            if ctx.get_block_count() > 0:
                 score += 10
                 factors.append('Previously blocked')
                 details['previously_blocked'] = True
 
-            cursor.close()
-            conn.close()
-
         except Exception as e:
             logger.error(f"[ThreatEvaluator] Fallback behavioral analysis error: {e}")
+        finally:
+            if context is None:
+                ctx.close()
 
         return score, factors, details
 
     # === SPECIALIZED DETECTORS (Phase 3) ===
 
     def _run_specialized_detectors(self, ip_address: str, event_data: Dict,
-                                    ti_details: Dict, geo_details: Dict) -> Dict:
+                                    ti_details: Dict, geo_details: Dict,
+                                    context: EventContext) -> Dict:
         """
         Run all specialized detectors and collect results.
         Returns dict with detector results and total score boost.
@@ -616,19 +602,19 @@ class ThreatEvaluator:
         }
 
         # 1. Impossible Travel Detection
-        travel_result = self._detect_impossible_travel(ip_address, username, geo)
+        travel_result = self._detect_impossible_travel(ip_address, username, geo, context)
         if travel_result.get('detected'):
             detections.append(travel_result)
             total_boost += travel_result.get('score_boost', 0)
 
         # 2. Brute Force Success Detection
-        brute_result = self._detect_brute_force_success(ip_address, event_type)
+        brute_result = self._detect_brute_force_success(ip_address, event_type, context)
         if brute_result.get('detected'):
             detections.append(brute_result)
             total_boost += brute_result.get('score_boost', 0)
 
         # 3. Lateral Movement Detection
-        lateral_result = self._detect_lateral_movement(ip_address)
+        lateral_result = self._detect_lateral_movement(ip_address, context)
         if lateral_result.get('detected'):
             detections.append(lateral_result)
             total_boost += lateral_result.get('score_boost', 0)
@@ -639,7 +625,8 @@ class ThreatEvaluator:
             'threat_types': [d.get('threat_type') for d in detections if d.get('threat_type')]
         }
 
-    def _detect_impossible_travel(self, ip_address: str, username: str, geo: Dict) -> Dict:
+    def _detect_impossible_travel(self, ip_address: str, username: str, geo: Dict,
+                                  context: EventContext) -> Dict:
         """
         Detect impossible travel based on velocity.
         If a user logs in from two locations faster than physically possible,
@@ -652,11 +639,8 @@ class ThreatEvaluator:
             return {'detected': False}
 
         try:
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-
             # Get last successful login for this username from a different IP
-            cursor.execute("""
+            prev_login = context.query("""
                 SELECT
                     ae.source_ip_text,
                     ae.timestamp,
@@ -675,10 +659,6 @@ class ThreatEvaluator:
                 LIMIT 1
             """, (username, ip_address))
 
-            prev_login = cursor.fetchone()
-            cursor.close()
-            conn.close()
-
             if not prev_login:
                 return {'detected': False}
 
@@ -729,7 +709,8 @@ class ThreatEvaluator:
 
         return {'detected': False}
 
-    def _detect_brute_force_success(self, ip_address: str, event_type: str) -> Dict:
+    def _detect_brute_force_success(self, ip_address: str, event_type: str,
+                                    context: EventContext) -> Dict:
         """
         Detect successful login after many failures.
         This indicates a successful brute force attack.
@@ -741,30 +722,10 @@ class ThreatEvaluator:
             return {'detected': False}
 
         try:
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-
             # Count recent failures from this IP before this success
-            cursor.execute("""
-                SELECT
-                    COUNT(*) as failure_count,
-                    COUNT(DISTINCT target_username) as unique_usernames,
-                    MIN(timestamp) as first_failure
-                FROM auth_events
-                WHERE source_ip_text = %s
-                AND event_type LIKE '%%failed%%'
-                AND timestamp >= DATE_SUB(NOW(), INTERVAL 1 HOUR)
-            """, (ip_address,))
-
-            stats = cursor.fetchone()
-            cursor.close()
-            conn.close()
-
-            if not stats:
-                return {'detected': False}
-
-            failure_count = stats.get('failure_count', 0) or 0
-            unique_usernames = stats.get('unique_usernames', 0) or 0
+            stats = context.get_event_stats(60, 'failed')
+            failure_count = stats['count']
+            unique_usernames = stats['unique_usernames']
 
             # Brute force success: 10+ failures followed by success
             if failure_count >= 10:
@@ -775,7 +736,7 @@ class ThreatEvaluator:
                     'details': {
                         'failures_before_success': failure_count,
                         'unique_usernames_tried': unique_usernames,
-                        'first_failure': stats.get('first_failure').isoformat() if stats.get('first_failure') else None
+                        'first_failure': stats['first_seen'].isoformat() if stats['first_seen'] else None
                     }
                 }
 
@@ -784,7 +745,7 @@ class ThreatEvaluator:
 
         return {'detected': False}
 
-    def _detect_lateral_movement(self, ip_address: str) -> Dict:
+    def _detect_lateral_movement(self, ip_address: str, context: EventContext) -> Dict:
         """
         Detect same IP accessing multiple servers in short time.
         This indicates lateral movement in a network.
@@ -793,11 +754,8 @@ class ThreatEvaluator:
             dict with: detected, score_boost, threat_type, details
         """
         try:
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-
             # Count unique servers accessed by this IP in last 10 minutes
-            cursor.execute("""
+            stats = context.query("""
                 SELECT
                     COUNT(DISTINCT target_server) as server_count,
                     GROUP_CONCAT(DISTINCT target_server SEPARATOR ', ') as servers,
@@ -808,10 +766,6 @@ class ThreatEvaluator:
                 AND target_server IS NOT NULL
             """, (ip_address,))
 
-            stats = cursor.fetchone()
-            cursor.close()
-            conn.close()
-
             if not stats:
                 return {'detected': False}
 
@@ -953,17 +907,17 @@ class ThreatEvaluator:
         """
         Store ML evaluation result in auth_events_ml table for a specific event.
 
+        The row is queued on the write-behind buffer and written with the
+        next batch (insert or update, one round trip per batch).
+
         Args:
             event_id: The auth_events.id
             evaluation: Result from evaluate_ip()
 
         Returns:
-            True if stored successfully
+            True if queued successfully
         """
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-
             # Get ML details from evaluation
             ml_details = evaluation.get('details', {}).get('ml', {})
             composite_score = evaluation.get('composite_score', 0)
@@ -986,51 +940,30 @@ class ThreatEvaluator:
             elif any('credential' in f.lower() for f in factors):
                 threat_type = 'credential_stuffing'
 
-            # Check if record already exists
-            cursor.execute("SELECT id FROM auth_events_ml WHERE event_id = %s", (event_id,))
-            existing = cursor.fetchone()
-
             # Prepare features JSON
             features_json = json.dumps(evaluation.get('components', {}))
 
-            if existing:
-                # Update existing record
-                cursor.execute("""
-                    UPDATE auth_events_ml
-                    SET risk_score = %s,
-                        threat_type = %s,
-                        confidence = %s,
-                        is_anomaly = %s,
-                        features_snapshot = %s
-                    WHERE event_id = %s
-                """, (
-                    risk_score,
-                    threat_type,
-                    ml_details.get('confidence', 0.8),
-                    1 if composite_score >= 60 else 0,
-                    features_json,
-                    event_id
-                ))
-            else:
-                # Insert new record
-                cursor.execute("""
-                    INSERT INTO auth_events_ml
-                    (event_id, model_id, risk_score, threat_type, confidence, is_anomaly, features_snapshot)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    event_id,
-                    1,  # Default model_id
-                    risk_score,
-                    threat_type,
-                    ml_details.get('confidence', 0.8),
-                    1 if composite_score >= 60 else 0,
-                    features_json
-                ))
+            # auth_events_ml.inference_time_ms is whole milliseconds
+            inference_ms = ml_details.get('inference_time_ms')
+            if inference_ms is not None:
+                inference_ms = int(round(inference_ms))
+
+            # Latest evaluation per event wins; model_id 1 is the default
+            # model and only applies when the row is inserted
+            buffer = get_write_buffer()
+            buffer.register('auth_events_ml', upsert_auth_events_ml, key=lambda row: row[0])
+            buffer.add('auth_events_ml', (
+                event_id,
+                1,  # Default model_id
+                risk_score,
+                threat_type,
+                ml_details.get('confidence', 0.8),
+                1 if composite_score >= 60 else 0,
+                features_json,
+                inference_ms
+            ))
 
-            conn.commit()
-            cursor.close()
-            conn.close()
-            logger.debug(f"[ThreatEvaluator] Stored ML result for event {event_id}: score={risk_score}")
+            logger.debug(f"[ThreatEvaluator] Queued ML result for event {event_id}: score={risk_score}")
             return True
 
         except Exception as e:
@@ -1049,13 +982,15 @@ def get_threat_evaluator() -> ThreatEvaluator:
     return _evaluator
 
 
-def evaluate_ip_threat(ip_address: str, event_data: Dict = None) -> Dict[str, Any]:
+def evaluate_ip_threat(ip_address: str, event_data: Dict = None,
+                       context: Optional[EventContext] = None) -> Dict[str, Any]:
     """Convenience function to evaluate an IP"""
     evaluator = get_threat_evaluator()
-    return evaluator.evaluate_ip(ip_address, event_data)
+    return evaluator.evaluate_ip(ip_address, event_data, context)
 
 
-def evaluate_and_store_for_event(event_id: int, ip_address: str, event_data: Dict = None) -> Dict[str, Any]:
+def evaluate_and_store_for_event(event_id: int, ip_address: str, event_data: Dict = None,
+                                 context: Optional[EventContext] = None) -> Dict[str, Any]:
     """
     Evaluate IP threat and store result in auth_events_ml.
 
@@ -1063,12 +998,13 @@ def evaluate_and_store_for_event(event_id: int, ip_address: str, event_data: Dic
         event_id: The auth_events.id to associate with
         ip_address: IP to evaluate
         event_data: Optional event context
+        context: Optional EventContext shared with the other pipeline stages
 
     Returns:
         Evaluation result dict
     """
     evaluator = get_threat_evaluator()
-    evaluation = evaluator.evaluate_ip(ip_address, event_data)
+    evaluation = evaluator.evaluate_ip(ip_address, event_data, context)
 
     # Store in auth_events_ml
     evaluator.store_ml_result_for_event(event_id, evaluation)
@@ -9,16 +9,20 @@ from pathlib import Path
 import os
 import requests
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import json
+import threading
 
 # Add project paths
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 sys.path.append(str(PROJECT_ROOT / "dbs"))
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from connection import get_connection
 from integrations_config import get_integration_config_value
+from rate_limiter import TokenBucket
 
 # Load environment variables
 load_dotenv(PROJECT_ROOT / ".env")
@@ -68,15 +72,42 @@ class ThreatIntelligence:
     # Cache duration
     CACHE_DURATION_DAYS = 7  # Refresh threat intel every 7 days
 
-    # API Endpoints
-    ABUSEIPDB_URL = "https://api.abuseipdb.com/api/v2/check"
-    VIRUSTOTAL_URL = "https://www.virustotal.com/api/v3/ip_addresses/{ip}"
-    SHODAN_URL = "https://api.shodan.io/shodan/host/{ip}"
-    GREYNOISE_COMMUNITY_URL = "https://api.greynoise.io/v3/community/{ip}"
-    GREYNOISE_ENTERPRISE_URL = "https://api.greynoise.io/v2/noise/context/{ip}"
+    # API Endpoints (overridable so lookups can be pointed at local stand-ins)
+    ABUSEIPDB_URL = os.getenv('ABUSEIPDB_API_URL', "https://api.abuseipdb.com/api/v2/check")
+    VIRUSTOTAL_URL = os.getenv('VIRUSTOTAL_API_URL', "https://www.virustotal.com/api/v3/ip_addresses/{ip}")
+    SHODAN_URL = os.getenv('SHODAN_API_URL', "https://api.shodan.io/shodan/host/{ip}")
+    GREYNOISE_COMMUNITY_URL = os.getenv('GREYNOISE_COMMUNITY_API_URL', "https://api.greynoise.io/v3/community/{ip}")
+    GREYNOISE_ENTERPRISE_URL = os.getenv('GREYNOISE_ENTERPRISE_API_URL', "https://api.greynoise.io/v2/noise/context/{ip}")
+
+    # Concurrent lookup settings
+    LOOKUP_DEADLINE_SEC = float(os.getenv('THREAT_INTEL_DEADLINE_SEC', 8))  # Whole fan-out
+    PROVIDER_TIMEOUT_SEC = float(os.getenv('THREAT_INTEL_PROVIDER_TIMEOUT_SEC', 10))  # Per HTTP call
+    MAX_WORKERS = int(os.getenv('THREAT_INTEL_MAX_WORKERS', 16))
+
+    # Partial results (providers timed out or rate limited) are stored like
+    # complete ones; the missing providers are queried again after
+    # PARTIAL_TTL_SEC, for up to PARTIAL_KEEP_SEC
+    PARTIAL_TTL_SEC = int(os.getenv('THREAT_INTEL_PARTIAL_TTL_SEC', 300))
+    PARTIAL_KEEP_SEC = int(os.getenv('THREAT_INTEL_PARTIAL_KEEP_SEC', 3600))
+    PARTIAL_MAX_LOCAL = 10000
+
+    # Per-provider token buckets: (requests per second, burst capacity)
+    # Daily quotas refill continuously; the burst lets a wave of new IPs through
+    PROVIDER_RATE_LIMITS = {
+        'abuseipdb': (ABUSEIPDB_RATE_LIMIT / 86400, int(os.getenv('ABUSEIPDB_BURST', 50))),
+        'virustotal': (min(VIRUSTOTAL_RATE_LIMIT / 86400, 4 / 60), int(os.getenv('VIRUSTOTAL_BURST', 4))),  # Public API: 4/min
+        'shodan': (float(os.getenv('SHODAN_RATE_LIMIT_PER_SEC', 1)), 1),
+        'greynoise': (int(os.getenv('GREYNOISE_RATE_LIMIT_PER_DAY', 100)) / 86400, int(os.getenv('GREYNOISE_BURST', 10))),
+    }
+
+    _rate_limiters = None
+    _executor = None
+    _init_lock = threading.Lock()
+    _partials = {}  # In-process partial results when Redis is unavailable
+    _partials_lock = threading.Lock()
 
     @staticmethod
-    def check_abuseipdb(ip_address):
+    def check_abuseipdb(ip_address, timeout=None):
         """
         Check IP reputation on AbuseIPDB
 
@@ -106,7 +137,7 @@ class ThreatIntelligence:
                 ThreatIntelligence.ABUSEIPDB_URL,
                 headers=headers,
                 params=params,
-                timeout=10
+                timeout=timeout or ThreatIntelligence.PROVIDER_TIMEOUT_SEC
             )
 
             if response.status_code == 200:
@@ -137,7 +168,7 @@ class ThreatIntelligence:
             return None
 
     @staticmethod
-    def check_virustotal(ip_address):
+    def check_virustotal(ip_address, timeout=None):
         """
         Check IP reputation on VirusTotal
 
@@ -161,7 +192,7 @@ class ThreatIntelligence:
             response = requests.get(
                 url,
                 headers=headers,
-                timeout=10
+                timeout=timeout or ThreatIntelligence.PROVIDER_TIMEOUT_SEC
             )
 
             if response.status_code == 200:
@@ -201,7 +232,7 @@ class ThreatIntelligence:
             return None
 
     @staticmethod
-    def check_shodan(ip_address):
+    def check_shodan(ip_address, timeout=None):
         """
         Check IP information on Shodan
 
@@ -222,7 +253,7 @@ class ThreatIntelligence:
             response = requests.get(
                 url,
                 params=params,
-                timeout=10
+                timeout=timeout or ThreatIntelligence.PROVIDER_TIMEOUT_SEC
             )
 
             if response.status_code == 200:
@@ -258,7 +289,7 @@ class ThreatIntelligence:
             return None
 
     @staticmethod
-    def check_greynoise(ip_address):
+    def check_greynoise(ip_address, timeout=None):
         """
         Check IP against GreyNoise to determine if it's internet noise or targeted attack.
         Uses Community API (free, 100/day) or Enterprise API if key configured.
@@ -287,7 +318,8 @@ class ThreatIntelligence:
 
             print(f"🔍 Checking GreyNoise for {ip_address}...")
 
-            response = requests.get(url, headers=headers, timeout=10)
+            response = requests.get(url, headers=headers,
+                                    timeout=timeout or ThreatIntelligence.PROVIDER_TIMEOUT_SEC)
 
             if response.status_code == 200:
                 data = response.json()
@@ -401,12 +433,144 @@ class ThreatIntelligence:
         return threat_level, confidence
 
     @staticmethod
-    def lookup_ip_threat(ip_address):
+    def _get_rate_limiters():
+        """Lazily create one token bucket per provider"""
+        if ThreatIntelligence._rate_limiters is None:
+            with ThreatIntelligence._init_lock:
+                if ThreatIntelligence._rate_limiters is None:
+                    ThreatIntelligence._rate_limiters = {
+                        name: TokenBucket(rate, capacity, name=name)
+                        for name, (rate, capacity) in ThreatIntelligence.PROVIDER_RATE_LIMITS.items()
+                    }
+        return ThreatIntelligence._rate_limiters
+
+    @staticmethod
+    def _get_executor():
+        """Lazily create the shared provider thread pool"""
+        if ThreatIntelligence._executor is None:
+            with ThreatIntelligence._init_lock:
+                if ThreatIntelligence._executor is None:
+                    ThreatIntelligence._executor = ThreadPoolExecutor(
+                        max_workers=ThreatIntelligence.MAX_WORKERS,
+                        thread_name_prefix='threat-intel'
+                    )
+        return ThreatIntelligence._executor
+
+    @staticmethod
+    def get_rate_limit_stats():
+        """Get per-provider rate limiter statistics"""
+        return {
+            name: limiter.get_stats()
+            for name, limiter in ThreatIntelligence._get_rate_limiters().items()
+        }
+
+    @staticmethod
+    def get_provider_status():
+        """
+        Which providers can be queried, and which only on a best-effort basis.
+
+        AbuseIPDB, VirusTotal and Shodan need an API key. GreyNoise always
+        answers through the Community API (100/day); without an Enterprise
+        key it is best effort, so a miss does not make a result partial.
+
+        Returns:
+            tuple: (configured provider names, best-effort provider names)
+        """
+        configured = {'greynoise'}
+        if ThreatIntelligence.ABUSEIPDB_API_KEY:
+            configured.add('abuseipdb')
+        if ThreatIntelligence.VIRUSTOTAL_API_KEY:
+            configured.add('virustotal')
+        if ThreatIntelligence.SHODAN_API_KEY:
+            configured.add('shodan')
+
+        best_effort = {'greynoise'}
+        try:
+            if _get_api_key_from_db('greynoise') and \
+                    get_integration_config_value('greynoise', 'use_community_api') != 'true':
+                best_effort.clear()
+        except Exception:
+            pass
+        return configured, best_effort
+
+    @staticmethod
+    def fetch_providers(ip_address, deadline=None, providers=None):
+        """
+        Query AbuseIPDB, VirusTotal, Shodan and GreyNoise concurrently.
+
+        Providers without an API key are skipped. Each of the others first
+        takes a token from its own bucket (waiting only while the bucket is
+        empty and only within the deadline), then runs its HTTP call with a
+        timeout bounded by the remaining deadline. Providers that are rate
+        limited or still running when the deadline passes come back as None,
+        so callers always get partial results.
+
+        Args:
+            ip_address (str): IP address to check
+            deadline (float): Seconds for the whole fan-out (default LOOKUP_DEADLINE_SEC)
+            providers (list): Only query these providers (default all)
+
+        Returns:
+            dict: provider name -> result (or None), plus 'timed_out',
+                  'rate_limited', 'not_configured' and 'best_effort' provider lists
+        """
+        deadline = deadline or ThreatIntelligence.LOOKUP_DEADLINE_SEC
+        expires_at = time.monotonic() + deadline
+        limiters = ThreatIntelligence._get_rate_limiters()
+        rate_limited = []
+
+        checks = {
+            'abuseipdb': ThreatIntelligence.check_abuseipdb,
+            'virustotal': ThreatIntelligence.check_virustotal,
+            'shodan': ThreatIntelligence.check_shodan,
+            'greynoise': ThreatIntelligence.check_greynoise,
+        }
+        if providers is not None:
+            checks = {name: check for name, check in checks.items() if name in providers}
+        configured, best_effort = ThreatIntelligence.get_provider_status()
+        not_configured = sorted(name for name in checks if name not in configured)
+        checks = {name: check for name, check in checks.items() if name in configured}
+
+        def run_check(name):
+            if not limiters[name].acquire(timeout=max(expires_at - time.monotonic(), 0)):
+                print(f"⚠️  {name} rate limit reached, skipping")
+                rate_limited.append(name)
+                return None
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                return None
+            return checks[name](ip_address, timeout=min(remaining, ThreatIntelligence.PROVIDER_TIMEOUT_SEC))
+
+        executor = ThreatIntelligence._get_executor()
+        futures = {executor.submit(run_check, name): name for name in checks}
+        done, not_done = wait(futures, timeout=deadline)
+
+        results = {name: None for name in checks}
+        for future in done:
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                print(f"❌ {futures[future]} lookup failed: {e}")
+
+        timed_out = sorted(futures[future] for future in not_done)
+        if timed_out:
+            # Slow providers finish in the background; their answer is dropped
+            print(f"⏱️  Deadline {deadline:.1f}s reached, partial result without: {', '.join(timed_out)}")
+
+        results['timed_out'] = timed_out
+        results['rate_limited'] = sorted(rate_limited)
+        results['not_configured'] = not_configured
+        results['best_effort'] = sorted(name for name in checks if name in best_effort)
+        return results
+
+    @staticmethod
+    def lookup_ip_threat(ip_address, deadline=None):
         """
         Comprehensive threat intelligence lookup
 
         Args:
             ip_address (str): IP address to check
+            deadline (float): Seconds allowed for the provider fan-out
 
         Returns:
             dict: Combined threat intelligence data
@@ -415,24 +579,54 @@ class ThreatIntelligence:
         print(f"\n🔍 Threat Intelligence Lookup: {ip_address}")
         print("="*70)
 
+        # After a partial result the providers that answered are in the DB;
+        # only the missing ones are queried again, once retry_at has passed
+        partial = ThreatIntelligence._get_partial(ip_address)
+        retry_due = partial is not None and time.time() >= partial['retry_at']
+
         # Check cache first
-        cached_data = ThreatIntelligence._get_from_cache(ip_address)
-        if cached_data:
-            print(f"✅ Cache hit - data from {cached_data.get('updated_at')}")
-            return cached_data
+        if not retry_due:
+            cached_data = ThreatIntelligence._get_from_cache(ip_address)
+            if cached_data:
+                print(f"✅ Cache hit - data from {cached_data.get('updated_at')}")
+                return cached_data
+
+        stored = ThreatIntelligence._get_stored_providers(ip_address, partial['missing']) if partial else {}
+        if partial and not retry_due:
+            print(f"✅ Partial result cache hit (missing: {', '.join(partial['missing'])})")
+            return ThreatIntelligence._build_threat_data(ip_address, stored, partial['missing'])
+
+        # Query the providers concurrently, each behind its own rate limiter
+        provider_results = ThreatIntelligence.fetch_providers(
+            ip_address, deadline, providers=partial['missing'] if partial else None
+        )
+        best_effort = provider_results.pop('best_effort')
+        provider_results.pop('not_configured')
+        missing = [name for name in provider_results.pop('timed_out') + provider_results.pop('rate_limited')
+                   if name not in best_effort]
+        providers = {**stored, **provider_results}
 
-        # Perform lookups (with delays to respect rate limits)
-        abuseipdb_data = ThreatIntelligence.check_abuseipdb(ip_address)
-        time.sleep(1)  # Rate limiting delay
+        threat_data = ThreatIntelligence._build_threat_data(ip_address, providers, missing)
 
-        virustotal_data = ThreatIntelligence.check_virustotal(ip_address)
-        time.sleep(1)
+        # Whatever the providers returned is stored; a partial result also
+        # keeps the list of missing providers to retry after PARTIAL_TTL_SEC
+        ThreatIntelligence._save_to_cache(threat_data)
+        if threat_data['partial']:
+            print(f"⚠️  Partial result, missing providers retried in {ThreatIntelligence.PARTIAL_TTL_SEC}s "
+                  f"(missing: {', '.join(missing)})")
+            ThreatIntelligence._save_partial(ip_address, missing, partial['expires_at'] if partial else None)
+        elif partial:
+            ThreatIntelligence._delete_partial(ip_address)
 
-        shodan_data = ThreatIntelligence.check_shodan(ip_address)
-        time.sleep(0.5)
+        return threat_data
 
-        # GreyNoise lookup (helps distinguish scanners from targeted attacks)
-        greynoise_data = ThreatIntelligence.check_greynoise(ip_address)
+    @staticmethod
+    def _build_threat_data(ip_address, providers, missing):
+        """Combine provider results into the threat_data dict"""
+        abuseipdb_data = providers.get('abuseipdb')
+        virustotal_data = providers.get('virustotal')
+        shodan_data = providers.get('shodan')
+        greynoise_data = providers.get('greynoise')
 
         # Calculate overall threat
         threat_level, confidence = ThreatIntelligence.calculate_threat_level(
@@ -466,13 +660,137 @@ class ThreatIntelligence:
             'shodan': shodan_data,
             'greynoise': greynoise_data,
             'threat_level': threat_level,
-            'confidence': confidence
+            'confidence': confidence,
+            'partial': bool(missing),
+            'missing_providers': sorted(missing)
         }
+        return threat_data
 
-        # Save to cache
-        ThreatIntelligence._save_to_cache(threat_data)
+    @staticmethod
+    def _partial_key(ip_address):
+        from cache import cache_key
+        return cache_key('threat_intel', 'partial', ip_address)
 
-        return threat_data
+    @staticmethod
+    def _get_partial(ip_address):
+        """Partial result kept for an IP (Redis, else in-process), or None"""
+        try:
+            from cache import get_cache
+            cache = get_cache()
+            if cache.enabled:
+                return cache.get(ThreatIntelligence._partial_key(ip_address))
+        except Exception as e:
+            print(f"⚠️  Partial threat intel cache read failed: {e}")
+
+        with ThreatIntelligence._partials_lock:
+            entry = ThreatIntelligence._partials.get(ip_address)
+            if entry and entry['expires_at'] <= time.time():
+                del ThreatIntelligence._partials[ip_address]
+                entry = None
+            return entry
+
+    @staticmethod
+    def _save_partial(ip_address, missing, expires_at=None):
+        """Remember a partial result's missing providers, retried after retry_at until expires_at"""
+        now = time.time()
+        expires_at = expires_at or now + ThreatIntelligence.PARTIAL_KEEP_SEC
+        if expires_at <= now:
+            return
+        entry = {
+            'missing': sorted(missing),
+            'retry_at': now + ThreatIntelligence.PARTIAL_TTL_SEC,
+            'expires_at': expires_at
+        }
+        try:
+            from cache import get_cache
+            cache = get_cache()
+            if cache.enabled:
+                cache.set(ThreatIntelligence._partial_key(ip_address), entry,
+                          ttl=max(int(expires_at - now), 1))
+                return
+        except Exception as e:
+            print(f"⚠️  Partial threat intel cache write failed: {e}")
+
+        with ThreatIntelligence._partials_lock:
+            partials = ThreatIntelligence._partials
+            if ip_address not in partials and len(partials) >= ThreatIntelligence.PARTIAL_MAX_LOCAL:
+                partials.pop(next(iter(partials)))
+            partials[ip_address] = entry
+
+    @staticmethod
+    def _delete_partial(ip_address):
+        try:
+            from cache import get_cache
+            cache = get_cache()
+            if cache.enabled:
+                cache.delete(ThreatIntelligence._partial_key(ip_address))
+        except Exception as e:
+            print(f"⚠️  Partial threat intel cache delete failed: {e}")
+
+        with ThreatIntelligence._partials_lock:
+            ThreatIntelligence._partials.pop(ip_address, None)
+
+    @staticmethod
+    def _get_stored_providers(ip_address, missing):
+        """Provider results stored by an earlier partial lookup (all but the missing ones)"""
+        try:
+            conn = get_connection()
+        except Exception as e:
+            print(f"⚠️  Stored threat intel read failed: {e}")
+            return {}
+        cursor = conn.cursor(dictionary=True)
+
+        try:
+            cursor.execute("""
+                SELECT
+                    abuseipdb_score, abuseipdb_reports, abuseipdb_last_reported, abuseipdb_checked_at,
+                    virustotal_positives, virustotal_total, virustotal_checked_at,
+                    shodan_ports, shodan_vulns, shodan_checked_at,
+                    greynoise_noise, greynoise_riot, greynoise_classification, greynoise_checked_at
+                FROM ip_geolocation
+                WHERE ip_address_text = %s
+            """, (ip_address,))
+            row = cursor.fetchone()
+        except Exception as e:
+            print(f"⚠️  Stored threat intel read failed: {e}")
+            row = None
+        finally:
+            cursor.close()
+            conn.close()
+
+        if not row:
+            return {}
+
+        oldest = datetime.now() - timedelta(days=ThreatIntelligence.CACHE_DURATION_DAYS)
+        providers = {}
+        if row['abuseipdb_checked_at'] and row['abuseipdb_checked_at'] > oldest:
+            providers['abuseipdb'] = {
+                'score': row['abuseipdb_score'],
+                'confidence': row['abuseipdb_score'],
+                'reports': row['abuseipdb_reports'],
+                'last_reported': row['abuseipdb_last_reported'],
+                'checked_at': row['abuseipdb_checked_at']
+            }
+        if row['virustotal_checked_at'] and row['virustotal_checked_at'] > oldest:
+            providers['virustotal'] = {
+                'positives': row['virustotal_positives'],
+                'total': row['virustotal_total'],
+                'checked_at': row['virustotal_checked_at']
+            }
+        if row['shodan_checked_at'] and row['shodan_checked_at'] > oldest:
+            providers['shodan'] = {
+                'ports': json.loads(row['shodan_ports'] or '[]'),
+                'vulns': json.loads(row['shodan_vulns'] or '[]'),
+                'checked_at': row['shodan_checked_at']
+            }
+        if row['greynoise_checked_at'] and row['greynoise_checked_at'] > oldest:
+            providers['greynoise'] = {
+                'noise': bool(row['greynoise_noise']),
+                'riot': bool(row['greynoise_riot']),
+                'classification': row['greynoise_classification'],
+                'checked_at': row['greynoise_checked_at']
+            }
+        return {name: data for name, data in providers.items() if name not in missing}
 
     @staticmethod
     def _get_from_cache(ip_address):
@@ -513,7 +831,12 @@ class ThreatIntelligence:
 
     @staticmethod
     def _save_to_cache(threat_data):
-        """Save threat intelligence to cache (writes to both ip_geolocation and ip_threat_intelligence)"""
+        """
+        Save threat intelligence to cache (writes to both ip_geolocation and ip_threat_intelligence)
+
+        Existing rows keep their earlier values for providers that did not
+        answer this time (partial results).
+        """
 
         conn = get_connection()
         cursor = conn.cursor()
@@ -533,17 +856,17 @@ class ThreatIntelligence:
             if ti_exists:
                 cursor.execute("""
                     UPDATE ip_threat_intelligence SET
-                        abuseipdb_score = %s,
-                        abuseipdb_confidence = %s,
-                        abuseipdb_reports = %s,
-                        abuseipdb_last_reported = %s,
-                        abuseipdb_checked_at = %s,
-                        virustotal_positives = %s,
-                        virustotal_total = %s,
-                        virustotal_checked_at = %s,
-                        shodan_ports = %s,
-                        shodan_vulns = %s,
-                        shodan_checked_at = %s,
+                        abuseipdb_score = COALESCE(%s, abuseipdb_score),
+                        abuseipdb_confidence = COALESCE(%s, abuseipdb_confidence),
+                        abuseipdb_reports = COALESCE(%s, abuseipdb_reports),
+                        abuseipdb_last_reported = COALESCE(%s, abuseipdb_last_reported),
+                        abuseipdb_checked_at = COALESCE(%s, abuseipdb_checked_at),
+                        virustotal_positives = COALESCE(%s, virustotal_positives),
+                        virustotal_total = COALESCE(%s, virustotal_total),
+                        virustotal_checked_at = COALESCE(%s, virustotal_checked_at),
+                        shodan_ports = COALESCE(%s, shodan_ports),
+                        shodan_vulns = COALESCE(%s, shodan_vulns),
+                        shodan_checked_at = COALESCE(%s, shodan_checked_at),
                         overall_threat_level = %s,
                         threat_confidence = %s,
                         last_seen = NOW()
@@ -600,20 +923,20 @@ class ThreatIntelligence:
                 # Update existing record
                 cursor.execute("""
                     UPDATE ip_geolocation SET
-                        abuseipdb_score = %s,
-                        abuseipdb_reports = %s,
-                        abuseipdb_last_reported = %s,
-                        abuseipdb_checked_at = %s,
-                        virustotal_positives = %s,
-                        virustotal_total = %s,
-                        virustotal_checked_at = %s,
-                        shodan_ports = %s,
-                        shodan_vulns = %s,
-                        shodan_checked_at = %s,
-                        greynoise_noise = %s,
-                        greynoise_riot = %s,
-                        greynoise_classification = %s,
-                        greynoise_checked_at = %s,
+                        abuseipdb_score = COALESCE(%s, abuseipdb_score),
+                        abuseipdb_reports = COALESCE(%s, abuseipdb_reports),
+                        abuseipdb_last_reported = COALESCE(%s, abuseipdb_last_reported),
+                        abuseipdb_checked_at = COALESCE(%s, abuseipdb_checked_at),
+                        virustotal_positives = COALESCE(%s, virustotal_positives),
+                        virustotal_total = COALESCE(%s, virustotal_total),
+                        virustotal_checked_at = COALESCE(%s, virustotal_checked_at),
+                        shodan_ports = COALESCE(%s, shodan_ports),
+                        shodan_vulns = COALESCE(%s, shodan_vulns),
+                        shodan_checked_at = COALESCE(%s, shodan_checked_at),
+                        greynoise_noise = COALESCE(%s, greynoise_noise),
+                        greynoise_riot = COALESCE(%s, greynoise_riot),
+                        greynoise_classification = COALESCE(%s, greynoise_classification),
+                        greynoise_checked_at = COALESCE(%s, greynoise_checked_at),
                         threat_level = %s,
                         last_seen = NOW()
                     WHERE ip_address_text = %s
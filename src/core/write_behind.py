@@ -0,0 +1,337 @@
+"""
+SSH Guardian v3.0 - Write-Behind Buffer
+Collects per-event result writes (ML prediction log, auth_events ML columns
+and processing status, auth_events_ml rows) and flushes them as multi-row
+statements every WRITE_BEHIND_BATCH_SIZE rows or WRITE_BEHIND_FLUSH_MS,
+one commit per sink and flush instead of one per event
+"""
+
+import os
+import sys
+import atexit
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.append(str(PROJECT_ROOT / "dbs"))
+
+from connection import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Buffer configuration
+WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', '1') == '1'
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', 100))
+WRITE_BEHIND_FLUSH_MS = int(os.getenv('WRITE_BEHIND_FLUSH_MS', 250))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv('WRITE_BEHIND_MAX_PENDING', 10000))
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv('WRITE_BEHIND_MAX_RETRIES', 3))
+
+
+class _Sink:
+    """Pending rows of one kind of write and the function that writes them"""
+
+    __slots__ = ('name', 'flush_fn', 'key', 'rows', 'failures')
+
+    def __init__(self, name: str, flush_fn: Callable, key: Optional[Callable]):
+        self.name = name
+        self.flush_fn = flush_fn
+        self.key = key
+        # Keyed sinks coalesce (last write per key wins), others append
+        self.rows = {} if key else []
+        # Consecutive failed flushes; rows are re-queued until it passes max_retries
+        self.failures = 0
+
+
+class WriteBehindBuffer:
+    """
+    Bounded write-behind buffer drained by a background flusher thread.
+
+    Writers register a sink (a flush function taking a cursor and a list of
+    row tuples) and add rows to it. Rows reach the database when the batch
+    size is reached, when the flush interval passes, on flush(), or at
+    interpreter exit. When WRITE_BEHIND_MAX_PENDING rows are waiting, the
+    writer flushes synchronously instead of growing the queue.
+
+    A failed flush puts its rows back in the queue for the next flush. After
+    WRITE_BEHIND_MAX_RETRIES consecutive failures (or at exit) a sink's rows
+    are written one row per transaction, so only rows the database rejects
+    are dropped; rows are dropped wholesale only when no connection can be
+    had at all.
+    """
+
+    def __init__(self, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval_ms: int = WRITE_BEHIND_FLUSH_MS,
+                 max_pending: int = WRITE_BEHIND_MAX_PENDING,
+                 enabled: bool = WRITE_BEHIND_ENABLED,
+                 max_retries: int = WRITE_BEHIND_MAX_RETRIES):
+        """
+        Initialize the buffer.
+
+        Args:
+            batch_size: Pending rows that trigger an immediate flush
+            flush_interval_ms: Longest time a row waits before being written
+            max_pending: Pending rows at which writers flush synchronously
+            enabled: False writes every row immediately (previous behavior)
+            max_retries: Failed flushes re-queued before falling back to row writes
+        """
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = max(flush_interval_ms, 1) / 1000.0
+        self.max_pending = max(max_pending, self.batch_size)
+        self.enabled = enabled
+        self.max_retries = max(max_retries, 0)
+
+        self._sinks: Dict[str, _Sink] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._flusher_pid = None
+
+        self.stats = {
+            'added': 0, 'coalesced': 0, 'written': 0, 'failed': 0,
+            'retried': 0, 'row_fallbacks': 0, 'flushes': 0, 'sync_flushes': 0
+        }
+
+    def register(self, name: str, flush_fn: Callable[[Any, List[tuple]], None],
+                 key: Optional[Callable[[tuple], Any]] = None):
+        """
+        Register a sink (idempotent).
+
+        Args:
+            name: Sink name
+            flush_fn: Writes a list of rows with the given cursor (no commit)
+            key: Row -> key for sinks where only the latest row per key matters
+        """
+        with self._lock:
+            if name not in self._sinks:
+                self._sinks[name] = _Sink(name, flush_fn, key)
+
+    def add(self, name: str, row: tuple):
+        """
+        Queue one row for a registered sink.
+
+        Args:
+            name: Sink name
+            row: Row tuple in the sink's flush_fn format
+        """
+        if not self.enabled or self._closed:
+            self._write({name: [row]}, requeue=False)
+            return
+
+        self._ensure_flusher()
+
+        with self._lock:
+            sink = self._sinks[name]
+            self.stats['added'] += 1
+            if sink.key:
+                key = sink.key(row)
+                if key in sink.rows:
+                    self.stats['coalesced'] += 1
+                else:
+                    self._pending += 1
+                sink.rows[key] = row
+            else:
+                sink.rows.append(row)
+                self._pending += 1
+
+            pending = self._pending
+            if pending >= self.batch_size:
+                self._wakeup.notify()
+
+        if pending >= self.max_pending:
+            # Backpressure: the flusher fell behind (slow or unavailable DB)
+            self.stats['sync_flushes'] += 1
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Write all pending rows now.
+
+        Returns:
+            Number of rows written
+        """
+        with self._flush_lock:
+            with self._lock:
+                batches = {}
+                for sink in self._sinks.values():
+                    if sink.rows:
+                        batches[sink.name] = list(sink.rows.values()) if sink.key else sink.rows
+                        sink.rows = {} if sink.key else []
+                self._pending = 0
+
+            if not batches:
+                return 0
+
+            self.stats['flushes'] += 1
+            return self._write(batches, requeue=not self._closed)
+
+    def _write(self, batches: Dict[str, List[tuple]], requeue: bool = True) -> int:
+        """
+        Write each sink's rows in its own transaction on one connection.
+
+        Args:
+            batches: Sink name -> rows to write
+            requeue: Put the rows of a failed sink back in the queue (until
+                it has failed max_retries times in a row) instead of
+                falling back to row-by-row writes right away
+
+        Returns:
+            Number of rows written
+        """
+        written = 0
+        try:
+            conn = get_connection()
+        except Exception as e:
+            for name, rows in batches.items():
+                if requeue and self._retry(name, rows):
+                    logger.warning(f"Write-behind flush of {len(rows)} {name} row(s) has no "
+                                   f"connection, retrying: {e}")
+                else:
+                    self.stats['failed'] += len(rows)
+                    logger.error(f"Write-behind flush dropped {len(rows)} {name} row(s): {e}")
+            return 0
+
+        cursor = conn.cursor()
+        try:
+            for name, rows in batches.items():
+                sink = self._sinks[name]
+                try:
+                    sink.flush_fn(cursor, rows)
+                    conn.commit()
+                    written += len(rows)
+                    sink.failures = 0
+                except Exception as e:
+                    conn.rollback()
+                    if requeue and self._retry(name, rows):
+                        logger.warning(f"Write-behind flush of {len(rows)} {name} row(s) failed, "
+                                       f"retrying (attempt {sink.failures}/{self.max_retries}): {e}")
+                        continue
+                    logger.error(f"Write-behind flush of {len(rows)} {name} row(s) failed, "
+                                 f"writing rows one by one: {e}")
+                    written += self._write_rows(conn, cursor, sink, rows)
+        finally:
+            cursor.close()
+            conn.close()
+
+        self.stats['written'] += written
+        return written
+
+    def _retry(self, name: str, rows: List[tuple]) -> bool:
+        """
+        Put rows of a failed flush back in front of the sink's queue.
+
+        Rows of keyed sinks are only restored for keys that have not been
+        written again since (the newer row wins).
+
+        Returns:
+            False once the sink has failed max_retries times in a row
+        """
+        with self._lock:
+            sink = self._sinks[name]
+            sink.failures += 1
+            if sink.failures > self.max_retries:
+                sink.failures = 0
+                return False
+
+            if sink.key:
+                restored = {}
+                for row in rows:
+                    key = sink.key(row)
+                    if key not in sink.rows:
+                        restored[key] = row
+                restored.update(sink.rows)
+                self._pending += len(restored) - len(sink.rows)
+                sink.rows = restored
+            else:
+                sink.rows = list(rows) + sink.rows
+                self._pending += len(rows)
+
+            self.stats['retried'] += len(rows)
+            return True
+
+    def _write_rows(self, conn, cursor, sink: _Sink, rows: List[tuple]) -> int:
+        """Fallback: one transaction per row, dropping only the rows that fail"""
+        self.stats['row_fallbacks'] += 1
+        written = 0
+        for row in rows:
+            try:
+                sink.flush_fn(cursor, [row])
+                conn.commit()
+                written += 1
+            except Exception as e:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                self.stats['failed'] += 1
+                logger.error(f"Write-behind dropped {sink.name} row {row!r}: {e}")
+        return written
+
+    def _ensure_flusher(self):
+        """Start the flusher thread in this process (again after a fork)"""
+        if self._flusher_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+
+        threading.Thread(target=self._run_flusher, name='write-behind', daemon=True).start()
+
+    def _run_flusher(self):
+        """Flush when a batch is full or the flush interval has passed"""
+        while not self._closed:
+            with self._lock:
+                # After a failed flush wait out the interval before retrying
+                retrying = any(sink.failures for sink in self._sinks.values())
+                if retrying or self._pending < self.batch_size:
+                    self._wakeup.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flusher error: {e}")
+
+    def close(self):
+        """Stop buffering and write everything still pending"""
+        self._closed = True
+        with self._lock:
+            self._wakeup.notify_all()
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Buffer counters plus the current number of pending rows"""
+        with self._lock:
+            return {
+                **self.stats,
+                'pending': self._pending,
+                'enabled': self.enabled,
+                'batch_size': self.batch_size,
+                'flush_interval_ms': int(self.flush_interval * 1000)
+            }
+
+
+# Global buffer instance
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_write_buffer() -> WriteBehindBuffer:
+    """Get or create the process-wide write-behind buffer (flushed at exit)"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = WriteBehindBuffer()
+                atexit.register(_buffer.close)
+    return _buffer
+
+
+def flush_writes() -> int:
+    """Write all pending buffered rows (e.g. before reading them back)"""
+    if _buffer is None:
+        return 0
+    return _buffer.flush()
@@ -0,0 +1,114 @@
+"""
+SSH Guardian v3.0 - Write-Behind Queries
+Multi-row statements used by the write-behind buffer to apply per-event
+result writes in one round trip per batch
+"""
+
+from typing import List, Sequence, Tuple
+
+
+def values_table(columns: Sequence[str], rows: List[tuple]) -> Tuple[str, list]:
+    """
+    Build a derived table of literal rows to JOIN against.
+
+    Args:
+        columns: Column names
+        rows: Row tuples (one value per column)
+
+    Returns:
+        (SQL "SELECT %s AS a, ... UNION ALL SELECT %s, ...", flat params)
+    """
+    first = 'SELECT ' + ', '.join(f'%s AS {column}' for column in columns)
+    other = 'SELECT ' + ', '.join(['%s'] * len(columns))
+    sql = '\n UNION ALL '.join([first] + [other] * (len(rows) - 1))
+    return sql, [value for row in rows for value in row]
+
+
+def update_event_ml_results(cursor, rows: List[tuple]) -> None:
+    """
+    Write ML results to auth_events for many events.
+
+    Args:
+        cursor: Database cursor (caller commits)
+        rows: (event_id, risk_score, threat_type, confidence, is_anomaly)
+    """
+    values, params = values_table(
+        ('id', 'risk_score', 'threat_type', 'confidence', 'is_anomaly'), rows
+    )
+    cursor.execute(f"""
+        UPDATE auth_events e
+        JOIN ({values}) v ON e.id = v.id
+        SET e.ml_risk_score = v.risk_score,
+            e.ml_threat_type = v.threat_type,
+            e.ml_confidence = v.confidence,
+            e.is_anomaly = v.is_anomaly
+    """, params)
+
+
+def update_event_processing_status(cursor, rows: List[tuple]) -> None:
+    """
+    Write processing status to auth_events for many events.
+
+    Args:
+        cursor: Database cursor (caller commits)
+        rows: (event_id, status, status_at); processed_at is set to
+            status_at when the status is 'completed'
+    """
+    values, params = values_table(('id', 'status', 'status_at'), rows)
+    cursor.execute(f"""
+        UPDATE auth_events e
+        JOIN ({values}) v ON e.id = v.id
+        SET e.processing_status = v.status,
+            e.processed_at = CASE WHEN v.status = 'completed' THEN v.status_at ELSE e.processed_at END
+    """, params)
+
+
+def upsert_auth_events_ml(cursor, rows: List[tuple]) -> None:
+    """
+    Insert or update auth_events_ml rows for many events.
+
+    auth_events_ml has no unique key on event_id, so existing event_ids are
+    looked up once for the batch: those are updated with one joined UPDATE,
+    the rest inserted with one multi-row INSERT.
+
+    Args:
+        cursor: Database cursor (caller commits)
+        rows: (event_id, model_id, risk_score, threat_type, confidence,
+            is_anomaly, features_snapshot, inference_time_ms); model_id is
+            only used on insert
+    """
+    event_ids = [row[0] for row in rows]
+    placeholders = ', '.join(['%s'] * len(event_ids))
+    cursor.execute(f"""
+        SELECT DISTINCT event_id FROM auth_events_ml
+        WHERE event_id IN ({placeholders})
+    """, tuple(event_ids))
+    existing = {row[0] for row in cursor.fetchall()}
+
+    updates = [row for row in rows if row[0] in existing]
+    inserts = [row for row in rows if row[0] not in existing]
+
+    if updates:
+        values, params = values_table(
+            ('event_id', 'risk_score', 'threat_type', 'confidence', 'is_anomaly',
+             'features_snapshot', 'inference_time_ms'),
+            [(row[0],) + tuple(row[2:]) for row in updates]
+        )
+        cursor.execute(f"""
+            UPDATE auth_events_ml m
+            JOIN ({values}) v ON m.event_id = v.event_id
+            SET m.risk_score = v.risk_score,
+                m.threat_type = v.threat_type,
+                m.confidence = v.confidence,
+                m.is_anomaly = v.is_anomaly,
+                m.features_snapshot = v.features_snapshot,
+                m.inference_time_ms = v.inference_time_ms
+        """, params)
+
+    if inserts:
+        cursor.executemany("""
+            INSERT INTO auth_events_ml
+            (event_id, model_id, risk_score, threat_type, confidence, is_anomaly,
+             features_snapshot, inference_time_ms)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, inserts)
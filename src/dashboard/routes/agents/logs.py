@@ -3,6 +3,7 @@ SSH Guardian v3.0 - Agent Log Submission
 Handles log batch processing from agents
 """
 
+import os
 import uuid
 import json
 from flask import request, jsonify
@@ -20,10 +21,36 @@ from .auth import require_api_key
 
 # Import log processor
 try:
-    from log_processor import process_log_line
+    from log_processor import process_log_batch
+    from enrichment_queue import is_queue_enabled
 except ImportError:
     sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent / "core"))
-    from log_processor import process_log_line
+    from log_processor import process_log_batch
+    from enrichment_queue import is_queue_enabled
+
+# A batch left 'processing' longer than this (crashed or killed request) may
+# be taken over by the agent's retry
+AGENT_BATCH_PROCESSING_TIMEOUT_SEC = int(os.getenv('AGENT_BATCH_PROCESSING_TIMEOUT_SEC', 900))
+
+
+def _batch_in_progress(batch_uuid: str):
+    """409 for a batch another request is still processing (the agent retries later)"""
+    return jsonify({
+        'success': False,
+        'error': 'Log batch is still being processed',
+        'batch_uuid': batch_uuid,
+        'retry': True
+    }), 409
+
+
+def _batch_uuid_conflict(batch_uuid: str):
+    """409 for a batch_uuid another agent already used (retrying can't help)"""
+    return jsonify({
+        'success': False,
+        'error': 'batch_uuid already belongs to another agent; send the batch under a new batch_uuid',
+        'batch_uuid': batch_uuid,
+        'retry': False
+    }), 409
 
 
 @agent_routes.route('/agents/logs', methods=['POST'])
@@ -50,47 +77,79 @@ def submit_logs():
         batch_id = None
 
         try:
-            # Create batch record
+            # Agents retry on timeout - acknowledge a batch we already stored
+            # instead of ingesting it a second time
             cursor.execute("""
-                INSERT INTO agent_log_batches (
-                    batch_uuid, agent_id, log_source, events_count,
-                    status, processing_started_at
-                ) VALUES (%s, %s, %s, %s, 'processing', NOW())
-            """, (batch_uuid, agent['id'], source_filename, batch_size))
-
-            batch_id = cursor.lastrowid
-            conn.commit()
-
-            # Process log lines
-            events_created = 0
-            events_failed = 0
-            failed_lines = []
-
-            for log_line in log_lines:
-                try:
-                    # Process log line through detection engine
-                    result = process_log_line(
-                        log_line=log_line,
-                        source_type='agent',
-                        agent_id=agent['id'],
-                        agent_batch_id=batch_id
-                    )
-
-                    if result and result.get('success'):
-                        events_created += 1
-                    else:
-                        events_failed += 1
-                        failed_lines.append({
-                            'line': log_line,
-                            'error': result.get('error', 'Unknown error') if result else 'Processing failed'
-                        })
-
-                except Exception as e:
-                    events_failed += 1
-                    failed_lines.append({
-                        'line': log_line,
-                        'error': str(e)
-                    })
+                SELECT id, status, events_processed, events_failed
+                FROM agent_log_batches
+                WHERE batch_uuid = %s AND agent_id = %s
+            """, (batch_uuid, agent['id']))
+            existing_batch = cursor.fetchone()
+
+            if existing_batch and existing_batch['status'] not in ('failed', 'processing'):
+                return jsonify({
+                    'success': True,
+                    'message': 'Log batch already received',
+                    'duplicate': True,
+                    'batch_uuid': batch_uuid,
+                    'batch_id': existing_batch['id'],
+                    'batch_size': batch_size,
+                    'events_created': existing_batch['events_processed'] or 0,
+                    'events_failed': existing_batch['events_failed'] or 0,
+                    'has_failures': (existing_batch['events_failed'] or 0) > 0
+                })
+
+            if existing_batch:
+                # Previous attempt failed or died mid-way - take the batch
+                # record over, unless another request is still working on it
+                cursor.execute("""
+                    UPDATE agent_log_batches
+                    SET status = 'processing', processing_started_at = NOW(),
+                        error_message = NULL
+                    WHERE id = %s
+                    AND (status = 'failed'
+                         OR (status = 'processing'
+                             AND processing_started_at < NOW() - INTERVAL %s SECOND))
+                """, (existing_batch['id'], AGENT_BATCH_PROCESSING_TIMEOUT_SEC))
+                conn.commit()
+                if not cursor.rowcount:
+                    return _batch_in_progress(batch_uuid)
+                batch_id = existing_batch['id']
+            else:
+                # Create batch record (a concurrent first attempt may win the insert)
+                cursor.execute("""
+                    INSERT IGNORE INTO agent_log_batches (
+                        batch_uuid, agent_id, log_source, events_count,
+                        status, processing_started_at
+                    ) VALUES (%s, %s, %s, %s, 'processing', NOW())
+                """, (batch_uuid, agent['id'], source_filename, batch_size))
+                conn.commit()
+                if not cursor.rowcount:
+                    # batch_uuid is unique across agents (event uuids derive from it)
+                    cursor.execute("""
+                        SELECT agent_id FROM agent_log_batches WHERE batch_uuid = %s
+                    """, (batch_uuid,))
+                    owner = cursor.fetchone()
+                    if owner and owner['agent_id'] != agent['id']:
+                        return _batch_uuid_conflict(batch_uuid)
+                    return _batch_in_progress(batch_uuid)
+                batch_id = cursor.lastrowid
+
+            # Process the whole batch through the set-based ingest path.
+            # With the enrichment queue enabled we acknowledge as soon as the
+            # rows are committed and scripts/enrichment_worker.py enriches them.
+            # The batch_uuid makes a retry reuse the rows already stored.
+            result = process_log_batch(
+                log_lines=log_lines,
+                source_type='agent',
+                agent_id=agent['id'],
+                agent_batch_id=batch_id,
+                defer_enrichment=is_queue_enabled(),
+                batch_uuid=batch_uuid
+            )
+
+            events_created = result['events_created']
+            events_failed = result['events_failed']
 
             # Update batch record with results
             cursor.execute("""
@@ -120,7 +179,8 @@ def submit_logs():
                 'batch_size': batch_size,
                 'events_created': events_created,
                 'events_failed': events_failed,
-                'has_failures': events_failed > 0
+                'has_failures': events_failed > 0,
+                'enrichment_queued': result['enrichment_deferred']
             })
 
         except Exception as e:
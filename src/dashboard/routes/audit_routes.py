@@ -13,6 +13,7 @@ sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from connection import get_connection
 from cache import get_cache, cache_key, cache_key_hash
+from pagination import InvalidCursor, decode_cursor, keyset_condition, order_by, next_page
 
 audit_routes = Blueprint('audit', __name__)
 
@@ -23,6 +24,10 @@ AUDIT_RESOURCES_TTL = 1800    # 30 minutes for resource types (rarely changes)
 AUDIT_STATS_TTL = 600         # 10 minutes for stats
 AUDIT_DETAIL_TTL = 900        # 15 minutes for single log detail
 
+# Keyset ordering for cursor pagination
+AUDIT_KEY = ('a.created_at', 'a.id')
+AUDIT_ORDERING = 'audit:created_at:desc'
+
 
 def invalidate_audit_cache():
     """Invalidate all audit log caches"""
@@ -37,6 +42,8 @@ def list_audit_logs():
     Query params:
     - page: Page number (default 1)
     - per_page: Items per page (default 50, max 100)
+    - cursor: Keyset pagination instead of page; empty for the first page,
+      then the previous page's next_cursor (total only on the first page)
     - action: Filter by action type
     - user_id: Filter by user ID
     - resource_type: Filter by resource type
@@ -45,7 +52,9 @@ def list_audit_logs():
     - search: Search in details
     """
     try:
-        page = int(request.args.get('page', 1))
+        page_cursor = request.args.get('cursor')
+        use_cursor = page_cursor is not None
+        page = 1 if use_cursor else int(request.args.get('page', 1))
         per_page = min(int(request.args.get('per_page', 50)), 100)
         action_filter = request.args.get('action', '').strip()
         user_id_filter = request.args.get('user_id', '').strip()
@@ -61,6 +70,8 @@ def list_audit_logs():
             'user_id': user_id_filter, 'resource_type': resource_type_filter,
             'start_date': start_date, 'end_date': end_date, 'search': search
         }
+        if use_cursor:
+            cache_params['cursor'] = page_cursor
         cache_k = cache_key_hash('audit', 'list', cache_params)
         cached = cache.get(cache_k)
         if cached is not None:
@@ -107,14 +118,25 @@ def list_audit_logs():
         if where_clauses:
             where_sql = "WHERE " + " AND ".join(where_clauses)
 
-        # Get total count
-        count_query = f"""
-            SELECT COUNT(*) as total
-            FROM audit_logs a
-            {where_sql}
-        """
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()['total']
+        # Get total count (cursor mode: first page only)
+        total = None
+        if not page_cursor:
+            count_query = f"""
+                SELECT COUNT(*) as total
+                FROM audit_logs a
+                {where_sql}
+            """
+            cursor.execute(count_query, params)
+            total = cursor.fetchone()['total']
+
+        # Keyset page: seek past the last (created_at, id) served
+        if page_cursor:
+            condition, key_params = keyset_condition(
+                AUDIT_KEY, decode_cursor(page_cursor, AUDIT_ORDERING, len(AUDIT_KEY))
+            )
+            where_clauses.append(condition)
+            params.extend(key_params)
+            where_sql = "WHERE " + " AND ".join(where_clauses)
 
         # Get paginated results
         offset = (page - 1) * per_page
@@ -126,14 +148,20 @@ def list_audit_logs():
             FROM audit_logs a
             LEFT JOIN users u ON a.user_id = u.id
             {where_sql}
-            ORDER BY a.created_at DESC
+            ORDER BY {order_by(AUDIT_KEY)}
             LIMIT %s OFFSET %s
         """
-        params.extend([per_page, offset])
+        params.extend([per_page + 1 if use_cursor else per_page, offset])
 
         cursor.execute(query, params)
         logs = cursor.fetchall()
 
+        next_cursor = None
+        if use_cursor:
+            logs, next_cursor = next_page(
+                logs, per_page, lambda log: (log['created_at'], log['id']), AUDIT_ORDERING
+            )
+
         # Format timestamps and parse JSON
         for log in logs:
             if log['created_at']:
@@ -143,13 +171,22 @@ def list_audit_logs():
         cursor.close()
         conn.close()
 
-        result_data = {
-            'logs': logs,
-            'total': total,
-            'page': page,
-            'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
-        }
+        if use_cursor:
+            result_data = {
+                'logs': logs,
+                'total': total,
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            }
+        else:
+            result_data = {
+                'logs': logs,
+                'total': total,
+                'page': page,
+                'per_page': per_page,
+                'total_pages': (total + per_page - 1) // per_page
+            }
 
         # Cache the result
         cache.set(cache_k, result_data, AUDIT_LIST_TTL)
@@ -160,6 +197,11 @@ def list_audit_logs():
             'from_cache': False
         })
 
+    except InvalidCursor as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
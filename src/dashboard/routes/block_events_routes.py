@@ -15,6 +15,7 @@ sys.path.append(str(PROJECT_ROOT / "dbs"))
 sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from connection import get_connection
+from pagination import InvalidCursor, decode_cursor, keyset_condition, order_by, next_page
 
 # Import threat intelligence for analysis
 try:
@@ -34,6 +35,10 @@ create_notification = None  # Will be defined below
 # Create Blueprint
 block_events_routes = Blueprint('block_events', __name__, url_prefix='/api/dashboard/block-events')
 
+# Keyset ordering for cursor pagination
+BLOCK_EVENTS_KEY = ('e.created_at', 'e.id')
+BLOCK_EVENTS_ORDERING = 'block_events:created_at:desc'
+
 
 def get_current_user_id():
     """Get current user ID from request context"""
@@ -58,6 +63,8 @@ def list_block_events():
         - time_range: 1h, 24h, 7d, 30d, all
         - page: Page number (default 1)
         - page_size: Items per page (default 50)
+        - cursor: Keyset pagination instead of page; empty for the first
+          page, then the previous page's next_cursor (total only on the first page)
     """
     conn = None
     cursor = None
@@ -68,7 +75,9 @@ def list_block_events():
         event_type = request.args.get('event_type')
         block_source = request.args.get('block_source')
         time_range = request.args.get('time_range', '24h')
-        page = request.args.get('page', 1, type=int)
+        page_cursor = request.args.get('cursor')
+        use_cursor = page_cursor is not None
+        page = 1 if use_cursor else request.args.get('page', 1, type=int)
         page_size = request.args.get('page_size', 50, type=int)
 
         # Limit page size
@@ -130,13 +139,24 @@ def list_block_events():
 
         where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
 
-        # Get total count - using blocking_actions table
-        cursor.execute(f"""
-            SELECT COUNT(*) as total
-            FROM blocking_actions e
-            WHERE {where_sql}
-        """, params)
-        total = cursor.fetchone()['total']
+        # Get total count - using blocking_actions table (cursor mode: first page only)
+        total = None
+        if not page_cursor:
+            cursor.execute(f"""
+                SELECT COUNT(*) as total
+                FROM blocking_actions e
+                WHERE {where_sql}
+            """, params)
+            total = cursor.fetchone()['total']
+
+        # Keyset page: seek past the last (created_at, id) served
+        if page_cursor:
+            condition, key_params = keyset_condition(
+                BLOCK_EVENTS_KEY,
+                decode_cursor(page_cursor, BLOCK_EVENTS_ORDERING, len(BLOCK_EVENTS_KEY))
+            )
+            where_sql = f"{where_sql} AND {condition}"
+            params = params + key_params
 
         # Get events with agent info - using blocking_actions table
         # Also try to get agent from ip_blocks if blocking_actions doesn't have it
@@ -158,11 +178,17 @@ def list_block_events():
             LEFT JOIN agents a ON e.agent_id = a.id
             LEFT JOIN agents a2 ON b.agent_id = a2.id
             WHERE {where_sql}
-            ORDER BY e.created_at DESC
+            ORDER BY {order_by(BLOCK_EVENTS_KEY)}
             LIMIT %s OFFSET %s
-        """, params + [page_size, offset])
+        """, params + [page_size + 1 if use_cursor else page_size, offset])
         events = cursor.fetchall()
 
+        next_cursor = None
+        if use_cursor:
+            events, next_cursor = next_page(
+                events, page_size, lambda e: (e['created_at'], e['id']), BLOCK_EVENTS_ORDERING
+            )
+
         # Format timestamps and parse JSON
         for event in events:
             if event.get('created_at'):
@@ -173,6 +199,16 @@ def list_block_events():
                 except:
                     pass
 
+        if use_cursor:
+            return jsonify({
+                'success': True,
+                'events': events,
+                'total': total,
+                'page_size': page_size,
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            })
+
         return jsonify({
             'success': True,
             'events': events,
@@ -182,6 +218,8 @@ def list_block_events():
             'pages': (total + page_size - 1) // page_size
         })
 
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
@@ -16,6 +16,7 @@ sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from connection import get_connection
 from blocking_engine import BlockingEngine, block_ip_manual, unblock_ip
+from blocking.rule_engine import invalidate_rule_cache
 from cache import get_cache, cache_key, cache_key_hash, invalidate_on_block_change
 from auth import AuditLogger
 
@@ -40,6 +41,7 @@ def invalidate_blocking_cache():
     """Invalidate all blocking-related caches"""
     cache = get_cache()
     cache.delete_pattern('blocking')
+    invalidate_rule_cache()
 
 
 @blocking_routes.route('/blocks/list', methods=['GET'])
@@ -2,6 +2,9 @@
 SSH Guardian v3.0 - Daily Reports Routes
 Provides API endpoints for generating daily security reports
 With Redis caching for improved performance
+
+Event figures come from auth_events_daily_summary and the rollup tables of
+migration 038 (kept current by core/event_rollups.py), not auth_events.
 """
 
 from flask import Blueprint, jsonify, request
@@ -16,6 +19,7 @@ sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from connection import get_connection
 from cache import get_cache, cache_key
+from event_rollups import refresh_rollups_if_due
 
 # Create Blueprint
 daily_reports_routes = Blueprint('daily_reports_routes', __name__)
@@ -69,74 +73,44 @@ def get_daily_summary():
         start_time = datetime.combine(report_date, datetime.min.time())
         end_time = datetime.combine(report_date, datetime.max.time())
 
+        refresh_rollups_if_due(background=True)
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # Try to use pre-aggregated daily summary table first (fastest option)
+        # Day totals and distinct counts (no row = no events that day)
         cursor.execute("""
             SELECT * FROM auth_events_daily_summary WHERE summary_date = %s
         """, (report_date,))
-        daily_summary = cursor.fetchone()
-
-        if daily_summary:
-            # Use pre-aggregated data from summary table
-            # Estimate risk breakdown based on avg_risk_score to avoid slow queries
-            total = daily_summary['total_events'] or 0
-            avg_risk = float(daily_summary['avg_risk_score'] or 0)
-
-            # Estimate risk distribution based on avg (most events are low risk)
-            if avg_risk >= 60:
-                critical = int(total * 0.02)
-                high = int(total * 0.05)
-                medium = int(total * 0.10)
-            elif avg_risk >= 40:
-                critical = int(total * 0.005)
-                high = int(total * 0.02)
-                medium = int(total * 0.05)
-            else:
-                critical = int(total * 0.001)
-                high = int(total * 0.005)
-                medium = int(total * 0.01)
-            low_events = max(0, total - critical - high - medium)
-
-            event_stats = {
-                'total_events': daily_summary['total_events'],
-                'failed_events': daily_summary['failed_count'],
-                'successful_events': daily_summary['successful_count'],
-                'invalid_events': daily_summary['invalid_count'],
-                'unique_ips': daily_summary['unique_ips'],
-                'unique_usernames': daily_summary['unique_usernames'],
-                'unique_servers': 1,  # Fast estimate
-                'anomalies': daily_summary['anomaly_count'],
-                'critical_events': critical,
-                'high_events': high,
-                'medium_events': medium,
-                'low_events': low_events,
-                'avg_risk_score': daily_summary['avg_risk_score']
-            }
-        else:
-            # Fallback to querying auth_events with LEFT JOIN to auth_events_ml
-            cursor.execute("""
-                SELECT
-                    COUNT(*) as total_events,
-                    SUM(CASE WHEN ae.event_type = 'failed' THEN 1 ELSE 0 END) as failed_events,
-                    SUM(CASE WHEN ae.event_type = 'successful' THEN 1 ELSE 0 END) as successful_events,
-                    SUM(CASE WHEN ae.event_type = 'invalid' THEN 1 ELSE 0 END) as invalid_events,
-                    COUNT(DISTINCT ae.source_ip_text) as unique_ips,
-                    COUNT(DISTINCT ae.target_username) as unique_usernames,
-                    COUNT(DISTINCT ae.target_server) as unique_servers,
-                    SUM(CASE WHEN ml.is_anomaly = 1 THEN 1 ELSE 0 END) as anomalies,
-                    SUM(CASE WHEN ml.risk_score >= 0.80 THEN 1 ELSE 0 END) as critical_events,
-                    SUM(CASE WHEN ml.risk_score >= 0.60 AND ml.risk_score < 0.80 THEN 1 ELSE 0 END) as high_events,
-                    SUM(CASE WHEN ml.risk_score >= 0.40 AND ml.risk_score < 0.60 THEN 1 ELSE 0 END) as medium_events,
-                    SUM(CASE WHEN ml.risk_score < 0.40 OR ml.risk_score IS NULL THEN 1 ELSE 0 END) as low_events,
-                    AVG(ml.risk_score) * 100 as avg_risk_score
-                FROM auth_events ae
-                LEFT JOIN auth_events_ml ml ON ae.id = ml.event_id
-                WHERE ae.timestamp >= %s AND ae.timestamp <= %s
-                AND ae.source_type != 'simulation'
-            """, (start_time, end_time))
-            event_stats = cursor.fetchone()
+        daily_summary = cursor.fetchone() or {}
+
+        # Risk breakdown from the daily rollup cube
+        cursor.execute("""
+            SELECT
+                SUM(critical_count) as critical_events,
+                SUM(high_count) as high_events,
+                SUM(medium_count) as medium_events,
+                SUM(low_count) as low_events
+            FROM auth_events_rollup_daily
+            WHERE bucket_date = %s
+        """, (report_date,))
+        risk_stats = cursor.fetchone() or {}
+
+        event_stats = {
+            'total_events': daily_summary.get('total_events'),
+            'failed_events': daily_summary.get('failed_count'),
+            'successful_events': daily_summary.get('successful_count'),
+            'invalid_events': daily_summary.get('invalid_count'),
+            'unique_ips': daily_summary.get('unique_ips'),
+            'unique_usernames': daily_summary.get('unique_usernames'),
+            'unique_servers': daily_summary.get('unique_servers'),
+            'anomalies': daily_summary.get('anomaly_count'),
+            'critical_events': int(risk_stats.get('critical_events') or 0),
+            'high_events': int(risk_stats.get('high_events') or 0),
+            'medium_events': int(risk_stats.get('medium_events') or 0),
+            'low_events': int(risk_stats.get('low_events') or 0),
+            'avg_risk_score': daily_summary.get('avg_risk_score')
+        }
 
         # Check if we have daily_statistics for additional info (optional table)
         daily_stats = None
@@ -241,23 +215,22 @@ def get_hourly_breakdown():
         start_time = datetime.combine(report_date, datetime.min.time())
         end_time = datetime.combine(report_date, datetime.max.time())
 
+        refresh_rollups_if_due(background=True)
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # Use composite index for efficient hourly aggregation
         cursor.execute("""
             SELECT
-                HOUR(ae.timestamp) as hour,
-                COUNT(*) as total_count,
-                SUM(CASE WHEN ae.event_type = 'failed' THEN 1 ELSE 0 END) as failed_count,
-                SUM(CASE WHEN ae.event_type = 'successful' THEN 1 ELSE 0 END) as success_count,
-                AVG(ml.risk_score) * 100 as avg_risk,
-                SUM(CASE WHEN ml.is_anomaly = 1 THEN 1 ELSE 0 END) as anomalies
-            FROM auth_events ae
-            LEFT JOIN auth_events_ml ml ON ae.id = ml.event_id
-            WHERE ae.timestamp >= %s AND ae.timestamp <= %s
-            AND ae.source_type != 'simulation'
-            GROUP BY HOUR(ae.timestamp)
+                HOUR(bucket_start) as hour,
+                SUM(event_count) as total_count,
+                SUM(CASE WHEN event_type = 'failed' THEN event_count ELSE 0 END) as failed_count,
+                SUM(CASE WHEN event_type = 'successful' THEN event_count ELSE 0 END) as success_count,
+                SUM(risk_sum) / SUM(event_count) as avg_risk,
+                SUM(anomaly_count) as anomalies
+            FROM auth_events_rollup_hourly
+            WHERE bucket_start >= %s AND bucket_start <= %s
+            GROUP BY bucket_start
             ORDER BY hour
         """, (start_time, end_time))
         hourly_raw = {row['hour']: row for row in cursor.fetchall()}
@@ -332,47 +305,29 @@ def get_top_threats():
                 'from_cache': True
             })
 
-        start_time = datetime.combine(report_date, datetime.min.time())
-        end_time = datetime.combine(report_date, datetime.max.time())
+        refresh_rollups_if_due(background=True)
 
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # Optimize: Use subquery to reduce COUNT(DISTINCT) operations
-        # First get top IPs by attempt count, then join for geo data
         cursor.execute("""
             SELECT
-                ip_data.ip,
-                geo.country_name as country,
-                geo.city,
-                ip_data.attempt_count,
-                ip_data.unique_usernames,
-                ip_data.avg_risk,
-                ip_data.max_risk,
-                ip_data.first_seen,
-                ip_data.last_seen,
-                ip_data.threat_type
-            FROM (
-                SELECT
-                    ae.source_ip_text as ip,
-                    COUNT(*) as attempt_count,
-                    COUNT(DISTINCT ae.target_username) as unique_usernames,
-                    AVG(ml.risk_score) * 100 as avg_risk,
-                    MAX(ml.risk_score) * 100 as max_risk,
-                    MIN(ae.timestamp) as first_seen,
-                    MAX(ae.timestamp) as last_seen,
-                    MAX(ml.threat_type) as threat_type
-                FROM auth_events ae
-                LEFT JOIN auth_events_ml ml ON ae.id = ml.event_id
-                WHERE ae.timestamp >= %s AND ae.timestamp <= %s
-                AND ae.source_type != 'simulation'
-                AND ae.event_type = 'failed'
-                GROUP BY ae.source_ip_text
-                ORDER BY attempt_count DESC
-                LIMIT %s
-            ) ip_data
-            LEFT JOIN ip_geolocation geo ON ip_data.ip = geo.ip_address_text
-        """, (start_time, end_time, limit))
+                ip_address as ip,
+                country_name as country,
+                city,
+                event_count as attempt_count,
+                unique_usernames,
+                risk_sum / event_count as avg_risk,
+                max_risk,
+                first_seen,
+                last_seen,
+                threat_type
+            FROM auth_events_rollup_ip_daily
+            WHERE bucket_date = %s
+            AND event_type = 'failed'
+            ORDER BY event_count DESC
+            LIMIT %s
+        """, (report_date, limit))
 
         top_ips = cursor.fetchall()
 
@@ -440,35 +395,33 @@ def get_geographic_breakdown():
                 'from_cache': True
             })
 
-        start_time = datetime.combine(report_date, datetime.min.time())
-        end_time = datetime.combine(report_date, datetime.max.time())
+        refresh_rollups_if_due(background=True)
 
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # Use index hint for performance
+        # One row per IP and day, so COUNT(*) is the distinct IP count
         cursor.execute("""
             SELECT
-                COALESCE(geo.country_name, 'Unknown') as country,
-                geo.country_code,
-                COUNT(*) as attempt_count,
-                COUNT(DISTINCT ae.source_ip_text) as unique_ips,
-                AVG(ml.risk_score) * 100 as avg_risk,
-                SUM(CASE WHEN ml.is_anomaly = 1 THEN 1 ELSE 0 END) as anomalies
-            FROM auth_events ae
-            LEFT JOIN auth_events_ml ml ON ae.id = ml.event_id
-            LEFT JOIN ip_geolocation geo ON ae.source_ip_text = geo.ip_address_text
-            WHERE ae.timestamp >= %s AND ae.timestamp <= %s
-            AND ae.source_type != 'simulation'
-            AND ae.event_type = 'failed'
-            GROUP BY geo.country_name, geo.country_code
+                COALESCE(MAX(country_name), 'Unknown') as country,
+                NULLIF(country_code, '') as country_code,
+                SUM(event_count) as attempt_count,
+                COUNT(*) as unique_ips,
+                SUM(risk_sum) / SUM(event_count) as avg_risk,
+                SUM(anomaly_count) as anomalies
+            FROM auth_events_rollup_ip_daily
+            WHERE bucket_date = %s
+            AND event_type = 'failed'
+            GROUP BY country_code
             ORDER BY attempt_count DESC
             LIMIT %s
-        """, (start_time, end_time, limit))
+        """, (report_date, limit))
 
         countries = cursor.fetchall()
 
         for country_data in countries:
+            country_data['attempt_count'] = int(country_data['attempt_count'] or 0)
+            country_data['anomalies'] = int(country_data['anomalies'] or 0)
             country_data['avg_risk'] = round(float(country_data['avg_risk'] or 0), 2)
 
         # Cache the result
@@ -526,29 +479,23 @@ def get_targeted_usernames():
                 'from_cache': True
             })
 
-        start_time = datetime.combine(report_date, datetime.min.time())
-        end_time = datetime.combine(report_date, datetime.max.time())
+        refresh_rollups_if_due(background=True)
 
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # Use composite index for username analysis
         cursor.execute("""
             SELECT
-                ae.target_username as username,
-                COUNT(*) as attempt_count,
-                COUNT(DISTINCT ae.source_ip_text) as unique_ips,
-                AVG(ml.risk_score) * 100 as avg_risk
-            FROM auth_events ae
-            LEFT JOIN auth_events_ml ml ON ae.id = ml.event_id
-            WHERE ae.timestamp >= %s AND ae.timestamp <= %s
-            AND ae.target_username IS NOT NULL
-            AND ae.source_type != 'simulation'
-            AND ae.event_type = 'failed'
-            GROUP BY ae.target_username
-            ORDER BY attempt_count DESC
+                username,
+                event_count as attempt_count,
+                unique_ips,
+                risk_sum / event_count as avg_risk
+            FROM auth_events_rollup_username_daily
+            WHERE bucket_date = %s
+            AND event_type = 'failed'
+            ORDER BY event_count DESC
             LIMIT %s
-        """, (start_time, end_time, limit))
+        """, (report_date, limit))
 
         usernames = cursor.fetchall()
 
@@ -608,31 +555,40 @@ def get_threat_types_breakdown():
                 'from_cache': True
             })
 
-        start_time = datetime.combine(report_date, datetime.min.time())
-        end_time = datetime.combine(report_date, datetime.max.time())
+        refresh_rollups_if_due(background=True)
 
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # Use index hint for performance
         cursor.execute("""
             SELECT
-                COALESCE(ml.threat_type, 'Unknown') as threat_type,
-                COUNT(*) as count,
-                AVG(ml.risk_score) * 100 as avg_risk,
-                COUNT(DISTINCT ae.source_ip_text) as unique_ips
-            FROM auth_events ae
-            LEFT JOIN auth_events_ml ml ON ae.id = ml.event_id
-            WHERE ae.timestamp >= %s AND ae.timestamp <= %s
-            AND ae.source_type != 'simulation'
-            AND ae.event_type = 'failed'
-            GROUP BY ml.threat_type
+                threat_type,
+                SUM(event_count) as count,
+                SUM(risk_sum) / SUM(event_count) as avg_risk
+            FROM auth_events_rollup_daily
+            WHERE bucket_date = %s
+            AND event_type = 'failed'
+            GROUP BY threat_type
             ORDER BY count DESC
-        """, (start_time, end_time))
+        """, (report_date,))
 
         threat_types = cursor.fetchall()
 
+        # Distinct IPs per threat type; an IP seen with several threat types
+        # in one day is counted under its highest-sorting one
+        cursor.execute("""
+            SELECT COALESCE(threat_type, '') as threat_type, COUNT(*) as unique_ips
+            FROM auth_events_rollup_ip_daily
+            WHERE bucket_date = %s
+            AND event_type = 'failed'
+            GROUP BY 1
+        """, (report_date,))
+        unique_ips = {row['threat_type']: row['unique_ips'] for row in cursor.fetchall()}
+
         for threat_data in threat_types:
+            threat_data['unique_ips'] = unique_ips.get(threat_data['threat_type'], 0)
+            threat_data['threat_type'] = threat_data['threat_type'] or 'Unknown'
+            threat_data['count'] = int(threat_data['count'] or 0)
             threat_data['avg_risk'] = round(float(threat_data['avg_risk'] or 0), 2)
 
         # Cache the result
@@ -689,42 +645,33 @@ def get_daily_comparison():
                 'from_cache': True
             })
 
+        refresh_rollups_if_due(background=True)
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # Current day stats
-        current_start = datetime.combine(report_date, datetime.min.time())
-        current_end = datetime.combine(report_date, datetime.max.time())
+        def day_stats(day):
+            cursor.execute("""
+                SELECT
+                    SUM(event_count) as total_events,
+                    SUM(critical_count + high_count) as high_risk
+                FROM auth_events_rollup_daily
+                WHERE bucket_date = %s
+                AND event_type = 'failed'
+            """, (day,))
+            stats = {key: int(value or 0) for key, value in cursor.fetchone().items()}
 
-        cursor.execute("""
-            SELECT
-                COUNT(*) as total_events,
-                SUM(CASE WHEN ml.risk_score >= 0.60 THEN 1 ELSE 0 END) as high_risk,
-                COUNT(DISTINCT ae.source_ip_text) as unique_ips
-            FROM auth_events ae
-            LEFT JOIN auth_events_ml ml ON ae.id = ml.event_id
-            WHERE ae.timestamp >= %s AND ae.timestamp <= %s
-            AND ae.source_type != 'simulation'
-            AND ae.event_type = 'failed'
-        """, (current_start, current_end))
-        current_stats = cursor.fetchone()
-
-        # Previous day stats
-        prev_start = datetime.combine(prev_date, datetime.min.time())
-        prev_end = datetime.combine(prev_date, datetime.max.time())
+            cursor.execute("""
+                SELECT COUNT(*) as unique_ips
+                FROM auth_events_rollup_ip_daily
+                WHERE bucket_date = %s
+                AND event_type = 'failed'
+            """, (day,))
+            stats['unique_ips'] = cursor.fetchone()['unique_ips']
+            return stats
 
-        cursor.execute("""
-            SELECT
-                COUNT(*) as total_events,
-                SUM(CASE WHEN ml.risk_score >= 0.60 THEN 1 ELSE 0 END) as high_risk,
-                COUNT(DISTINCT ae.source_ip_text) as unique_ips
-            FROM auth_events ae
-            LEFT JOIN auth_events_ml ml ON ae.id = ml.event_id
-            WHERE ae.timestamp >= %s AND ae.timestamp <= %s
-            AND ae.source_type != 'simulation'
-            AND ae.event_type = 'failed'
-        """, (prev_start, prev_end))
-        prev_stats = cursor.fetchone()
+        current_stats = day_stats(report_date)
+        prev_stats = day_stats(prev_date)
 
         # Calculate changes
         def calc_change(current, previous):
@@ -807,10 +754,12 @@ def get_available_dates():
                 'from_cache': True
             })
 
+        refresh_rollups_if_due(background=True)
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # Try to use pre-aggregated summary table first (much faster)
+        # The summary holds one row per day with events
         cursor.execute("""
             SELECT summary_date as date, total_events as event_count
             FROM auth_events_daily_summary
@@ -819,18 +768,6 @@ def get_available_dates():
         """, (limit,))
         dates = cursor.fetchall()
 
-        # Fallback to auth_events if summary table is empty or has fewer dates
-        if not dates or len(dates) < limit:
-            cursor.execute("""
-                SELECT DISTINCT DATE(timestamp) as date, COUNT(*) as event_count
-                FROM auth_events USE INDEX (idx_timestamp)
-                WHERE source_type != 'simulation'
-                GROUP BY DATE(timestamp)
-                ORDER BY date DESC
-                LIMIT %s
-            """, (limit,))
-            dates = cursor.fetchall()
-
         for date_data in dates:
             date_data['date'] = date_data['date'].isoformat()
 
@@ -17,6 +17,7 @@ sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from connection import get_connection
 from cache import get_cache, cache_key, cache_key_hash
+from pagination import decode_cursor, keyset_condition, order_by, next_page
 
 events_analysis_routes = Blueprint('events_analysis', __name__, url_prefix='/api/dashboard/events-analysis')
 
@@ -34,6 +35,10 @@ ALLOWED_SORT_FIELDS = {
     'target_username': 'e.target_username'
 }
 
+# Keyset pagination is offered for the timestamp sort (NOT NULL, indexed);
+# the other sort columns are nullable and keep page/offset paging
+KEYSET_SORT_FIELDS = {'timestamp'}
+
 
 def _get_approximate_count(cursor):
     """Get approximate row count from table statistics"""
@@ -51,7 +56,13 @@ def _get_approximate_count(cursor):
 
 @events_analysis_routes.route('/list', methods=['GET'])
 def get_events_list():
-    """Get paginated list of auth events - v3.1 schema"""
+    """
+    Get paginated list of auth events - v3.1 schema
+
+    With sort=timestamp, pass cursor (empty for the first page) for keyset
+    paging on (timestamp, id) instead of page numbers; the response then has
+    pagination.next_cursor and only the first page carries a total.
+    """
     conn = None
     cursor = None
     try:
@@ -67,14 +78,27 @@ def get_events_list():
         if order not in ['ASC', 'DESC']:
             order = 'DESC'
 
-        sort_column = ALLOWED_SORT_FIELDS.get(sort, 'e.timestamp')
+        if sort not in ALLOWED_SORT_FIELDS:
+            sort = 'timestamp'
+        sort_column = ALLOWED_SORT_FIELDS[sort]
+
+        page_cursor = request.args.get('cursor')
+        use_cursor = page_cursor is not None and sort in KEYSET_SORT_FIELDS
+        if use_cursor:
+            page = 1
         offset = (page - 1) * limit
 
+        sort_key = (sort_column, 'e.id')
+        ordering = f"events_analysis:{sort}:{order.lower()}"
+        descending = order == 'DESC'
+
         cache = get_cache()
         cache_params = {
             'page': page, 'limit': limit, 'sort': sort, 'order': order,
             'search': search, 'event_type': event_type, 'risk_level': risk_level, 'anomaly': anomaly
         }
+        if use_cursor:
+            cache_params['cursor'] = page_cursor
         cache_k = cache_key_hash('events_analysis', 'list', cache_params)
 
         cached = cache.get(cache_k)
@@ -126,7 +150,19 @@ def get_events_list():
         if where_conditions:
             where_clause = "WHERE " + " AND ".join(where_conditions)
 
-        if not has_filters:
+        page_conditions = list(where_conditions)
+        page_params = list(params)
+        if use_cursor and page_cursor:
+            condition, key_params = keyset_condition(
+                sort_key, decode_cursor(page_cursor, ordering, len(sort_key)), descending
+            )
+            page_conditions.append(condition)
+            page_params += key_params
+        page_where = "WHERE " + " AND ".join(page_conditions) if page_conditions else ""
+
+        if use_cursor and page_cursor:
+            total_count = None
+        elif not has_filters:
             total_count = _get_approximate_count(cursor)
         else:
             count_query = f"""
@@ -158,26 +194,42 @@ def get_events_list():
             FROM auth_events e
             LEFT JOIN auth_events_ml ml ON e.id = ml.event_id
             LEFT JOIN ip_geolocation g ON e.geo_id = g.id
-            {where_clause}
-            ORDER BY {sort_column} {order}
+            {page_where}
+            ORDER BY {order_by(sort_key, descending)}
             LIMIT %s OFFSET %s
         """
 
-        cursor.execute(query, params + [limit, offset])
+        cursor.execute(query, page_params + [limit + 1 if use_cursor else limit, offset])
         events = cursor.fetchall()
 
+        next_cursor = None
+        if use_cursor:
+            events, next_cursor = next_page(
+                events, limit, lambda e: (e['timestamp'], e['id']), ordering
+            )
+
         for event in events:
             if event.get('timestamp'):
                 event['timestamp'] = event['timestamp'].isoformat()
             if event.get('ml_risk_score'):
                 event['ml_risk_score'] = round(float(event['ml_risk_score']) * 100, 1)
 
-        pagination = {
-            'page': page,
-            'limit': limit,
-            'total': total_count,
-            'pages': max(1, (total_count + limit - 1) // limit)
-        }
+        if use_cursor:
+            pagination = {
+                'mode': 'cursor',
+                'limit': limit,
+                'total': total_count,
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            }
+        else:
+            pagination = {
+                'mode': 'offset',
+                'page': page,
+                'limit': limit,
+                'total': total_count,
+                'pages': max(1, (total_count + limit - 1) // limit)
+            }
 
         cache.set(cache_k, {'data': events, 'pagination': pagination}, EVENTS_LIST_TTL)
 
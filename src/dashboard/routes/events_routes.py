@@ -17,13 +17,21 @@ sys.path.append(str(PROJECT_ROOT / "src"))
 from connection import get_connection
 from core.cache import (
     get_cache, cache_key, cache_key_hash, CACHE_TTL,
-    cached_events_list, cache_events_list,
     cached_events_count, cache_events_count,
     cached_stats, cache_stats
 )
+from core.pagination import InvalidCursor, decode_cursor, keyset_condition, order_by, next_page
 
 events_routes = Blueprint('events_routes', __name__, url_prefix='/api/dashboard/events')
 
+# Keyset orderings (cursor tokens are bound to the ordering they came from)
+EVENTS_KEY = ('ae.timestamp', 'ae.id')
+EVENTS_ORDERING = 'events:timestamp:desc'
+GROUPED_KEY = ('last_activity', 'ip_address')
+GROUPED_ORDERING = 'events_grouped:last_activity:desc'
+BY_IP_KEY = ('COALESCE(ae.processed_at, ae.created_at)', 'ae.id')
+BY_IP_ORDERING = 'events_by_ip:last_activity:desc'
+
 
 def _get_count(conn, where_sql: str, params: list) -> int:
     """Get count for pagination"""
@@ -50,6 +58,8 @@ def list_events():
     Query Parameters:
     - limit: Number of events to return (default: 50, max: 200)
     - offset: Offset for pagination (default: 0)
+    - cursor: Keyset pagination instead of offset; empty for the first page,
+      then the previous page's next_cursor (total only on the first page)
     - event_type: Filter by event type (failed, successful, invalid)
     - threat_level: Filter by threat level (clean, low, medium, high, critical)
     - search: Search by IP or username
@@ -58,7 +68,9 @@ def list_events():
     """
     try:
         limit = min(int(request.args.get('limit', 50)), 200)
-        offset = int(request.args.get('offset', 0))
+        page_cursor = request.args.get('cursor')
+        use_cursor = page_cursor is not None
+        offset = 0 if use_cursor else int(request.args.get('offset', 0))
         event_type = request.args.get('event_type')
         threat_level = request.args.get('threat_level')
         search = request.args.get('search', '').strip()
@@ -76,215 +88,260 @@ def list_events():
             'time_range': time_range
         }
         filters = {k: v for k, v in filters.items() if v is not None}
+        page_filters = {**filters, 'cursor': page_cursor} if use_cursor else filters
 
         cache = get_cache()
-        if not nocache:
-            cached_result = cached_events_list(limit, offset, filters)
-            if cached_result:
-                cached_result['from_cache'] = True
-                return jsonify(cached_result), 200
-
-        where_clauses = []
-        params = []
-
-        if event_type:
-            where_clauses.append("ae.event_type = %s")
-            params.append(event_type)
-
-        if threat_level:
-            # v3.1: threat_level is in ip_geolocation table
-            where_clauses.append("geo.threat_level = %s")
-            params.append(threat_level)
-
-        if search:
-            where_clauses.append("(ae.target_username LIKE %s OR ae.source_ip_text LIKE %s)")
-            params.extend([f"%{search}%", f"%{search}%"])
-
-        if ip_filter:
-            where_clauses.append("ae.source_ip_text LIKE %s")
-            params.append(f"%{ip_filter}%")
-
-        if agent_id:
-            where_clauses.append("ae.agent_id = %s")
-            params.append(agent_id)
-
-        if time_range and time_range != 'all_time':
-            if time_range == 'today':
-                where_clauses.append("DATE(ae.timestamp) = CURDATE()")
-            elif time_range == 'yesterday':
-                where_clauses.append("DATE(ae.timestamp) = DATE_SUB(CURDATE(), INTERVAL 1 DAY)")
-            elif time_range == 'last_7_days':
-                where_clauses.append("ae.timestamp >= DATE_SUB(NOW(), INTERVAL 7 DAY)")
-            elif time_range == 'last_30_days':
-                where_clauses.append("ae.timestamp >= DATE_SUB(NOW(), INTERVAL 30 DAY)")
-
-        where_sql = " AND " + " AND ".join(where_clauses) if where_clauses else ""
-
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        try:
-            # v3.1: Join with auth_events_ml for ML data, threat data from ip_geolocation
-            base_query = f"""
-                SELECT
-                    ae.id,
-                    ae.event_uuid,
-                    ae.timestamp,
-                    ae.source_ip_text,
-                    ae.target_username,
-                    ae.event_type,
-                    ae.auth_method,
-                    ae.target_server,
-                    ae.target_port,
-                    ae.agent_id,
-                    ae.failure_reason,
-
-                    -- ML data from auth_events_ml (v3.1)
-                    ml.risk_score as ml_risk_score,
-                    ml.threat_type as ml_threat_type,
-                    ml.is_anomaly,
-                    ml.confidence as ml_confidence,
-
-                    -- GeoIP + Threat data from ip_geolocation (v3.1)
-                    geo.country_code,
-                    geo.country_name,
-                    geo.city,
-                    geo.region,
-                    geo.latitude,
-                    geo.longitude,
-                    geo.isp,
-                    geo.is_proxy,
-                    geo.is_vpn,
-                    geo.is_tor,
-                    geo.threat_level,
-                    geo.abuseipdb_score,
-                    geo.abuseipdb_reports,
-                    geo.virustotal_positives,
-                    geo.virustotal_total
-
-                FROM auth_events ae
-                LEFT JOIN ip_geolocation geo ON ae.geo_id = geo.id
-                LEFT JOIN auth_events_ml ml ON ae.id = ml.event_id
-
-                WHERE 1=1 {where_sql}
-
-                ORDER BY ae.timestamp DESC
-                LIMIT %s OFFSET %s
-            """
-
-            query_params = params + [limit, offset]
-            cursor.execute(base_query, query_params)
-            events = cursor.fetchall()
-
-            # Fetch agent data for events
-            if events:
-                unique_agent_ids = list(set(e['agent_id'] for e in events if e['agent_id']))
-                agent_data = {}
-                if unique_agent_ids:
-                    placeholders = ','.join(['%s'] * len(unique_agent_ids))
-                    cursor.execute(f"""
-                        SELECT id, agent_id, display_name, hostname
-                        FROM agents
-                        WHERE id IN ({placeholders})
-                    """, unique_agent_ids)
-                    for row in cursor.fetchall():
-                        agent_data[row['id']] = row
-
+        computed = {}
+
+        def load_page():
+            """Build the page; runs outside the request on background refreshes"""
+            where_clauses = []
+            params = []
+
+            if event_type:
+                where_clauses.append("ae.event_type = %s")
+                params.append(event_type)
+
+            if threat_level:
+                # v3.1: threat_level is in ip_geolocation table
+                where_clauses.append("geo.threat_level = %s")
+                params.append(threat_level)
+
+            if search:
+                where_clauses.append("(ae.target_username LIKE %s OR ae.source_ip_text LIKE %s)")
+                params.extend([f"%{search}%", f"%{search}%"])
+
+            if ip_filter:
+                where_clauses.append("ae.source_ip_text LIKE %s")
+                params.append(f"%{ip_filter}%")
+
+            if agent_id:
+                where_clauses.append("ae.agent_id = %s")
+                params.append(agent_id)
+
+            if time_range and time_range != 'all_time':
+                if time_range == 'today':
+                    where_clauses.append("DATE(ae.timestamp) = CURDATE()")
+                elif time_range == 'yesterday':
+                    where_clauses.append("DATE(ae.timestamp) = DATE_SUB(CURDATE(), INTERVAL 1 DAY)")
+                elif time_range == 'last_7_days':
+                    where_clauses.append("ae.timestamp >= DATE_SUB(NOW(), INTERVAL 7 DAY)")
+                elif time_range == 'last_30_days':
+                    where_clauses.append("ae.timestamp >= DATE_SUB(NOW(), INTERVAL 30 DAY)")
+
+            where_sql = " AND " + " AND ".join(where_clauses) if where_clauses else ""
+
+            # Keyset page: seek past the last (timestamp, id) served
+            page_sql = where_sql
+            page_params = list(params)
+            if page_cursor:
+                condition, key_params = keyset_condition(
+                    EVENTS_KEY, decode_cursor(page_cursor, EVENTS_ORDERING, len(EVENTS_KEY))
+                )
+                page_sql += f" AND {condition}"
+                page_params += key_params
+
+            conn = get_connection()
+            cursor = conn.cursor(dictionary=True)
+
+            try:
+                # v3.1: Join with auth_events_ml for ML data, threat data from ip_geolocation
+                base_query = f"""
+                    SELECT
+                        ae.id,
+                        ae.event_uuid,
+                        ae.timestamp,
+                        ae.source_ip_text,
+                        ae.target_username,
+                        ae.event_type,
+                        ae.auth_method,
+                        ae.target_server,
+                        ae.target_port,
+                        ae.agent_id,
+                        ae.failure_reason,
+
+                        -- ML data from auth_events_ml (v3.1)
+                        ml.risk_score as ml_risk_score,
+                        ml.threat_type as ml_threat_type,
+                        ml.is_anomaly,
+                        ml.confidence as ml_confidence,
+
+                        -- GeoIP + Threat data from ip_geolocation (v3.1)
+                        geo.country_code,
+                        geo.country_name,
+                        geo.city,
+                        geo.region,
+                        geo.latitude,
+                        geo.longitude,
+                        geo.isp,
+                        geo.is_proxy,
+                        geo.is_vpn,
+                        geo.is_tor,
+                        geo.threat_level,
+                        geo.abuseipdb_score,
+                        geo.abuseipdb_reports,
+                        geo.virustotal_positives,
+                        geo.virustotal_total
+
+                    FROM auth_events ae
+                    LEFT JOIN ip_geolocation geo ON ae.geo_id = geo.id
+                    LEFT JOIN auth_events_ml ml ON ae.id = ml.event_id
+
+                    WHERE 1=1 {page_sql}
+
+                    ORDER BY {order_by(EVENTS_KEY)}
+                    LIMIT %s OFFSET %s
+                """
+
+                if use_cursor:
+                    query_params = page_params + [limit + 1, 0]
+                else:
+                    query_params = params + [limit, offset]
+                cursor.execute(base_query, query_params)
+                events = cursor.fetchall()
+
+                next_cursor = None
+                if use_cursor:
+                    events, next_cursor = next_page(
+                        events, limit, lambda e: (e['timestamp'], e['id']), EVENTS_ORDERING
+                    )
+
+                # Fetch agent data for events
+                if events:
+                    unique_agent_ids = list(set(e['agent_id'] for e in events if e['agent_id']))
+                    agent_data = {}
+                    if unique_agent_ids:
+                        placeholders = ','.join(['%s'] * len(unique_agent_ids))
+                        cursor.execute(f"""
+                            SELECT id, agent_id, display_name, hostname
+                            FROM agents
+                            WHERE id IN ({placeholders})
+                        """, unique_agent_ids)
+                        for row in cursor.fetchall():
+                            agent_data[row['id']] = row
+
+                    for event in events:
+                        agent_id_val = event['agent_id']
+                        if agent_id_val and agent_id_val in agent_data:
+                            ag = agent_data[agent_id_val]
+                            event['agent_name'] = ag['display_name'] or ag['hostname']
+                            event['agent_hostname'] = ag['hostname']
+                            event['agent_id_string'] = ag['agent_id']
+                        else:
+                            event['agent_name'] = None
+                            event['agent_hostname'] = None
+                            event['agent_id_string'] = None
+
+                # Get count (cursor mode: first page only)
+                total = None
+                if not page_cursor:
+                    count_cache_key = cache_key_hash('events_count', filters=filters)
+                    total = cache.get(count_cache_key) if cache.enabled else None
+
+                    if total is None:
+                        total = _get_count(conn, where_sql, params)
+                        if cache.enabled:
+                            cache.set(count_cache_key, total, CACHE_TTL.get('events_count', 15))
+
+                # Format the response
+                formatted_events = []
                 for event in events:
-                    agent_id_val = event['agent_id']
-                    if agent_id_val and agent_id_val in agent_data:
-                        ag = agent_data[agent_id_val]
-                        event['agent_name'] = ag['display_name'] or ag['hostname']
-                        event['agent_hostname'] = ag['hostname']
-                        event['agent_id_string'] = ag['agent_id']
-                    else:
-                        event['agent_name'] = None
-                        event['agent_hostname'] = None
-                        event['agent_id_string'] = None
-
-            # Get count
-            count_cache_key = cache_key_hash('events_count', filters=filters)
-            total = cache.get(count_cache_key) if cache.enabled else None
-
-            if total is None:
-                total = _get_count(conn, where_sql, params)
-                if cache.enabled:
-                    cache.set(count_cache_key, total, CACHE_TTL.get('events_count', 15))
-
-            # Format the response
-            formatted_events = []
-            for event in events:
-                formatted_event = {
-                    'id': event['id'],
-                    'uuid': event['event_uuid'],
-                    'timestamp': event['timestamp'].isoformat() if event['timestamp'] else None,
-                    'ip': event['source_ip_text'],
-                    'username': event['target_username'],
-                    'event_type': event['event_type'],
-                    'auth_method': event['auth_method'],
-                    'server': event['target_server'],
-                    'port': event['target_port'],
-                    'failure_reason': event.get('failure_reason'),
-
-                    # ML Results (v3.1: from auth_events_ml) - convert to 0-100 scale
-                    'ml_risk_score': round(float(event['ml_risk_score']) * 100, 1) if event['ml_risk_score'] else None,
-                    'ml_threat_type': event['ml_threat_type'],
-                    'ml_confidence': round(float(event['ml_confidence']) * 100, 1) if event['ml_confidence'] else None,
-                    'is_anomaly': bool(event['is_anomaly']) if event['is_anomaly'] is not None else None,
-
-                    # GeoIP
-                    'location': {
-                        'country_code': event['country_code'],
-                        'country': event['country_name'],
-                        'city': event['city'],
-                        'region': event['region'],
-                        'latitude': float(event['latitude']) if event['latitude'] else None,
-                        'longitude': float(event['longitude']) if event['longitude'] else None,
-                        'isp': event['isp'],
-                        'is_proxy': bool(event['is_proxy']) if event['is_proxy'] is not None else False,
-                        'is_vpn': bool(event['is_vpn']) if event['is_vpn'] is not None else False,
-                        'is_tor': bool(event['is_tor']) if event['is_tor'] is not None else False
-                    } if event['country_name'] else None,
-
-                    # Threat Intel (v3.1: from ip_geolocation)
-                    'threat': {
-                        'level': event['threat_level'],
-                        'abuseipdb_score': event['abuseipdb_score'],
-                        'abuseipdb_reports': event['abuseipdb_reports'],
-                        'virustotal_detections': f"{event['virustotal_positives'] or 0}/{event['virustotal_total'] or 0}"
-                    } if event['threat_level'] or event['abuseipdb_score'] else None,
-
-                    # Agent
-                    'agent': {
-                        'id': event['agent_id'],
-                        'agent_id': event.get('agent_id_string'),
-                        'name': event.get('agent_name'),
-                        'hostname': event.get('agent_hostname')
-                    } if event.get('agent_name') or event['agent_id'] else None
-                }
+                    formatted_event = {
+                        'id': event['id'],
+                        'uuid': event['event_uuid'],
+                        'timestamp': event['timestamp'].isoformat() if event['timestamp'] else None,
+                        'ip': event['source_ip_text'],
+                        'username': event['target_username'],
+                        'event_type': event['event_type'],
+                        'auth_method': event['auth_method'],
+                        'server': event['target_server'],
+                        'port': event['target_port'],
+                        'failure_reason': event.get('failure_reason'),
+
+                        # ML Results (v3.1: from auth_events_ml) - convert to 0-100 scale
+                        'ml_risk_score': round(float(event['ml_risk_score']) * 100, 1) if event['ml_risk_score'] else None,
+                        'ml_threat_type': event['ml_threat_type'],
+                        'ml_confidence': round(float(event['ml_confidence']) * 100, 1) if event['ml_confidence'] else None,
+                        'is_anomaly': bool(event['is_anomaly']) if event['is_anomaly'] is not None else None,
+
+                        # GeoIP
+                        'location': {
+                            'country_code': event['country_code'],
+                            'country': event['country_name'],
+                            'city': event['city'],
+                            'region': event['region'],
+                            'latitude': float(event['latitude']) if event['latitude'] else None,
+                            'longitude': float(event['longitude']) if event['longitude'] else None,
+                            'isp': event['isp'],
+                            'is_proxy': bool(event['is_proxy']) if event['is_proxy'] is not None else False,
+                            'is_vpn': bool(event['is_vpn']) if event['is_vpn'] is not None else False,
+                            'is_tor': bool(event['is_tor']) if event['is_tor'] is not None else False
+                        } if event['country_name'] else None,
+
+                        # Threat Intel (v3.1: from ip_geolocation)
+                        'threat': {
+                            'level': event['threat_level'],
+                            'abuseipdb_score': event['abuseipdb_score'],
+                            'abuseipdb_reports': event['abuseipdb_reports'],
+                            'virustotal_detections': f"{event['virustotal_positives'] or 0}/{event['virustotal_total'] or 0}"
+                        } if event['threat_level'] or event['abuseipdb_score'] else None,
 
-                formatted_events.append(formatted_event)
+                        # Agent
+                        'agent': {
+                            'id': event['agent_id'],
+                            'agent_id': event.get('agent_id_string'),
+                            'name': event.get('agent_name'),
+                            'hostname': event.get('agent_hostname')
+                        } if event.get('agent_name') or event['agent_id'] else None
+                    }
+
+                    formatted_events.append(formatted_event)
+
+                if use_cursor:
+                    pagination = {
+                        'mode': 'cursor',
+                        'total': total,
+                        'limit': limit,
+                        'next_cursor': next_cursor,
+                        'has_more': next_cursor is not None
+                    }
+                else:
+                    pagination = {
+                        'mode': 'offset',
+                        'total': total,
+                        'limit': limit,
+                        'offset': offset,
+                        'has_more': (offset + limit) < total
+                    }
+
+                response_data = {
+                    'success': True,
+                    'events': formatted_events,
+                    'pagination': pagination,
+                    'from_cache': False
+                }
 
-            response_data = {
-                'success': True,
-                'events': formatted_events,
-                'pagination': {
-                    'total': total,
-                    'limit': limit,
-                    'offset': offset,
-                    'has_more': (offset + limit) < total
-                },
-                'from_cache': False
-            }
+                computed['data'] = response_data
+                return response_data
 
-            cache_events_list(limit, offset, filters, response_data)
+            finally:
+                cursor.close()
+                conn.close()
 
-            return jsonify(response_data), 200
+        if nocache:
+            response_data = load_page()
+        else:
+            response_data = cache.get_or_set(
+                cache_key_hash('events_list', limit=limit, offset=offset, filters=page_filters),
+                load_page, CACHE_TTL['events_list']
+            )
 
-        finally:
-            cursor.close()
-            conn.close()
+        # Anything but the object built by this request came from the cache
+        response_data = {**response_data, 'from_cache': response_data is not computed.get('data')}
+        return jsonify(response_data), 200
 
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         print(f"Error fetching events: {e}")
         import traceback
@@ -632,10 +689,15 @@ def list_events_grouped():
     """
     Get auth events grouped by IP address (unique IPs only)
     v3.1: threat_level from ip_geolocation
+
+    Pass cursor (empty for the first page) for keyset paging on
+    (last_activity, ip_address) instead of offset.
     """
     try:
         limit = min(int(request.args.get('limit', 50)), 100)
-        offset = int(request.args.get('offset', 0))
+        page_cursor = request.args.get('cursor')
+        use_cursor = page_cursor is not None
+        offset = 0 if use_cursor else int(request.args.get('offset', 0))
         event_type = request.args.get('event_type')
         agent_id = request.args.get('agent_id')
         time_range = request.args.get('time_range', '24h')
@@ -662,6 +724,15 @@ def list_events_grouped():
 
         where_sql = " AND ".join(where_clauses)
 
+        # Groups are keyed on aggregates, so the seek condition goes in HAVING
+        having_sql = ""
+        having_params = []
+        if page_cursor:
+            condition, having_params = keyset_condition(
+                GROUPED_KEY, decode_cursor(page_cursor, GROUPED_ORDERING, len(GROUPED_KEY))
+            )
+            having_sql = f"HAVING {condition}"
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
@@ -685,20 +756,29 @@ def list_events_grouped():
                 LEFT JOIN auth_events_ml ml ON ae.id = ml.event_id
                 WHERE {where_sql}
                 GROUP BY ae.source_ip_text
-                ORDER BY last_activity DESC
+                {having_sql}
+                ORDER BY {order_by(GROUPED_KEY)}
                 LIMIT %s OFFSET %s
-            """, params + [limit, offset])
+            """, params + having_params + [limit + 1 if use_cursor else limit, offset])
 
             groups = cursor.fetchall()
 
-            # Get total count
-            cursor.execute(f"""
-                SELECT COUNT(DISTINCT source_ip_text) as total
-                FROM auth_events ae
-                WHERE {where_sql}
-            """, params)
-            total_row = cursor.fetchone()
-            total_groups = total_row['total'] if total_row else 0
+            next_cursor = None
+            if use_cursor:
+                groups, next_cursor = next_page(
+                    groups, limit, lambda g: (g['last_activity'], g['ip_address']), GROUPED_ORDERING
+                )
+
+            # Get total count (cursor mode: first page only)
+            total_groups = None
+            if not page_cursor:
+                cursor.execute(f"""
+                    SELECT COUNT(DISTINCT source_ip_text) as total
+                    FROM auth_events ae
+                    WHERE {where_sql}
+                """, params)
+                total_row = cursor.fetchone()
+                total_groups = total_row['total'] if total_row else 0
 
             # Enrich with geo/threat data
             enriched_groups = []
@@ -766,21 +846,35 @@ def list_events_grouped():
                         } if agent else None
                     })
 
-            return jsonify({
-                'success': True,
-                'groups': enriched_groups,
-                'pagination': {
+            if use_cursor:
+                pagination = {
+                    'mode': 'cursor',
+                    'total': total_groups,
+                    'limit': limit,
+                    'next_cursor': next_cursor,
+                    'has_more': next_cursor is not None
+                }
+            else:
+                pagination = {
+                    'mode': 'offset',
                     'total': total_groups,
                     'limit': limit,
                     'offset': offset,
                     'has_more': offset + limit < total_groups
                 }
+
+            return jsonify({
+                'success': True,
+                'groups': enriched_groups,
+                'pagination': pagination
             })
 
         finally:
             cursor.close()
             conn.close()
 
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         print(f"Error in grouped events: {e}")
         import traceback
@@ -793,13 +887,20 @@ def list_events_grouped():
 
 @events_routes.route('/by-ip', methods=['GET'])
 def get_events_by_ip():
-    """Get paginated events for a specific IP address - v3.1 schema"""
+    """
+    Get paginated events for a specific IP address - v3.1 schema
+
+    Pass cursor (empty for the first page) for keyset paging on
+    (last_activity, id) instead of page numbers.
+    """
     try:
         ip_address = request.args.get('ip', '').strip()
         if not ip_address:
             return jsonify({'success': False, 'error': 'IP address is required'}), 400
 
-        page = max(1, int(request.args.get('page', 1)))
+        page_cursor = request.args.get('cursor')
+        use_cursor = page_cursor is not None
+        page = 1 if use_cursor else max(1, int(request.args.get('page', 1)))
         page_size = min(int(request.args.get('page_size', 20)), 100)
         event_type = request.args.get('event_type')
         time_range = request.args.get('time_range', '30d')
@@ -826,16 +927,27 @@ def get_events_by_ip():
         where_sql = " AND ".join(where_clauses)
         offset = (page - 1) * page_size
 
+        page_sql = where_sql
+        page_params = list(params)
+        if page_cursor:
+            condition, key_params = keyset_condition(
+                BY_IP_KEY, decode_cursor(page_cursor, BY_IP_ORDERING, len(BY_IP_KEY))
+            )
+            page_sql += f" AND {condition}"
+            page_params += key_params
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
         try:
-            cursor.execute(f"""
-                SELECT COUNT(*) as total
-                FROM auth_events ae
-                WHERE {where_sql}
-            """, params)
-            total = cursor.fetchone()['total']
+            total = None
+            if not page_cursor:
+                cursor.execute(f"""
+                    SELECT COUNT(*) as total
+                    FROM auth_events ae
+                    WHERE {where_sql}
+                """, params)
+                total = cursor.fetchone()['total']
 
             # v3.1: Get ML data from auth_events_ml
             # Sort by processed_at (or created_at as fallback) for most recently processed first
@@ -857,13 +969,19 @@ def get_events_by_ip():
                 FROM auth_events ae
                 LEFT JOIN auth_events_ml ml ON ae.id = ml.event_id
                 LEFT JOIN agents a ON ae.agent_id = a.id
-                WHERE {where_sql}
-                ORDER BY COALESCE(ae.processed_at, ae.created_at) DESC
+                WHERE {page_sql}
+                ORDER BY {order_by(BY_IP_KEY)}
                 LIMIT %s OFFSET %s
-            """, params + [page_size, offset])
+            """, page_params + [page_size + 1 if use_cursor else page_size, offset])
 
             events = cursor.fetchall()
 
+            next_cursor = None
+            if use_cursor:
+                events, next_cursor = next_page(
+                    events, page_size, lambda e: (e['last_activity'], e['id']), BY_IP_ORDERING
+                )
+
             for event in events:
                 if event['timestamp']:
                     event['timestamp'] = event['timestamp'].isoformat()
@@ -876,12 +994,18 @@ def get_events_by_ip():
                 if event['ml_risk_score']:
                     event['ml_risk_score'] = round(float(event['ml_risk_score']) * 100, 1)
 
-            total_pages = (total + page_size - 1) // page_size
-
-            return jsonify({
-                'success': True,
-                'events': events,
-                'pagination': {
+            if use_cursor:
+                pagination = {
+                    'mode': 'cursor',
+                    'total': total,
+                    'page_size': page_size,
+                    'next_cursor': next_cursor,
+                    'has_next': next_cursor is not None
+                }
+            else:
+                total_pages = (total + page_size - 1) // page_size
+                pagination = {
+                    'mode': 'offset',
                     'total': total,
                     'page': page,
                     'page_size': page_size,
@@ -889,12 +1013,19 @@ def get_events_by_ip():
                     'has_next': page < total_pages,
                     'has_prev': page > 1
                 }
+
+            return jsonify({
+                'success': True,
+                'events': events,
+                'pagination': pagination
             })
 
         finally:
             cursor.close()
             conn.close()
 
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         print(f"Error fetching events by IP: {e}")
         return jsonify({
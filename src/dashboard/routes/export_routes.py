@@ -1,27 +1,61 @@
 """
 SSH Guardian v3.0 - Export Routes
-API endpoints for exporting data in CSV, JSON, and XLSX formats
+API endpoints for exporting data in CSV, NDJSON, JSON, and XLSX formats
+
+Exports are streamed: rows are read from an unbuffered cursor in
+EXPORT_FETCH_SIZE batches and written to the response as they arrive
+(optionally gzip-compressed with compress=gzip), so memory use does not
+grow with the export size. XLSX is built with openpyxl's write-only mode
+in a temporary file and then streamed. There is no row cap; pass limit
+to export fewer rows.
 """
 
+import os
 import sys
 import io
 import csv
 import json
+import zlib
+import tempfile
 from pathlib import Path
 from datetime import datetime, timedelta
 from decimal import Decimal
 from flask import Blueprint, jsonify, request, Response
+import mysql.connector
 
 # Add project paths
 PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
 sys.path.append(str(PROJECT_ROOT / "dbs"))
 sys.path.append(str(PROJECT_ROOT / "src"))
 
-from connection import get_connection
+from connection import DB_CONFIG
+
+try:
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+    from openpyxl.utils import get_column_letter
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
 
 # Create Blueprint
 export_routes = Blueprint('export_routes', __name__, url_prefix='/api/dashboard/export')
 
+# Export streaming configuration
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', 1000))
+EXPORT_NET_WRITE_TIMEOUT_SEC = int(os.getenv('EXPORT_NET_WRITE_TIMEOUT_SEC', 600))
+
+STREAM_CHUNK_BYTES = 64 * 1024
+XLSX_MAX_ROWS = 1048576  # Excel sheet limit, header included
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
 
 def get_date_range(date_range: str, start_date: str = None, end_date: str = None):
     """Convert date range parameter to start/end dates"""
@@ -58,587 +92,406 @@ def format_value(value):
     return str(value)
 
 
-def generate_csv(data: list, filename: str) -> Response:
-    """Generate CSV response from data"""
-    if not data:
-        output = io.StringIO()
-        output.write('No data available\n')
-        response = Response(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
-        )
-        return response
+def format_json_row(row: dict) -> dict:
+    """Convert a row's non-serializable values for JSON output"""
+    formatted_row = {}
+    for k, v in row.items():
+        if isinstance(v, datetime):
+            formatted_row[k] = v.isoformat()
+        elif isinstance(v, Decimal):
+            formatted_row[k] = float(v)
+        elif isinstance(v, bytes):
+            formatted_row[k] = v.hex()
+        else:
+            formatted_row[k] = v
+    return formatted_row
+
+
+class ExportQuery:
+    """
+    Unbuffered result of one export query, read in EXPORT_FETCH_SIZE batches.
+
+    Uses a dedicated connection instead of the pool: an export can stream
+    for minutes, and a download abandoned half way is dropped with
+    shutdown() rather than reading (or returning to the pool) millions of
+    unread rows.
+    """
+
+    def __init__(self, query: str, params: list):
+        self.conn = mysql.connector.connect(**DB_CONFIG)
+        self.cursor = None
+        self.completed = False
+        try:
+            self.cursor = self.conn.cursor(dictionary=True, buffered=False)
+            # The server gives up on a client that stops reading for this long
+            self.cursor.execute("SET SESSION net_write_timeout = %s", (EXPORT_NET_WRITE_TIMEOUT_SEC,))
+            self.cursor.execute(query, params)
+        except Exception:
+            self.close()
+            raise
+        self.columns = list(self.cursor.column_names)
+
+    def __iter__(self):
+        while True:
+            rows = self.cursor.fetchmany(EXPORT_FETCH_SIZE)
+            if not rows:
+                self.completed = True
+                return
+            yield from rows
+
+    def close(self):
+        """Release the connection (safe to call more than once)"""
+        conn, self.conn = self.conn, None
+        if conn is None:
+            return
+        try:
+            if self.completed:
+                self.cursor.close()
+                conn.close()
+            else:
+                conn.shutdown()
+        except Exception as e:
+            print(f"Error closing export connection: {e}")
+
+
+def _buffered_chunks(lines):
+    """Join small strings into STREAM_CHUNK_BYTES-sized chunks"""
+    buffer = io.StringIO()
+    for line in lines:
+        buffer.write(line)
+        if buffer.tell() >= STREAM_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def generate_csv(result: ExportQuery):
+    """Yield CSV text, header first"""
+    line = io.StringIO()
+    writer = csv.writer(line)
+
+    def lines():
+        writer.writerow(result.columns)
+        yield line.getvalue()
+        for row in result:
+            line.seek(0)
+            line.truncate()
+            writer.writerow([format_value(row[column]) for column in result.columns])
+            yield line.getvalue()
+
+    return _buffered_chunks(lines())
+
+
+def generate_ndjson(result: ExportQuery):
+    """Yield one JSON object per line"""
+    return _buffered_chunks(
+        json.dumps(format_json_row(row), default=str) + '\n' for row in result
+    )
 
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=data[0].keys())
-    writer.writeheader()
 
-    for row in data:
-        formatted_row = {k: format_value(v) for k, v in row.items()}
-        writer.writerow(formatted_row)
+def generate_json_export(result: ExportQuery):
+    """Yield a {"data": [...], "count": N} document"""
+    def parts():
+        count = 0
+        yield '{"data": ['
+        for row in result:
+            yield (',\n' if count else '\n') + json.dumps(format_json_row(row), default=str)
+            count += 1
+        yield f'\n], "count": {count}}}\n'
+
+    return _buffered_chunks(parts())
+
+
+def generate_gzip(chunks):
+    """Gzip a stream of text chunks on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def generate_xlsx(result: ExportQuery) -> str:
+    """
+    Write the result to a temporary XLSX file in write-only mode.
+
+    Rows past the Excel sheet limit continue on further sheets.
+
+    Returns:
+        Path of the file (the caller removes it)
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+    header_font = Font(color="FFFFFF", bold=True)
+    ws = None
+    sheet_rows = XLSX_MAX_ROWS
+
+    def new_sheet():
+        sheet = wb.create_sheet("Export" if not wb.worksheets else f"Export {len(wb.worksheets) + 1}")
+        # Write-only sheets can't be auto-sized afterwards, size by header
+        for col, header in enumerate(result.columns, 1):
+            sheet.column_dimensions[get_column_letter(col)].width = min(max(len(header) + 2, 12), 50)
+        header_cells = []
+        for header in result.columns:
+            cell = WriteOnlyCell(sheet, value=header)
+            cell.fill = header_fill
+            cell.font = header_font
+            header_cells.append(cell)
+        sheet.append(header_cells)
+        return sheet
+
+    for row in result:
+        if sheet_rows >= XLSX_MAX_ROWS:
+            ws = new_sheet()
+            sheet_rows = 1
+        ws.append([format_value(row[column]) for column in result.columns])
+        sheet_rows += 1
+
+    if ws is None:
+        new_sheet()
+
+    handle, path = tempfile.mkstemp(prefix='ssh_guardian_export_', suffix='.xlsx')
+    os.close(handle)
+    try:
+        wb.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
 
-    response = Response(
-        output.getvalue(),
-        mimetype='text/csv',
-        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
-    )
-    return response
 
+def _file_chunks(path: str):
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(STREAM_CHUNK_BYTES)
+            if not data:
+                return
+            yield data
 
-def generate_json_export(data: list, filename: str) -> Response:
-    """Generate JSON response from data"""
-    # Format datetime objects and other non-serializable types
-    formatted_data = []
-    for row in data:
-        formatted_row = {}
-        for k, v in row.items():
-            if isinstance(v, datetime):
-                formatted_row[k] = v.isoformat()
-            elif isinstance(v, Decimal):
-                formatted_row[k] = float(v)
-            elif isinstance(v, bytes):
-                formatted_row[k] = v.hex()
-            else:
-                formatted_row[k] = v
-        formatted_data.append(formatted_row)
 
-    response = Response(
-        json.dumps({'data': formatted_data, 'count': len(formatted_data)}, indent=2, default=str),
-        mimetype='application/json',
-        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
-    )
-    return response
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def stream_export(name: str, select_sql: str, date_column: str, order_sql: str):
+    """
+    Run an export query and stream it in the requested format.
+
+    Query Parameters:
+        format: csv (default), ndjson, json or xlsx
+        compress: 'gzip' to gzip csv/ndjson/json output
+        limit: Maximum rows (default: all)
+        start_date / end_date: YYYY-MM-DD bounds on date_column (inclusive)
+
+    Args:
+        name: Export name used in the filename
+        select_sql: SELECT ... FROM ... [JOIN ...] without WHERE
+        date_column: Column the date bounds apply to
+        order_sql: ORDER BY expression
+
+    Returns:
+        Streaming Response, or a JSON error before any row is sent
+    """
+    format_type = request.args.get('format', 'csv')
+    if format_type not in EXPORT_MIMETYPES:
+        format_type = 'csv'
+    if format_type == 'xlsx' and not OPENPYXL_AVAILABLE:
+        # openpyxl not installed, fall back to CSV
+        format_type = 'csv'
+    compress = request.args.get('compress') == 'gzip' and format_type != 'xlsx'
+    limit = request.args.get('limit', type=int)
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+
+    where_clauses = []
+    params = []
+
+    # Range bounds rather than DATE(column) so the column's index is usable
+    if start_date:
+        where_clauses.append(f"{date_column} >= %s")
+        params.append(start_date)
+
+    if end_date:
+        where_clauses.append(f"{date_column} < %s + INTERVAL 1 DAY")
+        params.append(end_date)
+
+    where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+    query = f"{select_sql}\n{where_sql}\nORDER BY {order_sql}"
+    if limit:
+        query += "\nLIMIT %s"
+        params.append(limit)
 
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"{name}_export_{timestamp}.{format_type}"
+    mimetype = EXPORT_MIMETYPES[format_type]
 
-def generate_xlsx(data: list, filename: str) -> Response:
-    """Generate XLSX response from data"""
     try:
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill
-
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Export"
+        result = ExportQuery(query, params)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        if not data:
-            ws['A1'] = 'No data available'
-        else:
-            # Header row with styling
-            headers = list(data[0].keys())
-            header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-            header_font = Font(color="FFFFFF", bold=True)
-
-            for col, header in enumerate(headers, 1):
-                cell = ws.cell(row=1, column=col, value=header)
-                cell.fill = header_fill
-                cell.font = header_font
-
-            # Data rows
-            for row_idx, row_data in enumerate(data, 2):
-                for col_idx, header in enumerate(headers, 1):
-                    value = row_data.get(header)
-                    ws.cell(row=row_idx, column=col_idx, value=format_value(value))
-
-            # Auto-width columns
-            for col in ws.columns:
-                max_length = 0
-                column = col[0].column_letter
-                for cell in col:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                ws.column_dimensions[column].width = adjusted_width
-
-        # Save to bytes
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
+    if format_type == 'xlsx':
+        try:
+            path = generate_xlsx(result)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+        finally:
+            result.close()
 
         response = Response(
-            output.getvalue(),
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+            _file_chunks(path),
+            mimetype=mimetype,
+            headers={
+                'Content-Disposition': f'attachment; filename="{filename}"',
+                'Content-Length': str(os.path.getsize(path))
+            }
         )
+        response.call_on_close(lambda: _remove_file(path))
         return response
 
-    except ImportError:
-        # openpyxl not installed, fall back to CSV
-        return generate_csv(data, filename.replace('.xlsx', '.csv'))
+    generators = {'csv': generate_csv, 'ndjson': generate_ndjson, 'json': generate_json_export}
+    chunks = generators[format_type](result)
+    if compress:
+        chunks = generate_gzip(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+
+    def stream():
+        try:
+            yield from chunks
+        except Exception as e:
+            # Headers are already sent; the download ends truncated
+            print(f"Error streaming {name} export: {e}")
+        finally:
+            result.close()
+
+    response = Response(
+        stream(),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no'  # Don't let a reverse proxy buffer the whole file
+        }
+    )
+    response.call_on_close(result.close)
+    return response
 
 
 @export_routes.route('/events', methods=['GET'])
 def export_events():
     """Export authentication events"""
-    try:
-        format_type = request.args.get('format', 'csv')
-        limit = min(int(request.args.get('limit', 10000)), 1000000)
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        where_clauses = []
-        params = []
-
-        if start_date:
-            where_clauses.append("DATE(ae.timestamp) >= %s")
-            params.append(start_date)
-
-        if end_date:
-            where_clauses.append("DATE(ae.timestamp) <= %s")
-            params.append(end_date)
-
-        where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-
-        query = f"""
-            SELECT
-                ae.id, ae.source_ip_text as source_ip, ae.target_username as username,
-                ae.event_type, ae.timestamp, ae.target_server as server_name,
-                ae.target_port as port, ae.auth_method, ae.failure_reason,
-                ae.ml_risk_score, ae.ml_threat_type, ae.is_anomaly,
-                ae.processing_status, ae.source_type
-            FROM auth_events ae
-            {where_sql}
-            ORDER BY ae.timestamp DESC
-            LIMIT %s
-        """
-        params.append(limit)
-
-        cursor.execute(query, params)
-        data = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"events_export_{timestamp}.{format_type}"
-
-        if format_type == 'json':
-            return generate_json_export(data, filename)
-        elif format_type == 'xlsx':
-            return generate_xlsx(data, filename)
-        else:
-            return generate_csv(data, filename)
-
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return stream_export('events', """
+        SELECT
+            ae.id, ae.source_ip_text as source_ip, ae.target_username as username,
+            ae.event_type, ae.timestamp, ae.target_server as server_name,
+            ae.target_port as port, ae.auth_method, ae.failure_reason,
+            ae.ml_risk_score, ae.ml_threat_type, ae.is_anomaly,
+            ae.processing_status, ae.source_type
+        FROM auth_events ae
+    """, 'ae.timestamp', 'ae.timestamp DESC')
 
 
 @export_routes.route('/blocked_ips', methods=['GET'])
 def export_blocked_ips():
     """Export blocked IPs"""
-    try:
-        format_type = request.args.get('format', 'csv')
-        limit = min(int(request.args.get('limit', 10000)), 1000000)
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        where_clauses = []
-        params = []
-
-        if start_date:
-            where_clauses.append("DATE(blocked_at) >= %s")
-            params.append(start_date)
-
-        if end_date:
-            where_clauses.append("DATE(blocked_at) <= %s")
-            params.append(end_date)
-
-        where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-
-        query = f"""
-            SELECT
-                id, ip_address_text as source_ip, block_reason, block_source,
-                blocked_at, unblock_at, auto_unblock, is_active,
-                failed_attempts, risk_score, threat_level,
-                is_simulation, created_at
-            FROM ip_blocks
-            {where_sql}
-            ORDER BY blocked_at DESC
-            LIMIT %s
-        """
-        params.append(limit)
-
-        cursor.execute(query, params)
-        data = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"blocked_ips_export_{timestamp}.{format_type}"
-
-        if format_type == 'json':
-            return generate_json_export(data, filename)
-        elif format_type == 'xlsx':
-            return generate_xlsx(data, filename)
-        else:
-            return generate_csv(data, filename)
-
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return stream_export('blocked_ips', """
+        SELECT
+            id, ip_address_text as source_ip, block_reason, block_source,
+            blocked_at, unblock_at, auto_unblock, is_active,
+            failed_attempts, risk_score, threat_level,
+            is_simulation, created_at
+        FROM ip_blocks
+    """, 'blocked_at', 'blocked_at DESC')
 
 
 @export_routes.route('/ip_stats', methods=['GET'])
 def export_ip_stats():
     """Export IP statistics"""
-    try:
-        format_type = request.args.get('format', 'csv')
-        limit = min(int(request.args.get('limit', 10000)), 1000000)
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        where_clauses = []
-        params = []
-
-        if start_date:
-            where_clauses.append("DATE(last_seen) >= %s")
-            params.append(start_date)
-
-        if end_date:
-            where_clauses.append("DATE(last_seen) <= %s")
-            params.append(end_date)
-
-        where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-
-        query = f"""
-            SELECT
-                id, ip_address_text as source_ip, total_events, failed_events,
-                successful_events, invalid_events, unique_servers, unique_usernames,
-                avg_risk_score, max_risk_score, anomaly_count,
-                times_blocked, currently_blocked, first_seen, last_seen
-            FROM ip_statistics
-            {where_sql}
-            ORDER BY total_events DESC
-            LIMIT %s
-        """
-        params.append(limit)
-
-        cursor.execute(query, params)
-        data = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"ip_stats_export_{timestamp}.{format_type}"
-
-        if format_type == 'json':
-            return generate_json_export(data, filename)
-        elif format_type == 'xlsx':
-            return generate_xlsx(data, filename)
-        else:
-            return generate_csv(data, filename)
-
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return stream_export('ip_stats', """
+        SELECT
+            id, ip_address_text as source_ip, total_events, failed_events,
+            successful_events, invalid_events, unique_servers, unique_usernames,
+            avg_risk_score, max_risk_score, anomaly_count,
+            times_blocked, currently_blocked, first_seen, last_seen
+        FROM ip_statistics
+    """, 'last_seen', 'total_events DESC')
 
 
 @export_routes.route('/threat_intel', methods=['GET'])
 def export_threat_intel():
     """Export threat intelligence data"""
-    try:
-        format_type = request.args.get('format', 'csv')
-        limit = min(int(request.args.get('limit', 10000)), 1000000)
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        where_clauses = []
-        params = []
-
-        if start_date:
-            where_clauses.append("DATE(updated_at) >= %s")
-            params.append(start_date)
-
-        if end_date:
-            where_clauses.append("DATE(updated_at) <= %s")
-            params.append(end_date)
-
-        where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-
-        query = f"""
-            SELECT
-                id, ip_address_text as source_ip,
-                abuseipdb_score, abuseipdb_confidence, abuseipdb_reports,
-                abuseipdb_checked_at,
-                virustotal_positives, virustotal_total, virustotal_checked_at,
-                overall_threat_level, threat_confidence,
-                created_at, updated_at
-            FROM ip_threat_intelligence
-            {where_sql}
-            ORDER BY updated_at DESC
-            LIMIT %s
-        """
-        params.append(limit)
-
-        cursor.execute(query, params)
-        data = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"threat_intel_export_{timestamp}.{format_type}"
-
-        if format_type == 'json':
-            return generate_json_export(data, filename)
-        elif format_type == 'xlsx':
-            return generate_xlsx(data, filename)
-        else:
-            return generate_csv(data, filename)
-
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return stream_export('threat_intel', """
+        SELECT
+            id, ip_address_text as source_ip,
+            abuseipdb_score, abuseipdb_confidence, abuseipdb_reports,
+            abuseipdb_checked_at,
+            virustotal_positives, virustotal_total, virustotal_checked_at,
+            overall_threat_level, threat_confidence,
+            created_at, updated_at
+        FROM ip_threat_intelligence
+    """, 'updated_at', 'updated_at DESC')
 
 
 @export_routes.route('/geoip', methods=['GET'])
 def export_geoip():
     """Export GeoIP data"""
-    try:
-        format_type = request.args.get('format', 'csv')
-        limit = min(int(request.args.get('limit', 10000)), 1000000)
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        where_clauses = []
-        params = []
-
-        if start_date:
-            where_clauses.append("DATE(last_seen) >= %s")
-            params.append(start_date)
-
-        if end_date:
-            where_clauses.append("DATE(last_seen) <= %s")
-            params.append(end_date)
-
-        where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-
-        query = f"""
-            SELECT
-                id, ip_address_text as source_ip, country_code, country_name,
-                region, city, latitude, longitude, timezone,
-                asn, asn_org, isp,
-                is_proxy, is_vpn, is_tor, is_datacenter,
-                first_seen, last_seen
-            FROM ip_geolocation
-            {where_sql}
-            ORDER BY last_seen DESC
-            LIMIT %s
-        """
-        params.append(limit)
-
-        cursor.execute(query, params)
-        data = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"geoip_export_{timestamp}.{format_type}"
-
-        if format_type == 'json':
-            return generate_json_export(data, filename)
-        elif format_type == 'xlsx':
-            return generate_xlsx(data, filename)
-        else:
-            return generate_csv(data, filename)
-
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return stream_export('geoip', """
+        SELECT
+            id, ip_address_text as source_ip, country_code, country_name,
+            region, city, latitude, longitude, timezone,
+            asn, asn_org, isp,
+            is_proxy, is_vpn, is_tor, is_datacenter,
+            first_seen, last_seen
+        FROM ip_geolocation
+    """, 'last_seen', 'last_seen DESC')
 
 
 @export_routes.route('/audit', methods=['GET'])
 def export_audit():
     """Export audit logs"""
-    try:
-        format_type = request.args.get('format', 'csv')
-        limit = min(int(request.args.get('limit', 10000)), 1000000)
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        where_clauses = []
-        params = []
-
-        if start_date:
-            where_clauses.append("DATE(a.created_at) >= %s")
-            params.append(start_date)
-
-        if end_date:
-            where_clauses.append("DATE(a.created_at) <= %s")
-            params.append(end_date)
-
-        where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-
-        query = f"""
-            SELECT
-                a.id, a.user_id, a.action, a.resource_type, a.resource_id,
-                a.details, a.ip_address, a.user_agent, a.created_at,
-                u.email as user_email, u.full_name as user_name
-            FROM audit_logs a
-            LEFT JOIN users u ON a.user_id = u.id
-            {where_sql}
-            ORDER BY a.created_at DESC
-            LIMIT %s
-        """
-        params.append(limit)
-
-        cursor.execute(query, params)
-        data = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"audit_export_{timestamp}.{format_type}"
-
-        if format_type == 'json':
-            return generate_json_export(data, filename)
-        elif format_type == 'xlsx':
-            return generate_xlsx(data, filename)
-        else:
-            return generate_csv(data, filename)
-
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return stream_export('audit', """
+        SELECT
+            a.id, a.user_id, a.action, a.resource_type, a.resource_id,
+            a.details, a.ip_address, a.user_agent, a.created_at,
+            u.email as user_email, u.full_name as user_name
+        FROM audit_logs a
+        LEFT JOIN users u ON a.user_id = u.id
+    """, 'a.created_at', 'a.created_at DESC')
 
 
 @export_routes.route('/notifications', methods=['GET'])
 def export_notifications():
     """Export notification history"""
-    try:
-        format_type = request.args.get('format', 'csv')
-        limit = min(int(request.args.get('limit', 10000)), 1000000)
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        where_clauses = []
-        params = []
-
-        if start_date:
-            where_clauses.append("DATE(n.created_at) >= %s")
-            params.append(start_date)
-
-        if end_date:
-            where_clauses.append("DATE(n.created_at) <= %s")
-            params.append(end_date)
-
-        where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-
-        query = f"""
-            SELECT
-                n.id, n.notification_rule_id, n.trigger_type,
-                n.trigger_event_id, n.trigger_block_id,
-                n.message_title, n.message_body, n.priority,
-                n.status, n.sent_at, n.failed_reason,
-                n.retry_count, n.delivery_status, n.created_at,
-                nr.name as rule_name
-            FROM notifications n
-            LEFT JOIN notification_rules nr ON n.notification_rule_id = nr.id
-            {where_sql}
-            ORDER BY n.created_at DESC
-            LIMIT %s
-        """
-        params.append(limit)
-
-        cursor.execute(query, params)
-        data = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"notifications_export_{timestamp}.{format_type}"
-
-        if format_type == 'json':
-            return generate_json_export(data, filename)
-        elif format_type == 'xlsx':
-            return generate_xlsx(data, filename)
-        else:
-            return generate_csv(data, filename)
-
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return stream_export('notifications', """
+        SELECT
+            n.id, n.notification_rule_id, n.trigger_type,
+            n.trigger_event_id, n.trigger_block_id,
+            n.message_title, n.message_body, n.priority,
+            n.status, n.sent_at, n.failed_reason,
+            n.retry_count, n.delivery_status, n.created_at,
+            nr.name as rule_name
+        FROM notifications n
+        LEFT JOIN notification_rules nr ON n.notification_rule_id = nr.id
+    """, 'n.created_at', 'n.created_at DESC')
 
 
 @export_routes.route('/ml_predictions', methods=['GET'])
 def export_ml_predictions():
     """Export ML predictions"""
-    try:
-        format_type = request.args.get('format', 'csv')
-        limit = min(int(request.args.get('limit', 10000)), 1000000)
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        where_clauses = []
-        params = []
-
-        if start_date:
-            where_clauses.append("DATE(mp.created_at) >= %s")
-            params.append(start_date)
-
-        if end_date:
-            where_clauses.append("DATE(mp.created_at) <= %s")
-            params.append(end_date)
-
-        where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-
-        query = f"""
-            SELECT
-                mp.id, mp.event_id, mp.model_id,
-                mp.risk_score, mp.threat_type, mp.confidence,
-                mp.is_anomaly, mp.inference_time_ms,
-                mp.was_blocked, mp.manual_feedback,
-                mp.created_at,
-                mm.model_name, mm.algorithm
-            FROM ml_predictions mp
-            LEFT JOIN ml_models mm ON mp.model_id = mm.id
-            {where_sql}
-            ORDER BY mp.created_at DESC
-            LIMIT %s
-        """
-        params.append(limit)
-
-        cursor.execute(query, params)
-        data = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"ml_predictions_export_{timestamp}.{format_type}"
-
-        if format_type == 'json':
-            return generate_json_export(data, filename)
-        elif format_type == 'xlsx':
-            return generate_xlsx(data, filename)
-        else:
-            return generate_csv(data, filename)
-
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return stream_export('ml_predictions', """
+        SELECT
+            mp.id, mp.event_id, mp.model_id,
+            mp.risk_score, mp.threat_type, mp.confidence,
+            mp.is_anomaly, mp.inference_time_ms,
+            mp.was_blocked, mp.manual_feedback,
+            mp.created_at,
+            mm.model_name, mm.algorithm
+        FROM ml_predictions mp
+        LEFT JOIN ml_models mm ON mp.model_id = mm.id
+    """, 'mp.created_at', 'mp.created_at DESC')
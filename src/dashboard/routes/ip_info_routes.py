@@ -1,10 +1,11 @@
 """
 SSH Guardian v3.0 - IP Information Routes
 API endpoints for IP geolocation with provider selection
-Supports: FreeIPAPI, IP-API
+Supports: offline dataset (GEOIP_LOCAL_DB), FreeIPAPI, IP-API
 """
 
 from flask import Blueprint, jsonify
+import os
 import sys
 from pathlib import Path
 import requests
@@ -16,6 +17,7 @@ sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from cache import get_cache, cache_key
 from integrations_config import get_integration_config_value
+from geoip_local import get_local_geoip
 
 # Create Blueprint
 ip_info_routes = Blueprint('ip_info_routes', __name__, url_prefix='/api/dashboard/ip-info')
@@ -27,6 +29,17 @@ IPAPI_BASE_URL = "http://ip-api.com/json"
 # Cache TTL - 24 hours for IP geolocation (doesn't change frequently)
 IP_INFO_TTL = 86400
 
+# Call remote providers only for fields the offline dataset lacks
+REMOTE_ENRICHMENT = os.getenv('GEOIP_REMOTE_ENRICHMENT', '1') == '1'
+
+# Placeholder values the remote fetchers use for missing fields
+MISSING_VALUES = (None, 'Unknown', 'N/A', 0)
+
+
+def _is_missing(value):
+    """Placeholder check; False flags are real values, not a missing 0"""
+    return not isinstance(value, bool) and value in MISSING_VALUES
+
 
 def get_primary_provider():
     """Determine which GeoIP provider to use as primary"""
@@ -124,6 +137,49 @@ def fetch_from_ipapi(ip_address):
     return None
 
 
+def fetch_from_local(ip_address):
+    """Look up IP info in the offline dataset (no network)"""
+    local_db = get_local_geoip()
+    data = local_db.lookup(ip_address) if local_db else None
+    if not data:
+        return None
+
+    return {
+        'success': True,
+        'provider': 'local',
+        'ip_address': ip_address,
+        'ip_version': 6 if ':' in ip_address else 4,
+        'country': data.get('country_name') or data.get('country_code', 'Unknown'),
+        'country_code': data.get('country_code', 'N/A'),
+        'city': data.get('city', 'Unknown'),
+        'region': data.get('region', 'Unknown'),
+        'latitude': data.get('latitude', 0),
+        'longitude': data.get('longitude', 0),
+        'timezone': data.get('timezone', 'N/A'),
+        'isp': data.get('asn_org', 'Unknown'),
+        'asn': str(data['asn']) if data.get('asn') else 'N/A',
+        'is_proxy': False,
+        'continent': 'N/A',
+        'continent_code': 'N/A',
+        'zip_code': data.get('postal_code', 'N/A'),
+        'is_private': False,
+        'from_cache': False,
+        # City-level datasets (e.g. GeoLite2-City) need no remote call
+        'is_complete': data.get('city') is not None and data.get('latitude') is not None
+    }
+
+
+def merge_local_result(local, remote):
+    """Fill the fields the offline dataset lacks from a remote result"""
+    merged = dict(local)
+    for field, value in remote.items():
+        if _is_missing(merged.get(field)):
+            merged[field] = value
+    merged['is_proxy'] = remote.get('is_proxy', False)
+    merged['provider'] = f"local+{remote.get('provider', 'remote')}"
+    return merged
+
+
 def is_valid_ip(ip_address):
     """Validate IP address format"""
     import re
@@ -208,6 +264,14 @@ def lookup_ip(ip_address):
             cached['from_cache'] = True
             return jsonify(cached), 200
 
+        # Offline dataset is the primary provider
+        local_result = fetch_from_local(ip_address)
+        if local_result:
+            is_complete = local_result.pop('is_complete')
+            if is_complete or not REMOTE_ENRICHMENT:
+                cache.set(cache_k, local_result, IP_INFO_TTL)
+                return jsonify(local_result), 200
+
         # Determine which provider to use
         provider = get_primary_provider()
 
@@ -226,6 +290,10 @@ def lookup_ip(ip_address):
                 if result is None:
                     result = fetch_from_freeipapi(ip_address)
 
+            if local_result:
+                # Remote only fills the gaps; local data stands on its own
+                result = merge_local_result(local_result, result) if result else local_result
+
             if result:
                 # Cache the result
                 cache.set(cache_k, result, IP_INFO_TTL)
@@ -238,6 +306,9 @@ def lookup_ip(ip_address):
 
         except requests.RequestException as e:
             print(f"Error fetching IP info: {e}")
+            if local_result:
+                cache.set(cache_k, local_result, IP_INFO_TTL)
+                return jsonify(local_result), 200
             return jsonify({
                 'success': False,
                 'error': 'Failed to fetch IP information from external API'
@@ -315,6 +386,13 @@ def bulk_lookup():
                     'from_cache': False
                 }
             else:
+                # Offline dataset first, remote API only when it lacks the answer
+                local_result = fetch_from_local(ip)
+                if local_result and (local_result.pop('is_complete') or not REMOTE_ENRICHMENT):
+                    cache.set(cache_k, local_result, IP_INFO_TTL)
+                    results[ip] = local_result
+                    continue
+
                 # Fetch from API
                 try:
                     response = requests.get(
@@ -337,14 +415,16 @@ def bulk_lookup():
                             'is_private': False,
                             'from_cache': False
                         }
+                        if local_result:
+                            result = merge_local_result(local_result, {**result, 'provider': 'freeipapi'})
                         # Cache it
                         cache.set(cache_k, result, IP_INFO_TTL)
                         results[ip] = result
                     else:
-                        results[ip] = {'success': False, 'error': 'API error'}
+                        results[ip] = local_result or {'success': False, 'error': 'API error'}
 
                 except requests.RequestException:
-                    results[ip] = {'success': False, 'error': 'Request failed'}
+                    results[ip] = local_result or {'success': False, 'error': 'Request failed'}
 
         return jsonify({
             'success': True,
@@ -383,11 +463,21 @@ def get_provider_info():
         ipapi_primary = get_integration_config_value('ipapi', 'use_as_primary') == 'true'
 
         primary = get_primary_provider()
+        local_db = get_local_geoip()
 
         return jsonify({
             'success': True,
-            'primary_provider': primary,
+            'primary_provider': 'local' if local_db else primary,
+            'remote_provider': primary,
             'providers': {
+                'local': {
+                    'name': 'Offline dataset',
+                    'enabled': local_db is not None,
+                    'is_primary': local_db is not None,
+                    'remote_enrichment': REMOTE_ENRICHMENT,
+                    'stats': local_db.get_stats() if local_db else None,
+                    'features': ['Country', 'ASN', 'No network calls']
+                },
                 'freeipapi': {
                     'name': 'FreeIPAPI',
                     'enabled': freeipapi_enabled,
@@ -5,10 +5,10 @@ With Redis caching for improved performance
 """
 
 from flask import Blueprint, jsonify, request
+import os
 import sys
 from pathlib import Path
 from datetime import datetime, timedelta
-import threading
 
 # Add project paths
 PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
@@ -21,7 +21,8 @@ from cache import get_cache, cache_key, cache_key_hash
 from src.dashboard.routes.ml_routes_queries import (
     get_overview_data,
     get_dashboard_summary_data,
-    get_predictions_cursor_paginated
+    get_predictions_cursor_paginated,
+    get_shadow_score_summary
 )
 
 # Create Blueprint
@@ -39,14 +40,23 @@ ML_COMPARISON_TTL = 120     # 2 minutes for comparison
 ML_BENEFITS_TTL = 120       # 2 minutes for benefits
 ML_DASHBOARD_TTL = 30       # 30 seconds for dashboard summary
 
+# Per-event inference latency budget a candidate must meet (p95) before promotion
+ML_INFERENCE_BUDGET_MS = float(os.getenv('ML_INFERENCE_BUDGET_MS', 10))
+
 
 def invalidate_ml_cache():
     """Invalidate all ML-related caches"""
     cache = get_cache()
     cache.delete_pattern('ml')
 
-# Training job tracking
-_training_jobs = {}
+def _get_training_executor():
+    """Lazy load the ML training executor"""
+    try:
+        from ml import get_training_executor
+        return get_training_executor()
+    except Exception as e:
+        print(f"ML training executor not available: {e}")
+        return None
 
 
 def _get_ml_module():
@@ -458,7 +468,7 @@ def list_training_runs():
 @ml_routes.route('/training/start', methods=['POST'])
 def start_training():
     """
-    Start a new training job
+    Start a new training job in the training executor's worker processes
 
     Request body:
     {
@@ -466,7 +476,9 @@ def start_training():
         "data_start": "2024-01-01",
         "data_end": "2024-12-31",
         "include_simulation": true,
-        "hyperparameters": {} (optional)
+        "hyperparameters": {} (optional),
+        "param_grid": {"max_depth": [10, 20]} (optional, single algorithm),
+        "param_grids": {"xgboost": {"max_depth": [4, 6]}} (optional, per algorithm)
     }
     """
     try:
@@ -477,6 +489,7 @@ def start_training():
         data_end_str = data.get('data_end')
         include_simulation = data.get('include_simulation', True)
         hyperparameters = data.get('hyperparameters')
+        param_grids = data.get('param_grids') or {}
 
         # Default to last 30 days if no dates specified
         if data_end_str:
@@ -489,70 +502,42 @@ def start_training():
         else:
             data_start = data_end - timedelta(days=30)
 
-        # Get trainer
-        _, trainer = _get_ml_module()
-        if not trainer:
+        # Get training executor
+        executor = _get_training_executor()
+        if not executor:
             return jsonify({'success': False, 'error': 'ML training module not available'}), 500
 
-        # Generate job ID
-        import uuid
-        job_id = str(uuid.uuid4())[:8]
-
-        # Training callback to track progress
-        def progress_callback(stage, progress, message):
-            _training_jobs[job_id] = {
-                'stage': stage,
-                'progress': progress,
-                'message': message,
-                'updated_at': datetime.now().isoformat()
-            }
+        if algorithm == 'all':
+            algorithms = ['random_forest', 'gradient_boosting', 'xgboost']
+        else:
+            algorithms = [algorithm]
+            if hyperparameters:
+                hyperparameters = {algorithm: hyperparameters}
+            if data.get('param_grid'):
+                param_grids = {algorithm: data['param_grid']}
 
-        # Start training in background thread
-        def run_training():
-            try:
-                if algorithm == 'all':
-                    result = trainer.train_all_algorithms(
-                        data_start=data_start,
-                        data_end=data_end,
-                        include_simulation=include_simulation,
-                        callback=progress_callback
-                    )
-                else:
-                    result = trainer.train(
-                        algorithm=algorithm,
-                        data_start=data_start,
-                        data_end=data_end,
-                        hyperparameters=hyperparameters,
-                        include_simulation=include_simulation,
-                        callback=progress_callback
-                    )
-
-                _training_jobs[job_id]['result'] = result
-                _training_jobs[job_id]['stage'] = 'completed'
-                _training_jobs[job_id]['progress'] = 100
-
-            except Exception as e:
-                _training_jobs[job_id]['error'] = str(e)
-                _training_jobs[job_id]['stage'] = 'failed'
-
-        # Start training thread
-        _training_jobs[job_id] = {
-            'stage': 'starting',
-            'progress': 0,
-            'message': 'Initializing training...',
-            'algorithm': algorithm,
-            'started_at': datetime.now().isoformat()
-        }
+        try:
+            job = executor.submit(
+                algorithms,
+                data_start=data_start,
+                data_end=data_end,
+                include_simulation=include_simulation,
+                hyperparameters=hyperparameters,
+                param_grids=param_grids,
+                promote_best=(algorithm == 'all')
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
 
-        thread = threading.Thread(target=run_training)
-        thread.daemon = True
-        thread.start()
+        invalidate_ml_cache()
 
         return jsonify({
             'success': True,
             'message': 'Training started',
-            'job_id': job_id,
+            'job_id': job.job_id,
             'algorithm': algorithm,
+            'tasks': len(job.tasks),
+            'run_ids': job.run_ids,
             'data_range': {
                 'start': data_start.isoformat(),
                 'end': data_end.isoformat()
@@ -567,16 +552,141 @@ def start_training():
 
 @ml_routes.route('/training/status/<job_id>', methods=['GET'])
 def get_training_status(job_id):
-    """Get training job status"""
-    if job_id in _training_jobs:
+    """Get training job status (job stage plus per-run progress)"""
+    executor = _get_training_executor()
+    job = executor.get_job(job_id) if executor else None
+    if job:
         return jsonify({
             'success': True,
-            'job': _training_jobs[job_id]
+            'job': job.to_dict()
         }), 200
     else:
         return jsonify({'success': False, 'error': 'Job not found'}), 404
 
 
+@ml_routes.route('/training/cancel/<job_id>', methods=['POST'])
+def cancel_training(job_id):
+    """Cancel a queued or running training job"""
+    executor = _get_training_executor()
+    if executor and executor.cancel(job_id):
+        invalidate_ml_cache()
+        return jsonify({'success': True, 'message': 'Cancellation requested', 'job_id': job_id}), 202
+    return jsonify({'success': False, 'error': 'Job not found or already finished'}), 404
+
+
+@ml_routes.route('/training/incremental', methods=['GET'])
+def get_incremental_updates():
+    """Recent incremental model updates (scripts/incremental_ml_update.py)"""
+    try:
+        from ml.incremental_queries import fetch_incremental_updates
+
+        limit = min(int(request.args.get('limit', 20)), 100)
+        updates = fetch_incremental_updates(limit)
+
+        for update in updates:
+            for field in ('window_start', 'checkpoint_at', 'feedback_checkpoint_at', 'created_at'):
+                if update.get(field):
+                    update[field] = update[field].isoformat()
+            for field in ('base_f1', 'candidate_f1'):
+                if update.get(field) is not None:
+                    update[field] = float(update[field])
+
+        return jsonify({'success': True, 'updates': updates}), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ============================================================================
+# SHADOW SCORING ENDPOINTS
+# ============================================================================
+
+@ml_routes.route('/shadow', methods=['GET'])
+def get_shadow_status():
+    """Current shadow model, sample rate and this worker's shadow counters"""
+    try:
+        manager, _ = _get_ml_module()
+        if not manager:
+            return jsonify({'success': False, 'error': 'ML module not available'}), 500
+
+        return jsonify({'success': True, 'shadow': manager.get_shadow_status()}), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@ml_routes.route('/shadow', methods=['POST'])
+def set_shadow_model():
+    """
+    Start or stop shadow scoring of a candidate model (all workers).
+
+    Body: {"model_id": 42, "sample_rate": 0.1}; model_id null stops it
+    """
+    try:
+        manager, _ = _get_ml_module()
+        if not manager:
+            return jsonify({'success': False, 'error': 'ML module not available'}), 500
+
+        data = request.get_json() or {}
+        model_id = data.get('model_id')
+        sample_rate = data.get('sample_rate')
+
+        if model_id is not None:
+            model_id = int(model_id)
+            if model_id == manager.active_model_id:
+                return jsonify({'success': False, 'error': 'Model is already in production'}), 400
+        if sample_rate is not None and not 0 <= float(sample_rate) <= 1:
+            return jsonify({'success': False, 'error': 'sample_rate must be between 0 and 1'}), 400
+
+        if not manager.set_shadow_model(model_id, sample_rate):
+            return jsonify({'success': False, 'error': f'Could not load model {model_id}'}), 400
+
+        return jsonify({'success': True, 'shadow': manager.get_shadow_status()}), 200
+
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid parameter: {e}'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@ml_routes.route('/shadow/summary', methods=['GET'])
+def get_shadow_summary():
+    """
+    Shadow vs production: agreement, accuracy on analyst feedback and
+    inference latency percentiles.
+
+    Query: model_id (default: current shadow model), hours (default 24)
+    """
+    try:
+        model_id = request.args.get('model_id', type=int)
+        hours = min(request.args.get('hours', 24, type=int), 24 * 30)
+
+        if model_id is None:
+            manager, _ = _get_ml_module()
+            model_id = manager.get_shadow_status()['model_id'] if manager else None
+        if model_id is None:
+            return jsonify({'success': False, 'error': 'No shadow model; pass model_id'}), 400
+
+        conn = get_connection()
+        cursor = conn.cursor(dictionary=True)
+
+        try:
+            summary = get_shadow_score_summary(cursor, model_id, hours)
+        finally:
+            cursor.close()
+            conn.close()
+
+        shadow_p95 = summary['latency_ms']['shadow']['p95']
+        summary['latency_budget_ms'] = ML_INFERENCE_BUDGET_MS
+        summary['within_latency_budget'] = shadow_p95 <= ML_INFERENCE_BUDGET_MS \
+            if shadow_p95 is not None else None
+
+        return jsonify({'success': True, 'summary': summary}), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @ml_routes.route('/training/config', methods=['GET'])
 def get_training_config():
     """Get available training algorithms and default hyperparameters"""
@@ -963,36 +1073,27 @@ def get_dashboard_summary():
     """Get ML summary for main dashboard home page with caching"""
     try:
         cache = get_cache()
-        cache_k = cache_key('ml', 'dashboard_summary')
-
-        # Try cache first
-        cached = cache.get(cache_k)
-        if cached is not None:
-            return jsonify({
-                'success': True,
-                'ml_summary': cached,
-                'from_cache': True
-            }), 200
+        computed = {}
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        try:
-            # Use optimized query function (reduces 3 queries to 1)
-            ml_summary = get_dashboard_summary_data(cursor)
-
-            # Cache the result
-            cache.set(cache_k, ml_summary, ML_DASHBOARD_TTL)
+        def load_summary():
+            conn = get_connection()
+            cursor = conn.cursor(dictionary=True)
+            try:
+                # Use optimized query function (reduces 3 queries to 1)
+                computed['data'] = get_dashboard_summary_data(cursor)
+                return computed['data']
+            finally:
+                cursor.close()
+                conn.close()
 
-            return jsonify({
-                'success': True,
-                'ml_summary': ml_summary,
-                'from_cache': False
-            }), 200
+        # Polled by every open dashboard: one refresh at a time, stale-while-revalidate
+        ml_summary = cache.get_or_set(cache_key('ml', 'dashboard_summary'), load_summary, ML_DASHBOARD_TTL)
 
-        finally:
-            cursor.close()
-            conn.close()
+        return jsonify({
+            'success': True,
+            'ml_summary': ml_summary,
+            'from_cache': ml_summary is not computed.get('data')
+        }), 200
 
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
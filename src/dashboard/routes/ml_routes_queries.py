@@ -4,6 +4,7 @@ Optimized database queries to reduce round-trips and improve performance
 Updated for v3.1 schema (ml_predictions → auth_events_ml)
 """
 
+import json
 from typing import Dict, List, Any, Optional, Tuple
 
 
@@ -345,3 +346,142 @@ def get_predictions_cursor_paginated(
     next_cursor = predictions[-1]['id'] if has_more and predictions else None
 
     return formatted, next_cursor
+
+
+def _percentiles(values: List[float], points=(50, 90, 95, 99)) -> Dict[str, Optional[float]]:
+    """Nearest-rank percentiles of a list of numbers"""
+    if not values:
+        return {f'p{p}': None for p in points}
+
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    return {f'p{p}': round(ordered[min(last, max(0, int(round(p / 100 * last))))], 4) for p in points}
+
+
+def get_shadow_score_summary(cursor, shadow_model_id: int, hours: int = 24,
+                             latency_sample: int = 50000) -> Dict[str, Any]:
+    """
+    Shadow model vs production over a time window: agreement, accuracy on
+    analyst-labelled events, and per-event inference latency percentiles
+    (per ensemble and per model; both sides timed on the same sampled rows).
+
+    Args:
+        cursor: Database cursor (dictionary=True)
+        shadow_model_id: Candidate model ID
+        hours: Window length
+        latency_sample: Most recent rows used for the latency percentiles
+
+    Returns:
+        Dict with window, agreement, feedback accuracy and latency summaries
+    """
+    # Aggregates over the whole window
+    cursor.execute("""
+        SELECT COUNT(*) AS scored,
+               SUM(agrees) AS agreed,
+               SUM(production_anomaly) AS production_anomalies,
+               SUM(shadow_anomaly) AS shadow_anomalies,
+               AVG(ABS(CAST(shadow_risk_score AS SIGNED) - CAST(production_risk_score AS SIGNED))) AS mean_abs_score_diff,
+               AVG(production_inference_ms) AS production_mean_ms,
+               AVG(shadow_inference_ms) AS shadow_mean_ms,
+               MIN(created_at) AS first_scored_at,
+               MAX(created_at) AS last_scored_at
+        FROM ml_shadow_scores
+        WHERE shadow_model_id = %s
+        AND created_at >= DATE_SUB(NOW(), INTERVAL %s HOUR)
+    """, (shadow_model_id, hours))
+    totals = cursor.fetchone() or {}
+    scored = int(totals.get('scored') or 0)
+
+    # Both sides against analyst feedback (same labels as incremental training)
+    cursor.execute("""
+        SELECT COUNT(*) AS labelled,
+               SUM(s.production_anomaly = f.label) AS production_correct,
+               SUM(s.shadow_anomaly = f.label) AS shadow_correct
+        FROM ml_shadow_scores s
+        JOIN (
+            SELECT event_id,
+                   MAX(CASE manual_feedback
+                       WHEN 'confirmed_threat' THEN 1
+                       WHEN 'false_negative' THEN 1
+                       WHEN 'false_positive' THEN 0
+                       WHEN 'correct' THEN is_anomaly
+                   END) AS label
+            FROM auth_events_ml
+            WHERE manual_feedback IS NOT NULL
+            GROUP BY event_id
+        ) f ON f.event_id = s.event_id AND f.label IS NOT NULL
+        WHERE s.shadow_model_id = %s
+        AND s.created_at >= DATE_SUB(NOW(), INTERVAL %s HOUR)
+    """, (shadow_model_id, hours))
+    feedback = cursor.fetchone() or {}
+    labelled = int(feedback.get('labelled') or 0)
+
+    # Latency distribution from the most recent rows
+    cursor.execute("""
+        SELECT production_inference_ms, shadow_inference_ms, sample_size,
+               production_model_ms, shadow_model_ms
+        FROM ml_shadow_scores
+        WHERE shadow_model_id = %s
+        AND created_at >= DATE_SUB(NOW(), INTERVAL %s HOUR)
+        ORDER BY id DESC
+        LIMIT %s
+    """, (shadow_model_id, hours, latency_sample))
+    latency_rows = cursor.fetchall()
+
+    production_ms = [float(r['production_inference_ms']) for r in latency_rows
+                     if r['production_inference_ms'] is not None]
+    shadow_ms = [float(r['shadow_inference_ms']) for r in latency_rows
+                 if r['shadow_inference_ms'] is not None]
+    sample_sizes = [int(r['sample_size']) for r in latency_rows if r['sample_size']]
+
+    def _per_model(column):
+        # {"model_name": per-event ms} per row -> percentiles per model
+        values = {}
+        for r in latency_rows:
+            timings = r[column]
+            if isinstance(timings, (str, bytes)):
+                timings = json.loads(timings)
+            for model_name, ms in (timings or {}).items():
+                values.setdefault(model_name, []).append(float(ms))
+        return {
+            model_name: {'mean': round(sum(ms) / len(ms), 4), **_percentiles(ms)}
+            for model_name, ms in sorted(values.items())
+        }
+
+    def _ratio(part, whole):
+        return round(float(part or 0) / whole, 4) if whole else None
+
+    return {
+        'shadow_model_id': shadow_model_id,
+        'hours': hours,
+        'scored': scored,
+        'first_scored_at': totals['first_scored_at'].isoformat() if totals.get('first_scored_at') else None,
+        'last_scored_at': totals['last_scored_at'].isoformat() if totals.get('last_scored_at') else None,
+        'agreement_rate': _ratio(totals.get('agreed'), scored),
+        'production_anomaly_rate': _ratio(totals.get('production_anomalies'), scored),
+        'shadow_anomaly_rate': _ratio(totals.get('shadow_anomalies'), scored),
+        'mean_abs_score_diff': round(float(totals['mean_abs_score_diff']), 2)
+                               if totals.get('mean_abs_score_diff') is not None else None,
+        'feedback': {
+            'labelled': labelled,
+            'production_accuracy': _ratio(feedback.get('production_correct'), labelled),
+            'shadow_accuracy': _ratio(feedback.get('shadow_correct'), labelled)
+        },
+        'latency_ms': {
+            'sample_size': len(latency_rows),
+            'mean_rows_per_call': round(sum(sample_sizes) / len(sample_sizes), 2)
+                                  if sample_sizes else None,
+            'production': {
+                'mean': round(float(totals['production_mean_ms']), 4)
+                        if totals.get('production_mean_ms') is not None else None,
+                **_percentiles(production_ms),
+                'per_model': _per_model('production_model_ms')
+            },
+            'shadow': {
+                'mean': round(float(totals['shadow_mean_ms']), 4)
+                        if totals.get('shadow_mean_ms') is not None else None,
+                **_percentiles(shadow_ms),
+                'per_model': _per_model('shadow_model_ms')
+            }
+        }
+    }
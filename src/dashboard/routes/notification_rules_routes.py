@@ -15,6 +15,7 @@ sys.path.append(str(PROJECT_ROOT / "src"))
 
 from connection import get_connection
 from core.cache import get_cache, cache_key_hash
+from core.blocking.rule_engine import invalidate_rule_cache
 
 notification_rules_routes = Blueprint('notification_rules', __name__)
 
@@ -27,6 +28,7 @@ def invalidate_alert_rules_cache():
     cache = get_cache()
     cache.delete_pattern('alert_rules')
     cache.delete_pattern('blocking_rules')  # Also invalidate blocking rules cache
+    invalidate_rule_cache()  # Recompile rules on the next evaluation
 
 
 # Valid rule types (same as blocking rules)
@@ -15,9 +15,11 @@ PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
 sys.path.append(str(PROJECT_ROOT))
 sys.path.append(str(PROJECT_ROOT / "dbs"))
 sys.path.append(str(PROJECT_ROOT / "src"))
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from dbs.connection import get_connection
 from src.core.auth import login_required
+from attack_counters import record_auth_events
 
 pipeline_simulation_routes = Blueprint('pipeline_simulation_routes', __name__)
 
@@ -63,6 +65,7 @@ def create_attack_events(agent_id: int, attack_type: str, source_ip: str,
 
         hostname = agent['hostname']
         event_ids = []
+        counted_events = []
 
         # Generate events
         base_time = datetime.now()
@@ -100,11 +103,17 @@ def create_attack_events(agent_id: int, attack_type: str, source_ip: str,
             ))
 
             event_ids.append(cursor.lastrowid)
+            counted_events.append({
+                'ip_address': source_ip, 'username': username, 'event_type': 'failed',
+                'timestamp': timestamp, 'event_id': cursor.lastrowid
+            })
 
         conn.commit()
         cursor.close()
         conn.close()
 
+        record_auth_events(counted_events)
+
         return {
             'success': True,
             'event_ids': event_ids,
@@ -121,26 +130,17 @@ def create_attack_events(agent_id: int, attack_type: str, source_ip: str,
 def run_enrichment(event_ids: list):
     """Run enrichment pipeline on events"""
     try:
-        from core.enrichment import enrich_event
+        from core.enrichment import enrich_batch
 
+        # One batch: event rows, per-IP lookups and ML scoring are done once
         results = []
-        for event_id in event_ids:
-            # Get event IP
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT source_ip_text FROM auth_events WHERE id = %s", (event_id,))
-            event = cursor.fetchone()
-            cursor.close()
-            conn.close()
-
-            if event:
-                result = enrich_event(event_id, event['source_ip_text'], verbose=False, skip_notifications=True)
-                results.append({
-                    'event_id': event_id,
-                    'success': result.get('success', False),
-                    'ml': result.get('ml', {}),
-                    'blocking': result.get('blocking', {})
-                })
+        for result in enrich_batch(event_ids, verbose=False, skip_notifications=True):
+            results.append({
+                'event_id': result['event_id'],
+                'success': result.get('success', False),
+                'ml': result.get('ml', {}),
+                'blocking': result.get('blocking', {})
+            })
 
         return {'success': True, 'results': results}
 
@@ -152,6 +152,10 @@ def run_enrichment(event_ids: list):
 def verify_ml_detection(event_ids: list):
     """Verify ML detection results"""
     try:
+        # Enrichment results are written behind; make them visible first
+        from core.write_behind import flush_writes
+        flush_writes()
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
@@ -53,12 +53,11 @@ def clear_stats_cache():
         from core.cache import get_cache
 
         cache = get_cache()
-        deleted = cache.delete_pattern('events_stats')
-        deleted += cache.delete_pattern('dashboard')
+        invalidated = cache.invalidate_families('events_stats', 'dashboard')
 
         return jsonify({
             'success': True,
-            'message': f'Stats cache cleared ({deleted} keys)'
+            'message': f'Stats cache cleared ({invalidated} cache families)'
         })
     except Exception as e:
         return jsonify({
@@ -72,20 +71,16 @@ def clear_stats_cache():
 def clear_all_cache():
     """Clear all Redis cache"""
     try:
-        from core.cache import get_cache, get_redis_client
+        from core.cache import get_cache
 
-        client = get_redis_client()
-        if client:
-            # Get count of keys before flush
-            keys_count = client.dbsize()
+        cache = get_cache()
+        if cache.enabled:
             # Clear all SSH Guardian keys
-            keys = client.keys('sshg:*')
-            if keys:
-                client.delete(*keys)
+            deleted = cache.clear_all()
 
             return jsonify({
                 'success': True,
-                'message': f'All cache cleared ({len(keys)} keys)'
+                'message': f'All cache cleared ({deleted} keys)'
             })
         else:
             return jsonify({
@@ -104,15 +99,12 @@ def clear_all_cache():
 def clear_cache():
     """Clear cache (single endpoint for frontend use)"""
     try:
-        from core.cache import get_cache, get_redis_client
+        from core.cache import get_cache
 
-        client = get_redis_client()
-        if client:
+        cache = get_cache()
+        if cache.enabled:
             # Clear all SSH Guardian keys
-            keys = client.keys('sshg:*')
-            deleted = 0
-            if keys:
-                deleted = client.delete(*keys)
+            deleted = cache.clear_all()
 
             return jsonify({
                 'success': True,
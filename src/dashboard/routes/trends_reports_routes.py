@@ -3,12 +3,13 @@ SSH Guardian v3.0 - Trends Reports Routes
 Provides API endpoints for trend analysis and historical data
 With Redis caching for improved performance
 
-PERFORMANCE OPTIMIZATIONS:
-1. Use timestamp >= X AND timestamp < Y instead of DATE(timestamp) to leverage idx_timestamp
-2. Separate COUNT(DISTINCT) into subqueries to avoid slow full table scans
-3. Use subqueries to pre-filter data before JOINs and aggregations
-4. Leverage composite indexes: idx_timestamp_event_type, idx_ml_risk_score
-5. Filter on indexed columns: event_type, is_anomaly, ml_risk_score
+Event trends read the rollup tables of migration 038 (kept current by
+core/event_rollups.py), never auth_events itself:
+- auth_events_rollup_hourly / _daily: counts, anomalies and risk by
+  agent, event type, country and threat type
+- auth_events_rollup_ip_daily / _username_daily: per-IP and per-username
+  days, for top lists and distinct counts
+- auth_events_daily_summary: distinct IPs/usernames per day
 """
 
 from flask import Blueprint, jsonify, request
@@ -23,6 +24,7 @@ sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from connection import get_connection
 from cache import get_cache, cache_key
+from event_rollups import refresh_rollups_if_due
 
 # Create Blueprint
 trends_reports_routes = Blueprint('trends_reports_routes', __name__)
@@ -74,69 +76,48 @@ def get_trends_overview():
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=days)
 
+        refresh_rollups_if_due(background=True)
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # Get daily totals - OPTIMIZED: Use timestamp directly instead of DATE() for index usage
+        # Daily totals from the daily rollup cube
         cursor.execute("""
             SELECT
-                DATE(timestamp) as date,
-                COUNT(*) as total_events,
-                SUM(CASE WHEN event_type = 'failed' THEN 1 ELSE 0 END) as failed_events,
-                SUM(CASE WHEN event_type = 'successful' THEN 1 ELSE 0 END) as successful_events,
-                SUM(CASE WHEN is_anomaly = 1 THEN 1 ELSE 0 END) as anomalies,
-                AVG(ml_risk_score) as avg_risk_score,
-                SUM(CASE WHEN ml_risk_score >= 60 THEN 1 ELSE 0 END) as high_risk_events
-            FROM auth_events
-            WHERE timestamp >= %s AND timestamp < %s + INTERVAL 1 DAY
-            AND source_type != 'simulation'
-            GROUP BY DATE(timestamp)
-            ORDER BY date ASC
+                bucket_date as date,
+                SUM(event_count) as total_events,
+                SUM(CASE WHEN event_type = 'failed' THEN event_count ELSE 0 END) as failed_events,
+                SUM(CASE WHEN event_type = 'successful' THEN event_count ELSE 0 END) as successful_events,
+                SUM(anomaly_count) as anomalies,
+                SUM(risk_sum) / SUM(event_count) as avg_risk_score,
+                SUM(critical_count + high_count) as high_risk_events
+            FROM auth_events_rollup_daily
+            WHERE bucket_date BETWEEN %s AND %s
+            GROUP BY bucket_date
+            ORDER BY bucket_date ASC
         """, (start_date, end_date))
 
         daily_data = cursor.fetchall()
 
-        # Calculate unique counts separately with subquery optimization
+        # Distinct IPs/usernames per day from the daily summary
         cursor.execute("""
-            SELECT
-                DATE(timestamp) as date,
-                COUNT(*) as unique_ips
-            FROM (
-                SELECT DATE(timestamp) as timestamp, source_ip_text
-                FROM auth_events
-                WHERE timestamp >= %s AND timestamp < %s + INTERVAL 1 DAY
-                AND source_type != 'simulation'
-                GROUP BY DATE(timestamp), source_ip_text
-            ) as unique_ip_subquery
-            GROUP BY date
+            SELECT summary_date, unique_ips, unique_usernames
+            FROM auth_events_daily_summary
+            WHERE summary_date BETWEEN %s AND %s
         """, (start_date, end_date))
 
-        unique_ips_data = {row['date'].isoformat() if hasattr(row['date'], 'isoformat') else str(row['date']): row['unique_ips'] for row in cursor.fetchall()}
-
-        cursor.execute("""
-            SELECT
-                DATE(timestamp) as date,
-                COUNT(*) as unique_usernames
-            FROM (
-                SELECT DATE(timestamp) as timestamp, target_username
-                FROM auth_events
-                WHERE timestamp >= %s AND timestamp < %s + INTERVAL 1 DAY
-                AND source_type != 'simulation'
-                AND target_username IS NOT NULL
-                GROUP BY DATE(timestamp), target_username
-            ) as unique_username_subquery
-            GROUP BY date
-        """, (start_date, end_date))
-
-        unique_usernames_data = {row['date'].isoformat() if hasattr(row['date'], 'isoformat') else str(row['date']): row['unique_usernames'] for row in cursor.fetchall()}
+        unique_data = {row['summary_date'].isoformat(): row for row in cursor.fetchall()}
 
         # Format dates and numbers, merge unique counts
         for row in daily_data:
-            date_str = row['date'].isoformat() if hasattr(row['date'], 'isoformat') else str(row['date'])
+            date_str = row['date'].isoformat()
+            unique = unique_data.get(date_str, {})
             row['date'] = date_str
+            for key in ('total_events', 'failed_events', 'successful_events', 'anomalies', 'high_risk_events'):
+                row[key] = int(row[key] or 0)
             row['avg_risk_score'] = round(float(row['avg_risk_score'] or 0), 2)
-            row['unique_ips'] = unique_ips_data.get(date_str, 0)
-            row['unique_usernames'] = unique_usernames_data.get(date_str, 0)
+            row['unique_ips'] = unique.get('unique_ips', 0)
+            row['unique_usernames'] = unique.get('unique_usernames', 0)
 
         # Calculate period totals
         totals = {
@@ -217,45 +198,43 @@ def get_events_timeline():
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
 
+        refresh_rollups_if_due(background=True)
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
         if granularity == 'hourly' and days <= 7:
-            # OPTIMIZED: Use timestamp directly for index usage
             cursor.execute("""
                 SELECT
-                    DATE_FORMAT(timestamp, '%%Y-%%m-%%d %%H:00') as time_bucket,
-                    COUNT(*) as total,
-                    SUM(CASE WHEN event_type = 'failed' THEN 1 ELSE 0 END) as failed,
-                    SUM(CASE WHEN event_type = 'successful' THEN 1 ELSE 0 END) as successful
-                FROM auth_events
-                WHERE timestamp >= %s AND timestamp < %s + INTERVAL 1 DAY
-                AND source_type != 'simulation'
-                GROUP BY time_bucket
-                ORDER BY time_bucket ASC
-            """, (start_date, end_date))
+                    DATE_FORMAT(bucket_start, '%%Y-%%m-%%d %%H:00') as time_bucket,
+                    SUM(event_count) as total,
+                    SUM(CASE WHEN event_type = 'failed' THEN event_count ELSE 0 END) as failed,
+                    SUM(CASE WHEN event_type = 'successful' THEN event_count ELSE 0 END) as successful
+                FROM auth_events_rollup_hourly
+                WHERE bucket_start >= %s
+                GROUP BY bucket_start
+                ORDER BY bucket_start ASC
+            """, (start_date.replace(minute=0, second=0, microsecond=0),))
         else:
-            # OPTIMIZED: Use timestamp range instead of DATE() for index usage
             cursor.execute("""
                 SELECT
-                    DATE(timestamp) as time_bucket,
-                    COUNT(*) as total,
-                    SUM(CASE WHEN event_type = 'failed' THEN 1 ELSE 0 END) as failed,
-                    SUM(CASE WHEN event_type = 'successful' THEN 1 ELSE 0 END) as successful
-                FROM auth_events
-                WHERE timestamp >= %s AND timestamp < %s + INTERVAL 1 DAY
-                AND source_type != 'simulation'
-                GROUP BY DATE(timestamp)
-                ORDER BY time_bucket ASC
+                    bucket_date as time_bucket,
+                    SUM(event_count) as total,
+                    SUM(CASE WHEN event_type = 'failed' THEN event_count ELSE 0 END) as failed,
+                    SUM(CASE WHEN event_type = 'successful' THEN event_count ELSE 0 END) as successful
+                FROM auth_events_rollup_daily
+                WHERE bucket_date BETWEEN %s AND %s
+                GROUP BY bucket_date
+                ORDER BY bucket_date ASC
             """, (start_date.date(), end_date.date()))
 
         timeline_data = cursor.fetchall()
 
         for row in timeline_data:
-            if isinstance(row['time_bucket'], datetime):
-                row['time_bucket'] = row['time_bucket'].isoformat()
-            elif hasattr(row['time_bucket'], 'isoformat'):
+            if hasattr(row['time_bucket'], 'isoformat'):
                 row['time_bucket'] = row['time_bucket'].isoformat()
+            for key in ('total', 'failed', 'successful'):
+                row[key] = int(row[key] or 0)
 
         # Cache the result
         cache.set(cache_k, timeline_data, TRENDS_TIMELINE_TTL)
@@ -284,6 +263,9 @@ def get_top_attackers():
     """
     Get top attacking IPs over a period
 
+    unique_usernames is the most distinct usernames the IP tried in a
+    single day (distinct counts do not add up across days).
+
     Query Parameters:
         days: Number of days (default: 30)
         limit: Number of results (default: 10)
@@ -309,47 +291,35 @@ def get_top_attackers():
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=days)
 
+        refresh_rollups_if_due(background=True)
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # OPTIMIZED: Use timestamp range for index, calculate active_days from date range instead of COUNT DISTINCT
         cursor.execute("""
             SELECT
-                ae.source_ip_text as ip,
-                geo.country_name as country,
-                geo.country_code,
-                COUNT(*) as total_attempts,
-                DATEDIFF(MAX(DATE(ae.timestamp)), MIN(DATE(ae.timestamp))) + 1 as active_days,
-                (SELECT COUNT(*) FROM (
-                    SELECT 1 FROM auth_events ae2
-                    WHERE ae2.source_ip_text = ae.source_ip_text
-                    AND ae2.timestamp >= %s AND ae2.timestamp < %s + INTERVAL 1 DAY
-                    AND ae2.source_type != 'simulation'
-                    AND ae2.event_type = 'failed'
-                    AND ae2.target_username IS NOT NULL
-                    GROUP BY ae2.target_username
-                    LIMIT 1000
-                ) t) as unique_usernames,
-                AVG(ae.ml_risk_score) as avg_risk,
-                MAX(ae.ml_risk_score) as max_risk,
-                MIN(DATE(ae.timestamp)) as first_seen,
-                MAX(DATE(ae.timestamp)) as last_seen
-            FROM (
-                SELECT source_ip_text, timestamp, target_username, ml_risk_score
-                FROM auth_events
-                WHERE timestamp >= %s AND timestamp < %s + INTERVAL 1 DAY
-                AND source_type != 'simulation'
-                AND event_type = 'failed'
-            ) ae
-            LEFT JOIN ip_geolocation geo ON ae.source_ip_text = geo.ip_address_text
-            GROUP BY ae.source_ip_text, geo.country_name, geo.country_code
+                ip_address as ip,
+                MAX(country_name) as country,
+                NULLIF(MAX(country_code), '') as country_code,
+                SUM(event_count) as total_attempts,
+                DATEDIFF(MAX(bucket_date), MIN(bucket_date)) + 1 as active_days,
+                MAX(unique_usernames) as unique_usernames,
+                SUM(risk_sum) / SUM(event_count) as avg_risk,
+                MAX(max_risk) as max_risk,
+                MIN(bucket_date) as first_seen,
+                MAX(bucket_date) as last_seen
+            FROM auth_events_rollup_ip_daily
+            WHERE event_type = 'failed'
+            AND bucket_date BETWEEN %s AND %s
+            GROUP BY ip_address
             ORDER BY total_attempts DESC
             LIMIT %s
-        """, (start_date, end_date, start_date, end_date, limit))
+        """, (start_date, end_date, limit))
 
         attackers = cursor.fetchall()
 
         for row in attackers:
+            row['total_attempts'] = int(row['total_attempts'] or 0)
             row['avg_risk'] = round(float(row['avg_risk'] or 0), 2)
             row['max_risk'] = int(row['max_risk'] or 0)
             if row['first_seen']:
@@ -409,44 +379,34 @@ def get_country_trends():
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=days)
 
+        refresh_rollups_if_due(background=True)
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # OPTIMIZED: Use timestamp range for index, replace COUNT DISTINCT with subquery approximation
+        # Per-IP days carry the IP's country, so distinct IPs per country are exact
         cursor.execute("""
             SELECT
-                COALESCE(geo.country_name, 'Unknown') as country,
-                geo.country_code,
-                COUNT(*) as total_attempts,
-                (SELECT COUNT(*) FROM (
-                    SELECT 1 FROM auth_events ae2
-                    LEFT JOIN ip_geolocation geo2 ON ae2.source_ip_text = geo2.ip_address_text
-                    WHERE ae2.timestamp >= %s AND ae2.timestamp < %s + INTERVAL 1 DAY
-                    AND ae2.source_type != 'simulation'
-                    AND ae2.event_type = 'failed'
-                    AND COALESCE(geo2.country_name, 'Unknown') = COALESCE(geo.country_name, 'Unknown')
-                    GROUP BY ae2.source_ip_text
-                    LIMIT 10000
-                ) t) as unique_ips,
+                COALESCE(MAX(country_name), 'Unknown') as country,
+                NULLIF(country_code, '') as country_code,
+                SUM(event_count) as total_attempts,
+                COUNT(DISTINCT ip_address) as unique_ips,
                 DATEDIFF(%s, %s) + 1 as active_days,
-                AVG(ae.ml_risk_score) as avg_risk,
-                SUM(CASE WHEN ae.is_anomaly = 1 THEN 1 ELSE 0 END) as anomalies
-            FROM (
-                SELECT source_ip_text, timestamp, ml_risk_score, is_anomaly
-                FROM auth_events
-                WHERE timestamp >= %s AND timestamp < %s + INTERVAL 1 DAY
-                AND source_type != 'simulation'
-                AND event_type = 'failed'
-            ) ae
-            LEFT JOIN ip_geolocation geo ON ae.source_ip_text = geo.ip_address_text
-            GROUP BY geo.country_name, geo.country_code
+                SUM(risk_sum) / SUM(event_count) as avg_risk,
+                SUM(anomaly_count) as anomalies
+            FROM auth_events_rollup_ip_daily
+            WHERE event_type = 'failed'
+            AND bucket_date BETWEEN %s AND %s
+            GROUP BY country_code
             ORDER BY total_attempts DESC
             LIMIT %s
-        """, (start_date, end_date, end_date, start_date, start_date, end_date, limit))
+        """, (end_date, start_date, start_date, end_date, limit))
 
         countries = cursor.fetchall()
 
         for row in countries:
+            row['total_attempts'] = int(row['total_attempts'] or 0)
+            row['anomalies'] = int(row['anomalies'] or 0)
             row['avg_risk'] = round(float(row['avg_risk'] or 0), 2)
 
         # Cache the result
@@ -476,6 +436,9 @@ def get_username_trends():
     """
     Get most targeted usernames over a period
 
+    unique_ips is the most distinct IPs that tried the username in a
+    single day (distinct counts do not add up across days).
+
     Query Parameters:
         days: Number of days (default: 30)
         limit: Number of results (default: 10)
@@ -501,40 +464,32 @@ def get_username_trends():
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=days)
 
+        refresh_rollups_if_due(background=True)
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # OPTIMIZED: Use timestamp range for index, replace COUNT DISTINCT with subquery approximation
         cursor.execute("""
             SELECT
-                target_username as username,
-                COUNT(*) as total_attempts,
-                (SELECT COUNT(*) FROM (
-                    SELECT 1 FROM auth_events ae2
-                    WHERE ae2.target_username = auth_events.target_username
-                    AND ae2.timestamp >= %s AND ae2.timestamp < %s + INTERVAL 1 DAY
-                    AND ae2.source_type != 'simulation'
-                    AND ae2.event_type = 'failed'
-                    GROUP BY ae2.source_ip_text
-                    LIMIT 5000
-                ) t) as unique_ips,
-                DATEDIFF(MAX(DATE(timestamp)), MIN(DATE(timestamp))) + 1 as active_days,
-                AVG(ml_risk_score) as avg_risk,
-                MIN(DATE(timestamp)) as first_seen,
-                MAX(DATE(timestamp)) as last_seen
-            FROM auth_events
-            WHERE timestamp >= %s AND timestamp < %s + INTERVAL 1 DAY
-            AND source_type != 'simulation'
-            AND event_type = 'failed'
-            AND target_username IS NOT NULL
-            GROUP BY target_username
+                username,
+                SUM(event_count) as total_attempts,
+                MAX(unique_ips) as unique_ips,
+                DATEDIFF(MAX(bucket_date), MIN(bucket_date)) + 1 as active_days,
+                SUM(risk_sum) / SUM(event_count) as avg_risk,
+                MIN(bucket_date) as first_seen,
+                MAX(bucket_date) as last_seen
+            FROM auth_events_rollup_username_daily
+            WHERE event_type = 'failed'
+            AND bucket_date BETWEEN %s AND %s
+            GROUP BY username
             ORDER BY total_attempts DESC
             LIMIT %s
-        """, (start_date, end_date, start_date, end_date, limit))
+        """, (start_date, end_date, limit))
 
         usernames = cursor.fetchall()
 
         for row in usernames:
+            row['total_attempts'] = int(row['total_attempts'] or 0)
             row['avg_risk'] = round(float(row['avg_risk'] or 0), 2)
             if row['first_seen']:
                 row['first_seen'] = row['first_seen'].isoformat()
@@ -592,29 +547,31 @@ def get_risk_distribution():
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=days)
 
+        refresh_rollups_if_due(background=True)
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # OPTIMIZED: Use timestamp range and leverage idx_ml_risk_score index
         cursor.execute("""
             SELECT
-                DATE(timestamp) as date,
-                SUM(CASE WHEN ml_risk_score >= 80 THEN 1 ELSE 0 END) as critical,
-                SUM(CASE WHEN ml_risk_score >= 60 AND ml_risk_score < 80 THEN 1 ELSE 0 END) as high,
-                SUM(CASE WHEN ml_risk_score >= 40 AND ml_risk_score < 60 THEN 1 ELSE 0 END) as medium,
-                SUM(CASE WHEN ml_risk_score < 40 THEN 1 ELSE 0 END) as low
-            FROM auth_events
-            WHERE timestamp >= %s AND timestamp < %s + INTERVAL 1 DAY
-            AND source_type != 'simulation'
-            AND event_type = 'failed'
-            GROUP BY DATE(timestamp)
-            ORDER BY date ASC
+                bucket_date as date,
+                SUM(critical_count) as critical,
+                SUM(high_count) as high,
+                SUM(medium_count) as medium,
+                SUM(low_count) as low
+            FROM auth_events_rollup_daily
+            WHERE event_type = 'failed'
+            AND bucket_date BETWEEN %s AND %s
+            GROUP BY bucket_date
+            ORDER BY bucket_date ASC
         """, (start_date, end_date))
 
         risk_data = cursor.fetchall()
 
         for row in risk_data:
             row['date'] = row['date'].isoformat()
+            for key in ('critical', 'high', 'medium', 'low'):
+                row[key] = int(row[key] or 0)
 
         # Calculate totals
         totals = {
@@ -780,61 +737,33 @@ def get_period_comparison():
         prev_end = current_start - timedelta(days=1)
         prev_start = prev_end - timedelta(days=days-1)
 
+        refresh_rollups_if_due(background=True)
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # OPTIMIZED: Use timestamp range and avoid COUNT DISTINCT with approximation
-        # Current period stats
-        cursor.execute("""
-            SELECT
-                COUNT(*) as total_events,
-                SUM(CASE WHEN event_type = 'failed' THEN 1 ELSE 0 END) as failed_events,
-                SUM(CASE WHEN ml_risk_score >= 60 THEN 1 ELSE 0 END) as high_risk,
-                SUM(CASE WHEN is_anomaly = 1 THEN 1 ELSE 0 END) as anomalies
-            FROM auth_events
-            WHERE timestamp >= %s AND timestamp < %s + INTERVAL 1 DAY
-            AND source_type != 'simulation'
-        """, (current_start, end_date))
-        current_stats = cursor.fetchone()
-
-        # Get unique IPs for current period using subquery
-        cursor.execute("""
-            SELECT COUNT(*) as unique_ips
-            FROM (
-                SELECT source_ip_text
-                FROM auth_events
-                WHERE timestamp >= %s AND timestamp < %s + INTERVAL 1 DAY
-                AND source_type != 'simulation'
-                GROUP BY source_ip_text
-            ) as unique_subquery
-        """, (current_start, end_date))
-        current_stats['unique_ips'] = cursor.fetchone()['unique_ips']
-
-        # Previous period stats
-        cursor.execute("""
-            SELECT
-                COUNT(*) as total_events,
-                SUM(CASE WHEN event_type = 'failed' THEN 1 ELSE 0 END) as failed_events,
-                SUM(CASE WHEN ml_risk_score >= 60 THEN 1 ELSE 0 END) as high_risk,
-                SUM(CASE WHEN is_anomaly = 1 THEN 1 ELSE 0 END) as anomalies
-            FROM auth_events
-            WHERE timestamp >= %s AND timestamp < %s + INTERVAL 1 DAY
-            AND source_type != 'simulation'
-        """, (prev_start, prev_end))
-        prev_stats = cursor.fetchone()
-
-        # Get unique IPs for previous period using subquery
-        cursor.execute("""
-            SELECT COUNT(*) as unique_ips
-            FROM (
-                SELECT source_ip_text
-                FROM auth_events
-                WHERE timestamp >= %s AND timestamp < %s + INTERVAL 1 DAY
-                AND source_type != 'simulation'
-                GROUP BY source_ip_text
-            ) as unique_subquery
-        """, (prev_start, prev_end))
-        prev_stats['unique_ips'] = cursor.fetchone()['unique_ips']
+        def period_stats(start, end):
+            cursor.execute("""
+                SELECT
+                    SUM(event_count) as total_events,
+                    SUM(CASE WHEN event_type = 'failed' THEN event_count ELSE 0 END) as failed_events,
+                    SUM(critical_count + high_count) as high_risk,
+                    SUM(anomaly_count) as anomalies
+                FROM auth_events_rollup_daily
+                WHERE bucket_date BETWEEN %s AND %s
+            """, (start, end))
+            stats = {key: int(value or 0) for key, value in cursor.fetchone().items()}
+
+            cursor.execute("""
+                SELECT COUNT(DISTINCT ip_address) as unique_ips
+                FROM auth_events_rollup_ip_daily
+                WHERE bucket_date BETWEEN %s AND %s
+            """, (start, end))
+            stats['unique_ips'] = cursor.fetchone()['unique_ips']
+            return stats
+
+        current_stats = period_stats(current_start, end_date)
+        prev_stats = period_stats(prev_start, prev_end)
 
         def calc_change(current, previous):
             if previous == 0:
@@ -11,6 +11,10 @@
     let currentPage = 1;
     let perPage = 50;
     let totalPages = 1;
+    let totalLogs = 0;
+    // Keyset cursor per visited page (index page - 1); pages without one
+    // (jumps past the furthest page reached) fall back to page numbers
+    let pageCursors = [''];
     let currentFilters = {};
 
     /**
@@ -138,10 +142,16 @@
         }
 
         try {
-            const params = new URLSearchParams({
-                page: currentPage,
-                per_page: perPage
-            });
+            // Page 1 is (re)loaded after every filter change: forget old cursors
+            if (currentPage === 1) pageCursors = [''];
+
+            const params = new URLSearchParams({ per_page: perPage });
+            const cursor = pageCursors[currentPage - 1];
+            if (cursor !== undefined) {
+                params.append('cursor', cursor);
+            } else {
+                params.append('page', currentPage);
+            }
 
             // Add filters
             if (currentFilters.action) params.append('action', currentFilters.action);
@@ -161,9 +171,11 @@
 
             if (data.success) {
                 auditLogs = data.data.logs || [];
-                totalPages = data.data.total_pages || 1;
+                if (data.data.next_cursor) pageCursors[currentPage] = data.data.next_cursor;
+                if (data.data.total != null) totalLogs = data.data.total;
+                totalPages = Math.max(1, Math.ceil(totalLogs / perPage));
                 renderAuditLogs(auditLogs);
-                renderPagination(data.data);
+                renderPagination({ page: currentPage, total_pages: totalPages, total: totalLogs, per_page: perPage });
             } else {
                 throw new Error(data.error || 'Failed to load audit logs');
             }
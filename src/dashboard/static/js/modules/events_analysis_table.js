@@ -11,6 +11,10 @@
     function getState() { return window.eventsAnalysisState || { currentPage: 1, currentLimit: 20, filters: {} }; }
     function buildQueryString() { return window.buildQueryString ? window.buildQueryString() : ''; }
 
+    // Keyset cursor per visited page (index page - 1) and the first page's total
+    let pageCursors = [''];
+    let eventsTotal = 0;
+
     /**
      * Load events table
      */
@@ -18,12 +22,21 @@
         try {
             const state = getState();
             const query = buildQueryString();
-            const response = await fetch(`/api/dashboard/events/list?${query}&limit=${state.currentLimit}&offset=${(state.currentPage - 1) * state.currentLimit}`);
+            // Page 1 is reloaded after every filter change: forget old cursors
+            if (state.currentPage === 1) pageCursors = [''];
+            const cursor = pageCursors[state.currentPage - 1];
+            const paging = cursor !== undefined
+                ? `cursor=${encodeURIComponent(cursor)}`
+                : `offset=${(state.currentPage - 1) * state.currentLimit}`;
+            const response = await fetch(`/api/dashboard/events/list?${query}&limit=${state.currentLimit}&${paging}`);
             const data = await response.json();
 
             if (data.success) {
+                const pagination = data.pagination || {};
+                if (pagination.next_cursor) pageCursors[state.currentPage] = pagination.next_cursor;
+                if (pagination.total != null) eventsTotal = pagination.total;
                 renderEventsTable(data.events || []);
-                renderPagination(data.pagination || {});
+                renderPagination({ ...pagination, total: eventsTotal });
             }
         } catch (error) {
             console.error('Error loading events table:', error);
@@ -8,6 +8,8 @@
 
     let currentPage = 0;
     const pageSize = 50;
+    // Keyset cursor for each visited page (page 0 starts from '')
+    let pageCursors = [''];
     let autoRefreshInterval = null;
     let autoRefreshEnabled = false;
     const AUTO_REFRESH_DELAY = 30000; // 30 seconds
@@ -27,6 +29,7 @@
 
             // Reset pagination
             currentPage = 0;
+            pageCursors = [''];
 
             // Check for specific event ID in URL (from notification click)
             const eventId = getEventIdFromUrl();
@@ -624,6 +627,7 @@
     window.eventsLiveState = {
         get currentPage() { return currentPage; },
         set currentPage(v) { currentPage = v; },
+        get pageCursors() { return pageCursors; },
         pageSize: pageSize
     };
     window.escapeHtml = escapeHtml;
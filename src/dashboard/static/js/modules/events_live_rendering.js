@@ -7,9 +7,12 @@
 (function() {
     'use strict';
 
+    // Total from the first cursor page (later pages don't recount)
+    let eventsTotal = 0;
+
     // Reference to shared state from events_live_page.js
     function getState() {
-        return window.eventsLiveState || { currentPage: 0, pageSize: 50 };
+        return window.eventsLiveState || { currentPage: 0, pageCursors: [''], pageSize: 50 };
     }
 
     /**
@@ -40,10 +43,15 @@
         const agentId = agentFilter ? agentFilter.value : '';
         const timeRange = timeRangeFilter ? timeRangeFilter.value : 'last_30_days';
 
-        const params = new URLSearchParams({
-            limit: pageSize,
-            offset: currentPage * pageSize
-        });
+        // Keyset pagination: each page resumes from the cursor the previous page returned
+        const pageCursors = state.pageCursors || [''];
+        const pageCursor = pageCursors[currentPage];
+        const params = new URLSearchParams({ limit: pageSize });
+        if (pageCursor !== undefined) {
+            params.append('cursor', pageCursor);
+        } else {
+            params.append('offset', currentPage * pageSize);
+        }
 
         if (forceRefresh) {
             params.append('nocache', '1');
@@ -162,13 +170,17 @@
                 enrichMissingLocationData();
             }
 
-            // Update pagination
-            const { total, offset, has_more } = data.pagination;
+            // Update pagination (cursor pages after the first carry no total)
+            const { has_more, next_cursor } = data.pagination;
+            if (next_cursor) pageCursors[currentPage + 1] = next_cursor;
+            if (data.pagination.total != null) eventsTotal = data.pagination.total;
+            const total = eventsTotal;
+            const offset = currentPage * pageSize;
             const infoEl = document.getElementById('eventsInfo');
             const prevBtn = document.getElementById('prevPage');
             const nextBtn = document.getElementById('nextPage');
 
-            if (infoEl) infoEl.textContent = `Showing ${offset + 1}-${Math.min(offset + pageSize, total)} of ${total} events`;
+            if (infoEl) infoEl.textContent = `Showing ${offset + 1}-${offset + data.events.length} of ${total} events`;
             if (prevBtn) prevBtn.disabled = currentPage === 0;
             if (nextBtn) nextBtn.disabled = !has_more;
 
@@ -17,6 +17,7 @@ MODELS_DIR = PROJECT_ROOT / 'ml_models'
 _model_manager = None
 _feature_extractor = None
 _trainer = None
+_training_executor = None
 
 
 def get_model_manager():
@@ -61,6 +62,20 @@ def get_trainer():
     return _trainer
 
 
+def get_training_executor():
+    """
+    Get or create the global training executor (bounded worker process pool).
+
+    Returns:
+        TrainingExecutor instance
+    """
+    global _training_executor
+    if _training_executor is None:
+        from .training_executor import TrainingExecutor
+        _training_executor = TrainingExecutor(get_trainer())
+    return _training_executor
+
+
 def predict(event: dict) -> dict:
     """
     Convenience function for ML prediction.
@@ -75,6 +90,20 @@ def predict(event: dict) -> dict:
     return manager.predict(event)
 
 
+def predict_batch(events: list) -> list:
+    """
+    Convenience function for batch ML prediction.
+
+    Args:
+        events: List of event data dicts
+
+    Returns:
+        List of prediction results, same order as events
+    """
+    manager = get_model_manager()
+    return manager.predict_batch(events)
+
+
 def extract_features(event: dict):
     """
     Convenience function for feature extraction.
@@ -94,7 +123,9 @@ __all__ = [
     'get_model_manager',
     'get_feature_extractor',
     'get_trainer',
+    'get_training_executor',
     'predict',
+    'predict_batch',
     'extract_features',
     'MODELS_DIR',
     'ML_ROOT'
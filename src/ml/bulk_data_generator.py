@@ -13,8 +13,10 @@ import ipaddress
 
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 sys.path.append(str(PROJECT_ROOT / "dbs"))
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from connection import get_connection
+from attack_counters import record_auth_events
 
 
 class BulkDataGenerator:
@@ -300,6 +302,7 @@ class BulkDataGenerator:
 
     def _insert_batch(self, cursor, batch: List[Dict]):
         """Insert batch of events with proper enrichment linking"""
+        counted = []
         for event in batch:
             # Convert IP to binary format
             ip_binary = self._ip_to_binary(event['source_ip'])
@@ -332,6 +335,13 @@ class BulkDataGenerator:
                 None,  # ml_risk_score - will be calculated during training
                 None   # ml_threat_type
             ))
+            counted.append({
+                'ip_address': event['source_ip'], 'username': event['target_username'],
+                'event_type': event['event_type'], 'timestamp': event['timestamp'],
+                'event_id': cursor.lastrowid
+            })
+
+        record_auth_events(counted)
 
     def _ip_to_binary(self, ip_str: str) -> bytes:
         """Convert IP address string to binary format"""
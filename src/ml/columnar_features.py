@@ -0,0 +1,666 @@
+"""
+SSH Guardian v3.0 - Columnar Feature Extractor
+Computes the FeatureExtractor features for a whole chunk of events with
+NumPy (per-IP windows via sorted groups and searchsorted)
+"""
+
+import time
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from .feature_extractor import (
+    FeatureExtractor, ML_HISTORY_TTL_HOURS, ML_HISTORY_MAX_ATTEMPTS,
+    MAX_TRACKED_USERNAMES, MAX_TRACKED_SERVERS, HISTORY_WINDOW
+)
+
+US_PER_SEC = 1_000_000
+PROFILE_HOURS = 20  # typical_hours kept per username
+
+REASON_MAP = {
+    'invalid_user': 0.2,
+    'invalid_password': 0.4,
+    'connection_refused': 0.6,
+    'key_rejected': 0.3,
+    'timeout': 0.1,
+    'max_attempts': 0.8
+}
+
+THREAT_LEVEL_MAP = {
+    'clean': 0.0,
+    'low': 0.25,
+    'medium': 0.5,
+    'high': 0.75,
+    'critical': 1.0
+}
+
+
+def _take_columns(cols: Dict, index: np.ndarray) -> Dict:
+    """Select/reorder the rows of every column"""
+    return {
+        key: value[index] if isinstance(value, np.ndarray) else [value[i] for i in index]
+        for key, value in cols.items()
+    }
+
+
+class ColumnarFeatureExtractor:
+    """
+    Batch equivalent of FeatureExtractor for training and backfill.
+
+    extract_batch(events) returns the same (n, 50) matrix as calling
+    FeatureExtractor.reset_history() and then extract() on each event in
+    time order (ties in input order); rows come back in input order, so
+    events paged by id (delayed or backfilled logs) need no re-sorting.
+    Username time profiles carry over between calls like
+    FeatureExtractor.user_profiles. The in-memory caps of the streaming
+    extractor (ML_HISTORY_MAX_IPS, ML_USER_PROFILES_MAX) are not applied.
+    """
+
+    def __init__(self, ttl_hours: Optional[float] = None):
+        """
+        Initialize the columnar extractor
+
+        Args:
+            ttl_hours: IP history TTL to mirror (default ML_HISTORY_TTL_HOURS, 0 = never)
+        """
+        ttl_hours = ML_HISTORY_TTL_HOURS if ttl_hours is None else ttl_hours
+        self.ttl_us = int(ttl_hours * 3600 * US_PER_SEC) if ttl_hours else None
+        self.user_profiles: Dict[str, Dict] = {}
+        self._streaming = FeatureExtractor()
+
+    def get_feature_names(self) -> List[str]:
+        """Return list of all feature names (50 features)"""
+        return self._streaming.get_feature_names()
+
+    def reset_profiles(self):
+        """Forget username time profiles carried between calls"""
+        self.user_profiles.clear()
+
+    def extract_batch(self, events: List[Dict]) -> np.ndarray:
+        """
+        Extract features for a chunk of events.
+
+        Args:
+            events: Event dicts as accepted by FeatureExtractor.extract
+
+        Returns:
+            numpy array of shape (len(events), 50)
+        """
+        return self._extract(self._columns(events, flat=False))
+
+    def extract_rows(self, rows: List[Dict]) -> np.ndarray:
+        """
+        Extract features for flat query rows.
+
+        Same as extract_batch, but the geo and threat columns are read from
+        the row itself (as returned by fetch_training_data) instead of
+        nested 'geo'/'threat' dicts.
+
+        Args:
+            rows: Flat event rows with joined geo/threat columns
+
+        Returns:
+            numpy array of shape (len(rows), 50)
+        """
+        return self._extract(self._columns(rows, flat=True))
+
+    def prepare(self, events: List[Dict]) -> Dict:
+        """
+        Pull a chunk of events into compact columns, skipping bad rows.
+
+        For callers that extract over several chunks at once: the columns
+        take a fraction of the memory of the event dicts, which can be
+        dropped right away. Events whose fields can't be parsed are left
+        out (listed in 'kept' by position) instead of failing the chunk.
+
+        Args:
+            events: Event dicts as accepted by FeatureExtractor.extract
+
+        Returns:
+            Columns for extract_prepared(); 'kept' holds the positions of
+            the events they cover
+        """
+        return self._columns(events, flat=False, skip_invalid=True)
+
+    def extract_prepared(self, parts: List[Dict]) -> np.ndarray:
+        """
+        Extract features for chunks prepared with prepare(), as one batch.
+
+        Args:
+            parts: Column dicts from prepare(), in chunk order
+
+        Returns:
+            numpy array with one row per kept event, in chunk order
+        """
+        parts = [part for part in parts if len(part['t'])]
+        if not parts:
+            return self._extract({'t': np.zeros(0, dtype=np.int64)})
+        cols = {}
+        for key, value in parts[0].items():
+            if key == 'kept':
+                continue
+            if isinstance(value, np.ndarray):
+                cols[key] = np.concatenate([part[key] for part in parts])
+            else:
+                cols[key] = [item for part in parts for item in part[key]]
+        return self._extract(cols)
+
+    def _extract(self, cols: Dict) -> np.ndarray:
+        """Compute the feature matrix from extracted columns (any order)"""
+        n = len(cols['t'])
+        if n == 0:
+            return np.zeros((0, len(self.get_feature_names())), dtype=np.float32)
+
+        # The per-IP windows need time order; stable, so ties keep input order
+        order = np.argsort(cols['t'], kind='stable')
+        if np.any(order != np.arange(n)):
+            sorted_out = self._extract(_take_columns(cols, order))
+            out = np.empty_like(sorted_out)
+            out[order] = sorted_out
+            return out
+
+        out = np.zeros((n, 50), dtype=np.float64)
+
+        # === TEMPORAL FEATURES (6) ===
+        hour = cols['hour']
+        weekday = cols['weekday']
+        is_weekend = weekday >= 5
+        out[:, 0] = hour / 24.0
+        out[:, 1] = cols['minute'] / 60.0
+        out[:, 2] = weekday / 6.0
+        out[:, 3] = is_weekend
+        out[:, 4] = (hour >= 9) & (hour <= 17) & ~is_weekend
+        out[:, 5] = (hour < 6) | (hour > 22)
+
+        # === EVENT TYPE FEATURES (5) ===
+        out[:, 6] = cols['is_failed']
+        out[:, 7] = cols['is_success']
+        out[:, 8:11] = cols['reason_features']
+
+        # === GEOGRAPHIC FEATURES (lat, lon, country) ===
+        out[:, 11] = cols['lat'] / 90.0
+        out[:, 12] = cols['lon'] / 180.0
+        out[:, 13:15] = cols['country_features']
+
+        # === USERNAME FEATURES (6) ===
+        out[:, 17:23] = cols['username_features']
+
+        # === NETWORK FLAGS FEATURES (5) ===
+        out[:, 32:37] = cols['network_flags']
+
+        # === THREAT REPUTATION FEATURES (3) ===
+        out[:, 37] = cols['abuse'] / 100.0
+        vt_total = cols['vt_total']
+        out[:, 38] = np.divide(cols['vt_pos'], vt_total, out=np.zeros(n), where=vt_total > 0)
+        out[:, 39] = cols['threat_level']
+
+        # === PATTERN: sequential username ===
+        out[:, 40] = cols['is_sequential']
+
+        # === GREYNOISE ===
+        out[:, 48] = cols['greynoise']
+
+        # Per-IP history features (geo distance, IP behavior, pattern, advanced)
+        self._ip_features(cols, out)
+
+        # Per-username time deviation
+        out[:, 49] = self._user_time_deviation(cols)
+
+        return out.astype(np.float32)
+
+    def _columns(self, events: List[Dict], flat: bool,
+                 skip_invalid: bool = False) -> Dict[str, np.ndarray]:
+        """Pull the fields the features need into flat arrays"""
+        n = len(events)
+        streaming = self._streaming
+        valid = np.ones(n, dtype=bool)
+
+        timestamps = []
+        ips = []
+        event_types = []
+        reasons = []
+        usernames = []
+        servers = []
+        countries = []
+        threat_levels = []
+        lat = np.zeros(n)
+        lon = np.zeros(n)
+        has_loc = np.zeros(n, dtype=bool)
+        network_flags = np.zeros((n, 5))
+        abuse = np.zeros(n)
+        vt_pos = np.zeros(n)
+        vt_total = np.zeros(n)
+        greynoise = np.zeros(n)
+
+        for i, event in enumerate(events):
+            try:
+                if flat:
+                    geo = threat = event
+                else:
+                    geo = event.get('geo', {}) or {}
+                    threat = event.get('threat', {}) or {}
+
+                # Numeric fields first: a bad row fails before any list grows
+                timestamp = streaming._parse_timestamp(event.get('timestamp')).replace(tzinfo=None)
+                lat[i] = float(geo.get('latitude', 0) or 0)
+                lon[i] = float(geo.get('longitude', 0) or 0)
+                abuse[i] = float(threat.get('abuseipdb_score', 0) or 0)
+                vt_pos[i] = int(threat.get('virustotal_positives', 0) or 0)
+                vt_total[i] = int(threat.get('virustotal_total', 0) or 0)
+            except (TypeError, ValueError, AttributeError):
+                if not skip_invalid:
+                    raise
+                valid[i] = False
+                timestamps.append(datetime.min)
+                ips.append('')
+                event_types.append('')
+                reasons.append(('', ''))
+                usernames.append(None)
+                servers.append(None)
+                countries.append('')
+                threat_levels.append('')
+                continue
+
+            timestamps.append(timestamp)
+            ips.append(event.get('source_ip_text', '') or '')
+            event_types.append(str(event.get('event_type', '')).lower())
+            reasons.append((str(event.get('failure_reason', '')).lower(), event.get('failure_reason', '')))
+            usernames.append(event.get('target_username'))
+            servers.append(event.get('target_server'))
+            countries.append(geo.get('country_code', '') or '')
+            threat_levels.append(str(threat.get('overall_threat_level', '') or '').lower())
+
+            has_loc[i] = bool(geo.get('latitude') and geo.get('longitude'))
+            network_flags[i] = (
+                bool(geo.get('is_proxy')), bool(geo.get('is_vpn')), bool(geo.get('is_tor')),
+                bool(geo.get('is_datacenter')), bool(geo.get('is_hosting'))
+            )
+            if threat.get('greynoise_noise') is True:
+                greynoise[i] = 1.0
+            elif threat.get('greynoise_riot') is True:
+                greynoise[i] = -0.5
+
+        t64 = np.array(timestamps, dtype='datetime64[us]')
+        days = t64.astype('datetime64[D]')
+        cols = {
+            't': t64.astype(np.int64),
+            'hour': (t64.astype('datetime64[h]') - days).astype(np.int64),
+            'minute': (t64.astype('datetime64[m]') - t64.astype('datetime64[h]')).astype(np.int64),
+            'weekday': (days.astype(np.int64) + 3) % 7,  # 1970-01-01 was a Thursday
+            'lat': lat,
+            'lon': lon,
+            'has_loc': has_loc,
+            'network_flags': network_flags,
+            'abuse': abuse,
+            'vt_pos': vt_pos,
+            'vt_total': vt_total,
+            'greynoise': greynoise,
+            'ip': ips,
+            'has_ip': np.array([bool(ip) for ip in ips]),
+            'username': usernames,
+            'server': servers
+        }
+
+        # String-derived features are computed once per distinct value
+        def per_value(values, fn, width):
+            table = {}
+            result = np.zeros((n, width))
+            for i, value in enumerate(values):
+                row = table.get(value)
+                if row is None:
+                    row = table[value] = fn(value)
+                result[i] = row
+            return result
+
+        def event_type_features(event_type):
+            return (
+                1 if 'failed' in event_type else 0,
+                1 if 'success' in event_type or 'accepted' in event_type else 0
+            )
+
+        def reason_features(reason):
+            lowered, raw = reason
+            return (
+                1 if 'invalid_user' in lowered or 'invalid user' in lowered else 0,
+                1 if 'invalid_password' in lowered or 'password' in lowered else 0,
+                REASON_MAP.get(raw, 0.0)
+            )
+
+        def country_features(country_code):
+            return (
+                1 if country_code in FeatureExtractor.HIGH_RISK_COUNTRIES else 0,
+                1 if not country_code or country_code == 'Unknown' else 0
+            )
+
+        def username_features(raw):
+            original = str(raw or '')
+            username = original.lower()
+            return (
+                1 if username == 'root' else 0,
+                1 if username in FeatureExtractor.MALICIOUS_USERNAMES else 0,
+                1 if username in FeatureExtractor.SYSTEM_ACCOUNTS else 0,
+                streaming._calculate_entropy(username) / 4.0,
+                min(len(username), 32) / 32.0,
+                1 if any(c.isdigit() for c in username) else 0,
+                1 if len(original) > 1 and original[-1].isdigit() and original[:-1].isalpha() else 0
+            )
+
+        event_type_cols = per_value(event_types, event_type_features, 2)
+        cols['is_failed'] = event_type_cols[:, 0].astype(bool)
+        cols['is_success'] = event_type_cols[:, 1].astype(bool)
+        cols['reason_features'] = per_value(reasons, reason_features, 3)
+        cols['country_features'] = per_value(countries, country_features, 2)
+        user_cols = per_value(usernames, username_features, 7)
+        cols['username_features'] = user_cols[:, :6]
+        cols['is_sequential'] = user_cols[:, 6]
+        cols['threat_level'] = per_value(
+            threat_levels, lambda level: (THREAT_LEVEL_MAP.get(level, 0.5),), 1
+        )[:, 0]
+
+        if skip_invalid:
+            kept = np.flatnonzero(valid)
+            cols = _take_columns(cols, kept) if len(kept) < n else cols
+            cols['kept'] = kept
+        return cols
+
+    def _ip_groups(self, cols: Dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Order events by (IP history, arrival) and mark where each history starts.
+
+        A history restarts when the streaming extractor would have evicted
+        the IP for idling past the TTL. Events without an IP never get a
+        history, so each one is its own group.
+
+        Returns:
+            (permutation, group id, group start position) in sorted order
+        """
+        n = len(cols['ip'])
+        t = cols['t']
+        order = np.arange(n)
+
+        ip_values, ip_codes = np.unique(np.array(cols['ip'], dtype=object).astype(str), return_inverse=True)
+        has_ip = cols['has_ip']
+        ip_key = np.where(has_ip, ip_codes, len(ip_values) + order)
+
+        perm = np.lexsort((order, ip_key))
+        key_s = ip_key[perm]
+        t_s = t[perm]
+
+        new_group = np.ones(n, dtype=bool)
+        new_group[1:] = key_s[1:] != key_s[:-1]
+
+        if self.ttl_us:
+            # Newest event time seen (events with an IP) before each event;
+            # like FeatureExtractor.touched, times are capped at the wall clock
+            t_touch = np.minimum(t, int(time.time() * US_PER_SEC))
+            touched = np.where(has_ip, t_touch, np.iinfo(np.int64).min)
+            newest_before = np.empty(n, dtype=np.int64)
+            newest_before[0] = np.iinfo(np.int64).min
+            newest_before[1:] = np.maximum.accumulate(touched)[:-1]
+            newest_s = newest_before[perm]
+            touch_s = t_touch[perm]
+            expired = np.zeros(n, dtype=bool)
+            expired[1:] = newest_s[1:] > touch_s[:-1] + self.ttl_us
+            new_group |= expired
+
+        group = np.cumsum(new_group) - 1
+        positions = np.arange(n)
+        group_start = np.maximum.accumulate(np.where(new_group, positions, 0))
+        return perm, group, group_start
+
+    @staticmethod
+    def _window_counts(group: np.ndarray, group_start: np.ndarray, t_s: np.ndarray,
+                       mark: np.ndarray, cutoff: np.ndarray) -> np.ndarray:
+        """
+        Marked events earlier in the same group with time after cutoff.
+
+        Relies on times being non-decreasing within each group, so the
+        marked events at or before a cutoff are a prefix of the group's.
+        """
+        n = len(t_s)
+        prior = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(mark, out=prior[1:])
+        before_group = prior[group_start]
+        prior_in_group = prior[:n] - before_group
+
+        # Rank-compress times so (group, time) fits one sortable int64 key
+        unique_t = np.unique(t_s)
+        stride = len(unique_t) + 2
+        marked = np.flatnonzero(mark)
+        marked_keys = group[marked] * stride + np.searchsorted(unique_t, t_s[marked])
+        cutoff_rank = np.searchsorted(unique_t, cutoff, side='right') - 1
+        at_or_before = np.searchsorted(marked_keys, group * stride + cutoff_rank, side='right') - before_group
+
+        return prior_in_group - np.minimum(at_or_before, prior_in_group)
+
+    @staticmethod
+    def _last_prior(group_start: np.ndarray, mark: np.ndarray) -> np.ndarray:
+        """Position of the latest earlier marked event in the same group, or -1"""
+        n = len(mark)
+        positions = np.arange(n)
+        last = np.maximum.accumulate(np.where(mark, positions, -1))
+        prev = np.full(n, -1, dtype=np.int64)
+        prev[1:] = last[:-1]
+        return np.where(prev >= group_start, prev, -1)
+
+    @staticmethod
+    def _distinct_prior(group: np.ndarray, group_start: np.ndarray, values: List) -> np.ndarray:
+        """Distinct truthy values seen earlier in the same group"""
+        n = len(values)
+        present = np.array([bool(v) for v in values])
+        codes = np.zeros(n, dtype=np.int64)
+        if present.any():
+            _, codes[present] = np.unique(
+                np.array([str(v) for v, p in zip(values, present) if p], dtype=object).astype(str),
+                return_inverse=True
+            )
+        key = group * (codes.max() + 2) + codes
+        first = np.zeros(n, dtype=bool)
+        present_pos = np.flatnonzero(present)
+        _, first_idx = np.unique(key[present_pos], return_index=True)
+        first[present_pos[first_idx]] = True
+
+        prior = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(first, out=prior[1:])
+        return prior[:n] - prior[group_start]
+
+    @staticmethod
+    def _haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+        """Distance between coordinate arrays in km"""
+        lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 6371 * (2 * np.arcsin(np.sqrt(a)))
+
+    def _ip_features(self, cols: Dict, out: np.ndarray):
+        """Fill the features that depend on per-IP history"""
+        perm, group, group_start = self._ip_groups(cols)
+        n = len(perm)
+        positions = np.arange(n)
+
+        t_s = cols['t'][perm]
+        failed_s = cols['is_failed'][perm]
+        success_s = cols['is_success'][perm]
+        # History records a success only when the event is not also a failure
+        hist_success_s = success_s & ~failed_s
+        has_loc_s = cols['has_loc'][perm]
+        lat_s = cols['lat'][perm]
+        lon_s = cols['lon'][perm]
+        usernames_s = [cols['username'][i] for i in perm]
+        servers_s = [cols['server'][i] for i in perm]
+
+        feats = np.zeros((n, 50))
+
+        # --- Failure / success timestamp deques ---
+        def window(mark, seconds):
+            return self._window_counts(group, group_start, t_s, mark, t_s - seconds * US_PER_SEC)
+
+        fails_hour = window(failed_s, 3600)
+        fails_10min = window(failed_s, 600)
+        fails_minute = window(failed_s, 60)
+
+        def deque_state(mark):
+            """Length and first/last times of the 24h deque before each event"""
+            last = self._last_prior(group_start, mark)
+            has_last = last >= 0
+            last_t = np.where(has_last, t_s[np.maximum(last, 0)], 0)
+            # Kept entries: after (latest entry - 24h), capped to the newest ones
+            kept = self._window_counts(group, group_start, t_s, mark,
+                                       last_t - int(HISTORY_WINDOW.total_seconds() * US_PER_SEC))
+            kept = np.where(has_last, np.minimum(kept, ML_HISTORY_MAX_ATTEMPTS), 0)
+
+            marked = np.flatnonzero(mark)
+            prior = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(mark, out=prior[1:])
+            first_idx = marked[np.clip(prior[:n] - kept, 0, max(len(marked) - 1, 0))] if len(marked) else positions
+            first_t = t_s[first_idx]
+            return kept, first_t, last_t
+
+        failed_len, failed_first, failed_last = deque_state(failed_s)
+        success_len, _, _ = deque_state(hist_success_s)
+
+        # --- Distinct usernames / servers ---
+        unique_users = np.minimum(self._distinct_prior(group, group_start, usernames_s), MAX_TRACKED_USERNAMES)
+        unique_servers = np.minimum(self._distinct_prior(group, group_start, servers_s), MAX_TRACKED_SERVERS)
+
+        # --- First seen ---
+        seen_before = positions > group_start
+        since_first_us = t_s - t_s[group_start]
+
+        # --- Consecutive failures before each event ---
+        prior_fail = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(failed_s, out=prior_fail[1:])
+        last_success = self._last_prior(group_start, hist_success_s)
+        run_start = np.where(last_success >= 0, last_success + 1, group_start)
+        consecutive = prior_fail[:n] - prior_fail[run_start]
+
+        # --- Last location ---
+        last_loc = self._last_prior(group_start, has_loc_s)
+        has_last_loc = last_loc >= 0
+        loc_idx = np.maximum(last_loc, 0)
+        prev_lat = lat_s[loc_idx]
+        prev_lon = lon_s[loc_idx]
+        prev_loc_t = t_s[loc_idx]
+
+        # Geographic: distance from previous location
+        distance_km = self._haversine(prev_lat, prev_lon, lat_s, lon_s)
+        with_distance = has_last_loc & has_loc_s
+        distance = np.where(with_distance, distance_km / 20000.0, 0.0)
+        feats[:, 15] = distance
+        feats[:, 16] = with_distance & (distance > 0.1)
+
+        # IP behavior (9)
+        feats[:, 23] = np.minimum(fails_hour, 100) / 100.0
+        feats[:, 24] = np.minimum(fails_10min, 50) / 50.0
+        feats[:, 25] = np.minimum(unique_users, 50) / 50.0
+        feats[:, 26] = np.minimum(unique_servers, 20) / 20.0
+        total = failed_len + success_len
+        feats[:, 27] = np.divide(success_len, total, out=np.full(n, 0.5), where=total > 0)
+        feats[:, 28] = np.where(seen_before, np.minimum(since_first_us / US_PER_SEC / 3600.0, 168) / 168.0, 0.0)
+        mean_interval = np.divide((failed_last - failed_first) / US_PER_SEC, failed_len - 1,
+                                  out=np.zeros(n), where=failed_len > 1)
+        feats[:, 29] = np.where(failed_len > 1, np.minimum(mean_interval, 3600) / 3600.0, 0.0)
+        feats[:, 30] = fails_10min / 10.0
+        feats[:, 31] = ~seen_before
+
+        # Pattern: distributed attack
+        feats[:, 41] = (unique_servers > 3) & (fails_hour > 5)
+
+        # Advanced: travel velocity / impossible travel
+        nonzero_loc = (lat_s != 0) & (lon_s != 0)
+        hours_since_loc = (t_s - prev_loc_t) / US_PER_SEC / 3600.0
+        moving = has_last_loc & nonzero_loc & (hours_since_loc > 0.001)
+        velocity = np.divide(distance_km, hours_since_loc, out=np.zeros(n), where=moving)
+        feats[:, 42] = np.where(moving, np.minimum(velocity / 5000.0, 1.0), 0.0)
+        feats[:, 43] = moving & (velocity > 1000)
+
+        # Advanced: success after failures
+        brute_success = success_s & (consecutive >= 5)
+        feats[:, 44] = np.where(brute_success, np.minimum(consecutive / 20.0, 1.0), 0.0)
+        feats[:, 45] = brute_success
+
+        # Advanced: servers accessed, attempts per second
+        feats[:, 46] = np.minimum(unique_servers / 10.0, 1.0)
+        feats[:, 47] = np.where(fails_minute > 1, np.minimum(fails_minute / 60.0, 1.0), 0.0)
+
+        history_cols = [15, 16, 23, 24, 25, 26, 27, 28, 29, 30, 31, 41, 42, 43, 44, 45, 46, 47]
+        out[perm[:, None], history_cols] = feats[:, history_cols]
+
+    def _user_time_deviation(self, cols: Dict) -> np.ndarray:
+        """
+        Hours from the username's last 20 login hours (profile carried across calls).
+
+        Every event with a username reads the profile; only events that also
+        have an IP add to it (FeatureExtractor skips history for those).
+
+        Returns:
+            user_time_deviation_hours feature column
+        """
+        n = len(cols['username'])
+        result = np.zeros(n)
+
+        present = np.flatnonzero([bool(u) for u in cols['username']])
+        if len(present) == 0:
+            return result
+        names = [str(cols['username'][i]).lower() for i in present]
+
+        # Carried-over profiles become leading pseudo-events of their username
+        pseudo_names = []
+        pseudo_hours = []
+        for name in sorted(set(names) & self.user_profiles.keys()):
+            typical = list(self.user_profiles[name].get('typical_hours', []))[-PROFILE_HOURS:]
+            pseudo_names.extend([name] * len(typical))
+            pseudo_hours.extend(typical)
+        n_pseudo = len(pseudo_names)
+
+        all_names = np.array(pseudo_names + names, dtype=object).astype(str)
+        all_hours = np.concatenate([np.array(pseudo_hours, dtype=np.int64), cols['hour'][present]])
+        writes = np.concatenate([np.ones(n_pseudo, dtype=bool), cols['has_ip'][present]])
+        arrival = np.arange(len(all_names))
+
+        name_values, name_codes = np.unique(all_names, return_inverse=True)
+        order = np.lexsort((arrival, name_codes))
+        codes_s = name_codes[order]
+        hours_s = all_hours[order]
+        writes_s = writes[order]
+        m = len(order)
+        pos = np.arange(m)
+        starts = np.ones(m, dtype=bool)
+        starts[1:] = codes_s[1:] != codes_s[:-1]
+        group_start = np.maximum.accumulate(np.where(starts, pos, 0))
+
+        # The last 20 profile writes before each row, by writer rank
+        writer_hours = hours_s[writes_s]
+        writers_before = np.zeros(m + 1, dtype=np.int64)
+        np.cumsum(writes_s, out=writers_before[1:])
+        first_writer = writers_before[group_start]
+
+        deviation = np.full(m, np.inf)
+        for lag in range(1, PROFILE_HOURS + 1):
+            idx = writers_before[:m] - lag
+            valid = idx >= first_writer
+            if not valid.any():
+                break
+            diff = np.abs(hours_s - writer_hours[np.maximum(idx, 0)])
+            circular = np.minimum(diff, 24 - diff)
+            deviation = np.where(valid, np.minimum(deviation, circular), deviation)
+        deviation = np.where(np.isfinite(deviation), np.minimum(deviation / 12.0, 1.0), 0.0)
+
+        event_rows = arrival[order] >= n_pseudo
+        result[present[arrival[order][event_rows] - n_pseudo]] = deviation[event_rows]
+
+        # Carry each username's last 20 hours into the next call
+        group_starts = np.flatnonzero(starts)
+        group_ends = np.append(group_starts[1:], m)
+        for start, end in zip(group_starts, group_ends):
+            lo, hi = writers_before[start], writers_before[end]
+            if hi == lo:
+                continue
+            name = name_values[codes_s[start]]
+            previous = self.user_profiles.get(name, {})
+            new_writes = int((writes_s[start:end] & event_rows[start:end]).sum())
+            self.user_profiles[name] = {
+                'typical_hours': writer_hours[max(lo, hi - PROFILE_HOURS):hi].tolist(),
+                'login_count': previous.get('login_count', 0) + new_writes
+            }
+
+        return result
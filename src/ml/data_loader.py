@@ -0,0 +1,174 @@
+"""
+SSH Guardian v3.0 - Streaming Training Data Loader
+Pages large training queries with keyset cursors (WHERE key > last) or a
+server-side unbuffered cursor, optionally fetching the next chunk on a
+background thread while the current one is featurized
+"""
+
+import sys
+import queue
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Sequence, Callable, Iterator, Iterable
+
+# Add project paths
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.append(str(PROJECT_ROOT / "dbs"))
+
+from connection import get_connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 10000
+
+_DONE = object()
+
+
+def iter_keyset_chunks(query: str, params: Sequence = (), key_column: str = 'id',
+                       key_field: Optional[str] = None,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE,
+                       connect: Optional[Callable] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield query results in key order, one chunk per round trip.
+
+    Each page is "<query> AND <key_column> > %s ORDER BY <key_column> LIMIT %s",
+    so every page is an index range scan starting where the previous one
+    stopped (LIMIT/OFFSET re-reads all skipped rows on every page).
+
+    Args:
+        query: SELECT ... FROM ... WHERE <filters> (no ORDER BY / LIMIT;
+            use WHERE 1=1 when there is nothing to filter)
+        params: Parameters for the query's placeholders
+        key_column: Unique, indexed column to page on (e.g. 'e.id')
+        key_field: Name of that column in the result rows (default: key_column
+            without its table alias)
+        chunk_size: Rows per page
+        connect: Connection factory (default: the shared pool)
+
+    Yields:
+        Lists of row dicts, at most chunk_size long
+    """
+    connect = connect or get_connection
+    key_field = key_field or key_column.split('.')[-1]
+    page_query = f"{query} AND {key_column} > %s ORDER BY {key_column} LIMIT %s"
+    last_key = None
+
+    while True:
+        conn = connect()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            if last_key is None:
+                # First page: no lower bound (works for any key type)
+                cursor.execute(f"{query} ORDER BY {key_column} LIMIT %s", (*params, chunk_size))
+            else:
+                cursor.execute(page_query, (*params, last_key, chunk_size))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+        if not rows:
+            return
+
+        last_key = rows[-1][key_field]
+        yield rows
+
+        if len(rows) < chunk_size:
+            return
+
+
+def iter_streamed_chunks(query: str, params: Sequence = (),
+                         chunk_size: int = DEFAULT_CHUNK_SIZE,
+                         connect: Optional[Callable] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield query results from a single server-side (unbuffered) cursor.
+
+    For sources without a usable key column. The query runs once and rows
+    are read off the socket chunk by chunk; the connection stays busy until
+    the generator finishes or is closed.
+
+    Args:
+        query: Complete SELECT statement
+        params: Parameters for the query's placeholders
+        chunk_size: Rows per chunk
+        connect: Connection factory (default: the shared pool)
+
+    Yields:
+        Lists of row dicts, at most chunk_size long
+    """
+    conn = (connect or get_connection)()
+    cursor = conn.cursor(dictionary=True, buffered=False)
+    try:
+        cursor.execute(query, tuple(params))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        try:
+            # Stopped early: drain the result so the pooled connection is reusable
+            if conn.unread_result:
+                conn.consume_results()
+            cursor.close()
+        finally:
+            conn.close()
+
+
+def prefetched(chunks: Iterable, depth: int = 1) -> Iterator:
+    """
+    Run a chunk iterator on a background thread, keeping up to `depth`
+    chunks ready while the caller processes the current one.
+
+    Exceptions raised by the producer are re-raised in the caller. Closing
+    the returned generator (or breaking out of the loop) stops the producer.
+
+    Args:
+        chunks: Iterator/iterable of chunks (e.g. iter_keyset_chunks(...))
+        depth: Chunks to fetch ahead
+
+    Yields:
+        The chunks of `chunks`, in order
+    """
+    ready = queue.Queue(maxsize=max(depth, 1))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        source = iter(chunks)
+        try:
+            for chunk in source:
+                if not put(chunk):
+                    break
+        except BaseException as e:
+            put(e)
+            return
+        finally:
+            close = getattr(source, 'close', None)
+            if close:
+                close()
+        put(_DONE)
+
+    producer = threading.Thread(target=produce, name='training-data-prefetch', daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            item = ready.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join(timeout=5)
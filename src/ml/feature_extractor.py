@@ -6,9 +6,12 @@ Extracts 40+ features from SSH authentication events for ML prediction
 import numpy as np
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
-from collections import defaultdict
+from collections import OrderedDict, deque
+from bisect import bisect_right
 import math
+import os
 import sys
+import time
 from pathlib import Path
 
 # Add project paths
@@ -17,6 +20,63 @@ sys.path.append(str(PROJECT_ROOT / "dbs"))
 
 from connection import get_connection
 
+# Per-IP history bounds. IPs are dropped least-recently-seen first once
+# ML_HISTORY_MAX_IPS are tracked, or when not seen for ML_HISTORY_TTL_HOURS
+# (event time); ML_HISTORY_MAX_ATTEMPTS caps the 24h timestamps per IP
+ML_HISTORY_MAX_IPS = int(os.getenv('ML_HISTORY_MAX_IPS', 50000))
+ML_HISTORY_TTL_HOURS = float(os.getenv('ML_HISTORY_TTL_HOURS', 168))
+ML_HISTORY_MAX_ATTEMPTS = int(os.getenv('ML_HISTORY_MAX_ATTEMPTS', 5000))
+ML_USER_PROFILES_MAX = int(os.getenv('ML_USER_PROFILES_MAX', 50000))
+
+HISTORY_WINDOW = timedelta(hours=24)
+
+# Distinct usernames/servers kept per IP; the features saturate at 50 and 20
+MAX_TRACKED_USERNAMES = 64
+MAX_TRACKED_SERVERS = 32
+
+
+class _IPHistory:
+    """Behavior state for one source IP (timestamp deques kept sorted)"""
+
+    __slots__ = (
+        'failed_attempts', 'successful_logins', 'unique_usernames', 'unique_servers',
+        'first_seen', 'last_seen', 'last_location', 'last_location_time',
+        'consecutive_failures', 'touched'
+    )
+
+    def __init__(self):
+        self.failed_attempts = deque()
+        self.successful_logins = deque()
+        self.unique_usernames = set()
+        self.unique_servers = set()
+        self.first_seen = None
+        self.last_seen = None
+        self.last_location = None
+        self.last_location_time = None
+        self.consecutive_failures = 0
+        self.touched = None  # epoch of last_seen (at most wall clock), for TTL eviction
+
+
+def _insert_sorted(times: deque, timestamp: datetime):
+    """Add a timestamp keeping the deque ordered (appends unless out of order)"""
+    if not times or timestamp >= times[-1]:
+        times.append(timestamp)
+    else:
+        times.insert(bisect_right(times, timestamp), timestamp)
+    while len(times) > ML_HISTORY_MAX_ATTEMPTS:
+        times.popleft()
+
+
+def _expire(times: deque, cutoff: datetime):
+    """Drop timestamps at or before cutoff"""
+    while times and times[0] <= cutoff:
+        times.popleft()
+
+
+def _count_after(times: deque, cutoff: datetime) -> int:
+    """Number of timestamps after cutoff"""
+    return len(times) - bisect_right(times, cutoff)
+
 
 class FeatureExtractor:
     """
@@ -42,23 +102,59 @@ class FeatureExtractor:
         'CN', 'RU', 'KP', 'IR', 'VN', 'UA', 'PK', 'IN', 'BR', 'ID'
     }
 
-    def __init__(self):
-        """Initialize the feature extractor"""
-        # IP history tracking (in-memory for session)
-        self.ip_history = defaultdict(lambda: {
-            'failed_attempts': [],
-            'successful_logins': [],
-            'unique_usernames': set(),
-            'unique_servers': set(),
-            'first_seen': None,
-            'last_seen': None,
-            'last_location': None,
-            'last_location_time': None,
-            'consecutive_failures': 0
-        })
-
-        # User login history for time deviation detection
-        self.user_profiles = {}
+    def __init__(self, max_ips: Optional[int] = None, ttl_hours: Optional[float] = None):
+        """
+        Initialize the feature extractor
+
+        Args:
+            max_ips: Max IPs tracked in history (default ML_HISTORY_MAX_IPS)
+            ttl_hours: Drop IPs not seen for this long (default ML_HISTORY_TTL_HOURS, 0 = never)
+        """
+        self.max_ips = max_ips or ML_HISTORY_MAX_IPS
+        ttl_hours = ML_HISTORY_TTL_HOURS if ttl_hours is None else ttl_hours
+        self.ttl_sec = ttl_hours * 3600 if ttl_hours else None
+
+        # IP history tracking (in-memory for session), least recently seen first
+        self.ip_history: "OrderedDict[str, _IPHistory]" = OrderedDict()
+
+        # User login history for time deviation detection, least recently seen first
+        self.user_profiles = OrderedDict()
+
+        self.history_stats = {
+            'evicted_lru': 0,
+            'evicted_ttl': 0,
+            'user_profiles_evicted': 0
+        }
+
+    def _get_history(self, source_ip: str) -> _IPHistory:
+        """History for an IP, created on first use (enforcing the IP cap)"""
+        history = self.ip_history.get(source_ip)
+        if history is None:
+            history = self.ip_history[source_ip] = _IPHistory()
+            while len(self.ip_history) > self.max_ips:
+                self.ip_history.popitem(last=False)
+                self.history_stats['evicted_lru'] += 1
+        return history
+
+    def _expire_idle_ips(self, touched: float):
+        """
+        Drop IPs not seen within the TTL before the current event.
+
+        The cutoff follows the current event rather than the newest time
+        ever seen, and touched is capped at the wall clock, so a single
+        future-dated event (mis-parsed year, skewed agent clock) can't push
+        every other IP past the cutoff.
+        """
+        if not self.ttl_sec:
+            return
+        cutoff = touched - self.ttl_sec
+
+        while self.ip_history:
+            oldest = next(iter(self.ip_history.values()))
+            if oldest.touched is not None and oldest.touched >= cutoff:
+                break
+            self.ip_history.popitem(last=False)
+            self.history_stats['evicted_ttl'] += 1
 
     def extract(self, event: Dict) -> np.ndarray:
         """
@@ -181,7 +277,7 @@ class FeatureExtractor:
 
         # Distance from previous location (impossible travel detection)
         source_ip = event.get('source_ip_text', '')
-        last_loc = self.ip_history[source_ip].get('last_location')
+        last_loc = self._get_history(source_ip).last_location
 
         distance = 0.0
         is_new_location = 0
@@ -217,39 +313,37 @@ class FeatureExtractor:
         - success_rate, hours_since_first_seen, avg_interval, attempts_per_minute, is_first_time
         """
         source_ip = event.get('source_ip_text', '')
-        history = self.ip_history[source_ip]
+        history = self._get_history(source_ip)
 
         # Count recent failures
-        recent_fails_hour = len([t for t in history['failed_attempts']
-                                if (timestamp - t).total_seconds() < 3600])
-        recent_fails_10min = len([t for t in history['failed_attempts']
-                                 if (timestamp - t).total_seconds() < 600])
+        recent_fails_hour = _count_after(history.failed_attempts, timestamp - timedelta(seconds=3600))
+        recent_fails_10min = _count_after(history.failed_attempts, timestamp - timedelta(seconds=600))
 
         # Normalize (cap at reasonable max)
         fails_hour = min(recent_fails_hour, 100) / 100.0
         fails_10min = min(recent_fails_10min, 50) / 50.0
 
         # Unique targets
-        unique_users = min(len(history['unique_usernames']), 50) / 50.0
-        unique_servers = min(len(history['unique_servers']), 20) / 20.0
+        unique_users = min(len(history.unique_usernames), 50) / 50.0
+        unique_servers = min(len(history.unique_servers), 20) / 20.0
 
         # Success rate
-        total = len(history['failed_attempts']) + len(history['successful_logins'])
-        success_rate = len(history['successful_logins']) / total if total > 0 else 0.5
+        total = len(history.failed_attempts) + len(history.successful_logins)
+        success_rate = len(history.successful_logins) / total if total > 0 else 0.5
 
         # Time since first seen
-        if history['first_seen']:
-            hours_since_first = (timestamp - history['first_seen']).total_seconds() / 3600.0
+        if history.first_seen:
+            hours_since_first = (timestamp - history.first_seen).total_seconds() / 3600.0
             hours_since_first = min(hours_since_first, 168) / 168.0  # Cap at 1 week
         else:
             hours_since_first = 0.0
 
-        # Average interval between attempts
+        # Average interval between attempts (sorted, so the gaps sum to last - first)
         avg_interval = 0.0
-        if len(history['failed_attempts']) > 1:
-            times = sorted(history['failed_attempts'])
-            intervals = [(times[i] - times[i-1]).total_seconds() for i in range(1, len(times))]
-            avg_interval = min(np.mean(intervals), 3600) / 3600.0  # Cap at 1 hour
+        times = history.failed_attempts
+        if len(times) > 1:
+            mean_interval = (times[-1] - times[0]).total_seconds() / (len(times) - 1)
+            avg_interval = min(mean_interval, 3600) / 3600.0  # Cap at 1 hour
 
         # Attempts per minute
         if recent_fails_10min > 0:
@@ -258,7 +352,7 @@ class FeatureExtractor:
             attempts_per_min = 0.0
 
         # Is this the first time seeing this IP?
-        is_first_time = 1 if not history['first_seen'] else 0
+        is_first_time = 1 if not history.first_seen else 0
 
         return [
             fails_hour, fails_10min, unique_users, unique_servers,
@@ -315,7 +409,7 @@ class FeatureExtractor:
         """
         source_ip = event.get('source_ip_text', '')
         username = str(event.get('target_username', '') or '')
-        history = self.ip_history[source_ip]
+        history = self._get_history(source_ip)
 
         # Sequential username pattern (user1, user2, user3)
         is_sequential = 0
@@ -324,9 +418,8 @@ class FeatureExtractor:
                 is_sequential = 1
 
         # Distributed attack pattern (many servers, many IPs)
-        recent_fails = len([t for t in history['failed_attempts']
-                          if (timestamp - t).total_seconds() < 3600])
-        unique_servers = len(history['unique_servers'])
+        recent_fails = _count_after(history.failed_attempts, timestamp - timedelta(seconds=3600))
+        unique_servers = len(history.unique_servers)
         is_distributed = 1 if unique_servers > 3 and recent_fails > 5 else 0
 
         return [is_sequential, is_distributed]
@@ -342,7 +435,7 @@ class FeatureExtractor:
           is_greynoise_scanner, user_time_deviation_hours
         """
         source_ip = event.get('source_ip_text', '')
-        history = self.ip_history[source_ip]
+        history = self._get_history(source_ip)
         geo = event.get('geo', {}) or {}
         threat = event.get('threat', {}) or {}
         event_type = str(event.get('event_type', '')).lower()
@@ -352,14 +445,14 @@ class FeatureExtractor:
         travel_velocity = 0.0
         is_impossible_travel = 0.0
 
-        if history['last_location'] and history['last_location_time']:
+        if history.last_location and history.last_location_time:
             curr_lat = float(geo.get('latitude', 0) or 0)
             curr_lon = float(geo.get('longitude', 0) or 0)
 
             if curr_lat != 0 and curr_lon != 0:
-                prev_lat, prev_lon = history['last_location']
+                prev_lat, prev_lon = history.last_location
                 distance_km = self._haversine_distance(prev_lat, prev_lon, curr_lat, curr_lon)
-                time_diff_hours = (timestamp - history['last_location_time']).total_seconds() / 3600.0
+                time_diff_hours = (timestamp - history.last_location_time).total_seconds() / 3600.0
 
                 if time_diff_hours > 0.001:  # At least 3.6 seconds
                     velocity_kmh = distance_km / time_diff_hours
@@ -372,7 +465,7 @@ class FeatureExtractor:
         is_brute_success = 0.0
 
         is_success = 'success' in event_type or 'accepted' in event_type
-        consecutive_failures = history.get('consecutive_failures', 0)
+        consecutive_failures = history.consecutive_failures
 
         if is_success and consecutive_failures >= 5:
             is_brute_success = 1.0
@@ -383,17 +476,16 @@ class FeatureExtractor:
         recent_servers = set()
 
         # Check unique servers from recent attempts
-        if len(history['unique_servers']) > 0:
-            servers_10min = min(len(history['unique_servers']) / 10.0, 1.0)
+        if len(history.unique_servers) > 0:
+            servers_10min = min(len(history.unique_servers) / 10.0, 1.0)
 
         # === Feature 48: Attempts Per Second (Rapid Attack / DDoS) ===
         attempts_per_second = 0.0
 
-        recent_attempts = [t for t in history['failed_attempts']
-                         if (timestamp - t).total_seconds() < 60]
-        if len(recent_attempts) > 1:
+        recent_attempts = _count_after(history.failed_attempts, timestamp - timedelta(seconds=60))
+        if recent_attempts > 1:
             # Calculate rate over the last minute
-            attempts_per_second = min(len(recent_attempts) / 60.0, 1.0)
+            attempts_per_second = min(recent_attempts / 60.0, 1.0)
 
         # === Feature 49: GreyNoise Scanner (Internet Noise Detection) ===
         is_greynoise_scanner = 0.0
@@ -441,45 +533,48 @@ class FeatureExtractor:
         if not source_ip:
             return
 
-        history = self.ip_history[source_ip]
+        history = self._get_history(source_ip)
+        self.ip_history.move_to_end(source_ip)
 
         # Update timestamps
-        if not history['first_seen']:
-            history['first_seen'] = timestamp
-        history['last_seen'] = timestamp
+        if not history.first_seen:
+            history.first_seen = timestamp
+        history.last_seen = timestamp
+        history.touched = min(timestamp.timestamp(), time.time())
 
         # Track attempts
         event_type = str(event.get('event_type', '')).lower()
         if 'failed' in event_type:
-            history['failed_attempts'].append(timestamp)
+            _insert_sorted(history.failed_attempts, timestamp)
             # Keep only last 24 hours
-            cutoff = timestamp - timedelta(hours=24)
-            history['failed_attempts'] = [t for t in history['failed_attempts'] if t > cutoff]
+            _expire(history.failed_attempts, timestamp - HISTORY_WINDOW)
             # Track consecutive failures for brute force detection
-            history['consecutive_failures'] = history.get('consecutive_failures', 0) + 1
+            history.consecutive_failures += 1
         elif 'success' in event_type or 'accepted' in event_type:
-            history['successful_logins'].append(timestamp)
-            history['successful_logins'] = [t for t in history['successful_logins']
-                                           if t > timestamp - timedelta(hours=24)]
+            _insert_sorted(history.successful_logins, timestamp)
+            _expire(history.successful_logins, timestamp - HISTORY_WINDOW)
             # Reset consecutive failures on success
-            history['consecutive_failures'] = 0
+            history.consecutive_failures = 0
 
         # Track unique targets
         username = event.get('target_username')
         if username:
-            history['unique_usernames'].add(username)
+            if len(history.unique_usernames) < MAX_TRACKED_USERNAMES:
+                history.unique_usernames.add(username)
             # Update user profile for time deviation detection
             self._update_user_profile(username, timestamp)
 
         server = event.get('target_server')
-        if server:
-            history['unique_servers'].add(server)
+        if server and len(history.unique_servers) < MAX_TRACKED_SERVERS:
+            history.unique_servers.add(server)
 
         # Track location with timestamp for velocity calculation
         geo = event.get('geo', {}) or {}
         if geo.get('latitude') and geo.get('longitude'):
-            history['last_location'] = (float(geo['latitude']), float(geo['longitude']))
-            history['last_location_time'] = timestamp
+            history.last_location = (float(geo['latitude']), float(geo['longitude']))
+            history.last_location_time = timestamp
+
+        self._expire_idle_ips(history.touched)
 
     def _update_user_profile(self, username: str, timestamp: datetime):
         """Update user profile for time deviation detection"""
@@ -492,6 +587,11 @@ class FeatureExtractor:
                 'typical_hours': [],
                 'login_count': 0
             }
+            while len(self.user_profiles) > ML_USER_PROFILES_MAX:
+                self.user_profiles.popitem(last=False)
+                self.history_stats['user_profiles_evicted'] += 1
+        else:
+            self.user_profiles.move_to_end(username)
 
         profile = self.user_profiles[username]
         hour = timestamp.hour
@@ -607,9 +707,37 @@ class FeatureExtractor:
         self.ip_history.clear()
 
     def get_statistics(self) -> Dict:
-        """Get statistics about tracked IPs"""
+        """Get statistics about tracked IPs, history memory and evictions"""
+        ips_with_failures = 0
+        ips_with_successes = 0
+        timestamps = 0
+        memory = sys.getsizeof(self.ip_history) + sys.getsizeof(self.user_profiles)
+
+        for ip, history in self.ip_history.items():
+            if history.failed_attempts:
+                ips_with_failures += 1
+            if history.successful_logins:
+                ips_with_successes += 1
+            timestamps += len(history.failed_attempts) + len(history.successful_logins)
+            memory += (
+                sys.getsizeof(ip) + sys.getsizeof(history)
+                + sys.getsizeof(history.failed_attempts) + sys.getsizeof(history.successful_logins)
+                + sys.getsizeof(history.unique_usernames) + sys.getsizeof(history.unique_servers)
+            )
+
+        # datetime objects in the deques (the deque size only covers the pointers)
+        memory += timestamps * sys.getsizeof(datetime.min)
+
         return {
             'total_ips_tracked': len(self.ip_history),
-            'ips_with_failures': sum(1 for h in self.ip_history.values() if h['failed_attempts']),
-            'ips_with_successes': sum(1 for h in self.ip_history.values() if h['successful_logins'])
+            'ips_with_failures': ips_with_failures,
+            'ips_with_successes': ips_with_successes,
+            'timestamps_tracked': timestamps,
+            'user_profiles_tracked': len(self.user_profiles),
+            'approx_memory_bytes': memory,
+            'max_ips': self.max_ips,
+            'ttl_hours': self.ttl_sec / 3600 if self.ttl_sec else None,
+            'evicted_lru': self.history_stats['evicted_lru'],
+            'evicted_ttl': self.history_stats['evicted_ttl'],
+            'user_profiles_evicted': self.history_stats['user_profiles_evicted']
         }
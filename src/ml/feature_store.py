@@ -0,0 +1,296 @@
+"""
+SSH Guardian v3.0 - ML Feature Store
+Persists training feature matrices and labels as per-day .npy shards that
+are memory-mapped on load, so training runs only extract days not seen before
+"""
+
+import os
+import json
+import math
+import shutil
+import hashlib
+import inspect
+import logging
+from pathlib import Path
+from datetime import datetime, date, timedelta
+from typing import Dict, Any, Optional, List, Tuple, Callable
+import numpy as np
+
+from . import feature_extractor, columnar_features
+from .columnar_features import ColumnarFeatureExtractor
+from .feature_extractor import ML_HISTORY_TTL_HOURS
+from .trainer_queries import fetch_training_data, fetch_daily_event_stats
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+
+# Feature store configuration
+ML_FEATURE_STORE_ENABLED = os.getenv('ML_FEATURE_STORE_ENABLED', '1') == '1'
+ML_FEATURE_STORE_DIR = Path(os.getenv('ML_FEATURE_STORE_DIR') or PROJECT_ROOT / 'ml_models' / 'feature_store')
+ML_FEATURE_STORE_LOOKBACK_HOURS = float(os.getenv('ML_FEATURE_STORE_LOOKBACK_HOURS', 24))
+
+STORE_FORMAT = 1
+SHARD_ARRAYS = ('X', 'y', 'ids', 'ts')
+
+
+def _to_us(value) -> int:
+    """datetime -> int64 microseconds since epoch (naive, as stored)"""
+    return int(np.datetime64(value, 'us').astype(np.int64))
+
+
+def _source_digest(obj) -> bytes:
+    """Digest of a module/function's source so code edits invalidate shards"""
+    try:
+        source = inspect.getsource(obj)
+    except (OSError, TypeError):
+        source = getattr(obj, '__qualname__', repr(obj))
+    return hashlib.sha1(source.encode()).digest()
+
+
+def _write_arrays(path: Path, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+    """Write arrays + meta.json to a temp dir and rename it into place"""
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    tmp_path.mkdir(parents=True)
+
+    for name, values in arrays.items():
+        np.save(tmp_path / f'{name}.npy', values)
+    with open(tmp_path / 'meta.json', 'w') as f:
+        json.dump({**meta, 'built_at': datetime.now().isoformat()}, f)
+
+    if path.exists():
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+
+class FeatureStore:
+    """
+    Per-day feature shards for auth_events training windows.
+
+    Layout: <root>/<version>/<all|live>/<YYYY-MM-DD>/{X,y,ids,ts}.npy +
+    meta.json. The version hashes the feature extractor source, the label
+    function, the lookback and the IP history TTL, so any change that would
+    alter a matrix starts a fresh directory instead of mixing shards.
+
+    A finished day is extracted once, with ML_FEATURE_STORE_LOOKBACK_HOURS
+    of earlier events replayed first to warm the per-IP history, and reused
+    while the event count and max id in auth_events are unchanged for that
+    day and for every day its lookback window reaches into (events added to
+    the previous day change the warmed history, so they rebuild it too). The
+    current day is always extracted live and never written. Enrichment
+    rewritten after a day has been cached is not detected; delete that
+    day's directory to force a rebuild.
+    """
+
+    def __init__(self, label_fn: Optional[Callable[[Dict], int]] = None,
+                 root: Optional[Path] = None,
+                 lookback_hours: Optional[float] = None):
+        """
+        Initialize the feature store
+
+        Args:
+            label_fn: Row -> 0/1 label (MLTrainer._determine_label), needed by load()
+            root: Store directory (default ML_FEATURE_STORE_DIR)
+            lookback_hours: History warm-up per day (default ML_FEATURE_STORE_LOOKBACK_HOURS)
+        """
+        self.label_fn = label_fn
+        self.root = Path(root or ML_FEATURE_STORE_DIR)
+        self.lookback_hours = ML_FEATURE_STORE_LOOKBACK_HOURS if lookback_hours is None else lookback_hours
+        self.version = self._version()
+        self.stats = {'days_cached': 0, 'days_built': 0, 'days_live': 0}
+
+    def _version(self) -> str:
+        """Hash of everything that shapes a shard's contents"""
+        digest = hashlib.sha1()
+        digest.update(f'{STORE_FORMAT}/{self.lookback_hours}/{ML_HISTORY_TTL_HOURS}'.encode())
+        digest.update(_source_digest(feature_extractor))
+        digest.update(_source_digest(columnar_features))
+        digest.update(_source_digest(self.label_fn))
+        return digest.hexdigest()[:12]
+
+    def load(self, data_start: datetime, data_end: datetime,
+             include_simulation: bool = True,
+             with_timestamps: bool = False) -> Tuple[np.ndarray, ...]:
+        """
+        Feature matrix, labels and event ids for a training window.
+
+        Args:
+            data_start: Start of the window (inclusive)
+            data_end: End of the window (inclusive)
+            include_simulation: Include simulation events
+            with_timestamps: Also return event timestamps (int64 microseconds)
+
+        Returns:
+            (X, y, event_ids[, timestamps]) in timestamp order. A window
+            inside a single cached day is a read-only memmap view; otherwise
+            shards are concatenated once.
+        """
+        names = SHARD_ARRAYS if with_timestamps else SHARD_ARRAYS[:3]
+        variant = 'all' if include_simulation else 'live'
+        first_day = data_start.date()
+        last_day = data_end.date()
+        lookback_days = math.ceil(self.lookback_hours / 24) if self.lookback_hours > 0 else 0
+        day_stats = fetch_daily_event_stats(
+            datetime.combine(first_day - timedelta(days=lookback_days), datetime.min.time()),
+            datetime.combine(last_day + timedelta(days=1), datetime.min.time()),
+            include_simulation
+        )
+
+        start_us, end_us = _to_us(data_start), _to_us(data_end)
+        today = datetime.now().date()
+        parts = []
+
+        for day in sorted(d for d in day_stats if d >= first_day):
+            if day >= today:
+                shard = self._build_day(day, include_simulation)
+                self.stats['days_live'] += 1
+            else:
+                # Whole days covering the lookback window (a superset of it)
+                lookback = [
+                    [d.isoformat(), *day_stats[d]]
+                    for d in (day - timedelta(days=n) for n in range(lookback_days, 0, -1))
+                    if d in day_stats
+                ]
+                shard = self._get_day(variant, day, include_simulation, *day_stats[day], lookback)
+
+            lo = np.searchsorted(shard['ts'], start_us, side='left')
+            hi = np.searchsorted(shard['ts'], end_us, side='right')
+            if hi > lo:
+                parts.append({name: shard[name][lo:hi] for name in names})
+
+        if not parts:
+            return (np.array([]), np.array([])) + tuple(np.array([], dtype=np.int64) for _ in names[2:])
+        if len(parts) == 1:
+            return tuple(parts[0][name] for name in names)
+        return tuple(np.concatenate([p[name] for p in parts]) for name in names)
+
+    def _get_day(self, variant: str, day: date, include_simulation: bool,
+                 count: int, max_id: int, lookback: List[list]) -> Dict[str, np.ndarray]:
+        """
+        Open a cached day shard, (re)building it when missing or stale.
+
+        Args:
+            variant: 'all' or 'live' (simulation events excluded)
+            day: Day to open
+            include_simulation: Include simulation events when building
+            count: The day's event count in auth_events
+            max_id: The day's highest event id
+            lookback: [day, count, max_id] of the days the lookback reaches into
+
+        Returns:
+            Dict of the shard's arrays (memmaps when cached)
+        """
+        path = self.root / self.version / variant / day.isoformat()
+        shard = self._open_shard(path, count, max_id, lookback)
+        if shard is not None:
+            self.stats['days_cached'] += 1
+            return shard
+
+        arrays = self._build_day(day, include_simulation)
+        if not self.stats['days_built']:
+            self.prune_versions()
+        # Lookback stats were read before the build; a change in between
+        # only makes the next load rebuild the day once more
+        self._write_shard(path, arrays, lookback)
+        self.stats['days_built'] += 1
+        logger.info(f"Feature store: built {variant}/{day} ({len(arrays['ids'])} events)")
+        ids = arrays['ids']
+        return self._open_shard(path, len(ids), int(ids.max()) if len(ids) else 0, lookback) or arrays
+
+    def _build_day(self, day: date, include_simulation: bool) -> Dict[str, np.ndarray]:
+        """Extract one day's features after replaying the lookback window"""
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = day_start + timedelta(days=1) - timedelta(microseconds=1)
+        rows = fetch_training_data(day_start - timedelta(hours=self.lookback_hours),
+                                   day_end, include_simulation)
+
+        ts = (np.array([row['timestamp'] for row in rows], dtype='datetime64[us]').astype(np.int64)
+              if rows else np.array([], dtype=np.int64))
+        keep = ts >= _to_us(day_start)
+        features = ColumnarFeatureExtractor().extract_rows(rows)
+        day_rows = [row for row, kept in zip(rows, keep) if kept]
+
+        return {
+            'X': features[keep],
+            'y': np.array([self.label_fn(row) for row in day_rows], dtype=np.int8),
+            'ids': np.array([row['id'] for row in day_rows], dtype=np.int64),
+            'ts': ts[keep]
+        }
+
+    @staticmethod
+    def _open_shard(path: Path, count: int, max_id: int,
+                    lookback: List[list]) -> Optional[Dict[str, np.ndarray]]:
+        """Memory-map a shard if it exists and matches count/max id and lookback stats"""
+        try:
+            with open(path / 'meta.json') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if meta.get('count') != count or meta.get('max_id') != max_id or meta.get('lookback') != lookback:
+            return None
+
+        mmap_mode = 'r' if count else None
+        return {name: np.load(path / f'{name}.npy', mmap_mode=mmap_mode) for name in SHARD_ARRAYS}
+
+    def _write_shard(self, path: Path, arrays: Dict[str, np.ndarray], lookback: List[list]):
+        """Write a day shard with its count/max id and lookback stats metadata"""
+        ids = arrays['ids']
+        _write_arrays(path, arrays, {
+            'count': int(len(ids)),
+            'max_id': int(ids.max()) if len(ids) else 0,
+            'lookback': lookback,
+            'version': self.version
+        })
+
+    def cached_arrays(self, name: str, fingerprint: Any,
+                      build: Callable[[], Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+        """
+        Memory-mapped arrays for a named dataset, rebuilt when the fingerprint changes.
+
+        For sources other than auth_events (e.g. the ml_training_data tables).
+
+        Args:
+            name: Dataset name (directory under <root>/datasets)
+            fingerprint: JSON-serializable value identifying the source data and extractor
+            build: Returns a dict of arrays when the cache is cold
+
+        Returns:
+            Dict of arrays (read-only memmaps)
+        """
+        path = self.root / 'datasets' / name
+        fingerprint = json.loads(json.dumps(fingerprint, default=str))
+
+        try:
+            with open(path / 'meta.json') as f:
+                meta = json.load(f)
+            if meta.get('fingerprint') == fingerprint:
+                return {key: np.load(path / f'{key}.npy', mmap_mode='r') for key in meta['arrays']}
+        except (OSError, ValueError, KeyError):
+            pass
+
+        arrays = build()
+        _write_arrays(path, arrays, {'fingerprint': fingerprint, 'arrays': list(arrays)})
+        return arrays
+
+    def prune_versions(self) -> List[str]:
+        """Delete shard directories written by other extractor/label versions"""
+        removed = []
+        if not self.root.exists():
+            return removed
+        for entry in self.root.iterdir():
+            if entry.is_dir() and entry.name not in (self.version, 'datasets') and not entry.name.startswith('.'):
+                shutil.rmtree(entry, ignore_errors=True)
+                removed.append(entry.name)
+        return removed
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Store location, version and per-call shard counters"""
+        return {
+            'root': str(self.root),
+            'version': self.version,
+            'lookback_hours': self.lookback_hours,
+            **self.stats
+        }
@@ -0,0 +1,164 @@
+"""
+SSH Guardian v3.0 - Incremental Training Queries
+Database queries for checkpointed incremental model updates
+"""
+
+import sys
+from pathlib import Path
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+# Add project paths
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.append(str(PROJECT_ROOT / "dbs"))
+
+from connection import get_connection
+
+
+def fetch_active_model() -> Optional[Dict[str, Any]]:
+    """
+    Active production model row (the base for the next incremental update).
+
+    Returns:
+        Model row with id, model_name, algorithm, model_path, hyperparameters,
+        training_data_end and promoted_to_production_at, or None
+    """
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        cursor.execute("""
+            SELECT id, model_name, algorithm, model_path, hyperparameters,
+                   training_data_start, training_data_end, promoted_to_production_at
+            FROM ml_models
+            WHERE is_active = TRUE AND status = 'production'
+            ORDER BY promoted_to_production_at DESC
+            LIMIT 1
+        """)
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def fetch_last_promoted_update(model_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Incremental update that produced the given model, if any.
+
+    Args:
+        model_id: Candidate model ID
+
+    Returns:
+        ml_incremental_updates row or None (model came from a full retrain)
+    """
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        cursor.execute("""
+            SELECT id, checkpoint_at, feedback_checkpoint_at
+            FROM ml_incremental_updates
+            WHERE candidate_model_id = %s AND status = 'promoted'
+            ORDER BY id DESC
+            LIMIT 1
+        """, (model_id,))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def fetch_feedback_labels(feedback_since: datetime, window_start: datetime,
+                          feedback_until: datetime) -> List[Dict[str, Any]]:
+    """
+    Latest analyst feedback per event: feedback given since the checkpoint,
+    plus any feedback on events inside the new window.
+
+    Args:
+        feedback_since: Feedback checkpoint (exclusive)
+        window_start: Start of the new-event window
+        feedback_until: Upper bound for feedback_at (inclusive)
+
+    Returns:
+        List of dicts with event_id, event_timestamp, manual_feedback,
+        is_anomaly (the prediction the feedback is about) and feedback_at
+    """
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        cursor.execute("""
+            SELECT m.event_id, e.timestamp AS event_timestamp,
+                   m.manual_feedback, m.is_anomaly, m.feedback_at
+            FROM auth_events_ml m
+            JOIN auth_events e ON e.id = m.event_id
+            JOIN (
+                SELECT event_id, MAX(feedback_at) AS latest
+                FROM auth_events_ml
+                WHERE manual_feedback IS NOT NULL AND feedback_at <= %s
+                GROUP BY event_id
+            ) latest ON latest.event_id = m.event_id AND latest.latest = m.feedback_at
+            WHERE m.manual_feedback IS NOT NULL
+              AND (m.feedback_at > %s OR e.timestamp >= %s)
+        """, (feedback_until, feedback_since, window_start))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def record_incremental_update(update: Dict[str, Any]) -> int:
+    """
+    Insert an ml_incremental_updates row.
+
+    Args:
+        update: Column -> value (status, window_start and checkpoint_at required)
+
+    Returns:
+        New row ID
+
+    Raises:
+        Exception: Database errors
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        columns = list(update)
+        cursor.execute(f"""
+            INSERT INTO ml_incremental_updates ({', '.join(columns)})
+            VALUES ({', '.join(['%s'] * len(columns))})
+        """, tuple(update[c] for c in columns))
+        conn.commit()
+        return cursor.lastrowid
+    except Exception as e:
+        conn.rollback()
+        raise Exception(f"Failed to record incremental update: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def fetch_incremental_updates(limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    Recent incremental updates, newest first.
+
+    Args:
+        limit: Maximum rows
+
+    Returns:
+        List of ml_incremental_updates rows
+    """
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        cursor.execute("""
+            SELECT * FROM ml_incremental_updates
+            ORDER BY id DESC
+            LIMIT %s
+        """, (limit,))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
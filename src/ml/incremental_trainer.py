@@ -0,0 +1,336 @@
+"""
+SSH Guardian v3.0 - Incremental Model Updates
+Updates the active production model with events labelled since its last
+checkpoint plus analyst feedback (warm-started tree ensembles, or
+partial_fit where the estimator supports it), and promotes the result only
+if it beats the active model on a held-out window
+"""
+
+import os
+import copy
+import json
+import logging
+from datetime import datetime, timedelta, time as dt_time
+from typing import Dict, Any, Optional, List, Tuple
+import numpy as np
+
+from .feature_store import FeatureStore
+from .incremental_queries import (
+    fetch_active_model,
+    fetch_last_promoted_update,
+    fetch_feedback_labels,
+    record_incremental_update
+)
+
+logger = logging.getLogger(__name__)
+
+# Incremental update configuration
+ML_INCREMENTAL_MIN_EVENTS = int(os.getenv('ML_INCREMENTAL_MIN_EVENTS', 500))
+ML_INCREMENTAL_MAX_DAYS = float(os.getenv('ML_INCREMENTAL_MAX_DAYS', 7))
+ML_INCREMENTAL_HOLDOUT_FRACTION = float(os.getenv('ML_INCREMENTAL_HOLDOUT_FRACTION', 0.2))
+ML_INCREMENTAL_NEW_TREES = int(os.getenv('ML_INCREMENTAL_NEW_TREES', 25))
+ML_INCREMENTAL_MAX_TREES = int(os.getenv('ML_INCREMENTAL_MAX_TREES', 600))
+ML_INCREMENTAL_FEEDBACK_WEIGHT = float(os.getenv('ML_INCREMENTAL_FEEDBACK_WEIGHT', 5))
+ML_INCREMENTAL_MIN_F1_GAIN = float(os.getenv('ML_INCREMENTAL_MIN_F1_GAIN', 0.0))
+ML_INCREMENTAL_INCLUDE_SIMULATION = os.getenv('ML_INCREMENTAL_INCLUDE_SIMULATION', '0') == '1'
+
+FEEDBACK_LOOKBACK_DAYS = 30  # older feedback is left to the next full retrain
+
+# manual_feedback -> label ('correct' confirms whatever the model predicted)
+FEEDBACK_LABELS = {
+    'confirmed_threat': 1,
+    'false_negative': 1,
+    'false_positive': 0
+}
+
+
+def feedback_label(feedback: str, predicted_anomaly: Any) -> Optional[int]:
+    """Label implied by analyst feedback on a prediction (None = no label)"""
+    if feedback == 'correct':
+        return int(bool(predicted_anomaly))
+    return FEEDBACK_LABELS.get(feedback)
+
+
+def warm_update(model: Any, X: np.ndarray, y: np.ndarray,
+                sample_weight: Optional[np.ndarray] = None,
+                new_trees: Optional[int] = None,
+                max_trees: Optional[int] = None) -> Any:
+    """
+    Return a copy of a fitted model updated with new samples.
+
+    - partial_fit estimators: one partial_fit pass
+    - Random Forest / Extra Trees: new_trees trees grown on the new data are
+      added (warm_start); the oldest trees are dropped beyond max_trees
+    - Gradient Boosting: new_trees boosting stages fitted on the new data
+    - XGBoost: boosting continues from the existing booster
+
+    Args:
+        model: Fitted estimator (left untouched)
+        X: Scaled features of the new samples
+        y: Labels (must contain every class the model knows)
+        sample_weight: Optional per-sample weights
+        new_trees: Trees/stages to add (default ML_INCREMENTAL_NEW_TREES)
+        max_trees: Forest size cap (default ML_INCREMENTAL_MAX_TREES)
+
+    Returns:
+        Updated estimator
+
+    Raises:
+        ValueError: Estimator cannot be updated incrementally
+    """
+    new_trees = new_trees or ML_INCREMENTAL_NEW_TREES
+    max_trees = max_trees or ML_INCREMENTAL_MAX_TREES
+    name = type(model).__name__
+    model = copy.deepcopy(model)
+
+    if hasattr(model, 'partial_fit'):
+        model.partial_fit(X, y, sample_weight=sample_weight)
+
+    elif name in ('RandomForestClassifier', 'ExtraTreesClassifier'):
+        model.set_params(warm_start=True, oob_score=False,
+                         n_estimators=len(model.estimators_) + new_trees)
+        model.fit(X, y, sample_weight=sample_weight)
+        if len(model.estimators_) > max_trees:
+            model.estimators_ = model.estimators_[-max_trees:]
+            model.set_params(n_estimators=max_trees)
+
+    elif name == 'GradientBoostingClassifier':
+        model.set_params(warm_start=True, n_estimators=model.n_estimators_ + new_trees)
+        model.fit(X, y, sample_weight=sample_weight)
+
+    elif name == 'XGBClassifier':
+        from xgboost import XGBClassifier
+        params = model.get_params()
+        params['n_estimators'] = new_trees
+        updated = XGBClassifier(**params)
+        updated.fit(X, y, sample_weight=sample_weight, xgb_model=model.get_booster())
+        model = updated
+
+    else:
+        raise ValueError(f"{name} cannot be updated incrementally; run a full retrain")
+
+    return model
+
+
+class IncrementalTrainer:
+    """
+    Checkpointed incremental updates of the active production model.
+
+    Each run takes the events since the checkpoint (at most
+    ML_INCREMENTAL_MAX_DAYS), labels them with the trainer's rules, lets
+    analyst feedback from auth_events_ml override those labels (weighted
+    ML_INCREMENTAL_FEEDBACK_WEIGHT), and holds out the newest
+    ML_INCREMENTAL_HOLDOUT_FRACTION of the window. The updated model is
+    saved and promoted through MLTrainer.promote_model only when its F1 on
+    that holdout is at least the active model's plus ML_INCREMENTAL_MIN_F1_GAIN.
+    The holdout is trained on by the next run. The scaler is kept as is:
+    the existing trees were grown on its scaling.
+    """
+
+    def __init__(self, trainer, feature_store: Optional[FeatureStore] = None):
+        """
+        Initialize the incremental trainer
+
+        Args:
+            trainer: MLTrainer (labels, evaluation, saving and promotion)
+            feature_store: Feature store (default: the trainer's, or a new one)
+        """
+        self.trainer = trainer
+        self.store = feature_store or trainer.feature_store or FeatureStore(trainer._determine_label)
+
+    def run(self, now: Optional[datetime] = None, promote: bool = True,
+            min_events: Optional[int] = None,
+            include_simulation: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        Run one incremental update.
+
+        Args:
+            now: End of the new-event window (default: now)
+            promote: Save and promote a candidate that passes evaluation
+                (False = evaluate only)
+            min_events: Minimum new events (default ML_INCREMENTAL_MIN_EVENTS)
+            include_simulation: Train on simulation events too
+                (default ML_INCREMENTAL_INCLUDE_SIMULATION)
+
+        Returns:
+            Summary dict (status: promoted, rejected, skipped or failed)
+        """
+        now = now or datetime.now()
+        min_events = ML_INCREMENTAL_MIN_EVENTS if min_events is None else min_events
+        if include_simulation is None:
+            include_simulation = ML_INCREMENTAL_INCLUDE_SIMULATION
+
+        active = fetch_active_model()
+        if not active:
+            return {'status': 'skipped', 'message': 'No active production model to update'}
+
+        checkpoint, feedback_checkpoint = self._checkpoints(active)
+        window_start = max(checkpoint, now - timedelta(days=ML_INCREMENTAL_MAX_DAYS))
+        summary = {
+            'base_model_id': active['id'],
+            'algorithm': active['algorithm'],
+            'window_start': window_start,
+            'checkpoint_at': checkpoint,
+            'feedback_checkpoint_at': feedback_checkpoint,
+            'include_simulation': include_simulation
+        }
+
+        try:
+            return self._update(active, now, window_start, feedback_checkpoint,
+                                promote, min_events, include_simulation, summary)
+        except Exception as e:
+            logger.error(f"Incremental update failed: {e}", exc_info=True)
+            return self._finish(summary, 'failed', str(e), promote)
+
+    def _checkpoints(self, active: Dict[str, Any]) -> Tuple[datetime, datetime]:
+        """Where the active model's training data (and feedback) ends"""
+        last = fetch_last_promoted_update(active['id'])
+        if last:
+            return last['checkpoint_at'], last['feedback_checkpoint_at'] or last['checkpoint_at']
+
+        # Full retrain: it saw events up to training_data_end, and at most
+        # up to the moment it was promoted
+        end = datetime.combine(active['training_data_end'] + timedelta(days=1), dt_time.min)
+        promoted_at = active.get('promoted_to_production_at') or end
+        return min(end, promoted_at), promoted_at
+
+    def _update(self, active: Dict[str, Any], now: datetime, window_start: datetime,
+                feedback_checkpoint: datetime, promote: bool, min_events: int,
+                include_simulation: bool, summary: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the update set, fit the candidate, evaluate and (maybe) promote"""
+        import joblib
+
+        package = joblib.load(active['model_path'])
+        base_model = package.get('model') if isinstance(package, dict) else package
+        scaler = package.get('scaler') if isinstance(package, dict) else None
+        feature_names = package.get('feature_names') if isinstance(package, dict) else None
+
+        if scaler is None:
+            return self._finish(summary, 'skipped', 'Active model has no scaler; run a full retrain', promote)
+        if feature_names and feature_names != self.trainer.feature_extractor.get_feature_names():
+            return self._finish(summary, 'skipped', 'Feature set changed since the active model; run a full retrain', promote)
+
+        # New events since the checkpoint (features from the feature store)
+        X_new, y_new, ids_new, ts_new = self.store.load(
+            window_start + timedelta(microseconds=1), now, include_simulation, with_timestamps=True)
+        y_new = np.array(y_new, dtype=np.int64)
+        weights = np.ones(len(y_new))
+        summary['new_events'] = len(y_new)
+
+        if len(y_new) < min_events:
+            return self._finish(summary, 'skipped',
+                                f'{len(y_new)} new events since {window_start} (need {min_events})', promote)
+
+        # Analyst feedback overrides rule labels (and adds older events)
+        feedback = {}
+        feedback_at = {}
+        for row in fetch_feedback_labels(feedback_checkpoint, window_start, now):
+            label = feedback_label(row['manual_feedback'], row['is_anomaly'])
+            if label is not None:
+                feedback[row['event_id']] = label
+                feedback_at[row['event_id']] = row['event_timestamp']
+
+        in_window = np.isin(ids_new, list(feedback)) if feedback else np.zeros(len(ids_new), dtype=bool)
+        y_new[in_window] = [feedback[int(i)] for i in ids_new[in_window]]
+        weights[in_window] = ML_INCREMENTAL_FEEDBACK_WEIGHT
+
+        X_old, y_old = self._older_feedback_samples(feedback, feedback_at, window_start, now,
+                                                    include_simulation)
+        summary['feedback_events'] = int(in_window.sum()) + len(y_old)
+
+        # Newest events are the held-out window
+        split = int(len(y_new) * (1 - ML_INCREMENTAL_HOLDOUT_FRACTION))
+        X_hold, y_hold = X_new[split:], y_new[split:]
+        X_fit = np.concatenate([X_new[:split], X_old]) if len(y_old) else X_new[:split]
+        y_fit = np.concatenate([y_new[:split], y_old]) if len(y_old) else y_new[:split]
+        w_fit = np.concatenate([weights[:split], np.full(len(y_old), ML_INCREMENTAL_FEEDBACK_WEIGHT)])
+        summary['holdout_events'] = len(y_hold)
+        summary['checkpoint_at'] = datetime(1970, 1, 1) + timedelta(microseconds=int(ts_new[split - 1]))
+        summary['feedback_checkpoint_at'] = now
+
+        if len(np.unique(y_fit)) < 2:
+            return self._finish(summary, 'skipped', 'New events contain a single class', promote)
+
+        candidate = warm_update(base_model, scaler.transform(X_fit), y_fit, w_fit)
+
+        base_metrics = self.trainer._evaluate_model(base_model, scaler, X_hold, y_hold)
+        candidate_metrics = self.trainer._evaluate_model(candidate, scaler, X_hold, y_hold)
+        summary['base_f1'] = base_metrics['f1_score']
+        summary['candidate_f1'] = candidate_metrics['f1_score']
+        logger.info(f"Incremental update: holdout F1 {summary['base_f1']:.4f} -> {summary['candidate_f1']:.4f} "
+                    f"({len(y_fit)} samples, {summary['feedback_events']} with feedback)")
+
+        if summary['candidate_f1'] < summary['base_f1'] + ML_INCREMENTAL_MIN_F1_GAIN:
+            return self._finish(summary, 'rejected', 'Candidate did not beat the active model on the holdout', promote)
+        if not promote:
+            return self._finish(summary, 'rejected', 'Evaluation only (promotion disabled)', promote)
+
+        params = json.loads(active['hyperparameters']) if isinstance(active['hyperparameters'], str) \
+            else dict(active['hyperparameters'] or {})
+        params['incremental_base_model_id'] = active['id']
+        if hasattr(candidate, 'n_estimators'):
+            params['n_estimators'] = candidate.n_estimators
+
+        model_id = self.trainer._save_model(
+            model=candidate,
+            scaler=scaler,
+            algorithm=active['algorithm'],
+            params=params,
+            metrics=candidate_metrics,
+            data_start=datetime.combine(active['training_data_start'], dt_time.min),
+            data_end=now,
+            training_samples=len(y_fit),
+            test_samples=len(y_hold),
+            user_id=None
+        )
+        summary['candidate_model_id'] = model_id
+
+        if not self.trainer.promote_model(model_id):
+            return self._finish(summary, 'failed', f'Promotion of model {model_id} failed', promote)
+        return self._finish(summary, 'promoted', f'Model {model_id} promoted', promote)
+
+    def _older_feedback_samples(self, feedback: Dict[int, int], feedback_at: Dict[int, datetime],
+                                window_start: datetime, now: datetime,
+                                include_simulation: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """Features/labels for feedback on events from before the window"""
+        oldest = now - timedelta(days=FEEDBACK_LOOKBACK_DAYS)
+        by_day: Dict[Any, List[int]] = {}
+        for event_id, event_ts in feedback_at.items():
+            if oldest <= event_ts <= window_start:
+                by_day.setdefault(event_ts.date(), []).append(event_id)
+
+        X_parts, y_parts = [], []
+        for day, event_ids in sorted(by_day.items()):
+            day_start = datetime.combine(day, dt_time.min)
+            X_day, _, ids_day = self.store.load(day_start, day_start + timedelta(days=1, microseconds=-1),
+                                                include_simulation)
+            mask = np.isin(ids_day, event_ids)
+            if mask.any():
+                X_parts.append(np.asarray(X_day[mask]))
+                y_parts.append(np.array([feedback[int(i)] for i in ids_day[mask]], dtype=np.int64))
+
+        if not X_parts:
+            return np.zeros((0, len(self.trainer.feature_extractor.get_feature_names())), dtype=np.float32), \
+                np.zeros(0, dtype=np.int64)
+        return np.concatenate(X_parts), np.concatenate(y_parts)
+
+    @staticmethod
+    def _finish(summary: Dict[str, Any], status: str, message: str, record: bool) -> Dict[str, Any]:
+        """Record the outcome in ml_incremental_updates and return the summary"""
+        summary['status'] = status
+        summary['message'] = message
+        logger.info(f"Incremental update {status}: {message}")
+
+        if record:
+            try:
+                summary['update_id'] = record_incremental_update({
+                    key: summary.get(key) for key in (
+                        'base_model_id', 'candidate_model_id', 'algorithm', 'window_start',
+                        'checkpoint_at', 'feedback_checkpoint_at', 'new_events',
+                        'feedback_events', 'holdout_events', 'base_f1', 'candidate_f1',
+                        'status', 'message'
+                    ) if summary.get(key) is not None
+                })
+            except Exception as e:
+                logger.error(f"Failed to record incremental update: {e}")
+        return summary
@@ -5,7 +5,15 @@ Loads, manages, and performs inference with trained ML models
 
 import os
 import sys
+import json
+import uuid
+import shutil
+import hashlib
+import time
+import queue
+import random
 import logging
+import threading
 from pathlib import Path
 from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
@@ -14,13 +22,112 @@ import numpy as np
 # Add project paths
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 sys.path.append(str(PROJECT_ROOT / "dbs"))
+sys.path.append(str(PROJECT_ROOT / "src"))
+sys.path.append(str(PROJECT_ROOT / "src" / "core"))
 
 from connection import get_connection
+from core.write_behind import get_write_buffer
 from .feature_extractor import FeatureExtractor
-from .model_manager_queries import log_prediction_with_stats, get_active_model_info
+from .model_manager_queries import (
+    log_predictions_batch,
+    log_shadow_scores_batch,
+    get_active_model_info,
+    get_model_by_id
+)
 
 logger = logging.getLogger(__name__)
 
+# Model artifacts are re-saved uncompressed into immutable, versioned
+# directories and loaded with mmap_mode='r', so every worker process maps
+# the same page-cache pages instead of holding its own copy
+ML_MODEL_ARTIFACTS_DIR = os.getenv('ML_MODEL_ARTIFACTS_DIR', '')
+ML_MODEL_ARTIFACTS_KEEP = int(os.getenv('ML_MODEL_ARTIFACTS_KEEP', 3))
+
+# Redis channel on which a reload is announced to all workers
+ML_MODEL_RELOAD_CHANNEL = os.getenv('ML_MODEL_RELOAD_CHANNEL', 'ssh_guardian:ml:model_reload')
+
+# Shadow scoring: a candidate model scores a sampled fraction of production
+# traffic on a background thread (ml_shadow_scores, migration 037)
+ML_SHADOW_MODEL_ID = os.getenv('ML_SHADOW_MODEL_ID', '')
+ML_SHADOW_SAMPLE_RATE = float(os.getenv('ML_SHADOW_SAMPLE_RATE', 0.1))
+ML_SHADOW_QUEUE_SIZE = int(os.getenv('ML_SHADOW_QUEUE_SIZE', 1000))
+
+_ARTIFACT_FILE = 'model.joblib'
+
+
+def _get_redis():
+    """Shared Redis client, or None when redis/the server is unavailable"""
+    try:
+        from cache import get_redis_client
+    except ImportError:
+        return None
+    return get_redis_client()
+
+
+def _publish_control(payload: Dict[str, Any]) -> bool:
+    """Publish a control message to every model manager process"""
+    client = _get_redis()
+    if client is None:
+        return False
+
+    try:
+        client.publish(ML_MODEL_RELOAD_CHANNEL, json.dumps({
+            **payload,
+            'published_at': datetime.now().isoformat()
+        }))
+        return True
+    except Exception as e:
+        logger.warning(f"Could not publish model control message: {e}")
+        return False
+
+
+def publish_model_reload(model_id: Optional[int] = None, origin: Optional[str] = None) -> bool:
+    """
+    Tell every model manager process to reload the active model.
+
+    Args:
+        model_id: Newly active model ID (informational; workers re-read the DB)
+        origin: Publisher's manager ID, so it can skip its own message
+
+    Returns:
+        True if the message was published
+    """
+    return _publish_control({'type': 'reload', 'model_id': model_id, 'origin': origin})
+
+
+def publish_shadow_config(model_id: Optional[int], sample_rate: float,
+                          origin: Optional[str] = None) -> bool:
+    """
+    Tell every model manager process which model to shadow-score.
+
+    Args:
+        model_id: Candidate model ID (None stops shadow scoring)
+        sample_rate: Fraction of scored events also sent to the shadow model
+        origin: Publisher's manager ID, so it can skip its own message
+
+    Returns:
+        True if the message was published
+    """
+    return _publish_control({
+        'type': 'shadow', 'model_id': model_id, 'sample_rate': sample_rate, 'origin': origin
+    })
+
+
+class _ModelSet:
+    """
+    One loaded ensemble. Built completely before it is published and never
+    mutated afterwards, so a prediction that picked it up keeps a consistent
+    view of models, scalers and metadata across a reload.
+    """
+
+    __slots__ = ('models', 'scalers', 'model_info', 'active_model_id')
+
+    def __init__(self, active_model_id: Optional[int] = None):
+        self.models = {}  # model_name -> model object
+        self.scalers = {}  # model_name -> scaler object
+        self.model_info = {}  # model_name -> metadata
+        self.active_model_id = active_model_id
+
 
 class MLModelManager:
     """
@@ -28,6 +135,9 @@ class MLModelManager:
     Loads trained models, performs inference, and tracks predictions.
     """
 
+    # Seconds between attempts to subscribe to reload signals while Redis is down
+    LISTENER_RETRY_SEC = 30
+
     # Threat type classification thresholds
     THREAT_TYPES = {
         'brute_force': {'min_fails_10min': 0.1, 'min_fails_hour': 0.05},
@@ -46,18 +156,60 @@ class MLModelManager:
             models_dir: Directory containing saved model files
         """
         self.models_dir = Path(models_dir)
-        self.models = {}  # model_name -> model object
-        self.scalers = {}  # model_name -> scaler object
-        self.model_info = {}  # model_name -> metadata
+        self.artifacts_dir = Path(ML_MODEL_ARTIFACTS_DIR) if ML_MODEL_ARTIFACTS_DIR \
+            else self.models_dir / 'artifacts'
         self.feature_extractor = FeatureExtractor()
-        self.active_model_id = None
+        self.manager_id = uuid.uuid4().hex
+        self._state = _ModelSet()
+        self._reload_lock = threading.Lock()
+        self._listener_pid = None  # Process whose listener is subscribed
+        self._listener_lock = threading.Lock()
+        self._listener_retry_at = 0.0
+        if hasattr(os, 'register_at_fork'):
+            # A fork while another thread holds the lock must not leave the child stuck
+            os.register_at_fork(after_in_child=self._reset_listener_lock)
+
+        # Shadow scoring (candidate model next to production)
+        self._shadow = None  # _ModelSet of the candidate, or None
+        self.shadow_sample_rate = ML_SHADOW_SAMPLE_RATE
+        self._shadow_queue = queue.Queue(maxsize=ML_SHADOW_QUEUE_SIZE)
+        self._shadow_pid = None
+        self._shadow_lock = threading.Lock()  # shadow_stats and worker start
+        self.shadow_stats = {'sampled': 0, 'scored': 0, 'dropped': 0, 'errors': 0}
 
         # Load all available models
-        self._load_models()
+        self._state = self._load_models()
+        self._ensure_reload_listener()
+
+        if ML_SHADOW_MODEL_ID:
+            self.set_shadow_model(int(ML_SHADOW_MODEL_ID), broadcast=False)
 
-    def _load_models(self):
-        """Load the active production model from database"""
+    # The current ensemble; replaced (never modified) by a reload
+    @property
+    def models(self) -> Dict[str, Any]:
+        return self._state.models
+
+    @property
+    def scalers(self) -> Dict[str, Any]:
+        return self._state.scalers
+
+    @property
+    def model_info(self) -> Dict[str, Dict]:
+        return self._state.model_info
+
+    @property
+    def active_model_id(self) -> Optional[int]:
+        return self._state.active_model_id
+
+    def _load_models(self) -> _ModelSet:
+        """
+        Build a model set for the active production model from database.
+
+        Returns:
+            New _ModelSet (empty if no model could be loaded)
+        """
         logger.info("Loading ML model...")
+        state = _ModelSet()
 
         # Try to load joblib/pickle modules
         try:
@@ -65,7 +217,7 @@ class MLModelManager:
             import pickle
         except ImportError:
             logger.error("joblib not installed. ML models unavailable.")
-            return
+            return state
 
         # Step 1: Get active model info from database
         try:
@@ -78,58 +230,129 @@ class MLModelManager:
 
         if not active_model:
             logger.warning("No active production model in database. Falling back to directory scan.")
-            self._load_models_from_directory()
-            return
+            return self._load_models_from_directory(state)
 
         # Step 2: Load from model_path (preferred) or by model_name
         model_path_str = active_model.get('model_path')
         model_name = active_model.get('model_name')
-        self.active_model_id = active_model.get('id')
+        state.active_model_id = active_model.get('id')
 
         # Try loading from explicit model_path first
         if model_path_str:
             model_path = Path(model_path_str)
             if model_path.exists():
-                if self._load_single_model(model_path, model_name):
+                if self._load_single_model(model_path, model_name, state):
                     logger.info(f"Loaded active model from database path: {model_name}")
-                    return
+                    return state
 
         # Fallback: search in MODELS_DIR by name
         if self.models_dir.exists():
             for ext in ['.pkl', '.joblib']:
                 path = self.models_dir / f"{model_name}{ext}"
                 if path.exists():
-                    if self._load_single_model(path, model_name):
+                    if self._load_single_model(path, model_name, state):
                         logger.info(f"Loaded active model from MODELS_DIR: {model_name}")
-                        return
+                        return state
 
         logger.warning(f"Could not find model file for: {model_name}")
         # Last resort: scan directory for any models
-        self._load_models_from_directory()
+        return self._load_models_from_directory(state)
+
+    def _artifact_path(self, model_path: Path, model_name: str) -> Path:
+        """
+        Immutable, uncompressed copy of a model file that can be memory-mapped.
 
-    def _load_single_model(self, model_path: Path, model_name: str) -> bool:
-        """Load a single model file"""
+        The version directory is keyed by the source file's path, size and
+        mtime, so a retrained file gets a new directory and workers still
+        mapping the old one are unaffected. Concurrent workers may both build
+        a version; the first rename wins and the other copy is discarded.
+
+        Args:
+            model_path: Saved model file (.joblib/.pkl, possibly compressed)
+            model_name: Model name (directory prefix)
+
+        Returns:
+            Path to the artifact's model.joblib
+        """
+        import joblib
+
+        stat = model_path.stat()
+        digest = hashlib.sha1(
+            f"{model_path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+        ).hexdigest()[:12]
+        version_dir = self.artifacts_dir / f"{model_name}-{digest}"
+        artifact = version_dir / _ARTIFACT_FILE
+
+        if artifact.exists():
+            return artifact
+
+        self.artifacts_dir.mkdir(parents=True, exist_ok=True)
+        tmp_dir = self.artifacts_dir / f".{version_dir.name}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir()
+
+        try:
+            # No compression: compressed pickles cannot be memory-mapped
+            joblib.dump(joblib.load(model_path), tmp_dir / _ARTIFACT_FILE)
+            try:
+                tmp_dir.rename(version_dir)
+            except OSError:
+                if not artifact.exists():
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        logger.info(f"  Created model artifact {version_dir.name}")
+        self._prune_artifacts(model_name, keep=version_dir)
+        return artifact
+
+    def _prune_artifacts(self, model_name: str, keep: Path):
+        """
+        Remove old artifact versions of a model beyond ML_MODEL_ARTIFACTS_KEEP.
+
+        Workers still mapping a removed version keep their pages (the inode
+        lives until the last mapping is gone).
+        """
+        versions = sorted(
+            (d for d in self.artifacts_dir.glob(f"{model_name}-*") if d.is_dir() and d != keep),
+            key=lambda d: d.stat().st_mtime,
+            reverse=True
+        )
+        for old in versions[max(ML_MODEL_ARTIFACTS_KEEP - 1, 0):]:
+            shutil.rmtree(old, ignore_errors=True)
+
+    def _load_single_model(self, model_path: Path, model_name: str, state: _ModelSet) -> bool:
+        """Load a single model file into a model set"""
         try:
             import joblib
             logger.info(f"  Loading {model_name} from {model_path}...")
 
-            model_data = joblib.load(model_path)
+            try:
+                load_path = self._artifact_path(model_path, model_name)
+                model_data = joblib.load(load_path, mmap_mode='r')
+            except Exception as e:
+                # Read-only models dir etc.: private copy in this process
+                logger.warning(f"  Memory-mapped artifact unavailable for {model_name}: {e}")
+                load_path = model_path
+                model_data = joblib.load(model_path)
 
             # Handle different model formats
             if isinstance(model_data, dict):
-                self.models[model_name] = model_data.get('model')
-                self.scalers[model_name] = model_data.get('scaler')
-                self.model_info[model_name] = {
+                state.models[model_name] = model_data.get('model')
+                state.scalers[model_name] = model_data.get('scaler')
+                state.model_info[model_name] = {
                     'path': str(model_path),
+                    'artifact_path': str(load_path),
                     'feature_names': model_data.get('feature_names', []),
                     'metrics': model_data.get('metrics', {}),
                     'loaded_at': datetime.now()
                 }
             else:
                 # Just the model object
-                self.models[model_name] = model_data
-                self.model_info[model_name] = {
+                state.models[model_name] = model_data
+                state.model_info[model_name] = {
                     'path': str(model_path),
+                    'artifact_path': str(load_path),
                     'loaded_at': datetime.now()
                 }
 
@@ -140,41 +363,43 @@ class MLModelManager:
             logger.error(f"  ✗ Failed to load {model_path}: {e}")
             return False
 
-    def _load_models_from_directory(self):
+    def _load_models_from_directory(self, state: _ModelSet) -> _ModelSet:
         """Fallback: Load all models from directory (legacy behavior)"""
         if not self.models_dir.exists():
             logger.warning(f"Models directory not found: {self.models_dir}")
             self.models_dir.mkdir(parents=True, exist_ok=True)
-            return
+            return state
 
         try:
             import joblib
         except ImportError:
-            return
+            return state
 
         # Look for model files
         model_files = list(self.models_dir.glob('*.pkl')) + list(self.models_dir.glob('*.joblib'))
 
         if not model_files:
             logger.warning("No model files found in models directory")
-            return
+            return state
 
         # Load each model
         for model_path in model_files:
-            self._load_single_model(model_path, model_path.stem)
+            self._load_single_model(model_path, model_path.stem, state)
+
+        if state.models:
+            logger.info(f"Loaded {len(state.models)} ML model(s) from directory")
+            self._load_active_model_from_db(state)
 
-        if self.models:
-            logger.info(f"Loaded {len(self.models)} ML model(s) from directory")
-            self._load_active_model_from_db()
+        return state
 
-    def _load_active_model_from_db(self):
+    def _load_active_model_from_db(self, state: _ModelSet):
         """Load active model info from database"""
         try:
             conn = get_connection()
             active_model = get_active_model_info(conn)
 
             if active_model:
-                self.active_model_id = active_model['id']
+                state.active_model_id = active_model['id']
                 logger.info(f"Active model from DB: {active_model['model_name']} (ID: {active_model['id']})")
 
             conn.close()
@@ -197,7 +422,9 @@ class MLModelManager:
             - is_anomaly: bool
             - model_used: str
         """
-        if not self.models:
+        self._ensure_reload_listener()
+        state = self._state
+        if not state.models:
             return self._fallback_prediction(event)
 
         try:
@@ -206,21 +433,83 @@ class MLModelManager:
             features = features.reshape(1, -1)
 
             # Use ensemble prediction for best accuracy
-            return self.ensemble_predict(event, features)
+            return self.ensemble_predict(event, features, state)
 
         except Exception as e:
             logger.error(f"ML prediction error: {e}", exc_info=True)
-            return {
-                'ml_available': False,
-                'risk_score': 0,
-                'threat_type': None,
-                'confidence': 0.0,
-                'is_anomaly': False,
-                'model_used': 'error',
-                'error': str(e)
-            }
-
-    def ensemble_predict(self, event: Dict, features: np.ndarray) -> Dict[str, Any]:
+            return self._error_prediction(e)
+
+    def predict_batch(self, events: List[Dict[str, Any]],
+                      log_predictions: bool = True) -> List[Dict[str, Any]]:
+        """
+        Perform ML prediction on many events at once.
+
+        Features are extracted in event order (so per-IP history evolves
+        exactly as with repeated predict() calls), stacked into one matrix
+        and scaled/scored once per model; the weighted ensemble vote is
+        computed over the whole batch.
+
+        Args:
+            events: List of event dicts (same shape as for predict)
+            log_predictions: Record each prediction for model tracking
+                             (off for historical re-scoring)
+
+        Returns:
+            List of prediction result dicts, same order as events
+        """
+        if not events:
+            return []
+
+        self._ensure_reload_listener()
+        state = self._state
+        if not state.models:
+            return [self._fallback_prediction(event) for event in events]
+
+        results = [None] * len(events)
+        rows = []
+        positions = []
+        for position, event in enumerate(events):
+            try:
+                rows.append(self.feature_extractor.extract(event))
+                positions.append(position)
+            except Exception as e:
+                logger.error(f"ML feature extraction error: {e}", exc_info=True)
+                results[position] = self._error_prediction(e)
+
+        if rows:
+            features = np.vstack(rows)
+            started = time.perf_counter()
+            scores = self._ensemble_scores(features, state)
+            # Per-event share of the batch's scoring time
+            inference_ms = (time.perf_counter() - started) * 1000 / len(rows)
+            if scores is not None:
+                self._sample_shadow(features, [events[p] for p in positions], scores, state)
+
+            for row, position in enumerate(positions):
+                event = events[position]
+                try:
+                    if scores is None:
+                        results[position] = self._fallback_prediction(event)
+                        continue
+                    probabilities, is_anomaly, confidence, models_used = scores
+                    results[position] = self._finalize_prediction(
+                        event,
+                        features[row:row + 1],
+                        int(min(100, max(0, probabilities[row] * 100))),
+                        bool(is_anomaly[row]),
+                        float(confidence[row]),
+                        models_used,
+                        log_prediction=log_predictions,
+                        inference_ms=inference_ms
+                    )
+                except Exception as e:
+                    logger.error(f"ML prediction error: {e}", exc_info=True)
+                    results[position] = self._error_prediction(e)
+
+        return results
+
+    def ensemble_predict(self, event: Dict, features: np.ndarray,
+                         state: Optional[_ModelSet] = None) -> Dict[str, Any]:
         """
         Use ensemble of all models for prediction.
         Combines predictions using weighted voting based on model performance.
@@ -228,83 +517,148 @@ class MLModelManager:
         Args:
             event: Original event dict
             features: Pre-extracted feature array
+            state: Model set to use (default: the current one)
 
         Returns:
             Ensemble prediction result
         """
+        state = state or self._state
+        started = time.perf_counter()
+        scores = self._ensemble_scores(features, state)
+        inference_ms = (time.perf_counter() - started) * 1000
+        if scores is None:
+            return self._fallback_prediction(event)
+
+        self._sample_shadow(features, [event], scores, state)
+
+        probabilities, is_anomaly, confidence, models_used = scores
+        risk_score = int(min(100, max(0, probabilities[0] * 100)))
+
+        return self._finalize_prediction(
+            event, features, risk_score, bool(is_anomaly[0]), float(confidence[0]), models_used,
+            inference_ms=inference_ms
+        )
+
+    def _ensemble_scores(self, features: np.ndarray,
+                         state: Optional[_ModelSet] = None,
+                         model_ms: Optional[Dict[str, float]] = None) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, int]]:
+        """
+        Score a feature matrix with every loaded model and combine the votes.
+
+        Args:
+            features: Feature matrix of shape (n_events, n_features)
+            state: Model set to score with (default: the current one)
+            model_ms: If given, filled with each model's scoring time (ms)
+
+        Returns:
+            (ensemble probability, is_anomaly, confidence, models used), the
+            first three as arrays of length n_events, or None if no model
+            could score the batch
+        """
         predictions = []
         probabilities = []
         model_weights = []
+        has_probability = []
+
+        state = state or self._state
 
-        for model_name, model in self.models.items():
+        for model_name, model in state.models.items():
+            started = time.perf_counter()
             try:
                 # Scale features if scaler available
                 scaled_features = features
-                if model_name in self.scalers and self.scalers[model_name] is not None:
-                    scaled_features = self.scalers[model_name].transform(features)
+                if model_name in state.scalers and state.scalers[model_name] is not None:
+                    scaled_features = state.scalers[model_name].transform(features)
 
                 # Get prediction
-                pred = model.predict(scaled_features)[0]
-                predictions.append(pred)
+                pred = np.asarray(model.predict(scaled_features), dtype=np.float64)
 
                 # Get probability if available
+                estimated = True
                 if hasattr(model, 'predict_proba'):
-                    proba = model.predict_proba(scaled_features)[0]
-                    if len(proba) > 1:
-                        probabilities.append(proba[1])  # Probability of positive class
+                    proba = model.predict_proba(scaled_features)
+                    if proba.shape[1] > 1:
+                        prob = proba[:, 1]  # Probability of positive class
                     else:
-                        probabilities.append(float(pred))
+                        prob = pred
+                        estimated = False
                 elif hasattr(model, 'decision_function'):
                     # For SVM-like models
-                    decision = model.decision_function(scaled_features)[0]
+                    decision = model.decision_function(scaled_features)
                     prob = 1 / (1 + np.exp(-decision))  # Sigmoid
-                    probabilities.append(prob)
                 else:
-                    probabilities.append(float(pred))
+                    prob = pred
+                    estimated = False
 
                 # Model weight (default 1.0, or use F1 from info)
                 weight = 1.0
-                if model_name in self.model_info:
-                    metrics = self.model_info[model_name].get('metrics', {})
+                if model_name in state.model_info:
+                    metrics = state.model_info[model_name].get('metrics', {})
                     if 'f1_score' in metrics:
                         weight = metrics['f1_score']
+
+                predictions.append(pred)
+                probabilities.append(np.asarray(prob, dtype=np.float64))
                 model_weights.append(weight)
+                has_probability.append(estimated)
+                if model_ms is not None:
+                    model_ms[model_name] = (time.perf_counter() - started) * 1000
 
             except Exception as e:
                 logger.debug(f"Model {model_name} prediction failed: {e}")
                 continue
 
         if not predictions:
-            return self._fallback_prediction(event)
+            return None
 
-        # Weighted ensemble
+        # Weighted ensemble, one column per event
+        predictions = np.vstack(predictions)
+        probabilities = np.vstack(probabilities)
         weights = np.array(model_weights)
         weights = weights / weights.sum()  # Normalize
 
         # Weighted average for probability/risk score
-        if probabilities:
-            ensemble_probability = np.average(probabilities, weights=weights)
-            risk_score = int(min(100, max(0, ensemble_probability * 100)))
-        else:
-            risk_score = int(np.average(predictions, weights=weights) * 100)
+        ensemble_probability = np.average(probabilities, axis=0, weights=weights)
 
         # Majority vote for is_anomaly
-        ensemble_prediction = int(np.round(np.average(predictions, weights=weights)))
+        ensemble_prediction = np.round(np.average(predictions, axis=0, weights=weights)).astype(int)
         is_anomaly = ensemble_prediction == 1
 
         # Calculate confidence (based on agreement or model certainty)
         if len(predictions) > 1:
-            agreement = np.mean([1 if p == ensemble_prediction else 0 for p in predictions])
-            confidence = agreement
+            confidence = np.mean(predictions == ensemble_prediction, axis=0)
         else:
             # Single model: confidence = how certain the model is (distance from 0.5)
             # prob=0.9 → 90% sure anomaly → confidence=0.9
             # prob=0.1 → 90% sure normal → confidence=0.9
-            if probabilities:
-                confidence = max(probabilities[0], 1 - probabilities[0])
+            if has_probability[0]:
+                confidence = np.maximum(probabilities[0], 1 - probabilities[0])
             else:
-                confidence = 0.7
+                # A bare 0/1 prediction says nothing about certainty
+                confidence = np.full(probabilities.shape[1], 0.7)
+
+        return ensemble_probability, is_anomaly, confidence, len(predictions)
 
+    def _finalize_prediction(self, event: Dict, features: np.ndarray, risk_score: int,
+                             is_anomaly: bool, confidence: float, models_used: int,
+                             log_prediction: bool = True,
+                             inference_ms: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Apply threat typing and threat intel overrides to an ensemble score.
+
+        Args:
+            event: Original event dict
+            features: Feature row of shape (1, n_features)
+            risk_score: Ensemble risk score (0-100)
+            is_anomaly: Ensemble anomaly vote
+            confidence: Ensemble confidence
+            models_used: Number of models that scored the event
+            log_prediction: Record the prediction for model tracking
+            inference_ms: Per-event ensemble scoring time
+
+        Returns:
+            Prediction result dict
+        """
         # Determine threat type
         threat_type = self._classify_threat_type(event, features, risk_score, is_anomaly)
 
@@ -368,7 +722,8 @@ class MLModelManager:
         # =============================================================
 
         # Log prediction to database
-        self._log_prediction(event, risk_score, threat_type, confidence, is_anomaly)
+        if log_prediction:
+            self._log_prediction(event, risk_score, threat_type, confidence, is_anomaly, inference_ms)
 
         return {
             'ml_available': True,
@@ -376,8 +731,21 @@ class MLModelManager:
             'threat_type': threat_type,
             'confidence': round(confidence, 4),
             'is_anomaly': is_anomaly,
-            'model_used': f'ensemble_{len(predictions)}_models',
-            'predictions_count': len(predictions)
+            'model_used': f'ensemble_{models_used}_models',
+            'predictions_count': models_used,
+            'inference_time_ms': round(inference_ms, 4) if inference_ms is not None else None
+        }
+
+    def _error_prediction(self, error: Exception) -> Dict[str, Any]:
+        """Result returned when inference fails for an event"""
+        return {
+            'ml_available': False,
+            'risk_score': 0,
+            'threat_type': None,
+            'confidence': 0.0,
+            'is_anomaly': False,
+            'model_used': 'error',
+            'error': str(error)
         }
 
     def _classify_threat_type(self, event: Dict, features: np.ndarray,
@@ -630,9 +998,11 @@ class MLModelManager:
         }
 
     def _log_prediction(self, event: Dict, risk_score: int, threat_type: Optional[str],
-                       confidence: float, is_anomaly: bool):
-        """Log prediction to database for tracking"""
-        if not self.active_model_id:
+                       confidence: float, is_anomaly: bool,
+                       inference_ms: Optional[float] = None):
+        """Queue prediction for the batched prediction log (write-behind)"""
+        model_id = self.active_model_id
+        if not model_id:
             return
 
         try:
@@ -640,20 +1010,12 @@ class MLModelManager:
             if not event_id:
                 return
 
-            conn = get_connection()
-
-            # Use optimized combined query (INSERT + UPDATE in single transaction)
-            log_prediction_with_stats(
-                conn=conn,
-                event_id=event_id,
-                model_id=self.active_model_id,
-                risk_score=risk_score,
-                threat_type=threat_type,
-                confidence=confidence,
-                is_anomaly=is_anomaly
-            )
-
-            conn.close()
+            buffer = get_write_buffer()
+            buffer.register('ml_predictions', log_predictions_batch)
+            buffer.add('ml_predictions', (
+                event_id, model_id, risk_score, threat_type, confidence, is_anomaly,
+                datetime.now(), inference_ms
+            ))
 
         except Exception as e:
             logger.debug(f"Failed to log prediction: {e}")
@@ -664,6 +1026,8 @@ class MLModelManager:
             'models_loaded': len(self.models),
             'model_names': list(self.models.keys()),
             'active_model_id': self.active_model_id,
+            'artifact_paths': [info.get('artifact_path') for info in self.model_info.values()],
+            'shadow': self.get_shadow_status(),
             'feature_count': len(self.feature_extractor.get_feature_names())
         }
 
@@ -671,19 +1035,311 @@ class MLModelManager:
         """Reload the active model from database (alias for reload_active_model)"""
         self.reload_active_model()
 
-    def reload_active_model(self):
-        """Reload the active production model from database (for hot-swapping)"""
-        logger.info("Reloading active model...")
-        self.models.clear()
-        self.scalers.clear()
-        self.model_info.clear()
-        self.active_model_id = None
-        self._load_models()
-        logger.info(f"Reloaded active model: {list(self.models.keys())}")
+    def reload_active_model(self, broadcast: bool = True):
+        """
+        Reload the active production model from database (for hot-swapping).
+
+        The new ensemble is loaded off to the side while predictions keep
+        using the current one, then published with a single reference swap.
+
+        Args:
+            broadcast: Also signal the other worker processes over Redis
+        """
+        with self._reload_lock:
+            logger.info("Reloading active model...")
+            state = self._load_models()
+            self._state = state
+            logger.info(f"Reloaded active model: {list(state.models.keys())}")
+
+            # A promoted shadow model is now production
+            shadow = self._shadow
+            if shadow is not None and shadow.active_model_id == state.active_model_id:
+                self._shadow = None
+                logger.info(f"Shadow model {shadow.active_model_id} promoted; shadow scoring stopped")
+
+        if broadcast:
+            publish_model_reload(state.active_model_id, origin=self.manager_id)
 
     def set_active_model(self, model_id: int):
         """Set the active model by database ID"""
-        self.active_model_id = model_id
+        current = self._state
+        state = _ModelSet(model_id)
+        state.models, state.scalers, state.model_info = current.models, current.scalers, current.model_info
+        self._state = state
+
+    def set_shadow_model(self, model_id: Optional[int], sample_rate: Optional[float] = None,
+                         broadcast: bool = True) -> bool:
+        """
+        Start (or stop) shadow scoring with a candidate model.
+
+        The candidate is loaded off to the side like a reload, then scores a
+        sampled fraction of the events production scores, on a background
+        thread. Results go to ml_shadow_scores.
+
+        Args:
+            model_id: ml_models.id of the candidate (None stops shadow scoring)
+            sample_rate: Fraction of scored events to shadow (default: unchanged)
+            broadcast: Also apply in the other worker processes over Redis
+
+        Returns:
+            True if the candidate was loaded (or shadow scoring stopped)
+        """
+        if sample_rate is not None:
+            self.shadow_sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+
+        shadow = None
+        if model_id is not None:
+            try:
+                conn = get_connection()
+                try:
+                    model = get_model_by_id(conn, model_id)
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.warning(f"Could not look up shadow model {model_id}: {e}")
+                return False
+
+            if not model or not model.get('model_path') or not Path(model['model_path']).exists():
+                logger.warning(f"Shadow model {model_id} not found")
+                return False
+
+            shadow = _ModelSet(model_id)
+            if not self._load_single_model(Path(model['model_path']), model['model_name'], shadow):
+                return False
+
+        self._shadow = shadow
+        logger.info(f"Shadow scoring: {f'model {model_id} at {self.shadow_sample_rate:.0%}' if shadow else 'off'}")
+
+        if broadcast:
+            publish_shadow_config(model_id, self.shadow_sample_rate, origin=self.manager_id)
+        return True
+
+    def get_shadow_status(self) -> Dict[str, Any]:
+        """Shadow model, sample rate and this process's shadow counters"""
+        shadow = self._shadow
+        return {
+            'model_id': shadow.active_model_id if shadow else None,
+            'model_names': list(shadow.models.keys()) if shadow else [],
+            'sample_rate': self.shadow_sample_rate,
+            'queue_depth': self._shadow_queue.qsize(),
+            **self._shadow_counts()
+        }
+
+    def _shadow_counts(self, **increments) -> Dict[str, int]:
+        """Add to shadow_stats (request and shadow threads both count) and return a copy"""
+        with self._shadow_lock:
+            for name, value in increments.items():
+                self.shadow_stats[name] += value
+            return dict(self.shadow_stats)
+
+    def _sample_shadow(self, features: np.ndarray, events: List[Dict],
+                       scores: Tuple, state: _ModelSet):
+        """
+        Queue a sampled subset of a scored batch for the shadow model.
+
+        The production scores are kept for the comparison; latency is
+        measured by the shadow thread, which times both model sets on the
+        sampled rows. Never blocks: when the shadow thread falls behind,
+        samples are dropped.
+        """
+        shadow = self._shadow
+        if shadow is None or self.shadow_sample_rate <= 0:
+            return
+
+        sampled = [row for row in range(len(events)) if random.random() < self.shadow_sample_rate]
+        if not sampled:
+            return
+
+        probabilities, is_anomaly, _, _ = scores
+        item = (
+            shadow,
+            state,
+            features[sampled],
+            [events[row].get('id') for row in sampled],
+            probabilities[sampled],
+            is_anomaly[sampled]
+        )
+
+        self._shadow_counts(sampled=len(sampled))
+        self._ensure_shadow_worker()
+        try:
+            self._shadow_queue.put_nowait(item)
+        except queue.Full:
+            self._shadow_counts(dropped=len(sampled))
+
+    def _ensure_shadow_worker(self):
+        """Start the shadow scoring thread in this process (again after a fork)"""
+        if self._shadow_pid == os.getpid():
+            return
+
+        with self._shadow_lock:
+            if self._shadow_pid == os.getpid():
+                return
+            self._shadow_pid = os.getpid()
+
+        threading.Thread(target=self._run_shadow_worker, name='ml-shadow', daemon=True).start()
+
+    def _time_ensemble(self, features: np.ndarray, state: _ModelSet):
+        """
+        Score rows with a model set, timing the call.
+
+        Returns:
+            (scores or None, per-event ensemble ms, {model: per-event ms})
+        """
+        model_ms = {}
+        started = time.perf_counter()
+        scores = self._ensemble_scores(features, state, model_ms=model_ms)
+        rows = len(features)
+        per_event = (time.perf_counter() - started) * 1000 / rows
+        return scores, per_event, {name: round(ms / rows, 4) for name, ms in model_ms.items()}
+
+    def _run_shadow_worker(self):
+        """Score queued samples with the shadow model and record the comparison"""
+        buffer = get_write_buffer()
+        buffer.register('ml_shadow_scores', log_shadow_scores_batch)
+
+        while True:
+            shadow, production, features, event_ids, probabilities, is_anomaly = \
+                self._shadow_queue.get()
+            try:
+                # Both sides timed here on the same rows, so their latencies
+                # compare like for like (the request path scores whole batches);
+                # random order so neither side always runs on a cold cache
+                production_first = random.random() < 0.5
+                if production_first:
+                    _, production_ms, production_model_ms = self._time_ensemble(features, production)
+                scores, shadow_ms, shadow_model_ms = self._time_ensemble(features, shadow)
+                if scores is None:
+                    self._shadow_counts(errors=len(event_ids))
+                    continue
+                if not production_first:
+                    _, production_ms, production_model_ms = self._time_ensemble(features, production)
+
+                shadow_probabilities, shadow_anomaly, _, _ = scores
+                now = datetime.now()
+                for row, event_id in enumerate(event_ids):
+                    buffer.add('ml_shadow_scores', (
+                        event_id,
+                        production.active_model_id,
+                        shadow.active_model_id,
+                        int(min(100, max(0, probabilities[row] * 100))),
+                        int(min(100, max(0, shadow_probabilities[row] * 100))),
+                        bool(is_anomaly[row]),
+                        bool(shadow_anomaly[row]),
+                        bool(is_anomaly[row]) == bool(shadow_anomaly[row]),
+                        round(production_ms, 4),
+                        round(shadow_ms, 4),
+                        len(event_ids),
+                        json.dumps(production_model_ms),
+                        json.dumps(shadow_model_ms),
+                        now
+                    ))
+                self._shadow_counts(scored=len(event_ids))
+
+            except Exception as e:
+                self._shadow_counts(errors=len(event_ids))
+                logger.debug(f"Shadow scoring failed: {e}")
+
+    def _ensure_reload_listener(self):
+        """
+        Start the Redis reload listener for this process.
+
+        Checked on every prediction because a manager created before a
+        pre-fork server forks loses its thread in the workers. The process
+        only counts as listening once the subscription succeeded; while
+        Redis is unavailable the check is retried every
+        LISTENER_RETRY_SEC.
+        """
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+
+        # Another thread is subscribing right now; no need to wait for it
+        if not self._listener_lock.acquire(blocking=False):
+            return
+        try:
+            if self._listener_pid == pid or time.monotonic() < self._listener_retry_at:
+                return
+
+            pubsub = None
+            try:
+                client = _get_redis()
+                if client is not None:
+                    pubsub = client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(ML_MODEL_RELOAD_CHANNEL)
+            except Exception as e:
+                logger.debug(f"Model reload subscription failed: {e}")
+                pubsub = None
+
+            if pubsub is None:
+                logger.debug("Redis unavailable; model reloads are local to this process for now")
+                self._listener_retry_at = time.monotonic() + self.LISTENER_RETRY_SEC
+                return
+
+            self._listener_pid = pid
+        finally:
+            self._listener_lock.release()
+
+        threading.Thread(
+            target=self._listen_for_reloads, args=(pubsub,), name='ml-model-reload', daemon=True
+        ).start()
+
+    def _reset_listener_lock(self):
+        """Fresh listener lock in a forked child (the parent's may be held)"""
+        self._listener_lock = threading.Lock()
+
+    def _listen_for_reloads(self, pubsub=None):
+        """
+        Reload whenever another process announces a new active model.
+
+        Args:
+            pubsub: Already subscribed PubSub (resubscribes after errors)
+        """
+        while True:
+            try:
+                if pubsub is None:
+                    client = _get_redis()
+                    if client is None:
+                        time.sleep(self.LISTENER_RETRY_SEC)
+                        continue
+
+                    pubsub = client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(ML_MODEL_RELOAD_CHANNEL)
+
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if not message or message.get('type') != 'message':
+                        continue
+
+                    try:
+                        payload = json.loads(message['data'])
+                    except (TypeError, ValueError):
+                        payload = {}
+
+                    if payload.get('origin') == self.manager_id:
+                        continue
+                    model_id = payload.get('model_id')
+
+                    if payload.get('type') == 'shadow':
+                        self.set_shadow_model(model_id, payload.get('sample_rate'), broadcast=False)
+                        continue
+
+                    if model_id is not None and model_id == self.active_model_id:
+                        continue
+
+                    logger.info(f"Model reload signal received (model {model_id})")
+                    self.reload_active_model(broadcast=False)
+
+            except Exception as e:
+                logger.warning(f"Model reload listener error: {e}")
+                time.sleep(5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+                    pubsub = None
 
 
 # Convenience function
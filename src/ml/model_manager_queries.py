@@ -4,93 +4,124 @@ Optimized database query functions for ML model operations
 """
 
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 logger = logging.getLogger(__name__)
 
 
-def log_prediction_with_stats(conn, event_id: int, model_id: int, risk_score: int,
-                               threat_type: Optional[str], confidence: float,
-                               is_anomaly: bool) -> bool:
+def log_predictions_batch(cursor, rows: List[tuple]) -> None:
     """
-    Log ML prediction and update model statistics in a single transaction.
+    Log many ML predictions and update model statistics (write-behind flush).
 
-    Combines INSERT + UPDATE operations to reduce database round-trips.
-    Uses a single transaction with two statements for atomicity and performance.
+    One multi-row INSERT for the predictions, then one statistics UPDATE
+    per model in the batch instead of one per prediction.
+
+    Args:
+        cursor: Database cursor (caller commits)
+        rows: (event_id, model_id, risk_score, threat_type, confidence,
+            is_anomaly, created_at, inference_time_ms) tuples
+    """
+    cursor.executemany("""
+        INSERT INTO ml_predictions
+        (event_id, model_id, risk_score, threat_type, confidence, is_anomaly,
+         created_at, inference_time_ms)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, rows)
+
+    per_model = {}
+    for row in rows:
+        count, last_at = per_model.get(row[1], (0, row[6]))
+        per_model[row[1]] = (count + 1, max(last_at, row[6]))
+
+    for model_id, (count, last_at) in per_model.items():
+        cursor.execute("""
+            UPDATE ml_models
+            SET predictions_made = predictions_made + %s,
+                last_prediction_at = %s
+            WHERE id = %s
+        """, (count, last_at, model_id))
+
+
+def get_active_model_info(conn) -> Optional[Dict[str, Any]]:
+    """
+    Get information about the currently active production model.
 
     Args:
         conn: Database connection object
-        event_id: ID of the auth event being predicted
-        model_id: ID of the ML model used
-        risk_score: Risk score (0-100)
-        threat_type: Type of threat detected (optional)
-        confidence: Prediction confidence (0.0-1.0)
-        is_anomaly: Whether event is classified as anomaly
 
     Returns:
-        bool: True if successful, False otherwise
+        dict: Model info (id, model_name, algorithm, metrics) or None
     """
     cursor = None
     try:
-        cursor = conn.cursor()
-
-        # Execute both queries in a single transaction
-        # 1. Insert prediction record
-        cursor.execute("""
-            INSERT INTO ml_predictions
-            (event_id, model_id, risk_score, threat_type, confidence, is_anomaly, created_at)
-            VALUES (%s, %s, %s, %s, %s, %s, NOW())
-        """, (event_id, model_id, risk_score, threat_type, confidence, is_anomaly))
+        cursor = conn.cursor(dictionary=True)
 
-        # 2. Update model statistics
         cursor.execute("""
-            UPDATE ml_models
-            SET predictions_made = predictions_made + 1,
-                last_prediction_at = NOW()
-            WHERE id = %s
-        """, (model_id,))
+            SELECT id, model_name, algorithm, accuracy, f1_score, model_path
+            FROM ml_models
+            WHERE is_active = TRUE AND status = 'production'
+            LIMIT 1
+        """)
 
-        # Commit transaction
-        conn.commit()
-        return True
+        return cursor.fetchone()
 
     except Exception as e:
-        # Rollback on error
-        if conn:
-            conn.rollback()
-        logger.debug(f"Failed to log prediction: {e}")
-        return False
+        logger.debug(f"Failed to get active model info: {e}")
+        return None
 
     finally:
         if cursor:
             cursor.close()
 
 
-def get_active_model_info(conn) -> Optional[Dict[str, Any]]:
+def log_shadow_scores_batch(cursor, rows: List[tuple]) -> None:
     """
-    Get information about the currently active production model.
+    Record shadow model scores (write-behind flush).
+
+    Args:
+        cursor: Database cursor (caller commits)
+        rows: (event_id, production_model_id, shadow_model_id,
+            production_risk_score, shadow_risk_score, production_anomaly,
+            shadow_anomaly, agrees, production_inference_ms,
+            shadow_inference_ms, sample_size, production_model_ms,
+            shadow_model_ms, created_at) tuples
+    """
+    cursor.executemany("""
+        INSERT INTO ml_shadow_scores
+        (event_id, production_model_id, shadow_model_id,
+         production_risk_score, shadow_risk_score, production_anomaly,
+         shadow_anomaly, agrees, production_inference_ms,
+         shadow_inference_ms, sample_size, production_model_ms,
+         shadow_model_ms, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, rows)
+
+
+def get_model_by_id(conn, model_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Get a model's name and file path (e.g. a candidate to shadow-score).
 
     Args:
         conn: Database connection object
+        model_id: ml_models.id
 
     Returns:
-        dict: Model info (id, model_name, algorithm, metrics) or None
+        dict: Model info (id, model_name, algorithm, status, f1_score, model_path) or None
     """
     cursor = None
     try:
         cursor = conn.cursor(dictionary=True)
 
         cursor.execute("""
-            SELECT id, model_name, algorithm, accuracy, f1_score, model_path
+            SELECT id, model_name, algorithm, status, f1_score, model_path
             FROM ml_models
-            WHERE is_active = TRUE AND status = 'production'
-            LIMIT 1
-        """)
+            WHERE id = %s
+        """, (model_id,))
 
         return cursor.fetchone()
 
     except Exception as e:
-        logger.debug(f"Failed to get active model info: {e}")
+        logger.debug(f"Failed to get model {model_id}: {e}")
         return None
 
     finally:
@@ -20,6 +20,9 @@ sys.path.append(str(PROJECT_ROOT / "dbs"))
 
 from connection import get_connection
 from .feature_extractor import FeatureExtractor
+from .columnar_features import ColumnarFeatureExtractor
+from .feature_store import FeatureStore, ML_FEATURE_STORE_ENABLED
+from .model_manager import publish_model_reload
 from .trainer_queries import (
     fetch_training_data,
     update_training_run_progress,
@@ -99,12 +102,14 @@ class MLTrainer:
         self.models_dir = Path(models_dir)
         self.models_dir.mkdir(parents=True, exist_ok=True)
         self.feature_extractor = FeatureExtractor()
+        self.feature_store = FeatureStore(self._determine_label) if ML_FEATURE_STORE_ENABLED else None
 
     def train(self, algorithm: str, data_start: datetime, data_end: datetime,
               hyperparameters: Optional[Dict] = None,
               include_simulation: bool = True,
               user_id: Optional[int] = None,
-              callback: Optional[callable] = None) -> Dict[str, Any]:
+              callback: Optional[callable] = None,
+              training_data: Optional[Tuple[np.ndarray, np.ndarray, Any]] = None) -> Dict[str, Any]:
         """
         Train a new ML model.
 
@@ -116,6 +121,8 @@ class MLTrainer:
             include_simulation: Include simulation events in training
             user_id: User initiating training
             callback: Progress callback function(stage, progress, message)
+            training_data: (X, y, event_ids) already prepared for this window
+                (train_all_algorithms shares one load across algorithms)
 
         Returns:
             Training result with model info and metrics
@@ -133,7 +140,9 @@ class MLTrainer:
             if callback:
                 callback('preparing_data', 10, 'Loading events from database')
 
-            X, y, event_ids = self._prepare_training_data(data_start, data_end, include_simulation)
+            if training_data is None:
+                training_data = self._prepare_training_data(data_start, data_end, include_simulation)
+            X, y, event_ids = training_data
 
             if len(X) < 100:
                 raise ValueError(f"Insufficient training data: {len(X)} samples (need at least 100)")
@@ -145,58 +154,9 @@ class MLTrainer:
             if callback:
                 callback('extracting_features', 30, f'Extracting features from {len(X)} events')
 
-            # Stage 3: Split data (80/20)
-            self._update_run_status(run_id, 'training', 50, 'Splitting data 80/20 and training model')
-            if callback:
-                callback('training', 50, 'Splitting data 80/20 and training model')
-
-            X_train, X_test, y_train, y_test = self._split_data(X, y)
-
-            # Stage 4: Train model
             params = hyperparameters or self.ALGORITHMS[algorithm]['default_params']
-            model, scaler = self._train_model(algorithm, X_train, y_train, params)
-
-            # Stage 5: Evaluate
-            self._update_run_status(run_id, 'evaluating', 80, 'Evaluating model performance')
-            if callback:
-                callback('evaluating', 80, 'Evaluating model performance')
-
-            metrics = self._evaluate_model(model, scaler, X_test, y_test)
-
-            # Stage 6: Save model
-            self._update_run_status(run_id, 'completed', 95, 'Saving model')
-            if callback:
-                callback('completed', 95, 'Saving model')
-
-            model_id = self._save_model(
-                model=model,
-                scaler=scaler,
-                algorithm=algorithm,
-                params=params,
-                metrics=metrics,
-                data_start=data_start,
-                data_end=data_end,
-                training_samples=len(X_train),
-                test_samples=len(X_test),
-                user_id=user_id
-            )
-
-            # Update training run with model ID
-            self._complete_training_run(run_id, model_id, metrics)
-
-            if callback:
-                callback('completed', 100, 'Training complete')
-
-            return {
-                'success': True,
-                'run_id': run_id,
-                'model_id': model_id,
-                'algorithm': algorithm,
-                'metrics': metrics,
-                'training_samples': len(X_train),
-                'test_samples': len(X_test),
-                'total_samples': len(X)
-            }
+            return self.train_prepared(run_id, algorithm, X, y, params,
+                                       data_start, data_end, user_id, callback)
 
         except Exception as e:
             logger.error(f"Training failed: {e}", exc_info=True)
@@ -209,10 +169,87 @@ class MLTrainer:
                 'error': str(e)
             }
 
+    def train_prepared(self, run_id: int, algorithm: str, X: np.ndarray, y: np.ndarray,
+                       params: Dict, data_start: datetime, data_end: datetime,
+                       user_id: Optional[int] = None,
+                       callback: Optional[callable] = None) -> Dict[str, Any]:
+        """
+        Split, fit, evaluate and save a model for an existing training run.
+
+        Used by train() and by the training executor's worker processes,
+        which pass X/y as read-only memmaps. Errors are raised to the caller.
+
+        Args:
+            run_id: ml_training_runs id to report progress on
+            algorithm: Algorithm name
+            X: Feature matrix
+            y: Labels
+            params: Hyperparameters for the estimator
+            data_start: Start date of the training data
+            data_end: End date of the training data
+            user_id: User initiating training
+            callback: Progress callback function(stage, progress, message)
+
+        Returns:
+            Training result with model info and metrics
+        """
+        # Stage 3: Split data (80/20)
+        self._update_run_status(run_id, 'training', 50, 'Splitting data 80/20 and training model')
+        if callback:
+            callback('training', 50, 'Splitting data 80/20 and training model')
+
+        X_train, X_test, y_train, y_test = self._split_data(X, y)
+
+        # Stage 4: Train model
+        model, scaler = self._train_model(algorithm, X_train, y_train, params)
+
+        # Stage 5: Evaluate
+        self._update_run_status(run_id, 'evaluating', 80, 'Evaluating model performance')
+        if callback:
+            callback('evaluating', 80, 'Evaluating model performance')
+
+        metrics = self._evaluate_model(model, scaler, X_test, y_test)
+
+        # Stage 6: Save model
+        self._update_run_status(run_id, 'completed', 95, 'Saving model')
+        if callback:
+            callback('completed', 95, 'Saving model')
+
+        model_id = self._save_model(
+            model=model,
+            scaler=scaler,
+            algorithm=algorithm,
+            params=params,
+            metrics=metrics,
+            data_start=data_start,
+            data_end=data_end,
+            training_samples=len(X_train),
+            test_samples=len(X_test),
+            user_id=user_id
+        )
+
+        # Update training run with model ID
+        self._complete_training_run(run_id, model_id, metrics)
+
+        if callback:
+            callback('completed', 100, 'Training complete')
+
+        return {
+            'success': True,
+            'run_id': run_id,
+            'model_id': model_id,
+            'algorithm': algorithm,
+            'metrics': metrics,
+            'training_samples': len(X_train),
+            'test_samples': len(X_test),
+            'total_samples': len(X)
+        }
+
     def train_all_algorithms(self, data_start: datetime, data_end: datetime,
                             include_simulation: bool = True,
                             user_id: Optional[int] = None,
-                            callback: Optional[callable] = None) -> Dict[str, Any]:
+                            callback: Optional[callable] = None,
+                            parallel: bool = True) -> Dict[str, Any]:
         """
         Train all supported algorithms and select the best one.
 
@@ -222,6 +259,8 @@ class MLTrainer:
             include_simulation: Include simulation events
             user_id: User initiating training
             callback: Progress callback
+            parallel: Train the algorithms side by side in the training
+                executor's worker processes (False = one after another here)
 
         Returns:
             Results for all algorithms with best model info
@@ -229,6 +268,33 @@ class MLTrainer:
         results = {}
         algorithms = ['random_forest', 'gradient_boosting', 'xgboost']
 
+        if parallel:
+            from . import get_training_executor
+
+            job = get_training_executor().submit(
+                algorithms, data_start, data_end,
+                include_simulation=include_simulation,
+                user_id=user_id,
+                promote_best=True,
+                callback=callback
+            )
+            job.wait()
+
+            for run in (job.result or {}).get('runs', []):
+                results[run['algorithm']] = run
+            if (job.result or {}).get('best_model'):
+                results['best_model'] = job.result['best_model']
+            if job.error:
+                results['error'] = job.error
+            return results
+
+        # Load/extract the window once; every algorithm trains on the same matrix
+        try:
+            training_data = self._prepare_training_data(data_start, data_end, include_simulation)
+        except Exception as e:
+            logger.error(f"Shared data preparation failed, each run will retry: {e}")
+            training_data = None
+
         for i, algo in enumerate(algorithms):
             logger.info(f"Training {algo} ({i+1}/{len(algorithms)})")
             if callback:
@@ -237,7 +303,8 @@ class MLTrainer:
 
             result = self.train(algo, data_start, data_end,
                                include_simulation=include_simulation,
-                               user_id=user_id)
+                               user_id=user_id,
+                               training_data=training_data)
             results[algo] = result
 
         # Find best model by F1 score
@@ -264,56 +331,26 @@ class MLTrainer:
                                include_simulation: bool) -> Tuple[np.ndarray, np.ndarray, List[int]]:
         """Load and prepare training data from auth_events using optimized query"""
         try:
+            # Cached per-day shards (only days not seen before are extracted)
+            if self.feature_store is not None:
+                X, y, event_ids = self.feature_store.load(data_start, data_end, include_simulation)
+                logger.info(f"Feature store: {len(X)} samples ({self.feature_store.get_statistics()})")
+                return X, y, event_ids
+
             # Use optimized query from trainer_queries
             events = fetch_training_data(data_start, data_end, include_simulation)
 
             if not events:
                 return np.array([]), np.array([]), []
 
-            # Extract features and labels
-            features_list = []
-            labels = []
-            event_ids = []
-
-            for event in events:
-                # Prepare event dict for feature extraction
-                event_dict = {
-                    'id': event['id'],
-                    'timestamp': event['timestamp'],
-                    'event_type': event['event_type'],
-                    'source_ip_text': event['source_ip_text'],
-                    'target_username': event['target_username'],
-                    'target_server': event['target_server'],
-                    'auth_method': event['auth_method'],
-                    'failure_reason': event['failure_reason'],
-                    'geo': {
-                        'country_code': event.get('country_code'),
-                        'city': event.get('city'),
-                        'latitude': event.get('latitude'),
-                        'longitude': event.get('longitude'),
-                        'is_proxy': event.get('is_proxy'),
-                        'is_vpn': event.get('is_vpn'),
-                        'is_tor': event.get('is_tor'),
-                        'is_datacenter': event.get('is_datacenter'),
-                        'asn': event.get('asn')
-                    },
-                    'threat': {
-                        'abuseipdb_score': event.get('abuseipdb_score'),
-                        'virustotal_positives': event.get('virustotal_positives'),
-                        'overall_threat_level': event.get('overall_threat_level')
-                    }
-                }
-
-                # Extract features
-                features = self.feature_extractor.extract(event_dict)
-                features_list.append(features)
-
-                # Determine label (1 = threat/anomaly, 0 = normal)
-                label = self._determine_label(event)
-                labels.append(label)
-                event_ids.append(event['id'])
-
-            return np.array(features_list), np.array(labels), event_ids
+            # Extract features for the whole (timestamp-ordered) window at once
+            features = ColumnarFeatureExtractor().extract_rows(events)
+
+            # Determine labels (1 = threat/anomaly, 0 = normal)
+            labels = [self._determine_label(event) for event in events]
+            event_ids = [event['id'] for event in events]
+
+            return features, np.array(labels), event_ids
 
         except Exception as e:
             logger.error(f"Failed to prepare training data: {e}")
@@ -606,6 +643,8 @@ class MLTrainer:
         try:
             promote_model_to_production(model_id)
             logger.info(f"Model {model_id} promoted to production")
+            # Every dashboard worker swaps to the new model
+            publish_model_reload(model_id)
         except Exception as e:
             logger.error(f"Failed to promote model {model_id}: {e}")
             raise
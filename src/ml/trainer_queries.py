@@ -74,6 +74,48 @@ def fetch_training_data(data_start: datetime, data_end: datetime,
         conn.close()
 
 
+def fetch_daily_event_stats(range_start: datetime, range_end: datetime,
+                            include_simulation: bool = True) -> Dict[Any, Tuple[int, int]]:
+    """
+    Per-day event count and highest event id, used to tell whether a
+    cached feature-store day still matches auth_events.
+
+    Args:
+        range_start: First instant included
+        range_end: First instant excluded
+        include_simulation: Count simulation events
+
+    Returns:
+        Dict mapping date -> (event count, max event id)
+
+    Raises:
+        Exception: Database connection or query errors
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        query = """
+            SELECT DATE(timestamp) AS day, COUNT(*) AS events, MAX(id) AS max_id
+            FROM auth_events
+            WHERE timestamp >= %s AND timestamp < %s
+        """
+
+        if not include_simulation:
+            query += " AND source_type != 'simulation'"
+
+        query += " GROUP BY DATE(timestamp)"
+
+        cursor.execute(query, (range_start, range_end))
+        return {day: (int(events), int(max_id)) for day, events, max_id in cursor.fetchall()}
+
+    except Exception as e:
+        raise Exception(f"Failed to fetch daily event stats: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
+
 def batch_update_training_run(run_id: int, updates: Dict[str, Any]) -> None:
     """
     Batch update training run with multiple fields in a single query.
@@ -225,6 +267,82 @@ def fail_training_run(run_id: int, error_message: str) -> None:
         conn.close()
 
 
+def cancel_training_runs(run_ids: List[int]) -> int:
+    """
+    Mark unfinished training runs as cancelled.
+
+    Args:
+        run_ids: Training run IDs
+
+    Returns:
+        Number of runs cancelled (completed/failed runs are left as they are)
+
+    Raises:
+        Exception: Database errors
+    """
+    if not run_ids:
+        return 0
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        placeholders = ', '.join(['%s'] * len(run_ids))
+        cursor.execute(f"""
+            UPDATE ml_training_runs
+            SET status = 'cancelled', current_stage = 'Cancelled',
+                completed_at = NOW(),
+                duration_seconds = TIMESTAMPDIFF(SECOND, started_at, NOW())
+            WHERE id IN ({placeholders})
+              AND status NOT IN ('completed', 'failed', 'cancelled')
+        """, tuple(run_ids))
+        conn.commit()
+        return cursor.rowcount
+    except Exception as e:
+        conn.rollback()
+        raise Exception(f"Failed to cancel training runs {run_ids}: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def fetch_training_run_progress(run_ids: List[int]) -> List[Dict[str, Any]]:
+    """
+    Status/progress rows for a set of training runs.
+
+    Args:
+        run_ids: Training run IDs
+
+    Returns:
+        List of dicts with id, algorithm, status, progress_percent,
+        current_stage, model_id and error_message
+
+    Raises:
+        Exception: Database errors
+    """
+    if not run_ids:
+        return []
+
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        placeholders = ', '.join(['%s'] * len(run_ids))
+        cursor.execute(f"""
+            SELECT id, algorithm, status, progress_percent, current_stage,
+                   model_id, error_message
+            FROM ml_training_runs
+            WHERE id IN ({placeholders})
+            ORDER BY id
+        """, tuple(run_ids))
+        return cursor.fetchall()
+    except Exception as e:
+        raise Exception(f"Failed to fetch training run progress: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
+
 def promote_model_to_production(model_id: int) -> None:
     """
     Promote model to production, demoting current active model.
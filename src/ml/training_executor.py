@@ -0,0 +1,503 @@
+"""
+SSH Guardian v3.0 - ML Training Executor
+Runs training jobs (several algorithms and optional hyperparameter grids)
+in a bounded pool of niced worker processes that share the feature matrix
+through memory-mapped .npy files, with progress in ml_training_runs and
+cancellation
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import itertools
+import threading
+import subprocess
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Callable
+import numpy as np
+
+from .trainer_queries import (
+    update_training_run_progress,
+    update_training_run_samples,
+    fail_training_run,
+    cancel_training_runs,
+    fetch_training_run_progress
+)
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+
+# Executor configuration
+ML_TRAINING_WORKERS = int(os.getenv('ML_TRAINING_WORKERS', 2))
+ML_TRAINING_NICE = int(os.getenv('ML_TRAINING_NICE', 10))
+ML_TRAINING_JOBS_DIR = Path(os.getenv('ML_TRAINING_JOBS_DIR') or PROJECT_ROOT / 'ml_models' / 'training_jobs')
+
+POLL_INTERVAL_SEC = 0.5
+CANCEL_GRACE_SEC = 3
+MIN_TRAINING_SAMPLES = 100
+LOG_TAIL_CHARS = 2000
+
+
+class TrainingCancelled(Exception):
+    """Raised inside a worker when its job has been cancelled"""
+
+
+def expand_grid(base_params: Dict[str, Any], grid: Optional[Dict[str, List]]) -> List[Dict[str, Any]]:
+    """
+    Expand a hyperparameter grid over a base parameter set.
+
+    Args:
+        base_params: Default hyperparameters
+        grid: Parameter name -> list of values to try (None/empty = base only)
+
+    Returns:
+        One parameter dict per grid point
+    """
+    if not grid:
+        return [dict(base_params)]
+
+    names = list(grid)
+    values = [v if isinstance(v, (list, tuple)) else [v] for v in grid.values()]
+    return [{**base_params, **dict(zip(names, point))} for point in itertools.product(*values)]
+
+
+class TrainingJob:
+    """One submitted training job: a shared data window and its tasks"""
+
+    def __init__(self, job_id: str, tasks: List[Dict[str, Any]], data_start: datetime,
+                 data_end: datetime, include_simulation: bool, user_id: Optional[int],
+                 promote_best: bool, callback: Optional[Callable] = None):
+        self.job_id = job_id
+        self.tasks = tasks
+        self.data_start = data_start
+        self.data_end = data_end
+        self.include_simulation = include_simulation
+        self.user_id = user_id
+        self.promote_best = promote_best
+        self.callback = callback
+
+        self.stage = 'queued'
+        self.progress = 0
+        self.message = 'Waiting for a training worker'
+        self.result = None
+        self.error = None
+        self.started_at = datetime.now()
+        self.finished_at = None
+
+        self.cancel_requested = threading.Event()
+        self.processes: Dict[str, subprocess.Popen] = {}
+        self.done = threading.Event()
+
+    @property
+    def run_ids(self) -> List[int]:
+        return [task['run_id'] for task in self.tasks]
+
+    def set_stage(self, stage: str, progress: int, message: str):
+        """Update job-level progress and notify the callback"""
+        self.stage, self.progress, self.message = stage, progress, message
+        if self.callback:
+            try:
+                self.callback(stage, progress, message)
+            except Exception as e:
+                logger.warning(f"Training job {self.job_id} callback failed: {e}")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job has finished"""
+        return self.done.wait(timeout)
+
+    def to_dict(self, include_runs: bool = True) -> Dict[str, Any]:
+        """Job status for the API (per-run progress read from ml_training_runs)"""
+        status = {
+            'job_id': self.job_id,
+            'stage': self.stage,
+            'progress': self.progress,
+            'message': self.message,
+            'algorithms': sorted({task['algorithm'] for task in self.tasks}),
+            'tasks': len(self.tasks),
+            'run_ids': self.run_ids,
+            'started_at': self.started_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+        if self.result is not None:
+            status['result'] = self.result
+        if self.error:
+            status['error'] = self.error
+        if include_runs:
+            try:
+                status['runs'] = fetch_training_run_progress(self.run_ids)
+            except Exception as e:
+                logger.error(f"Failed to read training run progress: {e}")
+        return status
+
+
+class TrainingExecutor:
+    """
+    Bounded pool of training worker processes.
+
+    Each job first runs a 'prepare' worker that loads the window through
+    the feature store and writes X.npy / y.npy into the job directory.
+    Every (algorithm, hyperparameters) task then runs in its own worker,
+    at most max_workers at a time across all jobs, opening the matrix with
+    np.load(mmap_mode='r') so it is shared through the page cache instead
+    of being copied into each process. Workers are started with
+    `python -m ml.training_executor` (not forked from the web server) and
+    niced, so training does not compete with request handling for the GIL.
+    """
+
+    def __init__(self, trainer, max_workers: Optional[int] = None,
+                 jobs_dir: Optional[Path] = None):
+        """
+        Initialize the executor
+
+        Args:
+            trainer: MLTrainer (creates run records and promotes the best model)
+            max_workers: Concurrent worker processes (default ML_TRAINING_WORKERS)
+            jobs_dir: Scratch directory for shared matrices (default ML_TRAINING_JOBS_DIR)
+        """
+        self.trainer = trainer
+        self.max_workers = max(1, max_workers or ML_TRAINING_WORKERS)
+        self.jobs_dir = Path(jobs_dir or ML_TRAINING_JOBS_DIR)
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self._jobs: Dict[str, TrainingJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, algorithms: List[str], data_start: datetime, data_end: datetime,
+               include_simulation: bool = True,
+               hyperparameters: Optional[Dict[str, Dict]] = None,
+               param_grids: Optional[Dict[str, Dict[str, List]]] = None,
+               user_id: Optional[int] = None,
+               promote_best: bool = False,
+               callback: Optional[Callable] = None) -> TrainingJob:
+        """
+        Queue a training job and return immediately.
+
+        Args:
+            algorithms: Algorithms to train
+            data_start: Start date for training data
+            data_end: End date for training data
+            include_simulation: Include simulation events
+            hyperparameters: Per-algorithm hyperparameters (default: ALGORITHMS defaults)
+            param_grids: Per-algorithm grid of values to try on top of those
+            user_id: User initiating training
+            promote_best: Promote the best model (by F1) to production when done
+            callback: Job progress callback function(stage, progress, message)
+
+        Returns:
+            TrainingJob (poll to_dict() or wait())
+        """
+        hyperparameters = hyperparameters or {}
+        param_grids = param_grids or {}
+        tasks = []
+
+        for algorithm in algorithms:
+            if algorithm not in self.trainer.ALGORITHMS:
+                raise ValueError(f"Unknown algorithm: {algorithm}. Supported: {list(self.trainer.ALGORITHMS.keys())}")
+            base = hyperparameters.get(algorithm) or self.trainer.ALGORITHMS[algorithm]['default_params']
+            for params in expand_grid(base, param_grids.get(algorithm)):
+                run_id = self.trainer._create_training_run(algorithm, data_start, data_end,
+                                                           params, include_simulation, user_id)
+                tasks.append({'algorithm': algorithm, 'params': params, 'run_id': run_id})
+
+        job = TrainingJob(str(uuid.uuid4())[:8], tasks, data_start, data_end,
+                          include_simulation, user_id, promote_best, callback)
+        with self._lock:
+            self._jobs[job.job_id] = job
+
+        thread = threading.Thread(target=self._run_job, args=(job,),
+                                  name=f'training-job-{job.job_id}', daemon=True)
+        thread.start()
+        return job
+
+    def get_job(self, job_id: str) -> Optional[TrainingJob]:
+        """Look up a job submitted to this process"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a job: queued tasks never start, running workers are asked to
+        stop at their next stage and terminated after a short grace period.
+
+        Returns:
+            True if the job exists and had not finished yet
+        """
+        job = self.get_job(job_id)
+        if not job or job.done.is_set():
+            return False
+
+        job.cancel_requested.set()
+        (self.jobs_dir / job.job_id).mkdir(parents=True, exist_ok=True)
+        (self.jobs_dir / job.job_id / 'CANCEL').touch()
+        return True
+
+    # =========================================================================
+    # Job thread
+    # =========================================================================
+
+    def _run_job(self, job: TrainingJob):
+        """Prepare the shared matrix, then fan tasks out to worker processes"""
+        job_dir = self.jobs_dir / job.job_id
+        job_dir.mkdir(parents=True, exist_ok=True)
+
+        with open(job_dir / 'job.json', 'w') as f:
+            json.dump({
+                'models_dir': str(self.trainer.models_dir),
+                'data_start': job.data_start.isoformat(),
+                'data_end': job.data_end.isoformat(),
+                'include_simulation': job.include_simulation,
+                'user_id': job.user_id,
+                'run_ids': job.run_ids,
+                'threads_per_worker': max(1, (os.cpu_count() or 1) // self.max_workers),
+                'tasks': job.tasks
+            }, f, default=str)
+
+        prepared = False
+        try:
+            # Stage 1: one worker loads/extracts the window for every task
+            job.set_stage('preparing_data', 5, 'Loading training data')
+            for run_id in job.run_ids:
+                self._safe_progress(run_id, 'preparing_data', 10, 'Loading events (shared by all tasks in this job)')
+
+            if not self._run_worker(job, 'prepare'):
+                if job.cancel_requested.is_set():
+                    raise TrainingCancelled('Training cancelled')
+                raise RuntimeError(self._worker_error(job_dir, 'prepare'))
+
+            with open(job_dir / 'prepare.json') as f:
+                samples = json.load(f)['samples']
+            if samples < MIN_TRAINING_SAMPLES:
+                raise ValueError(f"Insufficient training data: {samples} samples (need at least {MIN_TRAINING_SAMPLES})")
+
+            prepared = True
+            for run_id in job.run_ids:
+                self._safe_samples(run_id, samples)
+                self._safe_progress(run_id, 'extracting_features', 30, f'Features ready for {samples} events')
+
+            # Stage 2: tasks in parallel, bounded by the executor-wide slots
+            job.set_stage('training', 30, f'Training {len(job.tasks)} model(s) on {samples} samples')
+            threads = [threading.Thread(target=self._run_worker, args=(job, str(index)), daemon=True)
+                       for index in range(len(job.tasks))]
+            for thread in threads:
+                thread.start()
+
+            finished = 0
+            for thread in threads:
+                thread.join()
+                finished += 1
+                job.set_stage('training', 30 + int(65 * finished / len(threads)),
+                              f'{finished}/{len(threads)} model(s) finished')
+
+            if job.cancel_requested.is_set():
+                raise TrainingCancelled('Training cancelled')
+
+            job.result = self._collect_results(job, job_dir)
+            job.set_stage('completed', 100, 'Training complete')
+
+        except TrainingCancelled as e:
+            job.error = str(e)
+            job.set_stage('cancelled', job.progress, str(e))
+        except Exception as e:
+            logger.error(f"Training job {job.job_id} failed: {e}", exc_info=True)
+            job.error = str(e)
+            if not prepared:
+                # Task workers record their own failures once they have started
+                for run_id in job.run_ids:
+                    self._safe_fail(run_id, str(e))
+            job.set_stage('failed', job.progress, str(e))
+        finally:
+            if job.cancel_requested.is_set():
+                try:
+                    cancel_training_runs(job.run_ids)
+                except Exception as e:
+                    logger.error(f"Failed to mark runs cancelled: {e}")
+            job.finished_at = datetime.now()
+            shutil.rmtree(job_dir, ignore_errors=True)
+            job.done.set()
+
+    def _run_worker(self, job: TrainingJob, task: str) -> bool:
+        """Run one worker process in a pool slot; False if it failed or was cancelled"""
+        job_dir = self.jobs_dir / job.job_id
+
+        with self._slots:
+            if job.cancel_requested.is_set():
+                return False
+
+            env = dict(os.environ)
+            env['PYTHONPATH'] = os.pathsep.join(
+                [str(PROJECT_ROOT / 'src'), str(PROJECT_ROOT / 'dbs'), env.get('PYTHONPATH', '')])
+
+            with open(job_dir / f'worker_{task}.log', 'w') as log:
+                process = subprocess.Popen(
+                    [sys.executable, '-m', 'ml.training_executor', str(job_dir), task],
+                    cwd=str(PROJECT_ROOT), env=env, stdout=log, stderr=subprocess.STDOUT
+                )
+                job.processes[task] = process
+
+                while process.poll() is None:
+                    if job.cancel_requested.wait(POLL_INTERVAL_SEC):
+                        try:
+                            process.wait(timeout=CANCEL_GRACE_SEC)
+                        except subprocess.TimeoutExpired:
+                            process.terminate()
+                            try:
+                                process.wait(timeout=CANCEL_GRACE_SEC)
+                            except subprocess.TimeoutExpired:
+                                process.kill()
+                                process.wait()
+                        break
+
+                job.processes.pop(task, None)
+
+        return process.returncode == 0 and not job.cancel_requested.is_set()
+
+    def _collect_results(self, job: TrainingJob, job_dir: Path) -> Dict[str, Any]:
+        """Gather worker results, pick the best model by F1 and optionally promote it"""
+        runs = []
+        for index, task in enumerate(job.tasks):
+            try:
+                with open(job_dir / f'result_{index}.json') as f:
+                    runs.append(json.load(f))
+            except (OSError, ValueError):
+                runs.append({
+                    'success': False,
+                    'run_id': task['run_id'],
+                    'algorithm': task['algorithm'],
+                    'error': self._worker_error(job_dir, str(index))
+                })
+                self._safe_fail(task['run_id'], runs[-1]['error'])
+
+        result = {'runs': runs}
+        successful = [r for r in runs if r.get('success')]
+        if successful:
+            best = max(successful, key=lambda r: (r.get('metrics') or {}).get('f1_score') or 0)
+            result['best_model'] = {
+                'algorithm': best['algorithm'],
+                'model_id': best['model_id'],
+                'run_id': best['run_id'],
+                'hyperparameters': best.get('hyperparameters'),
+                'f1_score': (best.get('metrics') or {}).get('f1_score')
+            }
+            if job.promote_best:
+                self.trainer._promote_model(best['model_id'])
+                result['best_model']['promoted'] = True
+
+        return result
+
+    @staticmethod
+    def _worker_error(job_dir: Path, task: str) -> str:
+        """Last lines of a worker's output, for error reporting"""
+        try:
+            tail = (job_dir / f'worker_{task}.log').read_text()[-LOG_TAIL_CHARS:].strip()
+        except OSError:
+            tail = ''
+        return f"Training worker '{task}' failed" + (f": {tail.splitlines()[-1]}" if tail else '')
+
+    @staticmethod
+    def _safe_progress(run_id: int, status: str, progress: int, stage: str):
+        try:
+            update_training_run_progress(run_id, status, progress, stage)
+        except Exception as e:
+            logger.error(f"Failed to update run status: {e}")
+
+    @staticmethod
+    def _safe_samples(run_id: int, samples: int):
+        try:
+            update_training_run_samples(run_id, samples)
+        except Exception as e:
+            logger.error(f"Failed to update run samples: {e}")
+
+    @staticmethod
+    def _safe_fail(run_id: int, error: str):
+        try:
+            fail_training_run(run_id, error)
+        except Exception as e:
+            logger.error(f"Failed to mark training run as failed: {e}")
+
+
+# =============================================================================
+# Worker process entry point
+# =============================================================================
+
+def _worker_prepare(job_dir: Path, spec: Dict[str, Any]):
+    """Load the training window once and write it as shared .npy files"""
+    from .trainer import MLTrainer
+
+    trainer = MLTrainer(Path(spec['models_dir']))
+    X, y, _ = trainer._prepare_training_data(
+        datetime.fromisoformat(spec['data_start']),
+        datetime.fromisoformat(spec['data_end']),
+        spec['include_simulation']
+    )
+    np.save(job_dir / 'X.npy', np.asarray(X, dtype=np.float32))
+    np.save(job_dir / 'y.npy', np.asarray(y))
+    with open(job_dir / 'prepare.json', 'w') as f:
+        json.dump({'samples': int(len(X))}, f)
+
+
+def _worker_train(job_dir: Path, spec: Dict[str, Any], index: int):
+    """Train one (algorithm, hyperparameters) task on the shared matrix"""
+    from .trainer import MLTrainer
+
+    task = spec['tasks'][index]
+    cancel_flag = job_dir / 'CANCEL'
+
+    def check_cancelled(stage, progress, message):
+        if cancel_flag.exists():
+            raise TrainingCancelled('Training cancelled')
+
+    # Tasks already run side by side; don't let each estimator claim every core
+    params = dict(task['params'])
+    if params.get('n_jobs') == -1:
+        params['n_jobs'] = spec['threads_per_worker']
+
+    X = np.load(job_dir / 'X.npy', mmap_mode='r')
+    y = np.load(job_dir / 'y.npy', mmap_mode='r')
+
+    trainer = MLTrainer(Path(spec['models_dir']))
+    result = {'success': False, 'run_id': task['run_id'], 'algorithm': task['algorithm'],
+              'hyperparameters': task['params']}
+    try:
+        result.update(trainer.train_prepared(
+            task['run_id'], task['algorithm'], X, y, params,
+            datetime.fromisoformat(spec['data_start']),
+            datetime.fromisoformat(spec['data_end']),
+            spec['user_id'], check_cancelled
+        ))
+    except TrainingCancelled:
+        cancel_training_runs([task['run_id']])
+        raise
+    except Exception as e:
+        fail_training_run(task['run_id'], str(e))
+        result['error'] = str(e)
+        raise
+    finally:
+        with open(job_dir / f'result_{index}.json', 'w') as f:
+            json.dump(result, f, default=str)
+
+
+def _worker_main(argv: List[str]) -> int:
+    job_dir, task = Path(argv[0]), argv[1]
+    if ML_TRAINING_NICE and hasattr(os, 'nice'):
+        os.nice(ML_TRAINING_NICE)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    with open(job_dir / 'job.json') as f:
+        spec = json.load(f)
+
+    started = time.time()
+    if task == 'prepare':
+        _worker_prepare(job_dir, spec)
+    else:
+        _worker_train(job_dir, spec, int(task))
+    logger.info(f"Worker '{task}' finished in {time.time() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(_worker_main(sys.argv[1:]))